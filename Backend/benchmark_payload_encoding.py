@@ -0,0 +1,117 @@
+"""
+Benchmark: size and encode/decode time of search payloads (JSON vs columnar MessagePack vs Arrow IPC)
+
+Usage:
+    python benchmark_payload_encoding.py                  # 100, 500 and 5000 properties
+    python benchmark_payload_encoding.py --sizes 100 1000
+    python benchmark_payload_encoding.py --view map       # PropertyMarker payloads
+
+JSON is measured the way FastAPI serializes a response_model (model -> JSON bytes),
+and decoded with json.loads. For the columnar formats "columns ms" is the decode a
+columnar client does (typed arrays, no per-row objects) and "rows ms" rebuilds the
+JSON-shaped list of dicts. gzip sizes are shown for reference.
+"""
+import sys
+import os
+import gzip
+import json
+import time
+import argparse
+
+import numpy as np
+
+# Add Backend to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+from models import (Property, PropertyMarker, PropertyCriteria, SearchResponse, SearchMode)
+import payload_encoding
+
+DISTRICTS = [f"حي {name}" for name in ("الملقا", "النرجس", "الياسمين", "العليا", "الربوة", "حطين", "الصحافة",
+                                        "الورود", "الندى", "العارض", "القيروان", "الرمال")]
+
+
+def synthetic_response(count, view="full", seed=0):
+    """A SearchResponse with realistic-looking properties and nearby services"""
+    rng = np.random.default_rng(seed)
+    items = []
+    for i in range(count):
+        lat, lon = float(24.7 + rng.uniform(-0.2, 0.2)), float(46.7 + rng.uniform(-0.2, 0.2))
+        price = float(rng.integers(20, 200) * 1000)
+        if view == "map":
+            items.append(PropertyMarker(id=str(100000 + i), final_lat=lat, final_lon=lon, price_num=price,
+                                        property_type="شقق", match_score=float(rng.integers(60, 101))))
+            continue
+        items.append(Property(
+            id=str(100000 + i), url=f"https://sa.aqar.fm/listing/{100000 + i}",
+            purpose="للايجار", property_type="شقق", city="الرياض", district=str(rng.choice(DISTRICTS)),
+            title=f"شقة للإيجار في {rng.choice(DISTRICTS)}", price_num=price, price_currency="SAR",
+            price_period="سنوي", area_m2=float(rng.integers(80, 300)),
+            description="شقة مودرن، مدخل خاص، قريبة من الخدمات والمدارس " * int(rng.integers(1, 5)),
+            image_url=f"https://images.aqar.fm/{100000 + i}.jpg",
+            lat=lat, lon=lon, final_lat=lat, final_lon=lon,
+            time_to_metro_min=float(rng.integers(5, 30)),
+            rooms=int(rng.integers(1, 6)), baths=int(rng.integers(1, 4)), halls=int(rng.integers(1, 3)),
+            nearby_schools=[{"name": f"مدرسة {j}", "distance_meters": float(rng.integers(200, 3000)),
+                             "drive_minutes": float(rng.integers(1, 10))} for j in range(int(rng.integers(0, 4)))],
+            nearby_mosques=[{"name": f"جامع {j}", "distance_meters": float(rng.integers(100, 1500)),
+                             "walk_minutes": float(rng.integers(1, 15))} for j in range(int(rng.integers(0, 3)))],
+            match_score=100.0,
+        ))
+
+    return SearchResponse(
+        success=True, message=f"لقيت لك {count} عقار",
+        criteria=PropertyCriteria(purpose="للايجار", property_type="شقق", city="الرياض"),
+        properties=[] if view == "map" else items, markers=items if view == "map" else None,
+        total_count=count, search_mode=SearchMode.EXACT,
+    )
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return result, best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 500, 5000])
+    parser.add_argument("--view", choices=["full", "map"], default="full")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    encoders = [
+        ("json", lambda r: r.model_dump_json().encode("utf-8"), json.loads),
+        ("msgpack", payload_encoding.encode_msgpack, payload_encoding.decode_msgpack),
+    ]
+    if payload_encoding._arrow() is not None:
+        encoders.append(("arrow", payload_encoding.encode_arrow, payload_encoding.decode_arrow))
+    else:
+        print("(pyarrow not installed: skipping Arrow IPC)")
+
+    print(f"view={args.view}, best of {args.repeat}")
+    print(f"{'rows':>6} {'format':>8} {'bytes':>10} {'gzip':>9} {'vs json':>8} "
+          f"{'encode ms':>10} {'columns ms':>11} {'rows ms':>8}")
+    for size in args.sizes:
+        response = synthetic_response(size, args.view)
+        json_size = None
+        for name, encode, decode in encoders:
+            data, encode_ms = timed(lambda: encode(response), args.repeat)
+            _, rows_ms = timed(lambda: decode(data), args.repeat)
+            columns = "-"
+            if name != "json":
+                _, columns_ms = timed(lambda: decode(data, rows=False), args.repeat)
+                columns = f"{columns_ms:.2f}"
+            json_size = json_size or len(data)
+            print(f"{size:>6} {name:>8} {len(data):>10} {len(gzip.compress(data)):>9} "
+                  f"{len(data) / json_size:>7.0%} {encode_ms:>10.2f} {columns:>11} {rows_ms:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Benchmark: memory, scoring throughput and recall of compressed vectors (float16 / int8 / truncated dims)
+
+Usage:
+    python benchmark_vector_codec.py                 # synthetic clustered vectors
+    python benchmark_vector_codec.py --rows 100000   # bigger synthetic set
+    python benchmark_vector_codec.py --from-db       # real property embeddings from Supabase
+
+Recall@k is measured against exact float32 top-k over all vectors, so
+VECTOR_INDEX_PRECISION / VECTOR_INDEX_DIMENSIONS / EMBEDDING_QUERY_PRECISION can be picked from one table.
+"""
+import sys
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+
+# Add Backend to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+from benchmark_vector_index import synthetic_dataset, database_dataset
+
+
+def top_k(scores, k):
+    """Indices of the k highest scores per row (unordered)"""
+    return np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+
+def run(vectors, queries, k, dimension_options, repeats=3):
+    from vector_codec import VectorCodec, PRECISIONS, FLOAT32, reduce_precision
+
+    vectors = VectorCodec().prepare(vectors)
+    queries = VectorCodec().prepare(queries)
+    truth = top_k(queries @ vectors.T, k)
+    dims = vectors.shape[1]
+
+    print(f"{len(vectors)} vectors x {dims} dims, {len(queries)} queries, recall@{k} vs exact float32\n")
+    print(f"{'codec':<18}{'B/vector':>10}{'MB':>9}{'Mvec/s':>9}{'recall@' + str(k):>11}{'RPC bytes':>11}")
+
+    for dimensions in dimension_options:
+        for precision in PRECISIONS:
+            codec = VectorCodec(precision, dimensions if dimensions and dimensions < dims else None)
+            encoded = codec.encode(vectors)
+            prepared = codec.prepare(queries)
+
+            started = time.perf_counter()
+            for _ in range(repeats):
+                scores = np.vstack([encoded.dot(q) for q in prepared])
+            throughput = repeats * len(prepared) * len(encoded) / (time.perf_counter() - started) / 1e6
+
+            found = top_k(scores, k)
+            recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+            # حمولة JSON لمتجه الطلب الكامل كما يرسله EmbeddingGenerator (عمود قاعدة البيانات لا يُقص)
+            query = queries[0].tolist() if precision == FLOAT32 else reduce_precision(queries[0], precision)
+            payload = len(json.dumps({"query_embedding": query}))
+            print(f"{codec.name:<18}{codec.bytes_per_vector(dims):>10}{encoded.nbytes / 2 ** 20:>9.1f}"
+                  f"{throughput:>9.1f}{recall:>11.3f}{payload:>11}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--dims", type=int, default=1024)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--dimensions", type=int, nargs="+", default=[0, 512, 256],
+                        help="truncation options (0 = all dimensions)")
+    parser.add_argument("--from-db", action="store_true")
+    args = parser.parse_args()
+
+    if args.from_db:
+        _, vectors, _, queries = database_dataset()
+    else:
+        _, vectors, _, queries = synthetic_dataset(args.rows, args.dims, args.clusters)
+
+    run(vectors, queries, k=args.k, dimension_options=args.dimensions)
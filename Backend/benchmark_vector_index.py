@@ -0,0 +1,115 @@
+"""
+Benchmark: recall@k and latency of the local IVF vector index vs brute-force cosine
+
+Usage:
+    python benchmark_vector_index.py                 # synthetic clustered vectors
+    python benchmark_vector_index.py --rows 50000    # bigger synthetic set
+    python benchmark_vector_index.py --from-db       # real property embeddings from Supabase
+
+Prints one line per n_probe value so VECTOR_INDEX_NPROBE can be tuned.
+"""
+import sys
+import os
+import time
+import argparse
+
+import numpy as np
+
+# Add Backend to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+
+def synthetic_dataset(rows, dims, clusters, seed=0):
+    """Clustered unit vectors with property-like metadata"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dims)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=rows)
+    vectors = centers[labels] + 0.6 * rng.normal(size=(rows, dims)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    metadata = [
+        {
+            "purpose": rng.choice(["للبيع", "للايجار"]),
+            "property_type": rng.choice(["شقق", "فلل", "دور", "استوديو"]),
+            "city": "الرياض",
+            "final_lat": float(24.7 + rng.uniform(-0.2, 0.2)),
+            "final_lon": float(46.7 + rng.uniform(-0.2, 0.2)),
+            "price_num": float(rng.integers(20, 200) * 1000),
+        }
+        for _ in range(rows)
+    ]
+    ids = [str(i) for i in range(rows)]
+
+    queries = centers[rng.integers(0, clusters, size=200)] + 0.6 * rng.normal(size=(200, dims)).astype(np.float32)
+    return ids, vectors, metadata, queries
+
+
+def database_dataset(sample_queries=200, seed=0):
+    """Real embeddings; queries are perturbed stored vectors"""
+    from database import db
+    from vector_index import VECTOR_COLUMNS, parse_pgvector
+
+    rows = db.fetch_all("properties", VECTOR_COLUMNS, order_by="id")
+    ids, vectors, metadata = [], [], []
+    for row in rows:
+        vector = parse_pgvector(row.pop("embedding", None))
+        if vector is not None and vector.size:
+            ids.append(row["id"])
+            vectors.append(vector)
+            metadata.append(row)
+
+    vectors = np.vstack(vectors)
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(vectors), size=sample_queries)
+    queries = vectors[picks] + 0.02 * rng.normal(size=(sample_queries, vectors.shape[1])).astype(np.float32)
+    return ids, vectors, metadata, queries
+
+
+def run(ids, vectors, metadata, queries, k, filters):
+    from vector_index import VectorIndex
+
+    index = VectorIndex()
+    started = time.perf_counter()
+    index.build(ids, vectors, metadata)
+    print(f"build: {len(ids)} vectors x {vectors.shape[1]} dims in {time.perf_counter() - started:.2f}s, "
+          f"{len(index.offsets) - 1} lists")
+
+    def timed(**kwargs):
+        results, latencies = [], []
+        for q in queries:
+            t0 = time.perf_counter()
+            results.append([r["id"] for r in index.search(q, k=k, threshold=-1.0, **filters, **kwargs)])
+            latencies.append((time.perf_counter() - t0) * 1000)
+        return results, np.array(latencies)
+
+    truth, brute_latency = timed(exact=True)
+    print(f"\n{'mode':<16}{'recall@' + str(k):>12}{'p50 ms':>10}{'p95 ms':>10}")
+    print(f"{'brute force':<16}{1.0:>12.3f}{np.percentile(brute_latency, 50):>10.2f}{np.percentile(brute_latency, 95):>10.2f}")
+
+    for n_probe in (1, 2, 4, 8, 16, 32, 64):
+        found, latency = timed(n_probe=n_probe)
+        recall = np.mean([len(set(f) & set(t)) / max(len(t), 1) for f, t in zip(found, truth)])
+        print(f"{'n_probe=' + str(n_probe):<16}{recall:>12.3f}{np.percentile(latency, 50):>10.2f}{np.percentile(latency, 95):>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--dims", type=int, default=1024)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--k", type=int, default=100)
+    parser.add_argument("--from-db", action="store_true")
+    parser.add_argument("--purpose", default=None, help="pre-filter, e.g. للايجار")
+    parser.add_argument("--property-type", default=None, help="pre-filter, e.g. شقق")
+    args = parser.parse_args()
+
+    if args.from_db:
+        dataset = database_dataset()
+    else:
+        dataset = synthetic_dataset(args.rows, args.dims, args.clusters)
+
+    run(*dataset, k=args.k, filters={"purpose": args.purpose, "property_type": args.property_type})
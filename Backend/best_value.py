@@ -0,0 +1,213 @@
+"""
+أفضل العروض لكل حي (Best-Value Rankings)
+
+لكل (الحي، الغرض، النوع) قائمة محسوبة مسبقاً بأرخص N عقار بسعر المتر مقارنة
+بمتوسط الحي. داخل المجموعة الواحدة متوسط الحي مشترك، فترتيب نسبة الخصم هو
+نفسه ترتيب سعر المتر تصاعدياً؛ لذلك تحتفظ كل مجموعة بـ heap محدود بأرخص N
+عقار ومجموع أسعار المتر للمتوسط:
+- إضافة عقار: مقارنة مع أغلى عنصر في الـ heap (O(log N))
+- حذف/تعديل عقار من القائمة: إعادة ملء القائمة عند القراءة التالية فقط
+- تغيّر المتوسط: لا يغيّر الترتيب، فقط نسبة الخصم وحد "أقل من المتوسط" عند القراءة
+"""
+from config import settings
+from property_store import PropertyStore, property_store
+from typing import List, Optional, Dict, Any, Tuple
+import heapq
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# (الحي، الغرض، النوع)
+GroupKey = Tuple[str, str, str]
+
+
+def _price_per_m2(row: Dict[str, Any]) -> Optional[float]:
+    try:
+        price, area = float(row.get('price_num')), float(row.get('area_m2'))
+    except (TypeError, ValueError):
+        return None
+    if price <= 0 or area <= 0:
+        return None
+    return price / area
+
+
+def group_key(row: Dict[str, Any]) -> Optional[GroupKey]:
+    if not row.get('district') or not row.get('purpose') or not row.get('property_type'):
+        return None
+    return (row['district'], row['purpose'], row['property_type'])
+
+
+class _Group:
+    """عقارات مجموعة واحدة + heap بأرخص N بسعر المتر"""
+
+    __slots__ = ('members', 'ppm_sum', 'top', 'top_ids', 'dirty')
+
+    def __init__(self):
+        self.members: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self.ppm_sum = 0.0
+        self.top: List[Tuple[float, str]] = []  # max-heap: (-سعر المتر، id)
+        self.top_ids: set = set()
+        self.dirty = False
+
+    def add(self, property_id: str, ppm: float, row: Dict[str, Any], top_n: int):
+        self.members[property_id] = (ppm, row)
+        self.ppm_sum += ppm
+        if self.dirty:
+            return
+        if len(self.top) < top_n:
+            heapq.heappush(self.top, (-ppm, property_id))
+            self.top_ids.add(property_id)
+        elif ppm < -self.top[0][0]:
+            _, evicted = heapq.heapreplace(self.top, (-ppm, property_id))
+            self.top_ids.discard(evicted)
+            self.top_ids.add(property_id)
+
+    def remove(self, property_id: str):
+        ppm, _ = self.members.pop(property_id)
+        self.ppm_sum -= ppm
+        if property_id in self.top_ids:
+            # عنصر من القائمة خرج: البديل غير معروف بدون مسح المجموعة، نؤجله للقراءة
+            self.dirty = True
+
+    def refill(self, top_n: int):
+        cheapest = heapq.nsmallest(top_n, self.members.items(), key=lambda item: (item[1][0], item[0]))
+        self.top = [(-ppm, property_id) for property_id, (ppm, _) in cheapest]
+        heapq.heapify(self.top)
+        self.top_ids = {property_id for property_id, _ in cheapest}
+        self.dirty = False
+
+    @property
+    def avg_price_per_m2(self) -> Optional[float]:
+        return self.ppm_sum / len(self.members) if self.members else None
+
+
+class BestValueIndex:
+    """قوائم أفضل العروض لكل مجموعة، تُبنى عند أول قراءة وتُحدّث من تغييرات المخزن"""
+
+    def __init__(self, store: PropertyStore, top_n: int = 20):
+        self.store = store
+        self.top_n = top_n
+        self._groups: Dict[GroupKey, _Group] = {}
+        # (الحي، الغرض) → الأنواع الموجودة فيه
+        self._types: Dict[Tuple[str, str], set] = {}
+        # لقطة المخزن التي تعكسها المجموعات (لتجنب تطبيق نفس التغيير مرتين)
+        self._source: Optional[List[Dict[str, Any]]] = None
+        self._lock = threading.Lock()
+
+    def _add_row(self, row: Dict[str, Any]):
+        key, ppm = group_key(row), _price_per_m2(row)
+        if key is None or ppm is None:
+            return
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = _Group()
+            self._types.setdefault(key[:2], set()).add(key[2])
+        group.add(str(row.get('id')), ppm, row, self.top_n)
+
+    def _remove_row(self, row: Dict[str, Any]):
+        key = group_key(row)
+        group = self._groups.get(key) if key else None
+        property_id = str(row.get('id'))
+        if group is None or property_id not in group.members:
+            return
+        group.remove(property_id)
+        if not group.members:
+            del self._groups[key]
+            types = self._types[key[:2]]
+            types.discard(key[2])
+            if not types:
+                del self._types[key[:2]]
+
+    def _sync(self):
+        """بناء المجموعات من اللقطة الحالية إذا لم تكن تعكسها (يُستدعى مع القفل)"""
+        rows = self.store.rows()
+        if self._source is rows:
+            return
+        self._groups, self._types = {}, {}
+        for row in rows:
+            self._add_row(row)
+        self._source = rows
+        logger.info(f"🏷️ بناء قوائم أفضل العروض: {len(self._groups)} مجموعة")
+
+    def ensure_loaded(self) -> bool:
+        loaded = self.store.ensure_loaded()
+        with self._lock:
+            self._sync()
+        return loaded
+
+    def on_property_changes(self, changes):
+        """مستمع تغييرات المخزن: تحديث المجموعات المتأثرة فقط"""
+        with self._lock:
+            if self._source is None or self._source is self.store.rows():
+                # لم تُبنَ بعد، أو بُنيت من اللقطة الجديدة قبل وصول الإشعار
+                return
+            for old, new in changes:
+                if old is not None:
+                    self._remove_row(old)
+                if new is not None:
+                    self._add_row(new)
+            self._source = self.store.rows()
+
+    def _ranked(self, key: GroupKey, limit: int) -> List[Dict[str, Any]]:
+        """أفضل العروض في مجموعة واحدة (أقل من متوسط الحي فقط) مع حقول المقارنة"""
+        group = self._groups.get(key)
+        if group is None:
+            return []
+        if group.dirty:
+            group.refill(self.top_n)
+
+        avg = group.avg_price_per_m2
+        results = []
+        for neg_ppm, property_id in sorted(group.top, key=lambda item: (-item[0], item[1]))[:limit]:
+            ppm = -neg_ppm
+            if ppm >= avg:
+                break
+            results.append({
+                **group.members[property_id][1],
+                'id': property_id,
+                'price_per_m2': round(ppm, 2),
+                'avg_price_per_m2': round(avg, 2),
+                'district_properties_count': len(group.members),
+                'discount_pct': round((avg - ppm) / avg * 100, 2),
+                'savings_per_m2': round(avg - ppm, 2),
+            })
+        return results
+
+    def best_value(self, district: str, purpose: str, property_type: Optional[str] = None,
+                   limit: int = 5) -> List[Dict[str, Any]]:
+        """
+        أفضل العروض في حي (لكل الأنواع إذا لم يُحدد النوع)
+
+        بدون نوع تُدمج قوائم الأنواع حسب نسبة الخصم؛ أفضل N في الحي لا بد أن
+        تكون ضمن أفضل N في نوعها
+        """
+        limit = max(1, min(limit, self.top_n))
+        with self._lock:
+            self._sync()
+            if property_type is not None:
+                return self._ranked((district, purpose, property_type), limit)
+            merged = []
+            for property_type in self._types.get((district, purpose), ()):
+                merged.extend(self._ranked((district, purpose, property_type), limit))
+        merged.sort(key=lambda r: (-r['discount_pct'], str(r.get('id'))))
+        return merged[:limit]
+
+    def best_value_batch(self, districts: List[str], purpose: str, property_type: Optional[str] = None,
+                         limit: int = 5) -> Dict[str, List[Dict[str, Any]]]:
+        """أفضل العروض لعدة أحياء في طلب واحد"""
+        return {district: self.best_value(district, purpose, property_type, limit) for district in districts}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'groups': len(self._groups),
+                'dirty_groups': sum(1 for g in self._groups.values() if g.dirty),
+                'top_n': self.top_n,
+            }
+
+
+# إنشاء instance واحد لكل worker
+best_value_index = BestValueIndex(property_store, top_n=settings.BEST_VALUE_TOP_N)
+
+property_store.subscribe(best_value_index.on_property_changes)
@@ -0,0 +1,292 @@
+"""
+إعادة حساب embeddings العقارات دفعة واحدة (Resumable Bulk Embedding)
+
+البحث الهجين يعتمد على وجود متجه لكل عقار، وهذه الأداة تبنيها:
+
+- تمر على جدول properties بصفحات مرتبة حسب id (keyset: id > آخر id) بدلاً
+  من OFFSET، فالصفحة التالية لا تتأثر بإضافة عقارات أثناء التشغيل
+- نص الـ embedding من العنوان + النوع والحي + الوصف
+- بصمة النص (مع اسم الخلفية) تُحفظ في embedding_text_hash، والعقار الذي لم
+  يتغير نصه يُتخطى
+- الترميز بدفعات كبيرة، والكتابة بـ UPDATE جماعي (دالة update_property_embeddings)
+  في خيط آخر أثناء ترميز الصفحة التالية؛ العقار المحذوف بين القراءة والكتابة
+  يُتخطى ولا يُعاد إنشاؤه
+- نقطة استئناف (checkpoint) تُحفظ بعد كتابة كل صفحة، فالتشغيل المنقطع يكمل
+  من آخر صفحة مكتملة
+
+الاستخدام:
+    python bulk_embedding.py                     # يكمل من آخر checkpoint
+    python bulk_embedding.py --restart --force   # إعادة حساب كل العقارات
+"""
+from config import settings
+from embedding_backends import create_backend, backend_key
+from vector_codec import FLOAT32, PRECISIONS, reduce_precision
+from postgrest.exceptions import APIError
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, Any, List, Optional
+import numpy as np
+import hashlib
+import json
+import os
+import re
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+SOURCE_COLUMNS = 'id, title, description, district, property_type, embedding_text_hash'
+HASH_COLUMN = 'embedding_text_hash'
+CHECKPOINT_VERSION = 1
+
+
+def build_embedding_text(row: Dict[str, Any], max_chars: int = 2000) -> str:
+    """نص الـ embedding للعقار: العنوان، ثم النوع والحي، ثم الوصف"""
+    location = " - ".join(str(v).strip() for v in (row.get('property_type'), row.get('district')) if v)
+    parts = [row.get("title"), location, row.get("description")]
+    text = "\n".join(str(p).strip() for p in parts if p and str(p).strip())
+    return re.sub(r'[ \t]+', ' ', text)[:max_chars]
+
+
+def text_hash(text: str, key: str) -> str:
+    """بصمة النص مع الخلفية (تغيير الموديل يعيد حساب كل المتجهات)"""
+    return hashlib.sha256(f"{key}\n{text}".encode('utf-8')).hexdigest()[:32]
+
+
+def format_pgvector(vector: np.ndarray, precision: str = FLOAT32) -> str:
+    """متجه بصيغة pgvector النصية ('[0.1,0.2,...]') بالدقة المطلوبة (float32 بدون فقد)"""
+    if precision == FLOAT32:
+        return '[' + ','.join(f'{v:.9g}' for v in np.asarray(vector, dtype=np.float32)) + ']'
+    return '[' + ','.join(map(str, reduce_precision(vector, precision))) + ']'
+
+
+class SupabasePropertyTable:
+    """القراءة والكتابة على جدول properties في Supabase"""
+
+    def __init__(self, table: str = 'properties'):
+        from database import db
+        self.client = db.client
+        self.table = table
+        self._bulk_update = True
+
+    def fetch_page(self, after_id: Optional[str], limit: int) -> List[Dict[str, Any]]:
+        query = self.client.table(self.table).select(SOURCE_COLUMNS).order('id').limit(limit)
+        if after_id is not None:
+            query = query.gt('id', after_id)
+        return query.execute().data or []
+
+    def write(self, rows: List[Dict[str, Any]]) -> int:
+        """
+        تحديث جماعي لأعمدة المتجه والبصمة فقط (UPDATE وليس upsert)
+
+        Returns:
+            عدد الصفوف المحدَّثة (أقل من المرسل إذا حُذفت عقارات بعد قراءتها)
+        """
+        if not rows:
+            return 0
+        if self._bulk_update:
+            try:
+                result = self.client.rpc('update_property_embeddings', {'p_rows': rows}).execute()
+                return int(result.data or 0)
+            except APIError as e:
+                # الدالة غير موجودة بعد (migration لم يُطبق): تحديث صف بصف
+                logger.warning(f"⚠️ update_property_embeddings غير متاحة، التحديث صفاً صفاً: {e}")
+                self._bulk_update = False
+        updated = 0
+        for row in rows:
+            values = {name: value for name, value in row.items() if name != 'id'}
+            result = self.client.table(self.table).update(values).eq('id', row['id']).execute()
+            updated += len(result.data or [])
+        return updated
+
+
+class Checkpoint:
+    """نقطة الاستئناف في ملف JSON (تُكتب بملف مؤقت ثم rename حتى لا تتلف عند الانقطاع)"""
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        if not self.path or not os.path.exists(self.path):
+            return None
+        with open(self.path, encoding='utf-8') as f:
+            state = json.load(f)
+        return state if state.get('version') == CHECKPOINT_VERSION else None
+
+    def save(self, state: Dict[str, Any]):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        temporary = f"{self.path}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(dict(state, version=CHECKPOINT_VERSION), f, ensure_ascii=False, indent=2)
+        os.replace(temporary, self.path)
+
+
+class BulkEmbedder:
+    """خط ترميز العقارات: قراءة صفحة ← تخطي غير المتغير ← ترميز ← تحديث ← checkpoint"""
+
+    def __init__(self, table, model, key: str, checkpoint_path: Optional[str] = None, page_size: int = 500,
+                 batch_size: int = 64, force: bool = False, precision: str = FLOAT32):
+        """
+        Args:
+            table: مصدر الصفوف ووجهة الكتابة (fetch_page / write)
+            model: أي كائن بواجهة SentenceTransformer.encode
+            key: اسم الخلفية (جزء من البصمة)
+            checkpoint_path: ملف نقطة الاستئناف (None = بدون استئناف)
+            page_size: عدد الصفوف في كل صفحة قراءة/كتابة
+            batch_size: حجم دفعة الترميز
+            force: إعادة الترميز حتى لو لم يتغير النص
+            precision: دقة نص المتجه المرسل (float16 = حمولة الكتابة أصغر بحوالي 2.5 مرة)
+        """
+        self.table = table
+        self.model = model
+        self.key = key
+        self.checkpoint = Checkpoint(checkpoint_path)
+        self.page_size = page_size
+        self.batch_size = batch_size
+        self.force = force
+        self.precision = precision
+
+    def _pending(self, rows: List[Dict[str, Any]]) -> List[tuple]:
+        """الصفوف التي تحتاج ترميزاً (مع نصها وبصمتها)"""
+        pending = []
+        for row in rows:
+            text = build_embedding_text(row)
+            if not text:
+                continue
+            digest = text_hash(text, self.key)
+            if self.force or row.get(HASH_COLUMN) != digest:
+                pending.append((row['id'], text, digest))
+        return pending
+
+    def _encode(self, pending: List[tuple]) -> List[Dict[str, Any]]:
+        vectors = np.asarray(self.model.encode([text for _, text, _ in pending], batch_size=self.batch_size,
+                                               normalize_embeddings=True))
+        return [{'id': row_id, 'embedding': format_pgvector(vector, self.precision), HASH_COLUMN: digest}
+                for (row_id, _, digest), vector in zip(pending, vectors)]
+
+    def run(self, restart: bool = False, max_pages: Optional[int] = None) -> Dict[str, Any]:
+        """
+        تشغيل الخط حتى نهاية الجدول (أو max_pages صفحة)
+
+        Returns:
+            ملخص: الصفوف الممسوحة/المرمَّزة/المتخطاة، الزمن، rows/s
+        """
+        state = None if restart else self.checkpoint.load()
+        if state and state.get('key') != self.key:
+            logger.warning(f"⚠️ نقطة الاستئناف لخلفية أخرى ({state.get('key')})، البدء من جديد")
+            state = None
+        if state and state.get('done'):
+            state = None
+        state = state or {'key': self.key, 'last_id': None, 'scanned': 0, 'embedded': 0, 'skipped': 0,
+                          'encode_seconds': 0.0, 'elapsed_seconds': 0.0}
+        resumed_from = state['last_id']
+        if resumed_from is not None:
+            logger.info(f"⏩ استئناف بعد id={resumed_from} ({state['scanned']} صف ممسوح سابقاً)")
+
+        started = time.perf_counter()
+        base_elapsed = state['elapsed_seconds']
+        session = {'scanned': 0, 'embedded': 0, 'encode_seconds': 0.0}
+        pages = 0
+        exhausted = False
+        writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bulk-embedding-writer")
+        pending_write: Optional[Future] = None
+        pending_state: Optional[Dict[str, Any]] = None
+        pending_records = 0
+
+        def commit():
+            # الكتابة السابقة اكتملت: الآن فقط تتقدم نقطة الاستئناف
+            if pending_write is not None:
+                written, expected = pending_write.result(), pending_records
+                if written is not None and written < expected:
+                    logger.warning(f"⚠️ {expected - written} عقار حُذف قبل كتابة متجهه (تم تخطيه)")
+                self.checkpoint.save(pending_state)
+
+        try:
+            after_id = state['last_id']
+            while max_pages is None or pages < max_pages:
+                rows = self.table.fetch_page(after_id, self.page_size)
+                if not rows:
+                    exhausted = True
+                    break
+                pages += 1
+                pending = self._pending(rows)
+                encode_started = time.perf_counter()
+                records = self._encode(pending) if pending else []
+                encode_seconds = time.perf_counter() - encode_started
+
+                after_id = rows[-1]['id']
+                state = dict(state, last_id=after_id, scanned=state['scanned'] + len(rows),
+                             embedded=state['embedded'] + len(records),
+                             skipped=state['skipped'] + len(rows) - len(records),
+                             encode_seconds=state['encode_seconds'] + encode_seconds,
+                             elapsed_seconds=base_elapsed + time.perf_counter() - started)
+                session['scanned'] += len(rows)
+                session['embedded'] += len(records)
+                session['encode_seconds'] += encode_seconds
+
+                commit()
+                pending_write, pending_state = writer.submit(self.table.write, records), state
+                pending_records = len(records)
+                rate = session['embedded'] / max(time.perf_counter() - started, 1e-9)
+                logger.info(f"📦 صفحة {pages}: {len(records)}/{len(rows)} مرمَّز، "
+                            f"المجموع {state['scanned']} ممسوح ({rate:.1f} rows/s)")
+                if len(rows) < self.page_size:
+                    exhausted = True
+                    break
+            commit()
+            pending_write = None
+            state = dict(state, done=exhausted, elapsed_seconds=base_elapsed + time.perf_counter() - started)
+            self.checkpoint.save(state)
+        finally:
+            writer.shutdown(wait=True)
+
+        elapsed = time.perf_counter() - started
+        return {
+            'key': self.key,
+            'done': state.get('done', False),
+            'resumed_from': resumed_from,
+            'pages': pages,
+            'scanned': state['scanned'],
+            'embedded': state['embedded'],
+            'skipped': state['skipped'],
+            'session_scanned': session['scanned'],
+            'session_embedded': session['embedded'],
+            'elapsed_seconds': round(elapsed, 2),
+            # معدل الترميز الفعلي (للتخطيط لإعادة ترميز كاملة) ومعدل المسح الكلي
+            'embedded_rows_per_second': round(session['embedded'] / session['encode_seconds'], 1)
+            if session['encode_seconds'] else 0.0,
+            'rows_per_second': round(session['scanned'] / elapsed, 1) if elapsed else 0.0,
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="إعادة حساب embeddings العقارات مع الاستئناف")
+    parser.add_argument("--checkpoint", default="data/bulk_embedding_checkpoint.json")
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--backend", default=None, help="sentence_transformers / onnx / sidecar")
+    parser.add_argument("--max-seq-length", type=int, default=512,
+                        help="الأوصاف أطول من رسائل المحادثة (الافتراضي 64 للطلبات)")
+    parser.add_argument("--max-pages", type=int, default=None)
+    parser.add_argument("--precision", default=FLOAT32, choices=PRECISIONS,
+                        help="دقة المتجه المكتوب (العمود يبقى vector(1024))")
+    parser.add_argument("--force", action="store_true", help="إعادة الترميز حتى لو لم يتغير النص")
+    parser.add_argument("--restart", action="store_true", help="تجاهل نقطة الاستئناف")
+    args = parser.parse_args()
+
+    backend = args.backend or settings.EMBEDDING_BACKEND
+    if backend == "onnx":
+        settings.EMBEDDING_MAX_SEQ_LENGTH = args.max_seq_length
+    model = create_backend(backend)
+    if hasattr(model, "max_seq_length") and backend == "sentence_transformers":
+        model.max_seq_length = args.max_seq_length
+
+    summary = BulkEmbedder(SupabasePropertyTable(), model, backend_key(backend), args.checkpoint,
+                           page_size=args.page_size, batch_size=args.batch_size, force=args.force,
+                           precision=args.precision) \
+        .run(restart=args.restart, max_pages=args.max_pages)
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
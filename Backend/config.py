@@ -27,10 +27,119 @@ class Settings(BaseSettings):
     HYBRID_SEARCH_LIMIT: int = 500
     VECTOR_SIMILARITY_THRESHOLD: float = 0.7
     
-    # أوزان البحث الهجين
-    # مااستخدمتها استخدمت دايركت بالكود الاساسي 
-    SQL_WEIGHT: float = 0.7
-    VECTOR_WEIGHT: float = 0.3
+    # ترتيب طبقة المشابه (ranking.py): أوزان الإشارات، تُطبَّع على المتاح منها لكل عقار
+    # (حلّت محل SQL_WEIGHT/VECTOR_WEIGHT: وزن التشابه الدلالي هو RANK_VECTOR_WEIGHT،
+    # وحصة الفلاتر موزعة على باقي الإشارات)
+    RANK_VECTOR_WEIGHT: float = 0.35  # التشابه الدلالي
+    RANK_PRICE_WEIGHT: float = 0.2  # القرب من نطاق السعر
+    RANK_GEO_WEIGHT: float = 0.15  # القرب من الجامعة/المسجد/مركز الحي
+    RANK_FIT_WEIGHT: float = 0.1  # الغرف والمساحة
+    RANK_SERVICE_WEIGHT: float = 0.15  # زمن الوصول للخدمات المطلوبة
+    RANK_DISTRICT_WEIGHT: float = 0.05  # نفس الحي المطلوب
+    RANK_RANGE_TOLERANCE: float = 0.5  # تجاوز حد النطاق بهذه النسبة = درجة 0
+    RANK_GEO_SCALE_KM: float = 5.0
+    RANK_SERVICE_TOLERANCE_MINUTES: float = 5.0  # نفس تسامح فلترة المشابه
+    
+    # إعدادات فهرس الخدمات داخل الذاكرة (مدارس/مساجد/جامعات)
+    POI_INDEX_ENABLED: bool = True
+    POI_INDEX_REFRESH_SECONDS: int = 3600  # إعادة تحميل الجداول كل ساعة
+    POI_INDEX_CELL_DEGREES: float = 0.01  # حجم خلية الشبكة (~1.1 كم)
+    
+    # مخزن العقارات العمودي داخل الذاكرة لمسار البحث المطابق (اختياري)
+    PROPERTY_STORE_ENABLED: bool = False
+    PROPERTY_STORE_POLL_SECONDS: int = 60  # سحب الصفوف المعدّلة حسب updated_at
+    PROPERTY_STORE_FULL_RELOAD_SECONDS: int = 3600  # إعادة تحميل كاملة لالتقاط الحذف
+    PROPERTY_STORE_UPDATED_AT_COLUMN: str = "updated_at"
+    
+    # فهرس المتجهات المحلي (IVF) بديل RPC search_properties_hybrid (اختياري)
+    VECTOR_INDEX_ENABLED: bool = False
+    VECTOR_INDEX_NPROBE: int = 8  # عدد القوائم المفحوصة لكل استعلام (دقة مقابل سرعة)
+    VECTOR_INDEX_REFRESH_SECONDS: int = 3600
+    VECTOR_INDEX_GEO_WEIGHT: float = 0.2  # أقصى خصم من التشابه للعقارات البعيدة
+    VECTOR_INDEX_GEO_SCALE_KM: float = 10.0  # المسافة التي يصل عندها الخصم لأقصاه
+    VECTOR_INDEX_PRECISION: str = "float32"  # float32 / float16 / int8 (benchmark_vector_codec.py)
+    VECTOR_INDEX_DIMENSIONS: Optional[int] = None  # قص الأبعاد (None = 1024 كاملة)
+    
+    # دليل أسماء الجامعات/المساجد/الأحياء داخل الذاكرة (بديل ILIKE والمطابقة الحرفية)
+    GAZETTEER_ENABLED: bool = True
+    GAZETTEER_REFRESH_SECONDS: int = 3600
+    GAZETTEER_CANDIDATES: int = 10  # مرشحو الثلاثيات الذين يُعاد ترتيبهم
+    GAZETTEER_DISTRICT_THRESHOLD: float = 0.75  # أقل درجة لاستبدال اسم الحي بالاسم الرسمي
+    
+    # محلل القواعد السريع قبل النموذج اللغوي (الطلبات المتكررة بدون رحلة OpenAI)
+    RULE_PARSER_ENABLED: bool = True
+    RULE_PARSER_MIN_CONFIDENCE: float = 0.9  # نسبة الكلمات المفهومة اللازمة لتخطي النموذج
+    
+    # فهرس BM25 النصي على العنوان والوصف، يُدمج مع البحث المتجهي (اختياري)
+    LEXICAL_INDEX_ENABLED: bool = False
+    LEXICAL_INDEX_REFRESH_SECONDS: int = 3600
+    LEXICAL_BM25_K1: float = 1.2
+    LEXICAL_BM25_B: float = 0.75
+    LEXICAL_TITLE_WEIGHT: int = 2  # تكرار كلمة العنوان يُحسب مرتين
+    LEXICAL_RRF_K: int = 60  # ثابت Reciprocal Rank Fusion
+    
+    # زمن التنقل على شبكة الطرق من ملف OSM محلي (بديل تحويل الدقائق بسرعة ثابتة)
+    TRAVEL_TIME_ENABLED: bool = False
+    TRAVEL_TIME_NETWORK_PATH: str = "data/riyadh_roads.npz"  # .npz أو .osm / .osm.gz
+    TRAVEL_TIME_GRID_METERS: float = 200.0  # حجم خلية الشبكة المكانية
+    TRAVEL_TIME_MAX_SNAP_METERS: float = 500.0  # أبعد مسافة لربط نقطة بأقرب طريق
+    TRAVEL_TIME_CACHE_SIZE: int = 64  # نتائج Dijkstra المحفوظة (أنواع الخدمات + المواقع)
+    
+    # ترقيم صفحات البحث بالمؤشر
+    SEARCH_PAGE_SIZE: int = 30  # عدد العقارات في الصفحة الافتراضية
+    SEARCH_MAX_PAGE_SIZE: int = 100
+    SIMILAR_MATCH_COUNT: int = 100  # عدد المرشحين من البحث المتجهي (طبقة المشابه)
+    SEARCH_STREAM_BATCH_SIZE: int = 10  # حجم دفعات المشابه في البحث المتدفق
+    
+    # ذاكرة نتائج البحث المؤقتة (LRU + TTL، تُحذف عند تغيّر العقارات)
+    SEARCH_CACHE_ENABLED: bool = True
+    SEARCH_CACHE_MAX_ENTRIES: int = 1024
+    SEARCH_CACHE_TTL_SECONDS: int = 300
+    
+    # خلفية توليد الـ embeddings: sentence_transformers (fp32، المرجع) أو onnx
+    # أو sidecar (عملية واحدة تحمل الموديل لكل الـ workers عبر UNIX socket)
+    EMBEDDING_BACKEND: str = "sentence_transformers"
+    EMBEDDING_ONNX_PATH: str = "models/bge-m3-onnx"  # ناتج: python embedding_backends.py export
+    EMBEDDING_ONNX_QUANTIZED: bool = True  # int8 ديناميكي بدلاً من fp32
+    EMBEDDING_MAX_SEQ_LENGTH: int = 64  # رسائل المحادثة قصيرة
+    EMBEDDING_ONNX_THREADS: int = 0  # 0 = افتراضي onnxruntime
+    EMBEDDING_QUERY_PRECISION: str = "float32"  # float16/int8 = حمولة RPC أصغر لمتجه الطلب
+    EMBEDDING_SIDECAR_SOCKET: str = "/tmp/map-ui-craft-embedding.sock"
+    EMBEDDING_SIDECAR_BACKEND: str = "sentence_transformers"  # الخلفية داخل العملية المشتركة
+    EMBEDDING_SIDECAR_AUTOSTART: bool = True  # gunicorn يشغّل العملية قبل الـ workers
+    EMBEDDING_SIDECAR_STARTUP_SECONDS: float = 180.0  # انتظار تحميل الموديل
+    EMBEDDING_SIDECAR_CHECK_SECONDS: float = 2.0  # فحص العملية وإعادة تشغيلها إذا توقفت
+    
+    # تجميع طلبات الـ embedding المتزامنة في دفعات
+    EMBEDDING_BATCHING_ENABLED: bool = True
+    EMBEDDING_BATCH_MAX_SIZE: int = 32
+    EMBEDDING_BATCH_MAX_WAIT_MS: float = 2.0  # انتظار اكتمال الدفعة بعد أول طلب
+    EMBEDDING_QUEUE_MAX_DEPTH: int = 256  # بعدها يُرفض الطلب (ضغط عكسي)
+    EMBEDDING_REQUEST_TIMEOUT_SECONDS: float = 10.0
+    
+    # ذاكرة متجهات نصوص البحث (LRU + ملف mmap اختياري مشترك بين workers)
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 2048
+    EMBEDDING_CACHE_DISK_PATH: Optional[str] = None  # مثال: "data/query_embeddings.bin"
+    EMBEDDING_CACHE_DISK_SLOTS: int = 16384  # ~64MB لمتجهات 1024 بُعد
+    
+    # تجميع علامات الخريطة على الخادم
+    MAP_CLUSTER_CELLS_PER_TILE: int = 4  # خلايا لكل ضلع بلاطة 256px (خلية ~64px)
+    MAP_CLUSTER_MAX_POINTS: int = 5000  # أقصى عدد عقارات يُجمّع لكل معايير
+    
+    # الخرائط الحرارية المحسوبة مسبقاً (تُبنى من مخزن العقارات وتُحدّث تدريجياً)
+    HEATMAP_CELLS_PER_TILE: int = 8  # خلايا لكل ضلع بلاطة 256px (خلية ~32px)
+    HEATMAP_MAX_ZOOM: int = 18
+    
+    # قوائم أفضل العروض لكل حي (أرخص سعر متر مقارنة بمتوسط الحي)
+    BEST_VALUE_TOP_N: int = 20  # حجم القائمة المحفوظة لكل (حي، غرض، نوع)
+    
+    # أحجام مجمّعات الخيوط للاستدعاءات المتزامنة (حتى لا تُوقف حلقة الأحداث)
+    LLM_POOL_SIZE: int = 16  # استدعاءات OpenAI (انتظار شبكة)
+    SEARCH_POOL_SIZE: int = 8  # تنفيذ محرك البحث
+    EMBEDDING_POOL_SIZE: int = 1  # الموديل يستهلك CPU، خيط واحد يكفي لكل worker
+    DB_POOL_SIZE: int = 16  # استعلامات Supabase المباشرة
+    STAGE_POOL_SIZE: int = 32  # مراحل البحث الهجين المتوازية (عدة مراحل لكل طلب)
     
     # إعدادات التطبيق
     APP_NAME: str = "المساعد العقاري الذكي"
@@ -3,11 +3,24 @@
 """
 from supabase import create_client, Client
 from config import settings
+from executors import executors
 from typing import Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
+# أعمدة العقار التي يعرضها الـ API (بدون embedding و search_text الثقيلين)
+PROPERTY_COLUMNS = (
+    'id, url, purpose, property_type, city, district, title, price_num, price_currency, '
+    'price_period, area_m2, description, image_url, lat, lon, final_lat, final_lon, '
+    'time_to_metro_min, rooms, baths, halls'
+)
+
+SCHOOL_COLUMNS = 'id, name, lat, lon, gender, levels_pg_array, primary_level, district'
+
+# أقصى عدد صفوف يرجعه PostgREST في استجابة واحدة (max-rows)
+POSTGREST_MAX_ROWS = 1000
+
 
 class Database:
     """مدير قاعدة البيانات (الغرض: إنشاء اتصال مع Supabase عند بدء التطبيق)"""
@@ -61,7 +74,7 @@ class Database:
             قائمة العقارات
         """
         try:
-            query = self.client.table('properties').select('*')
+            query = self.client.table('properties').select(PROPERTY_COLUMNS)
             
             # تطبيق الفلاتر
             for key, value in filters.items():
@@ -77,6 +90,38 @@ class Database:
             logger.error(f"خطأ في الحصول على العقارات: {e}")
             raise
     
+    def fetch_all(self, table: str, columns: str = '*', page_size: int = POSTGREST_MAX_ROWS,
+                  order_by: Optional[str] = None) -> list:
+        """
+        جلب جميع صفوف جدول على دفعات (PostgREST يحد كل استجابة بـ 1000 صف)
+        
+        Args:
+            table: اسم الجدول
+            columns: الأعمدة المطلوبة
+            page_size: حجم الدفعة
+            order_by: عمود ترتيب ثابت للتقسيم (اختياري)
+        
+        Returns:
+            قائمة جميع الصفوف
+        """
+        try:
+            rows = []
+            start = 0
+            while True:
+                query = self.client.table(table).select(columns)
+                if order_by:
+                    query = query.order(order_by)
+                result = query.range(start, start + page_size - 1).execute()
+                batch = result.data or []
+                rows.extend(batch)
+                if len(batch) < page_size:
+                    break
+                start += page_size
+            return rows
+        except Exception as e:
+            logger.error(f"خطأ في جلب جدول {table}: {e}")
+            raise
+    
     def get_property_by_id(self, property_id: str):
         """
         الحصول على عقار بواسطة ID
@@ -88,11 +133,36 @@ class Database:
             بيانات العقار
         """
         try:
-            result = self.client.table('properties').select('*').eq('id', property_id).execute()
+            result = self.client.table('properties').select(PROPERTY_COLUMNS).eq('id', property_id).execute()
             return result.data[0] if result.data else None
         except Exception as e:
             logger.error(f"خطأ في الحصول على العقار: {e}")
             raise
+
+    def get_properties_by_ids(self, property_ids: list) -> list:
+        """
+        جلب تفاصيل عدة عقارات دفعة واحدة (للعرض عند الطلب بعد وضع الخريطة)
+        
+        Returns:
+            العقارات بنفس ترتيب المعرفات المطلوبة (المفقود يُتجاهل)
+        """
+        if not property_ids:
+            return []
+        try:
+            result = self.client.table('properties').select(PROPERTY_COLUMNS).in_('id', property_ids).execute()
+            by_id = {str(row['id']): row for row in result.data or []}
+            return [by_id[str(pid)] for pid in property_ids if str(pid) in by_id]
+        except Exception as e:
+            logger.error(f"خطأ في جلب تفاصيل العقارات: {e}")
+            raise
+
+    async def get_properties_by_ids_async(self, property_ids: list) -> list:
+        """نسخة غير حاجبة من get_properties_by_ids (تعمل في مجمّع db)"""
+        return await executors.run("db", self.get_properties_by_ids, property_ids)
+
+    async def get_property_by_id_async(self, property_id: str):
+        """نسخة غير حاجبة من get_property_by_id (تعمل في مجمّع db)"""
+        return await executors.run("db", self.get_property_by_id, property_id)
     
     def get_schools_near_location(self, lat: float, lon: float, max_distance_km: float = 5, 
                                   gender: Optional[str] = None, levels: Optional[list] = None):
@@ -110,9 +180,17 @@ class Database:
             قائمة المدارس القريبة
         """
         try:
+            # استخدام فهرس الخدمات داخل الذاكرة إذا كان جاهزاً (بدون استعلام شبكي)
+            from poi_index import poi_index
+            if poi_index.ensure_loaded():
+                schools = []
+                for school, distance_m in poi_index.rows_within('schools', lat, lon, max_distance_km * 1000, gender):
+                    schools.append({**school, 'distance_km': distance_m / 1000.0})
+                return schools
+            
             # ملاحظة: يحتاج إلى دالة PostGIS لحساب المسافة
            
-            query = self.client.table('schools').select('*')
+            query = self.client.table('schools').select(SCHOOL_COLUMNS)
             
             if gender:
                 query = query.eq('gender', gender)
@@ -0,0 +1,289 @@
+"""
+خلفيات توليد الـ embeddings (Inference Backends)
+
+- sentence_transformers: BGE-m3 بدقة fp32 (المرجع)
+- sidecar: عميل لعملية embedding مشتركة بين الـ workers (embedding_sidecar.py)
+- onnx: نفس الموديل مصدَّراً إلى ONNX ومكمَّماً ديناميكياً إلى int8، مع طول
+  تسلسل قصير يناسب رسائل المحادثة. يعمل بـ onnxruntime فقط (بدون torch)
+  فيقل زمن الطلب واستهلاك الذاكرة لكل worker
+
+كل خلفية تقدم نفس واجهة SentenceTransformer.encode(texts, normalize_embeddings)
+حتى يبقى EmbeddingGenerator كما هو.
+
+التصدير والقياس من سطر الأوامر:
+    python embedding_backends.py export --out models/bge-m3-onnx
+    python embedding_backends.py benchmark --onnx models/bge-m3-onnx
+"""
+from config import settings
+from typing import Dict, Any, List, Optional, Union, Sequence
+import numpy as np
+import json
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+SENTENCE_TRANSFORMERS = "sentence_transformers"
+ONNX = "onnx"
+# عميل لعملية embedding مشتركة (embedding_sidecar.py) بدلاً من موديل داخل الـ worker
+SIDECAR = "sidecar"
+
+METADATA_FILE = "embedding_backend.json"
+FP32_FILE = "model.onnx"
+INT8_FILE = "model.int8.onnx"
+
+# جمل قصيرة تشبه طلبات المحادثة (للقياس والتحقق من التطابق)
+SAMPLE_QUERIES = [
+    "ابي شقة للايجار في النرجس ٣ غرف",
+    "فيلا للبيع في الملقا قريبة من مسجد",
+    "شقة عوائل قريبة من جامعة الملك سعود",
+    "دوبلكس حديث بمدخل خاص في الياسمين",
+    "ارض سكنية للبيع شمال الرياض",
+    "شقة مؤثثة للايجار الشهري قريب من مدارس",
+    "عمارة للبيع في حي العارض بسعر مليونين",
+    "بيت شعبي رخيص في السويدي",
+]
+
+
+def _as_list(texts: Union[str, Sequence[str]]) -> List[str]:
+    return [texts] if isinstance(texts, str) else list(texts)
+
+
+def _l2_normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class OnnxEmbeddingBackend:
+    """
+    موديل مصدَّر إلى ONNX (int8 افتراضياً)
+
+    المجلد يحتوي ملف الموديل والـ tokenizer وملف embedding_backend.json
+    (طريقة الـ pooling وطول التسلسل واسم الموديل الأصلي)
+    """
+
+    def __init__(self, model_dir: str, quantized: bool = True, max_seq_length: Optional[int] = None,
+                 threads: int = 0):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        with open(os.path.join(model_dir, METADATA_FILE), encoding="utf-8") as f:
+            self.metadata = json.load(f)
+        self.model_dir = model_dir
+        self.quantized = quantized
+        self.pooling = self.metadata.get("pooling", "cls")
+        self.max_seq_length = max_seq_length or self.metadata.get("max_seq_length", 64)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        path = os.path.join(model_dir, INT8_FILE if quantized else FP32_FILE)
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self._inputs = {i.name for i in self.session.get_inputs()}
+
+    @property
+    def name(self) -> str:
+        return f"onnx-{'int8' if self.quantized else 'fp32'}-{self.max_seq_length}"
+
+    def encode(self, texts: Union[str, Sequence[str]], normalize_embeddings: bool = True,
+               batch_size: int = 32, **kwargs) -> np.ndarray:
+        """نفس واجهة SentenceTransformer.encode (نص واحد = متجه واحد)"""
+        batch = _as_list(texts)
+        outputs = [self._encode_batch(batch[i:i + batch_size]) for i in range(0, len(batch), batch_size)]
+        vectors = np.vstack(outputs) if outputs else np.empty((0, 0), dtype=np.float32)
+        if normalize_embeddings:
+            vectors = _l2_normalize(vectors)
+        return vectors[0] if isinstance(texts, str) else vectors
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        tokens = self.tokenizer(texts, padding=True, truncation=True, max_length=self.max_seq_length,
+                                return_tensors="np")
+        feed = {name: tokens[name].astype(np.int64) for name in ("input_ids", "attention_mask")}
+        if "token_type_ids" in self._inputs:
+            feed["token_type_ids"] = tokens.get("token_type_ids", np.zeros_like(feed["input_ids"])).astype(np.int64)
+        hidden = self.session.run(None, feed)[0]
+        if self.pooling == "mean":
+            mask = feed["attention_mask"][:, :, None].astype(np.float32)
+            return (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        return hidden[:, 0]
+
+
+def export_onnx(model_name: str, out_dir: str, max_seq_length: int = 64, quantize: bool = True,
+                opset: int = 17) -> Dict[str, Any]:
+    """
+    تصدير موديل SentenceTransformer إلى ONNX وتكميمه ديناميكياً إلى int8
+
+    Args:
+        model_name: اسم الموديل أو مساره (مثل BAAI/bge-m3)
+        out_dir: مجلد الناتج
+        max_seq_length: أقصى طول تسلسل عند الاستدلال
+        quantize: إنشاء نسخة int8 بجانب fp32
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0]
+    pooling = "cls"
+    if len(model) > 1 and hasattr(model[1], "get_pooling_mode_str"):
+        pooling = model[1].get_pooling_mode_str()
+    if pooling not in ("cls", "mean"):
+        raise ValueError(f"طريقة pooling غير مدعومة: {pooling}")
+
+    os.makedirs(out_dir, exist_ok=True)
+    transformer.tokenizer.save_pretrained(out_dir)
+    auto_model = transformer.auto_model.eval()
+
+    class _Encoder(torch.nn.Module):
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, input_ids, attention_mask):
+            return self.inner(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+
+    sample = transformer.tokenizer(SAMPLE_QUERIES[:2], padding=True, return_tensors="pt")
+    fp32_path = os.path.join(out_dir, FP32_FILE)
+    started = time.perf_counter()
+    with torch.no_grad():
+        torch.onnx.export(
+            _Encoder(auto_model), (sample["input_ids"], sample["attention_mask"]), fp32_path,
+            input_names=["input_ids", "attention_mask"], output_names=["last_hidden_state"],
+            dynamic_axes={"input_ids": {0: "batch", 1: "sequence"},
+                          "attention_mask": {0: "batch", 1: "sequence"},
+                          "last_hidden_state": {0: "batch", 1: "sequence"}},
+            opset_version=opset, dynamo=False,
+        )
+    logger.info(f"📦 تصدير ONNX: {fp32_path} ({time.perf_counter() - started:.1f}s)")
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(fp32_path, os.path.join(out_dir, INT8_FILE), weight_type=QuantType.QInt8)
+
+    metadata = {"source_model": model_name, "pooling": pooling, "max_seq_length": max_seq_length,
+                "dimension": model.get_sentence_embedding_dimension(), "quantized": quantize}
+    with open(os.path.join(out_dir, METADATA_FILE), "w", encoding="utf-8") as f:
+        json.dump(metadata, f, ensure_ascii=False, indent=2)
+    metadata["sizes_mb"] = {name: round(os.path.getsize(os.path.join(out_dir, name)) / 2 ** 20, 1)
+                            for name in (FP32_FILE, INT8_FILE) if os.path.exists(os.path.join(out_dir, name))}
+    return metadata
+
+
+def create_backend(backend: Optional[str] = None, model_name: str = "BAAI/bge-m3"):
+    """إنشاء الخلفية المحددة في الإعدادات (EMBEDDING_BACKEND)"""
+    backend = backend or settings.EMBEDDING_BACKEND
+    if backend == ONNX:
+        return OnnxEmbeddingBackend(settings.EMBEDDING_ONNX_PATH, quantized=settings.EMBEDDING_ONNX_QUANTIZED,
+                                    max_seq_length=settings.EMBEDDING_MAX_SEQ_LENGTH,
+                                    threads=settings.EMBEDDING_ONNX_THREADS)
+    if backend == SENTENCE_TRANSFORMERS:
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name)
+    if backend == SIDECAR:
+        from embedding_sidecar import SidecarClient
+        return SidecarClient(settings.EMBEDDING_SIDECAR_SOCKET, timeout_seconds=settings.EMBEDDING_REQUEST_TIMEOUT_SECONDS)
+    raise ValueError(f"خلفية embedding غير معروفة: {backend}")
+
+
+def backend_key(backend: Optional[str] = None) -> str:
+    """
+    اسم الخلفية المحددة في الإعدادات (جزء من مفتاح ذاكرة المتجهات لأن متجهات
+    int8 أو التسلسل المقصوص تختلف قليلاً عن المرجع)
+    """
+    backend = backend or settings.EMBEDDING_BACKEND
+    if backend == SIDECAR:
+        # نفس متجهات الخلفية التي تشغّلها العملية المشتركة
+        return backend_key(settings.EMBEDDING_SIDECAR_BACKEND)
+    if backend == ONNX:
+        precision = 'int8' if settings.EMBEDDING_ONNX_QUANTIZED else 'fp32'
+        return f"{ONNX}-{precision}-{settings.EMBEDDING_MAX_SEQ_LENGTH}"
+    return backend
+
+
+def cosine_parity(reference: np.ndarray, candidate: np.ndarray) -> Dict[str, float]:
+    """تشابه جيب التمام بين متجهات المرجع والخلفية لكل نص"""
+    cos = np.sum(_l2_normalize(reference) * _l2_normalize(candidate), axis=1)
+    return {"min": float(cos.min()), "mean": float(cos.mean())}
+
+
+def _rss_mb() -> float:
+    """الذاكرة المقيمة الحالية للعملية"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def benchmark(factories: Dict[str, Any], queries: Sequence[str] = SAMPLE_QUERIES,
+              repeats: int = 5) -> Dict[str, Dict[str, Any]]:
+    """
+    قياس زمن الطلب الواحد والذاكرة والتطابق مع المرجع لكل خلفية
+
+    Args:
+        factories: اسم الخلفية -> دالة تنشئها (الأولى هي المرجع)
+        queries: نصوص القياس
+        repeats: عدد مرات تكرار كل نص
+    """
+    results: Dict[str, Dict[str, Any]] = {}
+    reference = None
+    for name, factory in factories.items():
+        before = _rss_mb()
+        started = time.perf_counter()
+        model = factory()
+        load_seconds = time.perf_counter() - started
+        loaded_mb = _rss_mb() - before
+
+        vectors = np.asarray(model.encode(list(queries), normalize_embeddings=True))
+        latencies = []
+        for _ in range(repeats):
+            for query in queries:
+                started = time.perf_counter()
+                model.encode(query, normalize_embeddings=True)
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        result = {"load_seconds": round(load_seconds, 2), "memory_mb": round(loaded_mb, 1),
+                  "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+                  "p95_ms": round(float(np.percentile(latencies, 95)), 2)}
+        if reference is None:
+            reference = vectors
+        else:
+            result["cosine"] = cosine_parity(reference, vectors)
+        results[name] = result
+        del model
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="تصدير BGE-m3 إلى ONNX وقياس الخلفيات")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_cmd = commands.add_parser("export")
+    export_cmd.add_argument("--model", default="BAAI/bge-m3")
+    export_cmd.add_argument("--out", default=settings.EMBEDDING_ONNX_PATH)
+    export_cmd.add_argument("--max-seq-length", type=int, default=settings.EMBEDDING_MAX_SEQ_LENGTH)
+    export_cmd.add_argument("--no-quantize", action="store_true")
+    bench_cmd = commands.add_parser("benchmark")
+    bench_cmd.add_argument("--model", default="BAAI/bge-m3")
+    bench_cmd.add_argument("--onnx", default=settings.EMBEDDING_ONNX_PATH)
+    bench_cmd.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        print(json.dumps(export_onnx(args.model, args.out, args.max_seq_length, not args.no_quantize),
+                         ensure_ascii=False, indent=2))
+    else:
+        from sentence_transformers import SentenceTransformer
+        factories = {
+            "fp32": lambda: SentenceTransformer(args.model, device="cpu"),
+            "onnx-fp32": lambda: OnnxEmbeddingBackend(args.onnx, quantized=False),
+        }
+        if os.path.exists(os.path.join(args.onnx, INT8_FILE)):
+            factories["onnx-int8"] = lambda: OnnxEmbeddingBackend(args.onnx, quantized=True)
+        print(json.dumps(benchmark(factories, repeats=args.repeats), ensure_ascii=False, indent=2))
@@ -0,0 +1,238 @@
+"""
+تجميع طلبات الـ embedding المتزامنة في دفعات (Dynamic Micro-Batching)
+
+كل بحث مشابه يولّد متجهاً لنص واحد، وتمرير نص واحد للموديل يضيّع قدرة المعالج
+على ضرب المصفوفات دفعة واحدة. هنا خيط واحد يجمع الطلبات المنتظرة حتى يمتلئ
+حجم الدفعة أو تنتهي مهلة قصيرة (بضع ملي ثوان) ثم يستدعي encode مرة واحدة
+ويعيد لكل طالب متجهه.
+
+- ضغط عكسي: عند امتلاء الطابور يُرفض الطلب فوراً (EmbeddingOverloaded) بدلاً
+  من تراكم الانتظار، والبحث يرجع للبحث الرقمي البديل
+- مهلة لكل طلب: الطلب الذي انتهت مهلته يُلغى ولا يدخل أي دفعة لاحقة
+- النصوص المكررة في نفس الدفعة تُحسب مرة واحدة
+
+منحنى الإنتاجية من سطر الأوامر:
+    python embedding_batcher.py --concurrency 8 32 128
+"""
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from collections import deque
+from typing import Dict, Any, List, Optional, Callable, Sequence
+import numpy as np
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingOverloaded(Exception):
+    """الطابور ممتلئ (ضغط عكسي)"""
+    pass
+
+
+class EmbeddingBatcher:
+    """طابور طلبات مع خيط واحد يستدعي encode على دفعات"""
+
+    def __init__(self, encode_batch: Callable[[List[str]], np.ndarray], max_batch_size: int = 32,
+                 max_wait_ms: float = 2.0, max_queue_depth: int = 256, timeout_seconds: float = 10.0,
+                 name: str = "embedding-batcher"):
+        """
+        Args:
+            encode_batch: دالة تحوّل قائمة نصوص إلى مصفوفة متجهات (صف لكل نص)
+            max_batch_size: أقصى عدد نصوص في الدفعة
+            max_wait_ms: أقصى انتظار لاكتمال الدفعة بعد وصول أول طلب
+            max_queue_depth: أقصى عدد طلبات منتظرة قبل الرفض
+            timeout_seconds: المهلة الافتراضية لكل طلب
+        """
+        self.encode_batch = encode_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue_depth = max_queue_depth
+        self.timeout_seconds = timeout_seconds
+        self.name = name
+        self._queue: "deque[tuple]" = deque()
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self._counters = {"requests": 0, "batches": 0, "encoded": 0, "deduplicated": 0,
+                          "rejected": 0, "timeouts": 0, "errors": 0, "max_batch": 0, "encode_seconds": 0.0}
+
+    def submit(self, text: str) -> Future:
+        """إضافة نص للطابور (يرفع EmbeddingOverloaded عند امتلائه)"""
+        future: Future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("مجمّع الدفعات مغلق")
+            if len(self._queue) >= self.max_queue_depth:
+                self._counters["rejected"] += 1
+                raise EmbeddingOverloaded(f"طابور embedding ممتلئ ({self.max_queue_depth})")
+            self._counters["requests"] += 1
+            self._queue.append((text, future))
+            self._ensure_worker()
+            self._condition.notify()
+        return future
+
+    def encode(self, text: str, timeout: Optional[float] = None) -> np.ndarray:
+        """
+        توليد متجه نص واحد والانتظار حتى تُحسب دفعته
+
+        Raises:
+            EmbeddingOverloaded: الطابور ممتلئ
+            TimeoutError: انتهت مهلة الطلب
+        """
+        future = self.submit(text)
+        try:
+            return future.result(timeout=self.timeout_seconds if timeout is None else timeout)
+        except FutureTimeout:
+            future.cancel()
+            with self._condition:
+                self._counters["timeouts"] += 1
+            raise TimeoutError(f"انتهت مهلة توليد الـ embedding ({self.timeout_seconds}s)")
+
+    def _ensure_worker(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def _next_batch(self) -> List[tuple]:
+        """أول طلب متاح ثم كل ما يصل حتى يمتلئ الحجم أو تنتهي المهلة"""
+        with self._condition:
+            while not self._queue and not self._closed:
+                self._condition.wait()
+            batch = []
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                if self._queue:
+                    text, future = self._queue.popleft()
+                    # الطلبات الملغاة (انتهت مهلتها) لا تدخل الدفعة
+                    if future.set_running_or_notify_cancel():
+                        batch.append((text, future))
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._closed:
+                    break
+                self._condition.wait(remaining)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                if self._closed:
+                    return
+                continue
+            self._process(batch)
+
+    def _process(self, batch: List[tuple]):
+        unique: Dict[str, int] = {}
+        for text, _ in batch:
+            unique.setdefault(text, len(unique))
+        texts = list(unique)
+        started = time.perf_counter()
+        try:
+            vectors = np.asarray(self.encode_batch(texts))
+            if vectors.ndim != 2 or len(vectors) != len(texts):
+                raise ValueError(f"encode أعاد شكلاً غير متوقع {vectors.shape} لـ {len(texts)} نص")
+        except Exception as e:
+            logger.error(f"❌ فشل توليد دفعة embedding ({len(texts)} نص): {e}")
+            with self._condition:
+                self._counters["errors"] += 1
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        elapsed = time.perf_counter() - started
+
+        with self._condition:
+            c = self._counters
+            c["batches"] += 1
+            c["encoded"] += len(texts)
+            c["deduplicated"] += len(batch) - len(texts)
+            c["max_batch"] = max(c["max_batch"], len(batch))
+            c["encode_seconds"] += elapsed
+        for text, future in batch:
+            future.set_result(vectors[unique[text]])
+
+    def close(self):
+        """إيقاف الخيط بعد إنهاء الطلبات المنتظرة"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            c = dict(self._counters)
+            depth = len(self._queue)
+        return {
+            "queue_depth": depth,
+            "max_queue_depth": self.max_queue_depth,
+            "requests": c["requests"],
+            "batches": c["batches"],
+            "avg_batch_size": round((c["encoded"] + c["deduplicated"]) / c["batches"], 2) if c["batches"] else 0.0,
+            "max_batch": c["max_batch"],
+            "deduplicated": c["deduplicated"],
+            "rejected": c["rejected"],
+            "timeouts": c["timeouts"],
+            "errors": c["errors"],
+            "avg_encode_ms": round(c["encode_seconds"] / c["batches"] * 1000, 2) if c["batches"] else 0.0,
+        }
+
+
+def throughput_curve(encode_batch: Callable[[List[str]], np.ndarray], texts: Sequence[str],
+                     concurrency: Sequence[int] = (8, 32, 128), requests_per_client: int = 4,
+                     **batcher_options) -> Dict[int, Dict[str, float]]:
+    """
+    مقارنة الإنتاجية (طلب/ثانية) بين التجميع والتنفيذ المتسلسل لكل مستوى تزامن
+
+    المتسلسل يحاكي الوضع السابق: خيط embedding واحد ونص واحد لكل استدعاء
+    """
+    curve: Dict[int, Dict[str, float]] = {}
+    for clients in concurrency:
+        lock = threading.Lock()
+
+        def serial(text: str):
+            with lock:
+                return encode_batch([text])[0]
+
+        batcher = EmbeddingBatcher(encode_batch, max_queue_depth=max(clients, 1) * 2, **batcher_options)
+        timings = {}
+        for mode, encode_one in (("serial", serial), ("batched", batcher.encode)):
+            def client(offset: int):
+                for i in range(requests_per_client):
+                    encode_one(texts[(offset * requests_per_client + i) % len(texts)])
+
+            threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            timings[mode] = clients * requests_per_client / (time.perf_counter() - started)
+        stats = batcher.stats()
+        batcher.close()
+        curve[clients] = {"serial_rps": round(timings["serial"], 1), "batched_rps": round(timings["batched"], 1),
+                          "speedup": round(timings["batched"] / timings["serial"], 2),
+                          "avg_batch_size": stats["avg_batch_size"]}
+    return curve
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    from embedding_backends import create_backend, SAMPLE_QUERIES
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="منحنى إنتاجية تجميع طلبات الـ embedding")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8, 32, 128])
+    parser.add_argument("--requests", type=int, default=4, help="طلبات لكل عميل")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--wait-ms", type=float, default=2.0)
+    args = parser.parse_args()
+
+    model = create_backend()
+    texts = [f"{query} {i}" for i in range(64) for query in SAMPLE_QUERIES]
+    curve = throughput_curve(lambda batch: model.encode(batch, normalize_embeddings=True), texts,
+                             args.concurrency, args.requests, max_batch_size=args.batch_size,
+                             max_wait_ms=args.wait_ms, timeout_seconds=600)
+    print(json.dumps(curve, ensure_ascii=False, indent=2))
@@ -0,0 +1,252 @@
+"""
+ذاكرة مؤقتة لمتجهات نصوص البحث (Query Embedding Cache)
+
+المفتاح هو النص بعد التطبيع العربي (الهمزات، التاء المربوطة، التشكيل،
+المسافات) عبر arabic_utils، فطلبان يختلفان في الشكل فقط يشتركان في نفس المتجه.
+
+طبقتان:
+- LRU داخل الذاكرة لكل worker
+- ملف على القرص (اختياري) بجدول hash ثابت الحجم يُقرأ عبر mmap: يبقى بعد إعادة
+  التشغيل ويشترك فيه كل workers الخاصة بـ gunicorn. كل خانة تحمل بصمة المفتاح
+  وCRC للمتجه؛ الكتابة تحت قفل ملف، والقراءة بدون قفل وتُرفض الخانة إذا لم
+  يطابق الـ CRC (كتابة متزامنة غير مكتملة = إخفاق عادي)
+"""
+from config import settings
+from arabic_utils import normalize_arabic_text
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+import numpy as np
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import logging
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # ويندوز: بدون قفل بين العمليات
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'EMBC0001'
+# magic، الأبعاد، عدد الخانات
+HEADER = struct.Struct('<8sII')
+HEADER_SIZE = 64
+DIGEST_SIZE = 16
+# بصمة المفتاح + CRC للمتجه + محجوز
+SLOT_HEADER = struct.Struct('<16sII')
+# أقصى عدد خانات يُفحص بعد خانة المفتاح (open addressing)
+MAX_PROBES = 8
+
+
+def normalize_query(text: str) -> str:
+    """تطبيع نص الطلب للمفتاح (عربي + مسافات موحّدة)"""
+    return normalize_arabic_text(text or '')
+
+
+def cache_digest(text: str, namespace: str = '') -> bytes:
+    """بصمة المفتاح: النص المطبَّع + اسم الموديل (متجهات موديلين لا تختلط)"""
+    payload = f"{namespace}\x00{normalize_query(text)}".encode('utf-8')
+    return hashlib.blake2b(payload, digest_size=DIGEST_SIZE).digest()
+
+
+class DiskEmbeddingTable:
+    """جدول hash ثابت الحجم على القرص، مفتوح بـ mmap ومشترك بين العمليات"""
+
+    def __init__(self, path: str, dim: int, slots: int):
+        self.path = path
+        self.dim = dim
+        self.slots = slots
+        self.slot_size = SLOT_HEADER.size + dim * 4
+        size = HEADER_SIZE + slots * self.slot_size
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            self._lock_file(fd)
+            try:
+                if os.fstat(fd).st_size == 0:
+                    os.ftruncate(fd, size)
+                    os.pwrite(fd, HEADER.pack(MAGIC, dim, slots), 0)
+                magic, file_dim, file_slots = HEADER.unpack(os.pread(fd, HEADER.size, 0))
+                if magic != MAGIC or file_dim != dim or file_slots != slots:
+                    raise ValueError(f"ملف ذاكرة المتجهات {path} بصيغة مختلفة "
+                                     f"(dim={file_dim}, slots={file_slots})")
+            finally:
+                self._unlock_file(fd)
+            self._map = mmap.mmap(fd, size)
+        except Exception:
+            os.close(fd)
+            raise
+        self._fd = fd
+
+    def _lock_file(self, fd: int):
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+
+    def _unlock_file(self, fd: int):
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def _offsets(self, digest: bytes):
+        start = int.from_bytes(digest[:8], 'little') % self.slots
+        for i in range(min(MAX_PROBES, self.slots)):
+            yield HEADER_SIZE + ((start + i) % self.slots) * self.slot_size
+
+    def get(self, digest: bytes) -> Optional[np.ndarray]:
+        for offset in self._offsets(digest):
+            slot_digest, crc, _ = SLOT_HEADER.unpack_from(self._map, offset)
+            if slot_digest == digest:
+                data = self._map[offset + SLOT_HEADER.size:offset + self.slot_size]
+                if zlib.crc32(data) != crc:
+                    return None
+                return np.frombuffer(data, dtype=np.float32).copy()
+            if slot_digest == bytes(DIGEST_SIZE):
+                return None
+        return None
+
+    def put(self, digest: bytes, vector: np.ndarray):
+        data = np.ascontiguousarray(vector, dtype=np.float32).tobytes()
+        self._lock_file(self._fd)
+        try:
+            # خانة المفتاح نفسه، أو أول خانة فارغة، وإلا نستبدل خانة البداية
+            offsets = list(self._offsets(digest))
+            target = offsets[0]
+            for offset in offsets:
+                slot_digest = self._map[offset:offset + DIGEST_SIZE]
+                if slot_digest == digest or slot_digest == bytes(DIGEST_SIZE):
+                    target = offset
+                    break
+            # إبطال الخانة أولاً حتى لا يقرأ أحد بصمة جديدة مع متجه قديم
+            self._map[target:target + DIGEST_SIZE] = bytes(DIGEST_SIZE)
+            self._map[target + SLOT_HEADER.size:target + self.slot_size] = data
+            SLOT_HEADER.pack_into(self._map, target, digest, zlib.crc32(data), 0)
+        finally:
+            self._unlock_file(self._fd)
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+
+class EmbeddingCache:
+    """LRU داخل الذاكرة + جدول القرص الاختياري، مع عدادات الإصابة والوقت الموفَّر"""
+
+    def __init__(self, max_entries: int = 2048, disk_path: Optional[str] = None,
+                 disk_slots: int = 16384, enabled: bool = True):
+        self.max_entries = max_entries
+        self.disk_path = disk_path
+        self.disk_slots = disk_slots
+        self.enabled = enabled
+        self._entries: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._disk: Optional[DiskEmbeddingTable] = None
+        self._disk_failed = False
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "compute_seconds": 0.0, "computed": 0}
+
+    def _disk_table(self, dim: int) -> Optional[DiskEmbeddingTable]:
+        """فتح ملف القرص عند أول متجه (الأبعاد تُعرف من الموديل)"""
+        if not self.disk_path or self._disk_failed:
+            return None
+        if self._disk is None:
+            try:
+                self._disk = DiskEmbeddingTable(self.disk_path, dim, self.disk_slots)
+                logger.info(f"💾 ذاكرة المتجهات على القرص: {self.disk_path} ({self.disk_slots} خانة)")
+            except Exception as e:
+                logger.error(f"❌ تعطيل ذاكرة المتجهات على القرص: {e}")
+                self._disk_failed = True
+                return None
+        return self._disk if self._disk.dim == dim else None
+
+    def _existing_disk_table(self) -> Optional[DiskEmbeddingTable]:
+        """فتح ملف القرص للقراءة إذا أنشأه worker آخر أو تشغيل سابق (الأبعاد من رأس الملف)"""
+        if self._disk is not None or not self.disk_path or self._disk_failed:
+            return self._disk
+        try:
+            with open(self.disk_path, 'rb') as f:
+                magic, dim, _ = HEADER.unpack(f.read(HEADER.size))
+        except (OSError, struct.error):
+            return None
+        # الملف غير موجود بعد أو worker آخر ما زال يكتب رأسه: نعيد المحاولة مع الطلب التالي
+        if magic != MAGIC:
+            return None
+        return self._disk_table(dim)
+
+    def get(self, text: str, namespace: str = '') -> Optional[List[float]]:
+        if not self.enabled:
+            return None
+        digest = cache_digest(text, namespace)
+        with self._lock:
+            vector = self._entries.get(digest)
+            if vector is not None:
+                self._entries.move_to_end(digest)
+                self._counters["memory_hits"] += 1
+                return vector.tolist()
+            disk = self._existing_disk_table()
+        vector = disk.get(digest) if disk is not None else None
+        with self._lock:
+            if vector is None:
+                self._counters["misses"] += 1
+                return None
+            self._counters["disk_hits"] += 1
+            self._remember(digest, vector)
+        return vector.tolist()
+
+    def put(self, text: str, embedding: List[float], namespace: str = '', compute_seconds: float = 0.0):
+        """حفظ متجه محسوب (compute_seconds = زمن توليده لحساب الوقت الموفَّر)"""
+        if not self.enabled or not embedding:
+            return
+        digest = cache_digest(text, namespace)
+        vector = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            self._remember(digest, vector)
+            self._counters["compute_seconds"] += compute_seconds
+            self._counters["computed"] += 1
+            disk = self._disk_table(vector.size)
+        if disk is not None:
+            try:
+                disk.put(digest, vector)
+            except Exception as e:
+                logger.error(f"❌ فشل حفظ المتجه على القرص: {e}")
+
+    def _remember(self, digest: bytes, vector: np.ndarray):
+        self._entries[digest] = vector
+        self._entries.move_to_end(digest)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            c = dict(self._counters)
+            entries = len(self._entries)
+        hits = c["memory_hits"] + c["disk_hits"]
+        lookups = hits + c["misses"]
+        avg_compute = c["compute_seconds"] / c["computed"] if c["computed"] else 0.0
+        return {
+            "entries": entries,
+            "memory_hits": c["memory_hits"],
+            "disk_hits": c["disk_hits"],
+            "misses": c["misses"],
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "avg_compute_ms": round(avg_compute * 1000, 1),
+            # كل إصابة وفّرت تقريباً متوسط زمن توليد متجه
+            "saved_seconds": round(hits * avg_compute, 3),
+            "disk_enabled": self._disk is not None,
+        }
+
+
+# إنشاء instance واحد لكل worker
+embedding_cache = EmbeddingCache(
+    max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES,
+    disk_path=settings.EMBEDDING_CACHE_DISK_PATH,
+    disk_slots=settings.EMBEDDING_CACHE_DISK_SLOTS,
+    enabled=settings.EMBEDDING_CACHE_ENABLED
+)
@@ -1,7 +1,17 @@
-from sentence_transformers import SentenceTransformer
+import asyncio
 import logging
+import threading
+import time
 import numpy as np
 
+from config import settings
+from executors import executors
+from embedding_batcher import EmbeddingBatcher
+from embedding_sidecar import SidecarClient, sidecar_health
+from embedding_cache import embedding_cache
+from embedding_backends import create_backend, backend_key, SIDECAR
+from vector_codec import reduce_precision, FLOAT32
+
 logger = logging.getLogger(__name__)
 
 class EmbeddingGenerator:
@@ -11,6 +21,11 @@ class EmbeddingGenerator:
     """
     _instance = None
     _model = None
+    _batcher = None
+    # مع التجميع تصل الطلبات من عدة خيوط: الموديل يُحمَّل مرة واحدة
+    _load_lock = threading.Lock()
+    # الاسم الرسمي للموديل
+    model_name = 'BAAI/bge-m3'
     
     def __new__(cls, *args, **kwargs):
         if cls._instance is None:
@@ -22,20 +37,75 @@ class EmbeddingGenerator:
         """
         تحميل الموديل عند أول استدعاء (Lazy Loading)
         """
-        if self._model is None:
-            logger.info("يتم تحميل موديل BGE-m3... (قد يستغرق بعض الوقت)")
+        if self._model is not None:
+            return
+        with self._load_lock:
+            if self._model is not None:
+                return
+            logger.info(f"يتم تحميل موديل BGE-m3 ({backend_key()})... (قد يستغرق بعض الوقت)")
             try:
-                # الاسم الرسمي للموديل
-                self._model = SentenceTransformer('BAAI/bge-m3')
+                # fp32 عبر sentence_transformers أو ONNX حسب EMBEDDING_BACKEND
+                self._model = create_backend(model_name=self.model_name)
                 logger.info("تم تحميل موديل BGE-m3 بنجاح.")
             except Exception as e:
                 logger.error(f"فشل تحميل موديل BGE-m3: {e}")
                 raise
 
+    def is_ready(self) -> bool:
+        """الموديل محمّل (عميل العملية المشتركة لا يحمل موديلاً فهو جاهز دائماً)"""
+        return self._model is not None or settings.EMBEDDING_BACKEND == SIDECAR
+
+    def load_in_background(self):
+        """بدء تحميل الموديل في خيط منفصل (مرة واحدة) بدلاً من حجز الطلب الحالي"""
+        if self._model is not None or self._load_lock.locked():
+            return
+
+        def load():
+            try:
+                self._load_model()
+            except Exception:
+                pass  # سُجّل الخطأ في _load_model، والطلب التالي يحاول من جديد
+
+        threading.Thread(target=load, name="embedding-warmup", daemon=True).start()
+
+    def _encode_batch(self, texts: list[str]) -> np.ndarray:
+        return self._model.encode(texts, normalize_embeddings=True)
+
+    def _get_batcher(self) -> EmbeddingBatcher:
+        """مجمّع الدفعات (يُنشأ عند أول استخدام)"""
+        if self._batcher is None:
+            with self._load_lock:
+                if self._batcher is None:
+                    self._batcher = EmbeddingBatcher(
+                        self._encode_batch,
+                        max_batch_size=settings.EMBEDDING_BATCH_MAX_SIZE,
+                        max_wait_ms=settings.EMBEDDING_BATCH_MAX_WAIT_MS,
+                        max_queue_depth=settings.EMBEDDING_QUEUE_MAX_DEPTH,
+                        timeout_seconds=settings.EMBEDDING_REQUEST_TIMEOUT_SECONDS
+                    )
+        return self._batcher
+
+    @property
+    def cache_namespace(self) -> str:
+        """الموديل + الخلفية جزء من مفتاح الذاكرة المؤقتة (متجهاتهما لا تختلط)"""
+        return f"{self.model_name}:{backend_key()}"
+
+    @staticmethod
+    def _reduce(embedding: list[float]) -> list[float]:
+        """دقة أقل لمتجه الطلب = حمولة RPC أصغر (float16 أقل من نصف حجم JSON)"""
+        if settings.EMBEDDING_QUERY_PRECISION == FLOAT32:
+            return embedding
+        return reduce_precision(embedding, settings.EMBEDDING_QUERY_PRECISION)
+
     def generate(self, text: str) -> list[float]:
         """
         توليد embedding لنص واحد
+        (من الذاكرة المؤقتة إذا سبق توليده لنفس النص بعد التطبيع)
         """
+        cached = embedding_cache.get(text, self.cache_namespace)
+        if cached is not None:
+            return self._reduce(cached)
+
         # تحميل الموديل إذا لم يتم تحميله
         self._load_model()
         
@@ -44,22 +114,60 @@ class EmbeddingGenerator:
             raise Exception("الموديل غير جاهز")
         
         try:
-            # توليد الـ embedding
-            embedding = self._model.encode(text, normalize_embeddings=True)
+            # توليد الـ embedding (ضمن دفعة مع الطلبات المتزامنة الأخرى إذا كان التجميع مفعّلاً)
+            started = time.perf_counter()
+            if settings.EMBEDDING_BATCHING_ENABLED:
+                embedding = self._get_batcher().encode(text)
+            else:
+                embedding = self._model.encode(text, normalize_embeddings=True)
             
             # التأكد أن المخرج هو list of floats
             if isinstance(embedding, np.ndarray):
-                return embedding.tolist()
-            elif isinstance(embedding, list):
-                return embedding
-            else:
+                embedding = embedding.tolist()
+            elif not isinstance(embedding, list):
                 logger.error(f"نوع الـ embedding غير متوقع: {type(embedding)}")
-                return list(map(float, embedding))
+                embedding = list(map(float, embedding))
+            
+            embedding_cache.put(text, embedding, self.cache_namespace, time.perf_counter() - started)
+            return self._reduce(embedding)
                 
         except Exception as e:
             logger.error(f"خطأ في توليد الـ embedding: {e}")
             return []
 
+    def generate_from_thread(self, text: str) -> list[float]:
+        """
+        توليد من خيط آخر (مثل مراحل البحث): مع التجميع يُستدعى generate مباشرة
+        لأن الطابور هو من يقيّد التزامن، وبدونه يُنفَّذ في مجمّع embedding
+        """
+        if settings.EMBEDDING_BATCHING_ENABLED:
+            return self.generate(text)
+        return executors.call("embedding", self.generate, text)
+
+    async def generate_async(self, text: str) -> list[float]:
+        """نسخة غير حاجبة من generate (تعمل في مجمّع embedding أو تنتظر دفعتها في خيط)"""
+        if settings.EMBEDDING_BATCHING_ENABLED:
+            return await asyncio.to_thread(self.generate, text)
+        return await executors.run("embedding", self.generate, text)
+
+    def stats(self) -> dict:
+        return {
+            "backend": backend_key(),
+            "loaded": self._model is not None,
+            "batching": self._batcher.stats() if self._batcher is not None else None,
+            # عميل العملية المشتركة (EMBEDDING_BACKEND=sidecar)
+            "sidecar": self._model.stats() if isinstance(self._model, SidecarClient) else None,
+        }
+
+    async def probe_sidecar(self) -> dict | None:
+        """
+        حياة العملية المشتركة (تُفحص حتى قبل أول طلب embedding)؛ الاتصال بالـ socket
+        حاجب فيُنفَّذ في مجمّع embedding وليس على الـ event loop
+        """
+        if settings.EMBEDDING_BACKEND != SIDECAR:
+            return None
+        return await executors.run("embedding", sidecar_health, settings.EMBEDDING_SIDECAR_SOCKET)
+
 # إنشاء instance عام ليتم استخدامه في المشروع
 # (سيتم تحميل الموديل عند أول استدعاء لـ generate)
 embedding_generator = EmbeddingGenerator()
@@ -0,0 +1,424 @@
+"""
+عملية embedding مشتركة لكل workers الخاصة بـ gunicorn (Embedding Sidecar)
+
+بدلاً من أن يحمّل كل worker نسخته من BGE-m3 (~2GB لكل نسخة)، تُحمِّل عملية
+محلية واحدة الموديل وتستقبل الطلبات عبر UNIX socket. كل worker يصبح عميلاً
+خفيفاً (EMBEDDING_BACKEND=sidecar) يقدم نفس واجهة encode، فإضافة worker تكلف
+ميغابايتات لا غيغابايتات.
+
+- البروتوكول: إطار لكل رسالة = طول 4 بايت + MessagePack
+    طلب:  {"op": "encode", "texts": [...]} أو {"op": "stats"}
+    رد:   {"ok": true, "shape": [n, dim], "data": <float32 bytes>}
+          {"ok": false, "error": "..."}
+- داخل العملية تمر النصوص على EmbeddingBatcher، فطلبات عدة workers في نفس
+  اللحظة تُحسب في دفعة واحدة
+- كل خيط في العميل يحتفظ باتصال دائم ويعيد الاتصال مرة واحدة عند انقطاعه
+
+التشغيل:
+    python embedding_sidecar.py serve
+أو تلقائياً من gunicorn_config.py عند EMBEDDING_SIDECAR_AUTOSTART، حيث يراقبها
+SidecarSupervisor ويعيد تشغيلها إذا توقفت
+"""
+from config import settings
+from embedding_batcher import EmbeddingBatcher
+from typing import Dict, Any, Optional, Union, Sequence, Callable
+import numpy as np
+import msgpack
+import os
+import signal
+import socket
+import socketserver
+import struct
+import subprocess
+import sys
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+FRAME_HEADER = struct.Struct('<I')
+# حد أعلى لحجم الرسالة (حماية من إطار تالف)
+MAX_FRAME_BYTES = 256 * 2 ** 20
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    chunks = bytearray()
+    while len(chunks) < size:
+        chunk = sock.recv(size - len(chunks))
+        if not chunk:
+            raise ConnectionError("انقطع الاتصال")
+        chunks.extend(chunk)
+    return bytes(chunks)
+
+
+def send_frame(sock: socket.socket, message: Dict[str, Any]):
+    payload = msgpack.packb(message, use_bin_type=True)
+    sock.sendall(FRAME_HEADER.pack(len(payload)) + payload)
+
+
+def recv_frame(sock: socket.socket) -> Dict[str, Any]:
+    (size,) = FRAME_HEADER.unpack(_recv_exact(sock, FRAME_HEADER.size))
+    if size > MAX_FRAME_BYTES:
+        raise ConnectionError(f"رسالة أكبر من المسموح ({size} بايت)")
+    return msgpack.unpackb(_recv_exact(sock, size), raw=False)
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    """اتصال واحد من worker: طلبات متتالية حتى يغلقه العميل"""
+
+    def setup(self):
+        self.server.sidecar._track(self.request, True)
+
+    def finish(self):
+        self.server.sidecar._track(self.request, False)
+
+    def handle(self):
+        while True:
+            try:
+                request = recv_frame(self.request)
+            except (ConnectionError, OSError):
+                return
+            try:
+                response = self.server.sidecar.handle(request)
+            except Exception as e:
+                logger.error(f"❌ فشل طلب embedding من worker: {e}")
+                response = {"ok": False, "error": str(e)}
+            try:
+                send_frame(self.request, response)
+            except OSError:
+                return
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    # اتصال دائم لكل خيط في كل worker (الافتراضي 5 يرفض الاتصالات المتزامنة بـ EAGAIN)
+    request_queue_size = 128
+
+
+class EmbeddingSidecar:
+    """الخادم: الموديل + مجمّع الدفعات + UNIX socket"""
+
+    def __init__(self, model, socket_path: str, max_batch_size: int = 32, max_wait_ms: float = 2.0,
+                 max_queue_depth: int = 256, timeout_seconds: float = 10.0):
+        """
+        Args:
+            model: أي كائن بواجهة SentenceTransformer.encode
+            socket_path: مسار الـ UNIX socket
+        """
+        self.model = model
+        self.socket_path = socket_path
+        self.batcher = EmbeddingBatcher(
+            lambda texts: model.encode(texts, normalize_embeddings=True), max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms, max_queue_depth=max_queue_depth, timeout_seconds=timeout_seconds,
+            name="sidecar-batcher"
+        )
+        self._server: Optional[_UnixServer] = None
+        self._thread: Optional[threading.Thread] = None
+        self._connections = set()
+        self._connections_lock = threading.Lock()
+        self.started_at = time.time()
+
+    def _track(self, connection: socket.socket, active: bool):
+        with self._connections_lock:
+            if active:
+                self._connections.add(connection)
+            else:
+                self._connections.discard(connection)
+
+    def handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        op = request.get("op")
+        if op == "encode":
+            texts = request.get("texts") or []
+            futures = [self.batcher.submit(text) for text in texts]
+            rows = [f.result(timeout=self.batcher.timeout_seconds) for f in futures]
+            vectors = np.ascontiguousarray(np.vstack(rows) if rows else np.empty((0, 0)), dtype=np.float32)
+            return {"ok": True, "shape": list(vectors.shape), "data": vectors.tobytes()}
+        if op == "stats":
+            return {"ok": True, "stats": self.stats()}
+        return {"ok": False, "error": f"عملية غير معروفة: {op}"}
+
+    def start(self) -> "EmbeddingSidecar":
+        """بدء الاستماع في خيط خلفي"""
+        directory = os.path.dirname(os.path.abspath(self.socket_path))
+        os.makedirs(directory, exist_ok=True)
+        # socket قديم من تشغيل سابق
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._server = _UnixServer(self.socket_path, _Handler)
+        self._server.sidecar = self
+        os.chmod(self.socket_path, 0o660)
+        self._thread = threading.Thread(target=self._server.serve_forever, name="embedding-sidecar", daemon=True)
+        self._thread.start()
+        logger.info(f"🧠 عملية الـ embedding تستمع على {self.socket_path}")
+        return self
+
+    def serve_forever(self):
+        """تشغيل حتى SIGTERM / Ctrl+C (من العملية الرئيسية)"""
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        self.start()
+        try:
+            self._thread.join()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        # إغلاق اتصالات الـ workers المفتوحة حتى تعيد الاتصال بالعملية الجديدة
+        with self._connections_lock:
+            connections, self._connections = list(self._connections), set()
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self.batcher.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._connections_lock:
+            connections = len(self._connections)
+        return {"pid": os.getpid(), "uptime_seconds": round(time.time() - self.started_at, 1),
+                "connections": connections, "batching": self.batcher.stats()}
+
+
+class SidecarClient:
+    """
+    عميل خفيف داخل كل worker بنفس واجهة SentenceTransformer.encode
+
+    المتجهات تصل مطبَّعة دائماً (الخادم يستدعي encode مع normalize_embeddings)
+    """
+
+    def __init__(self, socket_path: str, timeout_seconds: float = 10.0, connect_timeout: float = 1.0):
+        self.socket_path = socket_path
+        self.timeout_seconds = timeout_seconds
+        self.connect_timeout = connect_timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._counters = {"requests": 0, "texts": 0, "errors": 0, "reconnects": 0, "round_trip_seconds": 0.0}
+
+    def _connection(self) -> socket.socket:
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.connect_timeout)
+            try:
+                sock.connect(self.socket_path)
+            except OSError:
+                sock.close()
+                raise
+            sock.settimeout(self.timeout_seconds)
+            self._local.sock = sock
+        return sock
+
+    def _drop_connection(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            sock.close()
+            self._local.sock = None
+
+    def request(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """إرسال طلب وانتظار رده (إعادة اتصال واحدة إذا كان الاتصال القديم منقطعاً)"""
+        for attempt in range(2):
+            fresh = getattr(self._local, "sock", None) is None
+            try:
+                sock = self._connection()
+                send_frame(sock, message)
+                response = recv_frame(sock)
+                break
+            except (ConnectionError, BrokenPipeError, ConnectionResetError) as e:
+                self._drop_connection()
+                # اتصال جديد فشل = العملية متوقفة، لا فائدة من المحاولة مرة أخرى
+                if fresh or attempt == 1:
+                    raise ConnectionError(f"عملية الـ embedding غير متاحة: {e}") from e
+                with self._lock:
+                    self._counters["reconnects"] += 1
+            except OSError:
+                self._drop_connection()
+                raise
+        if not response.get("ok"):
+            raise RuntimeError(response.get("error", "خطأ غير معروف من عملية الـ embedding"))
+        return response
+
+    def encode(self, texts: Union[str, Sequence[str]], normalize_embeddings: bool = True, **kwargs) -> np.ndarray:
+        batch = [texts] if isinstance(texts, str) else list(texts)
+        started = time.perf_counter()
+        try:
+            response = self.request({"op": "encode", "texts": batch})
+        except Exception:
+            with self._lock:
+                self._counters["errors"] += 1
+            raise
+        vectors = np.frombuffer(response["data"], dtype=np.float32).reshape(response["shape"])
+        with self._lock:
+            c = self._counters
+            c["requests"] += 1
+            c["texts"] += len(batch)
+            c["round_trip_seconds"] += time.perf_counter() - started
+        return vectors[0] if isinstance(texts, str) else vectors
+
+    def server_stats(self) -> Dict[str, Any]:
+        return self.request({"op": "stats"})["stats"]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            c = dict(self._counters)
+        return {
+            "socket": self.socket_path,
+            "requests": c["requests"],
+            "texts": c["texts"],
+            "errors": c["errors"],
+            "reconnects": c["reconnects"],
+            "avg_round_trip_ms": round(c["round_trip_seconds"] / c["requests"] * 1000, 2) if c["requests"] else 0.0,
+        }
+
+
+def wait_until_ready(socket_path: str, timeout_seconds: float) -> bool:
+    """انتظار جاهزية العملية (الموديل يُحمَّل قبل فتح الـ socket)"""
+    client = SidecarClient(socket_path, timeout_seconds=timeout_seconds)
+    deadline = time.monotonic() + timeout_seconds
+    while time.monotonic() < deadline:
+        try:
+            client.server_stats()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def sidecar_health(socket_path: str, timeout_seconds: float = 1.0) -> Dict[str, Any]:
+    """
+    فحص حياة العملية المشتركة باتصال مستقل قصير المهلة (لا يحجز طلب المقاييس)
+
+    Returns:
+        {alive, pid, uptime_seconds, connections}؛ تغيّر pid يعني أنها أُعيد تشغيلها
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout_seconds)
+    try:
+        sock.connect(socket_path)
+        send_frame(sock, {"op": "stats"})
+        response = recv_frame(sock)
+    except OSError as e:
+        return {"alive": False, "error": str(e)}
+    finally:
+        sock.close()
+    stats = response.get("stats") or {}
+    return {"alive": bool(response.get("ok")), "pid": stats.get("pid"),
+            "uptime_seconds": stats.get("uptime_seconds"), "connections": stats.get("connections")}
+
+
+def start_process(socket_path: Optional[str] = None) -> subprocess.Popen:
+    """تشغيل العملية كعملية فرعية (من gunicorn قبل إنشاء الـ workers)"""
+    command = [sys.executable, os.path.abspath(__file__), "serve"]
+    if socket_path:
+        command += ["--socket", socket_path]
+    logger.info(f"🚀 تشغيل عملية الـ embedding: {' '.join(command)}")
+    return subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)))
+
+
+class SidecarSupervisor:
+    """
+    مراقبة العملية المشتركة من عملية gunicorn الرئيسية
+
+    خيط خلفي يفحص العملية كل check_seconds ويعيد تشغيلها إذا توقفت، مع انتظار
+    متزايد إذا كانت تتوقف فور تشغيلها. الـ workers يعيدون الاتصال تلقائياً،
+    وحتى تجهز يرجع البحث الدلالي للبحث الرقمي.
+    """
+
+    def __init__(self, socket_path: str, check_seconds: float = 2.0, max_backoff_seconds: float = 60.0,
+                 spawn: Optional[Callable[[], subprocess.Popen]] = None):
+        """
+        Args:
+            spawn: دالة تشغيل العملية (الافتراضي start_process)
+        """
+        self.socket_path = socket_path
+        self.check_seconds = check_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self._spawn = spawn or (lambda: start_process(socket_path))
+        self.process: Optional[subprocess.Popen] = None
+        self.restarts = 0
+        self._failures = 0
+        self._started_at = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, startup_seconds: float) -> bool:
+        """تشغيل العملية وبدء المراقبة؛ True إذا جهزت خلال startup_seconds"""
+        self._launch()
+        ready = wait_until_ready(self.socket_path, startup_seconds)
+        self._thread = threading.Thread(target=self._watch, name="embedding-sidecar-watchdog", daemon=True)
+        self._thread.start()
+        return ready
+
+    def _launch(self):
+        self.process = self._spawn()
+        self._started_at = time.monotonic()
+
+    def _watch(self):
+        while not self._stop.wait(self.check_seconds):
+            code = self.process.poll()
+            if code is None:
+                continue
+            # توقفت بعد عمل طويل = عطل عارض؛ توقفت فوراً = انتظار متزايد
+            if time.monotonic() - self._started_at > self.max_backoff_seconds:
+                self._failures = 0
+            delay = min(self.max_backoff_seconds, self.check_seconds * 2 ** self._failures)
+            self._failures += 1
+            logger.error(f"❌ عملية الـ embedding توقفت (exit={code})، إعادة التشغيل بعد {delay:.0f} ثانية")
+            if self._stop.wait(delay):
+                return
+            self.restarts += 1
+            try:
+                self._launch()
+            except Exception as e:
+                logger.error(f"❌ فشل إعادة تشغيل عملية الـ embedding: {e}")
+
+    def stop(self, timeout_seconds: float = 10.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            self.process.wait(timeout=timeout_seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        alive = self.process is not None and self.process.poll() is None
+        return {"alive": alive, "pid": self.process.pid if self.process else None, "restarts": self.restarts}
+
+
+if __name__ == "__main__":
+    import argparse
+    from embedding_backends import create_backend
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="عملية embedding مشتركة عبر UNIX socket")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_cmd = commands.add_parser("serve")
+    serve_cmd.add_argument("--socket", default=settings.EMBEDDING_SIDECAR_SOCKET)
+    stats_cmd = commands.add_parser("stats")
+    stats_cmd.add_argument("--socket", default=settings.EMBEDDING_SIDECAR_SOCKET)
+    args = parser.parse_args()
+
+    if args.command == "stats":
+        import json
+        print(json.dumps(SidecarClient(args.socket).server_stats(), ensure_ascii=False, indent=2))
+    else:
+        # الموديل يُحمَّل قبل فتح الـ socket حتى لا تصل طلبات قبل جاهزيته
+        if settings.EMBEDDING_SIDECAR_BACKEND == "sidecar":
+            parser.error("EMBEDDING_SIDECAR_BACKEND يجب أن يكون sentence_transformers أو onnx")
+        model = create_backend(settings.EMBEDDING_SIDECAR_BACKEND)
+        model.encode("تهيئة", normalize_embeddings=True)
+        EmbeddingSidecar(
+            model, args.socket,
+            max_batch_size=settings.EMBEDDING_BATCH_MAX_SIZE,
+            max_wait_ms=settings.EMBEDDING_BATCH_MAX_WAIT_MS,
+            max_queue_depth=settings.EMBEDDING_QUEUE_MAX_DEPTH,
+            timeout_seconds=settings.EMBEDDING_REQUEST_TIMEOUT_SECONDS
+        ).serve_forever()
@@ -0,0 +1,94 @@
+"""
+مجمّعات الخيوط المحدودة (Bounded Executors)
+
+العملاء المستخدمون (OpenAI / Supabase / SentenceTransformer) متزامنون، لذلك
+تُنفَّذ استدعاءاتهم في مجمّعات خيوط مسمّاة بأحجام قابلة للضبط بدلاً من
+تنفيذها داخل حلقة الأحداث، حتى لا يوقف طلب بطيء باقي الطلبات في نفس الـ worker.
+"""
+from config import settings
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable
+import asyncio
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedExecutors:
+    """مجمّع خيوط مستقل لكل نوع عمل (llm / search / embedding / db / stages)"""
+
+    def __init__(self, sizes: Dict[str, int]):
+        self.sizes = dict(sizes)
+        self._pools: Dict[str, ThreadPoolExecutor] = {}
+        self._pending: Dict[str, int] = {name: 0 for name in self.sizes}
+        self._lock = threading.Lock()
+
+    def _prefix(self, name: str) -> str:
+        return f"pool-{name}"
+
+    def get(self, name: str) -> ThreadPoolExecutor:
+        """المجمّع المسمّى (يُنشأ عند أول استخدام)"""
+        pool = self._pools.get(name)
+        if pool is None:
+            with self._lock:
+                pool = self._pools.get(name)
+                if pool is None:
+                    if name not in self.sizes:
+                        raise KeyError(f"مجمّع غير معروف: {name}")
+                    pool = ThreadPoolExecutor(max_workers=max(1, self.sizes[name]),
+                                              thread_name_prefix=self._prefix(name))
+                    self._pools[name] = pool
+                    logger.info(f"🧵 تم إنشاء مجمّع {name} بحجم {self.sizes[name]}")
+        return pool
+
+    def _tracked(self, name: str, fn: Callable, *args, **kwargs):
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._pending[name] -= 1
+
+    def _submit(self, name: str, fn: Callable, *args, **kwargs):
+        pool = self.get(name)
+        with self._lock:
+            self._pending[name] += 1
+        return pool.submit(self._tracked, name, fn, *args, **kwargs)
+
+    async def run(self, name: str, fn: Callable, *args, **kwargs) -> Any:
+        """تنفيذ دالة متزامنة في المجمّع المسمّى من كود async"""
+        future = self._submit(name, fn, *args, **kwargs)
+        return await asyncio.wrap_future(future)
+
+    def call(self, name: str, fn: Callable, *args, **kwargs) -> Any:
+        """
+        تنفيذ دالة متزامنة في المجمّع المسمّى من خيط آخر والانتظار
+
+        يُستخدم داخل البحث (الذي يعمل في مجمّع search) لتقييد التزامن على
+        الموارد المشتركة مثل موديل الـ embedding. إذا كان الخيط الحالي من نفس
+        المجمّع تُنفَّذ الدالة مباشرة لتجنب الجمود (deadlock).
+        """
+        if threading.current_thread().name.startswith(self._prefix(name) + "_"):
+            return fn(*args, **kwargs)
+        return self._submit(name, fn, *args, **kwargs).result()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """حجم كل مجمّع وعدد المهام الجارية أو المنتظرة فيه"""
+        with self._lock:
+            return {name: {"size": size, "pending": self._pending[name]} for name, size in self.sizes.items()}
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            pools, self._pools = self._pools, {}
+        for pool in pools.values():
+            pool.shutdown(wait=wait)
+
+
+# إنشاء instance واحد لكل worker
+executors = BoundedExecutors({
+    "llm": settings.LLM_POOL_SIZE,
+    "search": settings.SEARCH_POOL_SIZE,
+    "embedding": settings.EMBEDDING_POOL_SIZE,
+    "db": settings.DB_POOL_SIZE,
+    "stages": settings.STAGE_POOL_SIZE,
+})
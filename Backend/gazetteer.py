@@ -0,0 +1,306 @@
+"""
+دليل أسماء الأماكن داخل الذاكرة (Gazetteer): الجامعات، المساجد، الأحياء
+
+بديل جلب جدول الجامعات كاملاً مع كل بحث، و ILIKE '%name%' على المساجد،
+والمطابقة الحرفية لاسم الحي:
+
+- يُحمَّل مرة واحدة لكل worker ويُعاد بناؤه كل GAZETTEER_REFRESH_SECONDS
+- الأسماء مطبَّعة مسبقاً (normalize_arabic_text + حذف الكلمات العامة مثل
+  "مسجد" و"حي")
+- فهرس مقلوب لثلاثيات الأحرف (trigrams) يولّد المرشحين حتى مع الأخطاء
+  الإملائية، ثم calculate_similarity_score لأفضل المرشحين فقط
+- النتيجة تحمل الاسم الرسمي والإحداثيات معاً (مركز الحي = متوسط عقاراته)
+"""
+from config import settings
+from arabic_utils import normalize_arabic_text, calculate_similarity_score
+from typing import List, Optional, Dict, Any, Tuple
+from collections import defaultdict
+import numpy as np
+import threading
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+UNIVERSITIES = 'universities'
+MOSQUES = 'mosques'
+DISTRICTS = 'districts'
+KINDS = (UNIVERSITIES, MOSQUES, DISTRICTS)
+
+# كلمات لا تميّز المكان داخل نوعه (تُحذف من الاسم والطلب قبل المقارنة)
+GENERIC_WORDS = {
+    UNIVERSITIES: frozenset(),
+    MOSQUES: frozenset(normalize_arabic_text(w) for w in ('مسجد', 'جامع')),
+    DISTRICTS: frozenset(normalize_arabic_text(w) for w in ('حي',)),
+}
+
+# خصم درجة المطابقة بعد تصحيح خطأ إملائي في كلمة
+TYPO_PENALTY = 0.9
+# أقل تشابه ثلاثيات بين كلمتين لاعتبار إحداهما خطأً إملائياً في الأخرى
+TYPO_WORD_SIMILARITY = 0.5
+RESOLVED_CACHE_SIZE = 4096
+_MISSING = object()
+
+
+def trigrams(text: str) -> List[str]:
+    """ثلاثيات الأحرف للنص مع مسافة في طرفيه (الكلمات القصيرة تبقى قابلة للمطابقة)"""
+    padded = f" {text} "
+    return sorted({padded[i:i + 3] for i in range(len(padded) - 2)})
+
+
+def _dice(a: List[str], b: List[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return 2.0 * len(set(a) & set(b)) / (len(a) + len(b))
+
+
+def place_key(kind: str, name: Optional[str]) -> str:
+    """الاسم المطبَّع بدون الكلمات العامة لنوع المكان"""
+    words = normalize_arabic_text(name or '').split()
+    kept = [w for w in words if w not in GENERIC_WORDS[kind]]
+    return ' '.join(kept or words)
+
+
+def _typo_corrected(query: str, candidate: str) -> str:
+    """استبدال كل كلمة في الطلب بأقرب كلمة في المرشح إذا كانت خطأً إملائياً محتملاً"""
+    candidate_words = candidate.split()
+    corrected = []
+    for word in query.split():
+        if word in candidate_words or len(word) < 4:
+            corrected.append(word)
+            continue
+        grams = trigrams(word)
+        best, best_score = word, TYPO_WORD_SIMILARITY
+        for other in candidate_words:
+            score = _dice(grams, trigrams(other))
+            if score >= best_score:
+                best, best_score = other, score
+        corrected.append(best)
+    return ' '.join(corrected)
+
+
+class _KindIndex:
+    """أسماء نوع واحد: الأسماء البديلة (عربي/إنجليزي) ← الكيان، وفهرس الثلاثيات"""
+
+    def __init__(self, entries: List[Dict[str, Any]], kind: str):
+        self.entries = entries
+        self.alias_keys: List[str] = []
+        self.alias_entry: List[int] = []
+        self.exact: Dict[str, int] = {}
+        postings = defaultdict(list)
+
+        for entry_id, entry in enumerate(entries):
+            for alias in entry['aliases']:
+                key = place_key(kind, alias)
+                if not key or key in self.exact:
+                    continue
+                alias_id = len(self.alias_keys)
+                self.alias_keys.append(key)
+                self.alias_entry.append(entry_id)
+                self.exact[key] = entry_id
+                for gram in trigrams(key):
+                    postings[gram].append(alias_id)
+
+        self.postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+        self.gram_counts = np.array([len(trigrams(k)) for k in self.alias_keys], dtype=np.float32)
+
+    def candidates(self, key: str, limit: int) -> np.ndarray:
+        """أفضل limit اسماً بديلاً حسب تشابه الثلاثيات (Dice)"""
+        grams = trigrams(key)
+        hits = [self.postings[g] for g in grams if g in self.postings]
+        if not hits:
+            return np.empty(0, dtype=np.int64)
+        counts = np.bincount(np.concatenate(hits), minlength=len(self.alias_keys))
+        matched = np.flatnonzero(counts)
+        dice = 2.0 * counts[matched] / (len(grams) + self.gram_counts[matched])
+        if len(matched) > limit:
+            top = np.argpartition(-dice, limit - 1)[:limit]
+        else:
+            top = np.arange(len(matched))
+        return matched[top[np.argsort(-dice[top], kind='stable')]]
+
+
+class Gazetteer:
+    """
+    البحث عن مكان بالاسم: مطابقة تامة بعد التطبيع (dict)، وإلا مرشحو الثلاثيات
+    مرتبين بـ calculate_similarity_score
+    """
+
+    def __init__(self, refresh_seconds: int = 3600, candidates: int = 10):
+        self.refresh_seconds = refresh_seconds
+        self.candidates = candidates
+        self._kinds: Dict[str, _KindIndex] = {}
+        self._resolved: Dict[Tuple[str, str, float], Optional[Dict[str, Any]]] = {}
+        self._loaded_at = 0.0
+        self._last_attempt = 0.0
+        self._lock = threading.Lock()
+
+    # ═══════════════════════════════════════════════════════
+    # البناء
+    # ═══════════════════════════════════════════════════════
+    def build(self, universities: List[Dict[str, Any]], mosques: List[Dict[str, Any]],
+              properties: List[Dict[str, Any]]):
+        """
+        بناء الدليل من صفوف الجداول
+
+        Args:
+            universities: name_ar, name_en, lat, lon
+            mosques: name, lat, lon
+            properties: district, final_lat, final_lon (مركز الحي = متوسط عقاراته)
+        """
+        def located(rows, lat_field='lat', lon_field='lon'):
+            for row in rows:
+                lat, lon = row.get(lat_field), row.get(lon_field)
+                if lat is None or lon is None or (not lat and not lon):
+                    continue
+                yield row, float(lat), float(lon)
+
+        university_entries = [
+            {'name': row.get('name_ar') or row.get('name_en'), 'aliases': [row.get('name_ar'), row.get('name_en')],
+             'lat': lat, 'lon': lon}
+            for row, lat, lon in located(universities) if row.get('name_ar') or row.get('name_en')
+        ]
+        mosque_entries = [
+            {'name': row['name'], 'aliases': [row['name']], 'lat': lat, 'lon': lon}
+            for row, lat, lon in located(mosques) if row.get('name')
+        ]
+
+        sums: Dict[str, List[float]] = {}
+        for row, lat, lon in located(properties, 'final_lat', 'final_lon'):
+            district = (row.get('district') or '').strip()
+            if district:
+                total = sums.setdefault(district, [0.0, 0.0, 0])
+                total[0] += lat
+                total[1] += lon
+                total[2] += 1
+        district_entries = [
+            {'name': name, 'aliases': [name], 'lat': lat / count, 'lon': lon / count, 'count': count}
+            for name, (lat, lon, count) in sorted(sums.items())
+        ]
+
+        kinds = {
+            UNIVERSITIES: _KindIndex(university_entries, UNIVERSITIES),
+            MOSQUES: _KindIndex(mosque_entries, MOSQUES),
+            DISTRICTS: _KindIndex(district_entries, DISTRICTS),
+        }
+
+        # تبديل المراجع دفعة واحدة حتى لا يرى أي طلب دليلاً نصف محمّل
+        self._kinds, self._resolved = kinds, {}
+        self._loaded_at = time.time()
+        logger.info(f"🧾 تم بناء دليل الأماكن: {len(university_entries)} جامعة، "
+                    f"{len(mosque_entries)} مسجد، {len(district_entries)} حي")
+
+    def load(self):
+        """تحميل الأسماء والإحداثيات من Supabase"""
+        from database import db
+
+        self.build(
+            universities=db.fetch_all('universities', 'name_ar, name_en, lat, lon'),
+            mosques=db.fetch_all('mosques', 'name, lat, lon'),
+            properties=db.fetch_all('properties', 'district, final_lat, final_lon', order_by='id')
+        )
+
+    def is_loaded(self) -> bool:
+        return bool(self._kinds)
+
+    def ensure_loaded(self) -> bool:
+        """
+        التأكد من جاهزية الدليل: أول تحميل فقط يحجز الطلب، وإعادة البناء بعد
+        انتهاء المدة تتم في الخلفية
+        """
+        if not settings.GAZETTEER_ENABLED:
+            return False
+
+        now = time.time()
+        if self.is_loaded() and now - self._loaded_at < self.refresh_seconds:
+            return True
+        # لا نعيد محاولة التحميل الفاشل مع كل طلب
+        if not self.is_loaded() and now - self._last_attempt < 60:
+            return False
+
+        # طلب واحد فقط يبدأ التحديث؛ الباقون يستخدمون الدليل الحالي
+        if not self._lock.acquire(blocking=not self.is_loaded()):
+            return True
+        if self.is_loaded() and now - self._loaded_at < self.refresh_seconds:
+            # انتظرنا أول تحميل أكمله طلب آخر
+            self._lock.release()
+            return True
+        if self.is_loaded():
+            # إعادة البناء في خيط خلفي والطلبات تستمر على الدليل السابق حتى يُبدَّل
+            threading.Thread(target=self._reload, args=(now,), name="gazetteer-refresh", daemon=True).start()
+            return True
+        self._reload(now)
+        return self.is_loaded()
+
+    def _reload(self, now: float):
+        """التحميل ثم تحرير القفل (أول تحميل داخل الطلب، والتحديثات في خيط خلفي)"""
+        try:
+            self._last_attempt = now
+            self.load()
+        except Exception as e:
+            logger.error(f"❌ فشل تحميل دليل الأماكن: {e}")
+            if self.is_loaded():
+                self._loaded_at = now
+        finally:
+            self._lock.release()
+
+    # ═══════════════════════════════════════════════════════
+    # البحث
+    # ═══════════════════════════════════════════════════════
+    def resolve(self, kind: str, name: Optional[str], threshold: float = 0.5) -> Optional[Dict[str, Any]]:
+        """
+        أفضل مكان مطابق للاسم
+
+        Returns:
+            {name, lat, lon, score} أو None إذا كانت أفضل درجة أقل من threshold
+        """
+        # الذاكرة قبل الدليل: build يبدّل _kinds ثم _resolved، فنتيجة من دليل قديم
+        # لا تُحفظ أبداً في ذاكرة الدليل الجديد (التحديث يتم في خيط خلفي)
+        resolved = self._resolved
+        index = self._kinds.get(kind)
+        if index is None:
+            return None
+        key = place_key(kind, name)
+        if not key:
+            return None
+
+        cache_key = (kind, key, threshold)
+        # قراءة واحدة: طلب آخر قد يمسح الذاكرة بين "in" والفهرسة (None نتيجة محفوظة صحيحة)
+        cached = resolved.get(cache_key, _MISSING)
+        if cached is not _MISSING:
+            return cached
+
+        entry_id, score = index.exact.get(key), 1.0
+        if entry_id is None:
+            entry_id, score = None, 0.0
+            for alias_id in index.candidates(key, self.candidates):
+                alias = index.alias_keys[alias_id]
+                candidate = calculate_similarity_score(key, alias)
+                corrected = _typo_corrected(key, alias)
+                if corrected != key:
+                    candidate = max(candidate, TYPO_PENALTY * calculate_similarity_score(corrected, alias))
+                if candidate > score:
+                    entry_id, score = index.alias_entry[alias_id], candidate
+
+        result = None
+        if entry_id is not None and score >= threshold:
+            entry = index.entries[entry_id]
+            result = {'name': entry['name'], 'lat': entry['lat'], 'lon': entry['lon'], 'score': round(score, 3)}
+
+        if len(resolved) >= RESOLVED_CACHE_SIZE:
+            resolved.clear()
+        resolved[cache_key] = result
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'loaded': self.is_loaded(),
+            **{kind: len(index.entries) for kind, index in self._kinds.items()},
+            'trigrams': sum(len(index.postings) for index in self._kinds.values()),
+            'cached_lookups': len(self._resolved),
+        }
+
+
+# إنشاء instance واحد لكل worker (يُبنى عند أول بحث بالاسم)
+gazetteer = Gazetteer(refresh_seconds=settings.GAZETTEER_REFRESH_SECONDS,
+                      candidates=settings.GAZETTEER_CANDIDATES)
@@ -5,4 +5,25 @@ worker_class = "uvicorn.workers.UvicornWorker"
 
 
 # هذا ضروري ليتحمل تحميل موديل BGE-M3 عند بدء التشغيل
+# (مع EMBEDDING_BACKEND=sidecar لا يحمّل الـ worker الموديل، والعملية المشتركة تُنتظر في on_starting)
 timeout = 180
+
+_sidecar = None
+
+
+def on_starting(server):
+    """تشغيل عملية الـ embedding المشتركة مرة واحدة قبل إنشاء الـ workers ومراقبتها"""
+    global _sidecar
+    from config import settings
+    if settings.EMBEDDING_BACKEND != "sidecar" or not settings.EMBEDDING_SIDECAR_AUTOSTART:
+        return
+    from embedding_sidecar import SidecarSupervisor
+    _sidecar = SidecarSupervisor(settings.EMBEDDING_SIDECAR_SOCKET,
+                                 check_seconds=settings.EMBEDDING_SIDECAR_CHECK_SECONDS)
+    if not _sidecar.start(settings.EMBEDDING_SIDECAR_STARTUP_SECONDS):
+        server.log.error("عملية الـ embedding لم تصبح جاهزة، البحث الدلالي سيرجع للبحث الرقمي")
+
+
+def on_exit(server):
+    if _sidecar is not None:
+        _sidecar.stop()
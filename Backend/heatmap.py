@@ -0,0 +1,190 @@
+"""
+الخرائط الحرارية المحسوبة مسبقاً (Precomputed Heatmap Grids)
+
+لكل (الغرض، النوع، zoom) شبكة خلايا على إسقاط Web Mercator تحمل: عدد
+العقارات، متوسط السعر، ومتوسط سعر المتر. تُبنى الشبكة بتجميع متجهي (NumPy)
+من مخزن العقارات داخل الذاكرة، ثم تُحدَّث تدريجياً عند كل تغيير في العقارات
+(طرح مساهمة الصف القديم وإضافة الجديد) بدون إعادة البناء.
+"""
+from config import settings
+from map_clusters import grid_cells, cell_centers
+from property_store import PropertyStore, property_store
+from typing import List, Optional, Dict, Any, Tuple
+import numpy as np
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# أعمدة الإحصاءات لكل خلية
+COUNT, PRICE_SUM, PRICE_N, PPM_SUM, PPM_N = range(5)
+STAT_COLUMNS = 5
+
+
+def _contributions(lats: np.ndarray, lons: np.ndarray, prices: np.ndarray, areas: np.ndarray,
+                   zoom: int, cells_per_tile: int) -> Tuple[np.ndarray, np.ndarray, int]:
+    """مساهمة كل عقار في خليته: (مفاتيح الخلايا، مصفوفة الإحصاءات، عدد الخلايا في كل محور)"""
+    ix, iy, n = grid_cells(lats, lons, zoom, cells_per_tile)
+    priced = ~np.isnan(prices)
+    per_m2 = priced & ~np.isnan(areas) & (areas > 0)
+
+    values = np.zeros((len(lats), STAT_COLUMNS))
+    values[:, COUNT] = 1
+    values[priced, PRICE_SUM] = prices[priced]
+    values[priced, PRICE_N] = 1
+    values[per_m2, PPM_SUM] = prices[per_m2] / areas[per_m2]
+    values[per_m2, PPM_N] = 1
+    return ix * n + iy, values, n
+
+
+class HeatGrid:
+    """شبكة واحدة: مفاتيح خلايا مرتبة + إحصاءات تراكمية قابلة للتحديث"""
+
+    def __init__(self, zoom: int, cells_per_tile: int):
+        self.zoom = zoom
+        self.cells_per_tile = cells_per_tile
+        self.n = (2 ** zoom) * cells_per_tile
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.stats = np.zeros((0, STAT_COLUMNS))
+
+    def add(self, points: Dict[str, np.ndarray], sign: float = 1.0):
+        """إضافة (sign=1) أو طرح (sign=-1) مساهمة مجموعة عقارات"""
+        if len(points['final_lat']) == 0:
+            return
+        keys, values, _ = _contributions(points['final_lat'], points['final_lon'], points['price_num'],
+                                         points['area_m2'], self.zoom, self.cells_per_tile)
+        cells, inverse = np.unique(keys, return_inverse=True)
+        delta = np.zeros((len(cells), STAT_COLUMNS))
+        np.add.at(delta, inverse.reshape(-1), values * sign)
+
+        position = np.searchsorted(self.keys, cells)
+        found = position < len(self.keys)
+        found[found] = self.keys[position[found]] == cells[found]
+        self.stats[position[found]] += delta[found]
+
+        if not found.all():
+            keys = np.concatenate([self.keys, cells[~found]])
+            stats = np.concatenate([self.stats, delta[~found]])
+            order = np.argsort(keys, kind='stable')
+            self.keys, self.stats = keys[order], stats[order]
+
+        # الخلايا التي فرغت بعد الطرح
+        alive = self.stats[:, COUNT] > 0.5
+        if not alive.all():
+            self.keys, self.stats = self.keys[alive], self.stats[alive]
+
+    def cells(self, bounds: Optional[Tuple[float, float, float, float]] = None) -> List[Dict[str, Any]]:
+        """خلايا الشبكة (اختيارياً داخل إطار العرض)"""
+        lats, lons = cell_centers(self.keys // self.n, self.keys % self.n, self.n)
+        stats = self.stats
+        mask = np.ones(len(self.keys), dtype=bool)
+        if bounds is not None:
+            south, west, north, east = bounds
+            mask = (lats >= south) & (lats <= north) & (lons >= west) & (lons <= east)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_price = stats[:, PRICE_SUM] / stats[:, PRICE_N]
+            mean_ppm = stats[:, PPM_SUM] / stats[:, PPM_N]
+
+        return [
+            {
+                'lat': round(float(lats[i]), 6),
+                'lon': round(float(lons[i]), 6),
+                'count': int(round(stats[i, COUNT])),
+                'mean_price': round(float(mean_price[i]), 2) if stats[i, PRICE_N] > 0.5 else None,
+                'mean_price_per_m2': round(float(mean_ppm[i]), 2) if stats[i, PPM_N] > 0.5 else None,
+            }
+            for i in np.flatnonzero(mask)
+        ]
+
+
+def _row_points(rows: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """أعمدة مجموعة صغيرة من الصفوف المتغيرة (بنفس شروط الموقع في المخزن)"""
+    def column(name):
+        return np.array([np.nan if r.get(name) in (None, '') else float(r[name]) for r in rows], dtype=np.float64)
+
+    points = {name: column(name) for name in ('final_lat', 'final_lon', 'price_num', 'area_m2')}
+    located = ~np.isnan(points['final_lat']) & (points['final_lat'] != 0) & ~np.isnan(points['final_lon'])
+    return {name: values[located] for name, values in points.items()}
+
+
+class HeatmapService:
+    """
+    شبكات حرارية لكل (الغرض، النوع، zoom) تُبنى عند أول طلب وتُحدّث تدريجياً
+    من تغييرات المخزن
+    """
+
+    def __init__(self, store: PropertyStore, cells_per_tile: int = 8):
+        self.store = store
+        self.cells_per_tile = cells_per_tile
+        self._grids: Dict[Tuple[str, str, int], HeatGrid] = {}
+        # لقطة المخزن التي تعكسها الشبكات (لتجنب تطبيق نفس التغيير مرتين)
+        self._source: Optional[List[Dict[str, Any]]] = None
+        self._lock = threading.Lock()
+
+    def grid(self, purpose: str, property_type: str, zoom: int,
+             bounds: Optional[Tuple[float, float, float, float]] = None) -> Dict[str, Any]:
+        """
+        خلايا الخريطة الحرارية
+
+        Returns:
+            {'cells', 'total_count'}؛ total_count لكل العقارات وليس للإطار فقط
+        """
+        self.store.ensure_loaded()
+        key = (purpose, property_type, zoom)
+        with self._lock:
+            # قراءة واحدة للقطة: تحديث بين قراءتين كان يجعل _source والنقاط من لقطتين مختلفتين
+            snapshot = self.store.snapshot()
+            rows = snapshot.rows if snapshot is not None else []
+            if self._source is not rows:
+                # لقطة لم يصلنا إشعارها بعد (أو فشل التحميل): نبني من اللقطة الحالية
+                self._grids.clear()
+                self._source = rows
+            grid = self._grids.get(key)
+            if grid is None:
+                grid = HeatGrid(zoom, self.cells_per_tile)
+                grid.add(self.store.points(purpose, property_type, snapshot))
+                self._grids[key] = grid
+                logger.info(f"🔥 بناء شبكة حرارية {purpose}/{property_type} zoom={zoom}: {len(grid.keys)} خلية")
+            cells = grid.cells(bounds)
+            total = int(round(grid.stats[:, COUNT].sum()))
+        return {'cells': cells, 'total_count': total}
+
+    def on_property_changes(self, changes):
+        """مستمع تغييرات المخزن: طرح الصفوف القديمة وإضافة الجديدة في الشبكات المتأثرة"""
+        with self._lock:
+            rows = self.store.rows()
+            if not self._grids or self._source is rows:
+                # لا شبكات، أو بُنيت الشبكات من اللقطة الجديدة قبل وصول الإشعار
+                self._source = rows
+                return
+
+            removed: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+            added: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+            for old, new in changes:
+                if old is not None:
+                    removed.setdefault((old.get('purpose'), old.get('property_type')), []).append(old)
+                if new is not None:
+                    added.setdefault((new.get('purpose'), new.get('property_type')), []).append(new)
+
+            for (purpose, property_type, _), grid in self._grids.items():
+                segment = (purpose, property_type)
+                if segment in removed:
+                    grid.add(_row_points(removed[segment]), sign=-1.0)
+                if segment in added:
+                    grid.add(_row_points(added[segment]))
+            self._source = rows
+        logger.info(f"🔥 تحديث تدريجي للشبكات الحرارية: {len(changes)} تغيير")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'grids': len(self._grids),
+                'cells': int(sum(len(g.keys) for g in self._grids.values())),
+            }
+
+
+# إنشاء instance واحد لكل worker
+heatmap_service = HeatmapService(property_store, cells_per_tile=settings.HEATMAP_CELLS_PER_TILE)
+
+property_store.subscribe(heatmap_service.on_property_changes)
@@ -0,0 +1,425 @@
+"""
+فهرس نصي BM25 داخل الذاكرة على عنوان ووصف العقارات
+
+الكلمات الدقيقة (اسم شارع، "مؤثثة"، "مدخل خاص") لا يلتقطها البحث المتجهي
+جيداً، وهذا الفهرس يكمّله:
+
+- التقطيع: normalize_arabic_text ثم تجذيع خفيف (حذف ال/وال/بال/لل واللواحق
+  ات/ون/ين/ها/ه...) بدون قاموس
+- قوائم postings مضغوطة: فروق معرفات المستندات + تكرار الكلمة بترميز varint
+  في buffer واحد (بايتان تقريباً لكل posting بدلاً من 8)
+- ترتيب BM25 مع وزن أعلى للعنوان، وفلترة على الغرض/النوع/المدينة/السعر
+- دمج النتائج مع البحث المتجهي بـ Reciprocal Rank Fusion، أو استخدامها وحدها
+  كمرحلة أولى رخيصة عندما يكون موديل الـ embedding بارداً أو مزدحماً
+"""
+from config import settings
+from arabic_utils import normalize_arabic_text
+from poi_index import haversine_meters
+from typing import List, Optional, Dict, Any, Sequence
+from collections import Counter
+from functools import lru_cache
+import numpy as np
+import threading
+import logging
+import time
+import re
+
+logger = logging.getLogger(__name__)
+
+LEXICAL_COLUMNS = 'id, title, description, purpose, property_type, city, final_lat, final_lon, price_num'
+
+# كلمات الربط وكلمات المحادثة الشائعة في الطلبات (بعد التطبيع)
+STOP_WORDS = frozenset(normalize_arabic_text(w) for w in (
+    'في', 'من', 'على', 'الى', 'إلى', 'عن', 'مع', 'او', 'أو', 'ثم', 'هذا', 'هذه', 'ذلك', 'التي', 'الذي',
+    'كل', 'غير', 'بعد', 'قبل', 'عند', 'فيه', 'فيها', 'به', 'بها', 'له', 'لها', 'ما', 'لا', 'يا', 'و',
+    'ابي', 'ابغى', 'ابغي', 'ودي', 'اريد', 'احتاج', 'ابحث', 'ابيها', 'ابيه', 'لو', 'سمحت', 'تكفى', 'بس',
+))
+
+# بادئات ولواحق التجذيع الخفيف (الأطول أولاً، بعد التطبيع: ة ← ه)
+PREFIXES = ('وال', 'بال', 'كال', 'فال', 'لل', 'ال')
+SUFFIXES = ('ها', 'ان', 'ات', 'ون', 'ين', 'يه', 'ه', 'ي')
+
+_TOKEN_SPLIT = re.compile(r'[^\w]+')
+_TATWEEL = re.compile('ـ')
+
+
+def light_stem(token: str) -> str:
+    """تجذيع خفيف (Light10 مبسّط): بادئة واحدة ثم لاحقة واحدة، مع إبقاء 3 أحرف على الأقل"""
+    if len(token) > 3 and token.startswith('و'):
+        token = token[1:]
+    for prefix in PREFIXES:
+        if token.startswith(prefix) and len(token) - len(prefix) >= 2:
+            token = token[len(prefix):]
+            break
+    else:
+        # باء الجر في الكلمات الطويلة فقط ("بمدخل" ← "مدخل")
+        if len(token) >= 5 and token.startswith('ب'):
+            token = token[1:]
+    for suffix in SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            token = token[:-len(suffix)]
+            break
+    return token
+
+
+@lru_cache(maxsize=65536)
+def _index_term(word: str) -> Optional[str]:
+    # الكلمات تتكرر كثيراً بين الأوصاف: التجذيع مرة واحدة لكل كلمة
+    if len(word) < 2 or word in STOP_WORDS:
+        return None
+    stem = light_stem(word)
+    return None if stem in STOP_WORDS else stem
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """كلمات النص بعد التطبيع والتجذيع (بدون كلمات الربط)"""
+    if not text:
+        return []
+    text = normalize_arabic_text(_TATWEEL.sub('', str(text)))
+    return [term for term in map(_index_term, _TOKEN_SPLIT.split(text)) if term]
+
+
+# ═══════════════════════════════════════════════════════
+# ترميز varint
+# ═══════════════════════════════════════════════════════
+def encode_varints(values: np.ndarray) -> np.ndarray:
+    """ترميز أعداد صحيحة غير سالبة بـ 7 بتات لكل بايت (البت الأعلى = يتبعه بايت)"""
+    values = np.asarray(values, dtype=np.uint64)
+    if len(values) == 0:
+        return np.empty(0, dtype=np.uint8)
+    sizes = np.ones(len(values), dtype=np.int64)
+    for shift in range(7, 64, 7):
+        sizes += values >= (np.uint64(1) << np.uint64(shift))
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    out = np.empty(int(sizes.sum()), dtype=np.uint8)
+    for i in range(int(sizes.max())):
+        sel = sizes > i
+        byte = (values[sel] >> np.uint64(7 * i)) & np.uint64(0x7F)
+        more = (sizes[sel] > i + 1).astype(np.uint64) << np.uint64(7)
+        out[starts[sel] + i] = (byte | more).astype(np.uint8)
+    return out
+
+
+def decode_varints(data: np.ndarray) -> np.ndarray:
+    """عكس encode_varints (متجهياً بدون حلقة على البايتات)"""
+    data = np.asarray(data, dtype=np.uint8)
+    if len(data) == 0:
+        return np.empty(0, dtype=np.uint64)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    group = np.repeat(np.arange(len(ends)), ends - starts + 1)
+    shifts = (7 * (np.arange(len(data)) - starts[group])).astype(np.uint64)
+    payload = (data & 0x7F).astype(np.uint64) << shifts
+    return np.add.reduceat(payload, starts)
+
+
+def reciprocal_rank_fusion(result_lists: Sequence[List[Dict[str, Any]]], limit: int,
+                           k: int = 60) -> List[Dict[str, Any]]:
+    """
+    دمج قوائم مرتبة بـ RRF: درجة كل عقار = Σ 1 / (k + ترتيبه في كل قائمة)
+
+    يُحتفظ بأول نسخة من العقار (قائمة البحث المتجهي أولاً حتى يبقى تشابهها)
+    """
+    scores: Dict[str, float] = {}
+    items: Dict[str, Dict[str, Any]] = {}
+    for results in result_lists:
+        for rank, item in enumerate(results):
+            p_id = str(item['id'])
+            scores[p_id] = scores.get(p_id, 0.0) + 1.0 / (k + rank + 1)
+            items.setdefault(p_id, item)
+    ordered = sorted(scores, key=lambda p_id: -scores[p_id])
+    return [dict(items[p_id], rrf_score=round(scores[p_id], 6)) for p_id in ordered[:limit]]
+
+
+class _Postings:
+    """
+    بيانات الفهرس المبنية (تُبدَّل دفعة واحدة بمرجع واحد): البحث يأخذها مرة
+    واحدة حتى لا يخلط فهرساً قديماً بجديد أثناء إعادة البناء في الخلفية
+    """
+
+    def __init__(self, ids: np.ndarray, doc_lengths: np.ndarray, postings: np.ndarray,
+                 terms: Dict[str, tuple], metadata: Dict[str, np.ndarray], vocab: Dict[str, Dict[Any, int]]):
+        self.ids = ids
+        self.doc_lengths = doc_lengths
+        self.avg_doc_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+        self.postings = postings
+        self.terms = terms
+        self.metadata = metadata
+        self.vocab = vocab
+
+
+_EMPTY = _Postings(np.empty(0, dtype=object), np.empty(0, dtype=np.float32), np.empty(0, dtype=np.uint8), {}, {}, {})
+
+
+class LexicalIndex:
+    """
+    فهرس مقلوب (inverted index) مع ترتيب BM25
+
+    لكل كلمة: عدد المستندات df وموضعها في buffer الـ postings المضغوط
+    (فرق المعرف عن السابق، التكرار) كأزواج varint
+    """
+
+    def __init__(self, refresh_seconds: int = 3600, k1: float = 1.2, b: float = 0.75, title_weight: int = 2):
+        self.refresh_seconds = refresh_seconds
+        self.k1 = k1
+        self.b = b
+        self.title_weight = title_weight
+
+        self._data = _EMPTY
+        self._loaded_at = 0.0
+        self._last_attempt = 0.0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data.ids)
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._data.ids
+
+    @property
+    def postings(self) -> np.ndarray:
+        return self._data.postings
+
+    # ═══════════════════════════════════════════════════════
+    # البناء
+    # ═══════════════════════════════════════════════════════
+    def build(self, rows: List[Dict[str, Any]]):
+        """
+        بناء الفهرس
+
+        Args:
+            rows: لكل عقار: id, title, description, purpose, property_type, city,
+                  final_lat, final_lon, price_num
+        """
+        started = time.time()
+        vocabulary: Dict[str, int] = {}
+        term_ids, doc_ids, tfs = [], [], []
+        lengths = np.zeros(len(rows), dtype=np.float32)
+
+        for doc, row in enumerate(rows):
+            counts = Counter(tokenize(row.get('description')))
+            for term, tf in Counter(tokenize(row.get('title'))).items():
+                counts[term] += self.title_weight * tf
+            lengths[doc] = sum(counts.values())
+            term_ids.extend([vocabulary.setdefault(term, len(vocabulary)) for term in counts])
+            doc_ids.extend([doc] * len(counts))
+            tfs.extend(counts.values())
+
+        term_ids = np.array(term_ids, dtype=np.int64)
+        doc_ids = np.array(doc_ids, dtype=np.int64)
+        tfs = np.array(tfs, dtype=np.int64)
+
+        # ترتيب حسب (الكلمة، المستند) ثم فروق المعرفات داخل كل كلمة
+        order = np.lexsort((doc_ids, term_ids))
+        term_ids, doc_ids, tfs = term_ids[order], doc_ids[order], tfs[order]
+        first = np.ones(len(term_ids), dtype=bool)
+        first[1:] = term_ids[1:] != term_ids[:-1]
+        gaps = doc_ids.copy()
+        gaps[~first] = np.diff(doc_ids)[~first[1:]]
+
+        interleaved = np.empty(2 * len(gaps), dtype=np.int64)
+        interleaved[0::2], interleaved[1::2] = gaps, tfs
+        postings = encode_varints(interleaved)
+
+        # موضع بداية كل كلمة في الـ buffer = مجموع أحجام ما قبلها
+        value_sizes = np.ones(len(interleaved), dtype=np.int64)
+        for shift in range(7, 64, 7):
+            value_sizes += interleaved >= (1 << shift)
+        byte_offsets = np.concatenate([[0], np.cumsum(value_sizes)])
+        term_starts = np.flatnonzero(first)
+        term_ends = np.concatenate([term_starts[1:], [len(term_ids)]])
+        names = {i: term for term, i in vocabulary.items()}
+        terms = {
+            names[int(term_ids[s])]: (int(e - s), int(byte_offsets[2 * s]), int(byte_offsets[2 * e]))
+            for s, e in zip(term_starts, term_ends)
+        }
+
+        vocab: Dict[str, Dict[Any, int]] = {}
+
+        def coded_column(name):
+            # ترميز قاموسي حتى تكون مقارنة الفلاتر على أعداد صحيحة
+            codes = vocab.setdefault(name, {})
+            return np.array([codes.setdefault(row.get(name), len(codes)) for row in rows], dtype=np.int32)
+
+        def float_column(name):
+            return np.array([np.nan if row.get(name) is None else float(row[name]) for row in rows],
+                            dtype=np.float64)
+
+        metadata = {
+            'purpose': coded_column('purpose'),
+            'property_type': coded_column('property_type'),
+            'city': coded_column('city'),
+            'final_lat': float_column('final_lat'),
+            'final_lon': float_column('final_lon'),
+            'price_num': float_column('price_num'),
+        }
+
+        # تبديل مرجع واحد بعد اكتمال البناء
+        ids = np.array([str(row['id']) for row in rows], dtype=object)
+        self._data = _Postings(ids, lengths, postings, terms, metadata, vocab)
+        self._loaded_at = time.time()
+
+        logger.info(f"🔤 تم بناء الفهرس النصي: {len(rows)} عقار، {len(terms)} كلمة، "
+                    f"{len(gaps)} posting في {postings.nbytes / 1024:.0f}KB ({time.time() - started:.1f} ث)")
+
+    def load(self):
+        """تحميل عناوين وأوصاف العقارات من Supabase وبناء الفهرس"""
+        from database import db
+
+        rows = db.fetch_all('properties', LEXICAL_COLUMNS, order_by='id')
+        if rows:
+            self.build(rows)
+
+    def is_loaded(self) -> bool:
+        return len(self) > 0
+
+    def ensure_loaded(self) -> bool:
+        """
+        التأكد من جاهزية الفهرس: أول تحميل فقط يحجز الطلب، وإعادة البناء بعد
+        انتهاء المدة تتم في الخلفية
+        """
+        now = time.time()
+        if self.is_loaded() and now - self._loaded_at < self.refresh_seconds:
+            return True
+        # لا نعيد محاولة التحميل الفاشل مع كل طلب
+        if not self.is_loaded() and now - self._last_attempt < 60:
+            return False
+
+        # طلب واحد فقط يبدأ التحديث؛ الباقون يستخدمون الفهرس الحالي
+        if not self._lock.acquire(blocking=not self.is_loaded()):
+            return True
+        if self.is_loaded() and now - self._loaded_at < self.refresh_seconds:
+            # انتظرنا أول تحميل أكمله طلب آخر
+            self._lock.release()
+            return True
+        if self.is_loaded():
+            # إعادة البناء في خيط خلفي والطلبات تستمر على الفهرس السابق حتى يُبدَّل
+            threading.Thread(target=self._reload, args=(now,), name="lexical-index-refresh", daemon=True).start()
+            return True
+        self._reload(now)
+        return self.is_loaded()
+
+    def _reload(self, now: float):
+        """التحميل ثم تحرير القفل (أول تحميل داخل الطلب، والتحديثات في خيط خلفي)"""
+        try:
+            self._last_attempt = now
+            self.load()
+        except Exception as e:
+            logger.error(f"❌ فشل تحميل الفهرس النصي: {e}")
+            if self.is_loaded():
+                self._loaded_at = now
+        finally:
+            self._lock.release()
+
+    # ═══════════════════════════════════════════════════════
+    # البحث
+    # ═══════════════════════════════════════════════════════
+    def postings_for(self, term: str, data: Optional[_Postings] = None):
+        """(مواضع المستندات، التكرار) لكلمة بعد التطبيع والتجذيع"""
+        data = data or self._data
+        entry = data.terms.get(term)
+        if entry is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        _, start, end = entry
+        values = decode_varints(data.postings[start:end]).astype(np.int64)
+        return np.cumsum(values[0::2]), values[1::2].astype(np.float32)
+
+    def scores(self, query: str, data: Optional[_Postings] = None) -> np.ndarray:
+        """درجة BM25 لكل المستندات (0 = لا توجد كلمة مشتركة)"""
+        data = data or self._data
+        n = len(data.ids)
+        result = np.zeros(n, dtype=np.float32)
+        for term in dict.fromkeys(tokenize(query)):
+            entry = data.terms.get(term)
+            if entry is None:
+                continue
+            df = entry[0]
+            idf = np.log1p((n - df + 0.5) / (df + 0.5))
+            docs, tfs = self.postings_for(term, data)
+            norm = self.k1 * (1.0 - self.b + self.b * data.doc_lengths[docs] / max(data.avg_doc_length, 1e-9))
+            result[docs] += idf * tfs * (self.k1 + 1.0) / (tfs + norm)
+        return result
+
+    def _filter_mask(self, data: _Postings, positions: np.ndarray, purpose: Optional[str],
+                     property_type: Optional[str], city: Optional[str], min_price: Optional[float],
+                     max_price: Optional[float]) -> np.ndarray:
+        meta = data.metadata
+        mask = np.ones(len(positions), dtype=bool)
+        for name, value in (('purpose', purpose), ('property_type', property_type), ('city', city)):
+            if value:
+                mask &= meta[name][positions] == data.vocab[name].get(value, -1)
+        if min_price is not None:
+            mask &= meta['price_num'][positions] >= min_price
+        if max_price is not None:
+            mask &= meta['price_num'][positions] <= max_price
+        return mask
+
+    def search(self, query: str, k: int = 100, purpose: Optional[str] = None,
+               property_type: Optional[str] = None, city: Optional[str] = None,
+               min_price: Optional[float] = None, max_price: Optional[float] = None,
+               lat: Optional[float] = None, lon: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        أعلى k عقار حسب BM25 بنفس شكل مخرجات vector_index.search
+
+        Returns:
+            قائمة {id, similarity, bm25, dist_meters, final_lat, final_lon, price_num} مرتبة؛
+            similarity = درجة BM25 نسبةً لأعلى نتيجة (0-1)
+        """
+        data = self._data
+        if len(data.ids) == 0:
+            return []
+
+        scores = self.scores(query, data)
+        positions = np.flatnonzero(scores > 0)
+        positions = positions[self._filter_mask(data, positions, purpose, property_type, city, min_price, max_price)]
+        if len(positions) == 0:
+            return []
+
+        score = scores[positions]
+        if len(score) > k:
+            top = np.argpartition(-score, k - 1)[:k]
+        else:
+            top = np.arange(len(score))
+        top = top[np.argsort(-score[top], kind='stable')]
+        best = float(score[top[0]])
+
+        meta = data.metadata
+        lats, lons = meta['final_lat'][positions], meta['final_lon'][positions]
+        distances = np.full(len(positions), np.nan)
+        if lat is not None and lon is not None:
+            distances = haversine_meters(lat, lon, lats, lons)
+
+        return [
+            {
+                'id': data.ids[positions[i]],
+                'similarity': float(score[i]) / best,
+                'bm25': float(score[i]),
+                'dist_meters': None if np.isnan(distances[i]) else float(distances[i]),
+                'final_lat': None if np.isnan(lats[i]) else float(lats[i]),
+                'final_lon': None if np.isnan(lons[i]) else float(lons[i]),
+                'price_num': None if np.isnan(meta['price_num'][positions[i]]) else float(meta['price_num'][positions[i]]),
+            }
+            for i in top
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        data = self._data
+        postings = sum(entry[0] for entry in data.terms.values())
+        return {
+            'documents': len(data.ids),
+            'terms': len(data.terms),
+            'postings': postings,
+            'postings_bytes': int(data.postings.nbytes),
+            # int32 للمعرف + int32 للتكرار بدون ضغط
+            'uncompressed_bytes': postings * 8,
+        }
+
+
+# إنشاء instance واحد لكل worker (يُبنى عند أول بحث مشابه إذا كان مفعّلاً)
+lexical_index = LexicalIndex(
+    refresh_seconds=settings.LEXICAL_INDEX_REFRESH_SECONDS,
+    k1=settings.LEXICAL_BM25_K1,
+    b=settings.LEXICAL_BM25_B,
+    title_weight=settings.LEXICAL_TITLE_WEIGHT
+)
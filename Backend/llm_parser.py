@@ -4,6 +4,8 @@
 """
 from openai import OpenAI
 from config import settings
+from executors import executors
+from rule_parser import rule_parser
 from models import (
     PropertyCriteria, PropertyPurpose, PropertyType, PricePeriod,
     RangeFilter, IntRangeFilter, PriceFilter, SchoolRequirements,
@@ -195,6 +197,17 @@ class LLMParser:
         Returns:
             CriteriaExtractionResponse يحتوي على المعايير المستخرجة ونوع الإجراء
         """
+        # الطريق السريع: قواعد اللهجة المحلية، والنموذج اللغوي فقط عند انخفاض الثقة
+        if settings.RULE_PARSER_ENABLED:
+            try:
+                parsed = rule_parser.parse(user_query, previous_criteria)
+                if rule_parser.accept(parsed):
+                    logger.info(f"⚡ محلل القواعد فهم الطلب (ثقة {parsed['confidence']}) بدون استدعاء النموذج")
+                    return self._build_response(parsed['arguments'], user_query, previous_criteria)
+                logger.info(f"🤖 ثقة محلل القواعد {parsed['confidence']} - الرجوع إلى النموذج اللغوي")
+            except Exception as e:
+                logger.warning(f"⚠️ فشل محلل القواعد، الرجوع إلى النموذج اللغوي: {e}")
+
         try:
             # تحضير السياق السابق إذا وجد
             context_message = ""
@@ -354,49 +367,7 @@ class LLMParser:
                 )
             
             # تحويل النتيجة إلى dict
-            criteria_dict = json.loads(function_call.arguments)
-            
-            # استخراج نوع الإجراء وملخص التغييرات
-            action_type_str = criteria_dict.pop('action_type', 'NEW_SEARCH')
-            action_type = ActionType(action_type_str)
-            changes_summary = criteria_dict.pop('changes_summary', None)
-            
-            # ═══════════════════════════════════════════════════════════
-            # [جديد] دمج المعايير إذا كان التعديل
-            # ═══════════════════════════════════════════════════════════
-            if action_type == ActionType.UPDATE_CRITERIA and previous_criteria:
-                criteria_dict = self._merge_criteria(
-                    previous_criteria.dict(exclude_none=True),
-                    criteria_dict
-                )
-                logger.info(f"🔄 تم دمج المعايير. التغييرات: {changes_summary}")
-            
-            # تحويل الـ dict إلى PropertyCriteria
-            criteria = self._dict_to_criteria(criteria_dict, user_query)
-            
-            # التحقق من اكتمال المعايير الأساسية
-            if not criteria.purpose or not criteria.property_type:
-                return CriteriaExtractionResponse(
-                    success=False,
-                    message="أحتاج معلومات إضافية لمساعدتك بشكل أفضل.",
-                    criteria=criteria,
-                    needs_clarification=True,
-                    action_type=ActionType.CLARIFICATION,
-                    clarification_questions=self._generate_clarification_questions(criteria)
-                )
-            
-            # نجح الاستخراج
-            message = self._generate_confirmation_message(criteria, action_type, changes_summary)
-            
-            return CriteriaExtractionResponse(
-                success=True,
-                message=message,
-                criteria=criteria,
-                needs_clarification=False,
-                action_type=action_type,
-                changes_summary=changes_summary,
-                previous_criteria=previous_criteria
-            )
+            return self._build_response(json.loads(function_call.arguments), user_query, previous_criteria)
             
         except Exception as e:
             logger.error(f"خطأ في استخراج المعايير: {e}")
@@ -407,6 +378,63 @@ class LLMParser:
                 action_type=ActionType.CLARIFICATION
             )
 
+    def _build_response(
+        self,
+        criteria_dict: dict,
+        user_query: str,
+        previous_criteria: Optional[PropertyCriteria] = None
+    ) -> CriteriaExtractionResponse:
+        """تحويل مخرجات extract_property_criteria (من النموذج أو محلل القواعد) إلى استجابة"""
+        # استخراج نوع الإجراء وملخص التغييرات
+        action_type_str = criteria_dict.pop('action_type', 'NEW_SEARCH')
+        action_type = ActionType(action_type_str)
+        changes_summary = criteria_dict.pop('changes_summary', None)
+        
+        # ═══════════════════════════════════════════════════════════
+        # [جديد] دمج المعايير إذا كان التعديل
+        # ═══════════════════════════════════════════════════════════
+        if action_type == ActionType.UPDATE_CRITERIA and previous_criteria:
+            criteria_dict = self._merge_criteria(
+                previous_criteria.dict(exclude_none=True),
+                criteria_dict
+            )
+            logger.info(f"🔄 تم دمج المعايير. التغييرات: {changes_summary}")
+        
+        # تحويل الـ dict إلى PropertyCriteria
+        criteria = self._dict_to_criteria(criteria_dict, user_query)
+        
+        # التحقق من اكتمال المعايير الأساسية
+        if not criteria.purpose or not criteria.property_type:
+            return CriteriaExtractionResponse(
+                success=False,
+                message="أحتاج معلومات إضافية لمساعدتك بشكل أفضل.",
+                criteria=criteria,
+                needs_clarification=True,
+                action_type=ActionType.CLARIFICATION,
+                clarification_questions=self._generate_clarification_questions(criteria)
+            )
+        
+        # نجح الاستخراج
+        message = self._generate_confirmation_message(criteria, action_type, changes_summary)
+        
+        return CriteriaExtractionResponse(
+            success=True,
+            message=message,
+            criteria=criteria,
+            needs_clarification=False,
+            action_type=action_type,
+            changes_summary=changes_summary,
+            previous_criteria=previous_criteria
+        )
+
+    async def extract_criteria_async(
+        self,
+        user_query: str,
+        previous_criteria: Optional[PropertyCriteria] = None
+    ) -> CriteriaExtractionResponse:
+        """نسخة غير حاجبة من extract_criteria (تعمل في مجمّع llm)"""
+        return await executors.run("llm", self.extract_criteria, user_query, previous_criteria)
+
     def _merge_criteria(self, previous: dict, updates: dict) -> dict:
         """
         دمج المعايير الجديدة مع السابقة
@@ -2,20 +2,39 @@
 المساعد العقاري الذكي - Backend API
 FastAPI Application - مع دعم المحادثة التفاعلية (Multi-Turn)
 """
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
 import logging
+import json
 
 from config import settings
 from models import (
     UserQuery, SearchModeSelection, SearchResponse, 
     CriteriaExtractionResponse, ChatMessage, SearchMode,
-    PropertyCriteria, Property, ActionType
+    PropertyCriteria, Property, ActionType, SearchView, PropertyDetailsRequest,
+    ClusterRequest, ClusterResponse, HeatmapResponse, PropertyPurpose, PropertyType,
+    MarketStat, MarketStatsResponse, BestValueProperty, BestValueRequest, BestValueResponse
 )
 from llm_parser import llm_parser
+from rule_parser import rule_parser
 from search_engine import search_engine
+from executors import executors
+from search_cache import search_cache, listing_watcher
+from map_clusters import map_clusterer
+from heatmap import heatmap_service
+from market_stats import market_stats
+from best_value import best_value_index
+from travel_time import travel_time_engine
+from embedding_cache import embedding_cache
+from embedding_generator import embedding_generator
+from lexical_index import lexical_index
+from gazetteer import gazetteer
+import payload_encoding
+from pagination import InvalidCursor
 
 # إعداد logging
 logging.basicConfig(
@@ -41,6 +60,20 @@ app.add_middleware(
 )
 
 
+@app.on_event("startup")
+def start_listing_watcher():
+    """مراقبة تغييرات العقارات لحذف نتائج البحث المتأثرة من الذاكرة المؤقتة"""
+    if settings.SEARCH_CACHE_ENABLED:
+        listing_watcher.start()
+
+
+@app.on_event("shutdown")
+def shutdown_executors():
+    """إيقاف مجمّعات الخيوط ومراقب التغييرات عند إيقاف الـ worker"""
+    listing_watcher.stop()
+    executors.shutdown(wait=False)
+
+
 @app.get("/")
 async def root():
     """الصفحة الرئيسية"""
@@ -64,7 +97,26 @@ async def health_check():
     return {
         "status": "healthy",
         "model": settings.LLM_MODEL,
-        "multi_turn_support": True  
+        "multi_turn_support": True,
+        "executors": executors.stats()
+    }
+
+
+@app.get("/api/metrics")
+async def metrics():
+    """عدادات الذاكرة المؤقتة ومجمّعات الخيوط"""
+    return {
+        "search_cache": search_cache.stats(),
+        "heatmap": heatmap_service.stats(),
+        "market_stats": market_stats.stats(),
+        "best_value": best_value_index.stats(),
+        "travel_time": travel_time_engine.stats(),
+        "embedding_cache": embedding_cache.stats(),
+        "embedding": {**embedding_generator.stats(), "sidecar_health": await embedding_generator.probe_sidecar()},
+        "lexical_index": lexical_index.stats(),
+        "gazetteer": gazetteer.stats(),
+        "rule_parser": rule_parser.stats(),
+        "executors": executors.stats()
     }
 
 
@@ -106,7 +158,7 @@ async def process_user_query(query: UserQuery):
             logger.info(f"🆕 لا توجد معايير سابقة - بحث جديد")
         
         # استخراج المعايير باستخدام LLM مع المعايير السابقة
-        result = llm_parser.extract_criteria(
+        result = await llm_parser.extract_criteria_async(
             user_query=query.message,
             previous_criteria=query.previous_criteria  #تمرير المعايير السابقة
         )
@@ -127,11 +179,28 @@ async def process_user_query(query: UserQuery):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _search_message(mode: SearchMode, count: int, has_more: bool, is_next_page: bool) -> str:
+    """تحديد رسالة البحث بناءً على النتائج"""
+    if is_next_page:
+        return f"هذي {count} عقار إضافي 👇" if count else "ما في نتائج إضافية 👌"
+    if count == 0:
+        if mode == SearchMode.EXACT:
+            return "للأسف ما لقيت عقارات تطابق طلبك بالضبط 😔\n\nلكن عندي اقتراحات قريبة جداً من اللي تبي!\nتبي أعرضها لك؟"
+        return "للأسف ما لقيت عقارات مشابهة لطلبك 😔\n\nجرب تعدل المعايير أو تتواصل معنا للمساعدة."
+    if has_more:
+        return f"لقيت لك أكثر من {count} عقار! 🎊\n\nتبي أضيق البحث شوي؟ مثلاً:\n• تحدد نطاق سعر أضيق\n• تحدد حي معين\n• تضيف شروط إضافية"
+    mode_text = "مطابق" if mode == SearchMode.EXACT else "مشابه"
+    return f"لقيت لك {count} عقار {mode_text}! 🎉\n\nشوفهم على الخريطة 👇"
+
+
 @app.post("/api/search", response_model=SearchResponse)
-async def search_properties(selection: SearchModeSelection):
+async def search_properties(selection: SearchModeSelection, request: Request):
     """
     البحث عن العقارات بناءً على المعايير ونوع البحث
     
+    الاستجابة JSON افتراضياً، أو أعمدة ثنائية إذا طلب العميل في Accept:
+    application/x-msgpack أو application/vnd.apache.arrow.stream
+    
     Args:
         selection: اختيار نوع البحث والمعايير
     
@@ -142,30 +211,33 @@ async def search_properties(selection: SearchModeSelection):
         logger.info(f"🔍 بدء البحث: mode={selection.mode}")
         logger.info(f"   المعايير: {selection.criteria.dict(exclude_none=True)}")
         
-        # البحث عن العقارات
-        properties = search_engine.search(selection.criteria, selection.mode)
-        
-        # تحديد الرسالة بناءً على النتائج
-        if len(properties) == 0:
-            if selection.mode == SearchMode.EXACT:
-                message = "للأسف ما لقيت عقارات تطابق طلبك بالضبط 😔\n\nلكن عندي اقتراحات قريبة جداً من اللي تبي!\nتبي أعرضها لك؟"
-            else:
-                message = "للأسف ما لقيت عقارات مشابهة لطلبك 😔\n\nجرب تعدل المعايير أو تتواصل معنا للمساعدة."
-        elif len(properties) > 50:
-            message = f"لقيت لك أكثر من {len(properties)} عقار! 🎊\n\nتبي أضيق البحث شوي؟ مثلاً:\n• تحدد نطاق سعر أضيق\n• تحدد حي معين\n• تضيف شروط إضافية"
-        else:
-            mode_text = "مطابق" if selection.mode == SearchMode.EXACT else "مشابه"
-            message = f"لقيت لك {len(properties)} عقار {mode_text}! 🎉\n\nشوفهم على الخريطة 👇"
+        # البحث عن العقارات (صفحة واحدة)
+        page = await search_engine.search_page_async(
+            selection.criteria, selection.mode, selection.cursor, selection.page_size, selection.view
+        )
+        items = page.items
+        # وضع الخريطة: علامات خفيفة فقط، والتفاصيل عبر /api/properties/details
+        is_map = selection.view == SearchView.MAP
         
-        return SearchResponse(
+        response = SearchResponse(
             success=True,
-            message=message,
+            message=_search_message(selection.mode, len(items), page.has_more, selection.cursor is not None),
             criteria=selection.criteria,
-            properties=properties,
-            total_count=len(properties),
-            search_mode=selection.mode
+            properties=[] if is_map else items,
+            markers=items if is_map else None,
+            total_count=len(items),
+            search_mode=selection.mode,
+            next_cursor=page.next_cursor,
+            has_more=page.has_more
         )
         
+        media_type = payload_encoding.negotiate(request.headers.get("accept"))
+        if media_type:
+            return Response(content=payload_encoding.encode(response, media_type), media_type=media_type)
+        return response
+        
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f" خطأ في البحث: {e}")
         import traceback
@@ -173,6 +245,209 @@ async def search_properties(selection: SearchModeSelection):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/search/stream")
+async def search_properties_stream(selection: SearchModeSelection, request: Request):
+    """
+    البحث المتدفق: نفس /api/search لكن تُرسل النتائج المطابقة فور جاهزيتها
+    ثم المشابهة على دفعات، ثم حدث ملخص يحمل نص الرسالة
+    
+    الصيغة NDJSON (سطر JSON لكل حدث)، أو Server-Sent Events إذا أرسل
+    العميل Accept: text/event-stream
+    
+    Args:
+        selection: اختيار نوع البحث والمعايير (مع cursor و page_size اختيارياً)
+    """
+    logger.info(f"🔍 بدء البحث المتدفق: mode={selection.mode}")
+    try:
+        events = search_engine.search_stream(
+            selection.criteria, selection.mode, selection.cursor, selection.page_size,
+            view=selection.view
+        )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    use_sse = "text/event-stream" in request.headers.get("accept", "")
+    
+    async def body():
+        try:
+            async for event in events:
+                if event['event'] == 'summary':
+                    event['message'] = _search_message(
+                        selection.mode, event['total_count'], event['has_more'], selection.cursor is not None
+                    )
+                payload = json.dumps(jsonable_encoder(event), ensure_ascii=False)
+                yield f"event: {event['event']}\ndata: {payload}\n\n" if use_sse else payload + "\n"
+        except Exception as e:
+            logger.error(f" خطأ في البحث المتدفق: {e}")
+            payload = json.dumps({'event': 'error', 'detail': str(e)}, ensure_ascii=False)
+            yield f"event: error\ndata: {payload}\n\n" if use_sse else payload + "\n"
+    
+    return StreamingResponse(body(), media_type="text/event-stream" if use_sse else "application/x-ndjson")
+
+
+@app.post("/api/search/clusters", response_model=ClusterResponse)
+async def search_clusters(request: ClusterRequest):
+    """
+    علامات الخريطة مجمّعة على الخادم لمستوى التقريب وإطار العرض
+    
+    كل مجموعة تحمل العدد والمركز ونطاق السعر؛ المجموعات محفوظة لكل zoom
+    فتحريك الخريطة لا يعيد البحث
+    
+    Args:
+        request: المعايير + zoom + إطار العرض (اختياري)
+    """
+    try:
+        bounds = request.bounds
+        result = await executors.run(
+            "search", map_clusterer.clusters, request.criteria, request.zoom,
+            (bounds.south, bounds.west, bounds.north, bounds.east) if bounds else None
+        )
+        return ClusterResponse(success=True, zoom=request.zoom, **result)
+        
+    except Exception as e:
+        logger.error(f" خطأ في تجميع الخريطة: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/heatmap", response_model=HeatmapResponse)
+async def get_heatmap(purpose: PropertyPurpose, property_type: PropertyType,
+                      zoom: int = Query(..., ge=0, le=settings.HEATMAP_MAX_ZOOM),
+                      south: Optional[float] = None, west: Optional[float] = None,
+                      north: Optional[float] = None, east: Optional[float] = None):
+    """
+    خريطة حرارية محسوبة مسبقاً: لكل خلية العدد ومتوسط السعر ومتوسط سعر المتر
+    
+    Args:
+        purpose / property_type: فلتر الغرض والنوع
+        zoom: مستوى تقريب الخريطة
+        south / west / north / east: إطار العرض (اختياري، الأربعة معاً)
+    """
+    edges = (south, west, north, east)
+    if any(v is not None for v in edges) and any(v is None for v in edges):
+        raise HTTPException(status_code=400, detail="إطار العرض يحتاج south و west و north و east معاً")
+    
+    try:
+        result = await executors.run(
+            "search", heatmap_service.grid, purpose.value, property_type.value, zoom,
+            edges if south is not None else None
+        )
+        return HeatmapResponse(success=True, zoom=zoom, **result)
+        
+    except Exception as e:
+        logger.error(f" خطأ في الخريطة الحرارية: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _market_stats(purpose: str, property_type: Optional[str], city: Optional[str],
+                  district: Optional[str]) -> List[dict]:
+    market_stats.ensure_loaded()
+    if city and district:
+        # قراءة مباشرة O(1) لحي واحد
+        aggregate = market_stats.get(city, district, purpose, property_type)
+        if aggregate is None:
+            return []
+        return [{'city': city, 'district': district, 'purpose': purpose,
+                 'property_type': property_type, **aggregate.to_dict()}]
+    stats = market_stats.districts(purpose, property_type, city)
+    return [s for s in stats if s['district'] == district] if district else stats
+
+
+@app.get("/api/market-stats", response_model=MarketStatsResponse)
+async def get_market_stats(purpose: PropertyPurpose, property_type: Optional[PropertyType] = None,
+                           city: Optional[str] = None, district: Optional[str] = None):
+    """
+    إحصاءات السوق لكل حي من الذاكرة (العدد، متوسط السعر وسعر المتر، المركز)
+    
+    Args:
+        purpose: الغرض (للبيع / للايجار)
+        property_type: النوع (بدونه = كل الأنواع)
+        city / district: تحديد المدينة والحي (بدونهما = كل الأحياء مرتبة حسب سعر المتر)
+    """
+    try:
+        stats = await executors.run(
+            "search", _market_stats, purpose.value,
+            property_type.value if property_type else None, city, district
+        )
+        return MarketStatsResponse(success=True, stats=[MarketStat(**s) for s in stats])
+        
+    except Exception as e:
+        logger.error(f" خطأ في إحصاءات السوق: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _best_value_batch(districts: List[str], purpose: str, property_type: Optional[str], limit: int):
+    best_value_index.ensure_loaded()
+    return best_value_index.best_value_batch(districts, purpose, property_type, limit)
+
+
+@app.get("/api/best-value", response_model=List[BestValueProperty])
+async def get_best_value(district: str, purpose: PropertyPurpose, property_type: Optional[PropertyType] = None,
+                         limit: int = Query(5, ge=1, le=20)):
+    """
+    أفضل العروض في حي: عقارات سعر المتر فيها أقل من متوسط الحي، مرتبة حسب نسبة الخصم
+    
+    Args:
+        district: الحي
+        purpose / property_type: الغرض والنوع (بدون النوع = كل الأنواع)
+        limit: عدد العقارات
+    """
+    try:
+        results = await executors.run(
+            "search", _best_value_batch, [district], purpose.value,
+            property_type.value if property_type else None, limit
+        )
+        return [BestValueProperty(**row) for row in results[district]]
+        
+    except Exception as e:
+        logger.error(f" خطأ في أفضل العروض: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/best-value/batch", response_model=BestValueResponse)
+async def get_best_value_batch(request: BestValueRequest):
+    """
+    أفضل العروض لعدة أحياء في طلب واحد (بدل طلب لكل حي)
+    
+    Args:
+        request: الأحياء + الغرض + النوع (اختياري) + العدد لكل حي
+    """
+    try:
+        results = await executors.run(
+            "search", _best_value_batch, request.districts, request.purpose.value,
+            request.property_type.value if request.property_type else None, request.limit
+        )
+        return BestValueResponse(
+            success=True,
+            results={district: [BestValueProperty(**row) for row in rows] for district, rows in results.items()}
+        )
+        
+    except Exception as e:
+        logger.error(f" خطأ في أفضل العروض: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/properties/details", response_model=List[Property])
+async def get_properties_details(request: PropertyDetailsRequest):
+    """
+    تفاصيل عدة عقارات دفعة واحدة (بعد البحث بوضع الخريطة view=map)
+    
+    Args:
+        request: معرفات العقارات (حتى 100)
+    
+    Returns:
+        العقارات الموجودة بنفس ترتيب المعرفات
+    """
+    try:
+        from database import db
+        
+        rows = await db.get_properties_by_ids_async(request.ids)
+        return [Property(**row) for row in rows]
+        
+    except Exception as e:
+        logger.error(f" خطأ في الحصول على تفاصيل العقارات: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.get("/api/properties/{property_id}", response_model=Property)
 async def get_property_details(property_id: str):
     """
@@ -187,7 +462,7 @@ async def get_property_details(property_id: str):
     try:
         from database import db
         
-        property_data = db.get_property_by_id(property_id)
+        property_data = await db.get_property_by_id_async(property_id)
         
         if not property_data:
             raise HTTPException(status_code=404, detail="العقار غير موجود")
@@ -0,0 +1,151 @@
+"""
+تجميع علامات الخريطة على الخادم (Server-side Marker Clustering)
+
+تُجمّع عقارات البحث المطابق في شبكة خلايا على إسقاط Web Mercator بحسب
+مستوى التقريب (zoom)، فتستلم الخريطة عشرات المجموعات (العدد، المركز، نطاق
+السعر) بدلاً من آلاف العلامات. تجميع العالم كله يُحفظ في ذاكرة البحث لكل
+zoom، وتحريك الخريطة داخل نفس الـ zoom يكتفي بتصفية المجموعات حسب الإطار.
+"""
+from config import settings
+from models import PropertyCriteria, SearchMode
+from search_cache import search_cache
+from typing import List, Optional, Dict, Any, Tuple
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+# حدود إسقاط Web Mercator (نفس حدود بلاطات الخرائط)
+MAX_MERCATOR_LAT = 85.05112878
+
+
+def _mercator(lats: np.ndarray, lons: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """تحويل الإحداثيات لمستوى البلاطات الموحّد [0, 1)"""
+    lat_rad = np.radians(np.clip(lats, -MAX_MERCATOR_LAT, MAX_MERCATOR_LAT))
+    x = (lons + 180.0) / 360.0
+    y = (1.0 - np.log(np.tan(lat_rad) + 1.0 / np.cos(lat_rad)) / np.pi) / 2.0
+    return x, y
+
+
+def grid_cells(lats: np.ndarray, lons: np.ndarray, zoom: int,
+               cells_per_tile: int) -> Tuple[np.ndarray, np.ndarray, int]:
+    """
+    خلية الشبكة (ix, iy) لكل نقطة عند zoom؛ كل بلاطة (256px) تُقسم إلى
+    cells_per_tile × cells_per_tile خلية، فحجم الخلية بالبكسل ثابت
+
+    Returns:
+        (ix، iy، عدد الخلايا في كل محور)
+    """
+    n = (2 ** zoom) * cells_per_tile
+    x, y = _mercator(lats, lons)
+    ix = np.clip((x * n).astype(np.int64), 0, n - 1)
+    iy = np.clip((y * n).astype(np.int64), 0, n - 1)
+    return ix, iy, n
+
+
+def cell_centers(ix: np.ndarray, iy: np.ndarray, n: int) -> Tuple[np.ndarray, np.ndarray]:
+    """إحداثيات مركز كل خلية (عكس إسقاط Mercator)"""
+    lons = (ix + 0.5) / n * 360.0 - 180.0
+    lats = np.degrees(np.arctan(np.sinh(np.pi * (1.0 - 2.0 * (iy + 0.5) / n))))
+    return lats, lons
+
+
+def cluster_points(lats: np.ndarray, lons: np.ndarray, prices: np.ndarray, ids: List[str],
+                   zoom: int, cells_per_tile: int = 4) -> List[Dict[str, Any]]:
+    """
+    تجميع النقاط في خلايا شبكة ثابتة الحجم على الشاشة (grid_cells)
+
+    Returns:
+        مجموعة لكل خلية غير فارغة: المفتاح، العدد، المركز، أقل/أعلى سعر،
+        ومعرف العقار إذا كانت المجموعة عقاراً واحداً
+    """
+    if len(lats) == 0:
+        return []
+
+    ix, iy, n = grid_cells(lats, lons, zoom, cells_per_tile)
+    cells, inverse = np.unique(ix * n + iy, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    counts = np.bincount(inverse)
+    center_lat = np.bincount(inverse, weights=lats) / counts
+    center_lon = np.bincount(inverse, weights=lons) / counts
+
+    # العقارات بدون سعر لا تدخل في نطاق السعر
+    priced = ~np.isnan(prices)
+    min_price = np.full(len(cells), np.inf)
+    max_price = np.full(len(cells), -np.inf)
+    np.minimum.at(min_price, inverse[priced], prices[priced])
+    np.maximum.at(max_price, inverse[priced], prices[priced])
+
+    # أول عقار في كل خلية (للمجموعات ذات العقار الواحد)
+    first = np.full(len(cells), len(ids), dtype=np.int64)
+    np.minimum.at(first, inverse, np.arange(len(ids)))
+
+    clusters = []
+    for c, cell in enumerate(cells):
+        has_price = np.isfinite(min_price[c])
+        clusters.append({
+            'key': f"{zoom}/{int(cell // n)}/{int(cell % n)}",
+            'count': int(counts[c]),
+            'lat': float(center_lat[c]),
+            'lon': float(center_lon[c]),
+            'min_price': float(min_price[c]) if has_price else None,
+            'max_price': float(max_price[c]) if has_price else None,
+            'property_id': ids[first[c]] if counts[c] == 1 else None,
+        })
+    return clusters
+
+
+class MapClusterer:
+    """تجميع نتائج البحث المطابق مع ذاكرة لكل (معايير، zoom)"""
+
+    def __init__(self, cells_per_tile: int = 4, max_points: int = 5000):
+        self.cells_per_tile = cells_per_tile
+        self.max_points = max_points
+
+    def clusters(self, criteria: PropertyCriteria, zoom: int,
+                 bounds: Optional[Tuple[float, float, float, float]] = None) -> Dict[str, Any]:
+        """
+        مجموعات الخريطة لمعايير البحث
+
+        Args:
+            zoom: مستوى تقريب الخريطة
+            bounds: إطار العرض (جنوب، غرب، شمال، شرق)؛ None = كل المجموعات
+
+        Returns:
+            {'clusters', 'total_count', 'truncated'}؛ total_count لكل العقارات
+            المطابقة وليس للإطار فقط
+        """
+        cache_key = search_cache.key(criteria, SearchMode.EXACT, namespace=f"clusters:{zoom}:{self.cells_per_tile}")
+        world = search_cache.get(cache_key)
+        if world is None:
+            world = self._cluster_world(criteria, zoom)
+            search_cache.put(cache_key, world, criteria)
+
+        clusters = world['clusters']
+        if bounds is not None:
+            south, west, north, east = bounds
+            clusters = [c for c in clusters if south <= c['lat'] <= north and west <= c['lon'] <= east]
+        return {**world, 'clusters': clusters}
+
+    def _cluster_world(self, criteria: PropertyCriteria, zoom: int) -> Dict[str, Any]:
+        from search_engine import search_engine
+
+        rows, truncated = search_engine.matching_rows(criteria, self.max_points)
+        lats = np.array([float(r.get('final_lat') or 0) for r in rows], dtype=np.float64)
+        lons = np.array([float(r.get('final_lon') or 0) for r in rows], dtype=np.float64)
+        prices = np.array([np.nan if r.get('price_num') is None else float(r['price_num']) for r in rows],
+                          dtype=np.float64)
+        clusters = cluster_points(lats, lons, prices, [str(r.get('id')) for r in rows],
+                                  zoom, self.cells_per_tile)
+
+        if truncated:
+            logger.warning(f"⚠️ تجميع الخريطة اكتفى بأول {self.max_points} عقار")
+        logger.info(f"🗺️ تجميع {len(rows)} عقار في {len(clusters)} مجموعة (zoom={zoom})")
+        return {'clusters': clusters, 'total_count': len(rows), 'truncated': truncated}
+
+
+# إنشاء instance واحد لكل worker
+map_clusterer = MapClusterer(
+    cells_per_tile=settings.MAP_CLUSTER_CELLS_PER_TILE,
+    max_points=settings.MAP_CLUSTER_MAX_POINTS
+)
@@ -0,0 +1,220 @@
+"""
+إحصاءات السوق لكل حي (District Market Statistics)
+
+مجاميع تراكمية لكل (المدينة، الحي، الغرض، النوع): العدد، مجموع السعر، مجموع
+سعر المتر، ومجموع الإحداثيات للمركز. تُحدَّث تدريجياً من تغييرات مخزن العقارات
+(طرح الصف القديم وإضافة الجديد)، فقراءة إحصاءات حي O(1) من الذاكرة بدلاً من
+إعادة تجميع جدول العقارات في كل طلب. المجاميع قابلة للجمع، فإحصاءات الحي لكل
+الأنواع تُحسب بجمع مجاميع أنواعه.
+"""
+from arabic_utils import normalize_arabic_text
+from property_store import PropertyStore, property_store
+from typing import List, Optional, Dict, Any, Tuple
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# (المدينة، الحي، الغرض الموحّد، النوع)
+MarketKey = Tuple[Optional[str], Optional[str], Optional[str], Optional[str]]
+
+
+def _number(value) -> Optional[float]:
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class MarketAggregate:
+    """مجاميع قابلة للإضافة والطرح لمجموعة عقارات"""
+
+    __slots__ = ('count', 'price_sum', 'price_n', 'ppm_sum', 'ppm_n', 'lat_sum', 'lon_sum', 'located')
+
+    def __init__(self):
+        self.count = 0
+        self.price_sum = 0.0
+        self.price_n = 0
+        self.ppm_sum = 0.0
+        self.ppm_n = 0
+        self.lat_sum = 0.0
+        self.lon_sum = 0.0
+        self.located = 0
+
+    def add(self, row: Dict[str, Any], sign: int = 1):
+        """إضافة (sign=1) أو طرح (sign=-1) مساهمة عقار"""
+        self.count += sign
+        price, area = _number(row.get('price_num')), _number(row.get('area_m2'))
+        if price is not None:
+            self.price_sum += sign * price
+            self.price_n += sign
+            if area:
+                self.ppm_sum += sign * price / area
+                self.ppm_n += sign
+        lat, lon = _number(row.get('final_lat')), _number(row.get('final_lon'))
+        if lat and lon is not None:
+            self.lat_sum += sign * lat
+            self.lon_sum += sign * lon
+            self.located += sign
+
+    def merge(self, other: "MarketAggregate"):
+        for name in self.__slots__:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    @property
+    def avg_price(self) -> Optional[float]:
+        return self.price_sum / self.price_n if self.price_n else None
+
+    @property
+    def avg_price_per_m2(self) -> Optional[float]:
+        return self.ppm_sum / self.ppm_n if self.ppm_n else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'properties_count': self.count,
+            'avg_price': round(self.avg_price, 2) if self.price_n else None,
+            'avg_price_per_m2': round(self.avg_price_per_m2, 2) if self.ppm_n else None,
+            'priced_count': self.price_n,
+            'avg_lat': self.lat_sum / self.located if self.located else None,
+            'avg_lon': self.lon_sum / self.located if self.located else None,
+        }
+
+
+def normalize_purpose(purpose: Optional[str]) -> Optional[str]:
+    """
+    توحيد الغرض مثل normalized_purpose في view الـ district_market_stats
+
+    "للبيع"/"بيع" → "بيع"، و"للإيجار"/"للايجار"/"إيجار" → "إيجار"؛ غير ذلك يبقى كما هو
+    """
+    text = normalize_arabic_text(purpose or '')
+    if 'بيع' in text:
+        return 'بيع'
+    if 'ايجار' in text or 'اجار' in text:
+        return 'إيجار'
+    return purpose
+
+
+def market_key(row: Dict[str, Any]) -> MarketKey:
+    return (row.get('city'), row.get('district'), normalize_purpose(row.get('purpose')), row.get('property_type'))
+
+
+class MarketStats:
+    """
+    إحصاءات السوق داخل الذاكرة، تُبنى عند أول قراءة وتُحدّث من تغييرات المخزن
+
+    متاحة لمحرك البحث أيضاً (مثلاً لمقارنة سعر المتر بمتوسط الحي في الترتيب)
+    """
+
+    def __init__(self, store: PropertyStore):
+        self.store = store
+        self._aggregates: Dict[MarketKey, MarketAggregate] = {}
+        # (المدينة، الحي، الغرض) → الأنواع الموجودة فيه، لقراءة الحي لكل الأنواع بدون مسح
+        self._types: Dict[Tuple[Optional[str], Optional[str], Optional[str]], set] = {}
+        # لقطة المخزن التي تعكسها المجاميع (لتجنب تطبيق نفس التغيير مرتين)
+        self._source: Optional[List[Dict[str, Any]]] = None
+        self._lock = threading.Lock()
+
+    def _sync(self):
+        """بناء المجاميع من اللقطة الحالية إذا لم تكن تعكسها (يُستدعى مع القفل)"""
+        rows = self.store.rows()
+        if self._source is rows:
+            return
+        self._aggregates, self._types = {}, {}
+        for row in rows:
+            self._add_row(row)
+        self._source = rows
+        logger.info(f"📊 بناء إحصاءات السوق: {len(self._aggregates)} مجموعة من {len(rows)} عقار")
+
+    def _add_row(self, row: Dict[str, Any]):
+        key = market_key(row)
+        aggregate = self._aggregates.get(key)
+        if aggregate is None:
+            aggregate = self._aggregates[key] = MarketAggregate()
+            self._types.setdefault(key[:3], set()).add(key[3])
+        aggregate.add(row)
+
+    def _remove_row(self, row: Dict[str, Any]):
+        key = market_key(row)
+        aggregate = self._aggregates.get(key)
+        if aggregate is None:
+            return
+        aggregate.add(row, sign=-1)
+        if aggregate.count <= 0:
+            del self._aggregates[key]
+            types = self._types.get(key[:3])
+            types.discard(key[3])
+            if not types:
+                del self._types[key[:3]]
+
+    def ensure_loaded(self) -> bool:
+        loaded = self.store.ensure_loaded()
+        with self._lock:
+            self._sync()
+        return loaded
+
+    def on_property_changes(self, changes):
+        """مستمع تغييرات المخزن: تحديث المجاميع المتأثرة فقط"""
+        with self._lock:
+            if self._source is None or self._source is self.store.rows():
+                # لم تُبنَ بعد، أو بُنيت من اللقطة الجديدة قبل وصول الإشعار
+                return
+            for old, new in changes:
+                if old is not None:
+                    self._remove_row(old)
+                if new is not None:
+                    self._add_row(new)
+            self._source = self.store.rows()
+
+    def get(self, city: Optional[str], district: Optional[str], purpose: str,
+            property_type: Optional[str] = None) -> Optional[MarketAggregate]:
+        """
+        مجاميع حي واحد (لكل الأنواع إذا لم يُحدد النوع)
+
+        Returns:
+            نسخة من المجاميع أو None إذا لم توجد عقارات
+        """
+        purpose = normalize_purpose(purpose)
+        with self._lock:
+            self._sync()
+            types = [property_type] if property_type is not None else self._types.get((city, district, purpose), ())
+            keys = [k for k in ((city, district, purpose, t) for t in types) if k in self._aggregates]
+            if not keys:
+                return None
+            result = MarketAggregate()
+            for key in keys:
+                result.merge(self._aggregates[key])
+            return result
+
+    def districts(self, purpose: str, property_type: Optional[str] = None,
+                  city: Optional[str] = None) -> List[Dict[str, Any]]:
+        """إحصاءات كل الأحياء لغرض معين (مرتبة حسب متوسط سعر المتر تنازلياً)"""
+        normalized = normalize_purpose(purpose)
+        with self._lock:
+            self._sync()
+            merged: Dict[Tuple[Optional[str], Optional[str]], MarketAggregate] = {}
+            for (k_city, k_district, k_purpose, k_type), aggregate in self._aggregates.items():
+                if k_purpose != normalized or (property_type and k_type != property_type) or (city and k_city != city):
+                    continue
+                if k_district is None:
+                    continue
+                merged.setdefault((k_city, k_district), MarketAggregate()).merge(aggregate)
+
+        stats = [
+            {'city': k_city, 'district': k_district, 'purpose': purpose, 'property_type': property_type,
+             **aggregate.to_dict()}
+            for (k_city, k_district), aggregate in merged.items()
+        ]
+        stats.sort(key=lambda s: (s['avg_price_per_m2'] is None, -(s['avg_price_per_m2'] or 0)))
+        return stats
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'groups': len(self._aggregates), 'built': self._source is not None}
+
+
+# إنشاء instance واحد لكل worker
+market_stats = MarketStats(property_store)
+
+property_store.subscribe(market_stats.on_property_changes)
@@ -117,6 +117,11 @@ class SearchMode(str, Enum):
     SIMILAR = "similar"
 
 
+class SearchView(str, Enum):
+    FULL = "full"
+    MAP = "map"  # الحقول اللازمة لرسم الخريطة فقط
+
+
 class Property(BaseModel):
     """نموذج العقار - تم إضافة حقول الخدمات القريبة"""
     id: str
@@ -150,6 +155,111 @@ class Property(BaseModel):
     match_score: Optional[float] = None
 
 
+class PropertyMarker(BaseModel):
+    """نسخة مختصرة من العقار لرسم الخريطة (التفاصيل تُجلب عند الطلب)"""
+    id: str
+    final_lat: Optional[float] = None
+    final_lon: Optional[float] = None
+    price_num: Optional[float] = None
+    property_type: str
+    match_score: Optional[float] = None
+
+
+class PropertyDetailsRequest(BaseModel):
+    """طلب تفاصيل عدة عقارات دفعة واحدة"""
+    ids: List[str] = Field(..., min_length=1, max_length=100)
+
+
+class MapBounds(BaseModel):
+    """إطار عرض الخريطة"""
+    south: float = Field(..., ge=-90, le=90)
+    west: float = Field(..., ge=-180, le=180)
+    north: float = Field(..., ge=-90, le=90)
+    east: float = Field(..., ge=-180, le=180)
+
+
+class ClusterRequest(BaseModel):
+    criteria: PropertyCriteria
+    zoom: int = Field(..., ge=0, le=22, description="مستوى تقريب الخريطة")
+    bounds: Optional[MapBounds] = Field(None, description="إطار العرض (بدون = كل المجموعات)")
+
+
+class MapCluster(BaseModel):
+    """مجموعة عقارات في خلية واحدة من شبكة الخريطة"""
+    key: str  # zoom/x/y
+    count: int
+    lat: float
+    lon: float
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    property_id: Optional[str] = None  # عند وجود عقار واحد فقط
+
+
+class ClusterResponse(BaseModel):
+    success: bool
+    zoom: int
+    clusters: List[MapCluster] = []
+    total_count: int = 0  # كل العقارات المطابقة (وليس داخل الإطار فقط)
+    truncated: bool = False
+
+
+class HeatmapCell(BaseModel):
+    """خلية في الخريطة الحرارية (المركز + الإحصاءات)"""
+    lat: float
+    lon: float
+    count: int
+    mean_price: Optional[float] = None
+    mean_price_per_m2: Optional[float] = None
+
+
+class HeatmapResponse(BaseModel):
+    success: bool
+    zoom: int
+    cells: List[HeatmapCell] = []
+    total_count: int = 0  # كل عقارات الغرض/النوع (وليس داخل الإطار فقط)
+
+
+class MarketStat(BaseModel):
+    """إحصاءات السوق لحي (بنفس أسماء حقول district_market_stats)"""
+    city: Optional[str] = None
+    district: Optional[str] = None
+    purpose: str
+    property_type: Optional[str] = None  # None = كل الأنواع
+    properties_count: int
+    priced_count: int = 0
+    avg_price: Optional[float] = None
+    avg_price_per_m2: Optional[float] = None
+    avg_lat: Optional[float] = None
+    avg_lon: Optional[float] = None
+
+
+class MarketStatsResponse(BaseModel):
+    success: bool
+    stats: List[MarketStat] = []
+
+
+class BestValueProperty(Property):
+    """عقار أرخص من متوسط حيه (بنفس حقول district_best_value_properties)"""
+    price_per_m2: float
+    avg_price_per_m2: float
+    district_properties_count: int
+    discount_pct: float  # نسبة الخصم عن متوسط سعر المتر في الحي
+    savings_per_m2: float
+
+
+class BestValueRequest(BaseModel):
+    """طلب أفضل العروض لعدة أحياء دفعة واحدة"""
+    districts: List[str] = Field(..., min_length=1, max_length=50)
+    purpose: PropertyPurpose
+    property_type: Optional[PropertyType] = None  # بدون = كل الأنواع
+    limit: int = Field(5, ge=1, le=20)
+
+
+class BestValueResponse(BaseModel):
+    success: bool
+    results: Dict[str, List[BestValueProperty]] = {}
+
+
 class ChatMessage(BaseModel):
     role: Literal["user", "assistant", "system"]
     content: str
@@ -173,6 +283,9 @@ class UserQuery(BaseModel):
 class SearchModeSelection(BaseModel):
     mode: SearchMode
     criteria: PropertyCriteria
+    cursor: Optional[str] = Field(None, description="مؤشر الصفحة التالية من الاستجابة السابقة")
+    page_size: Optional[int] = Field(None, ge=1, le=100, description="عدد العقارات في الصفحة")
+    view: SearchView = Field(SearchView.FULL, description="full = كل التفاصيل، map = حقول الخريطة فقط")
 
 
 class SearchResponse(BaseModel):
@@ -180,8 +293,11 @@ class SearchResponse(BaseModel):
     message: str
     criteria: Optional[PropertyCriteria] = None
     properties: List[Property] = []
+    markers: Optional[List[PropertyMarker]] = None  # بدل properties عند view=map
     total_count: int = 0
     search_mode: Optional[SearchMode] = None
+    next_cursor: Optional[str] = None
+    has_more: bool = False
 
 
 
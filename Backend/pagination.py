@@ -0,0 +1,95 @@
+"""
+ترقيم صفحات البحث بالمؤشر (Keyset / Cursor Pagination)
+
+المؤشر نص مُعتم (base64) يحمل:
+- t: الطبقة الحالية (e = المطابق، s = المشابه)
+- a: مفتاح ترتيب آخر عقار مطابق أُرسل (السعر، id) لبدء الصفحة التالية بعده
+- p: موقع الصفحة التالية داخل نتائج الـ RPC المكاني للمطابق
+- r: ما تبقى من طبقة المشابه المرتبة [(id، match_score)]، فالصفحات التالية تجلب
+  العقارات بالمعرف فقط ولا تعيد الـ embedding أو البحث المتجهي أو الترتيب
+  مهما كان الـ worker أو عمر ذاكرة البحث
+- k: بداية بصمة المعايير، لرفض مؤشر صادر لبحث آخر
+"""
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+import base64
+import json
+
+CURSOR_VERSION = 2
+
+TIER_EXACT = "e"
+TIER_SIMILAR = "s"
+
+# (السعر أو None، id) بنفس ترتيب order('price_num').order('id') مع NULL في الآخر
+SortKey = Tuple[Optional[float], str]
+# (id، match_score) لعقار في طبقة المشابه
+RankedEntry = Tuple[str, int]
+
+
+class InvalidCursor(ValueError):
+    """مؤشر تالف أو لا يخص هذه المعايير"""
+
+
+@dataclass
+class Cursor:
+    tier: str = TIER_EXACT
+    after: Optional[SortKey] = None
+    position: int = 0
+    ranked: Optional[List[RankedEntry]] = None
+
+
+@dataclass
+class SearchPage:
+    """صفحة واحدة من نتائج البحث"""
+    items: List[Any] = field(default_factory=list)
+    next_cursor: Optional[str] = None
+
+    @property
+    def has_more(self) -> bool:
+        return self.next_cursor is not None
+
+
+def sort_key(row: Dict[str, Any]) -> SortKey:
+    price = row.get('price_num')
+    return (None if price is None else float(price), str(row.get('id')))
+
+
+def sort_tuple(key: SortKey) -> tuple:
+    """مفتاح مقارنة بايثون: NULL بعد كل الأسعار"""
+    price, property_id = key
+    return (price is None, price or 0.0, property_id)
+
+
+def encode_cursor(cursor: Cursor, fingerprint: str) -> str:
+    payload = {"v": CURSOR_VERSION, "k": fingerprint[:16], "t": cursor.tier, "p": cursor.position}
+    if cursor.after is not None:
+        payload["a"] = list(cursor.after)
+    if cursor.ranked is not None:
+        payload["r"] = [[property_id, score] for property_id, score in cursor.ranked]
+    raw = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: Optional[str], fingerprint: str) -> Cursor:
+    if not token:
+        return Cursor()
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        payload = json.loads(raw)
+        after = payload.get("a")
+        ranked = payload.get("r")
+        cursor = Cursor(
+            tier=payload["t"],
+            after=(None if after[0] is None else float(after[0]), str(after[1])) if after else None,
+            position=int(payload.get("p", 0)),
+            ranked=[(str(entry[0]), int(entry[1])) for entry in ranked] if ranked is not None else None,
+        )
+    except (ValueError, KeyError, TypeError, IndexError) as e:
+        raise InvalidCursor(f"مؤشر غير صالح: {e}")
+
+    if payload.get("v") != CURSOR_VERSION or payload.get("k") != fingerprint[:16]:
+        raise InvalidCursor("المؤشر لا يخص معايير البحث هذه")
+    if cursor.tier not in (TIER_EXACT, TIER_SIMILAR) or cursor.position < 0 or \
+            (cursor.tier == TIER_SIMILAR and cursor.ranked is None):
+        raise InvalidCursor("مؤشر غير صالح")
+    return cursor
@@ -0,0 +1,253 @@
+"""
+ترميز عمودي ثنائي لنتائج البحث (Columnar Binary Encoding)
+
+بدلاً من قائمة كائنات JSON تكرر نفس المفاتيح لكل عقار، تُرسل النتائج كأعمدة:
+- الإحداثيات float32 والأرقام float64 كبايتات خام (NaN = NULL)
+- الحقول المتكررة (الحي، النوع، المدينة...) بترميز قاموسي: قائمة قيم + أكواد uint16
+- النصوص والخدمات القريبة كقوائم كما هي
+
+الصيغة تُختار حسب ترويسة Accept:
+    application/x-msgpack               → MessagePack (الافتراضي الثنائي)
+    application/vnd.apache.arrow.stream → Arrow IPC (إذا كانت pyarrow مثبتة)
+وبدونهما تبقى الاستجابة JSON كما هي.
+"""
+from operator import attrgetter
+from typing import List, Optional, Dict, Any
+import json
+import msgpack
+import numpy as np
+
+MSGPACK_MEDIA_TYPE = "application/x-msgpack"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+COLUMNAR_VERSION = 1
+
+FLOAT32_FIELDS = {'lat', 'lon', 'final_lat', 'final_lon'}
+FLOAT64_FIELDS = {'price_num', 'area_m2', 'time_to_metro_min', 'match_score'}
+INT_FIELDS = {'rooms', 'baths', 'halls'}  # int32 مع -1 = NULL
+DICTIONARY_FIELDS = {'purpose', 'property_type', 'city', 'district', 'price_currency', 'price_period'}
+NESTED_FIELDS = {'nearby_schools', 'nearby_universities', 'nearby_mosques'}
+
+# الحقول التي تحمل العقارات في SearchResponse
+ITEM_FIELDS = ('properties', 'markers')
+
+
+def _arrow():
+    """pyarrow اختيارية: None إذا لم تكن مثبتة"""
+    try:
+        import pyarrow
+        return pyarrow
+    except ImportError:
+        return None
+
+
+def negotiate(accept: Optional[str]) -> Optional[str]:
+    """
+    اختيار الصيغة الثنائية من ترويسة Accept (حسب q ثم الترتيب)
+
+    Returns:
+        نوع الوسائط الثنائي أو None للبقاء على JSON
+    """
+    if not accept:
+        return None
+    offers = []
+    for i, part in enumerate(accept.split(",")):
+        media, *params = [p.strip() for p in part.split(";")]
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        offers.append((-q, i, media.lower()))
+
+    for q, _, media in sorted(offers):
+        if q == 0:
+            break
+        if media == "application/json":
+            return None
+        if media in (MSGPACK_MEDIA_TYPE, "application/msgpack"):
+            return MSGPACK_MEDIA_TYPE
+        if media == ARROW_MEDIA_TYPE and _arrow() is not None:
+            return ARROW_MEDIA_TYPE
+    return None
+
+
+# ═══════════════════════════════════════════════════════
+# الأعمدة
+# ═══════════════════════════════════════════════════════
+def _kind(name: str) -> str:
+    if name in FLOAT32_FIELDS: return 'f4'
+    if name in FLOAT64_FIELDS: return 'f8'
+    if name in INT_FIELDS: return 'i4'
+    if name in DICTIONARY_FIELDS: return 'dict'
+    if name in NESTED_FIELDS: return 'nested'
+    return 'str'
+
+
+def _dictionary(values: List[Optional[str]]) -> Dict[str, Any]:
+    codes: Dict[Optional[str], int] = {}
+    encoded = np.fromiter((codes.setdefault(v, len(codes)) for v in values), dtype='<u2', count=len(values))
+    return {'values': list(codes), 'codes': encoded.tobytes()}
+
+
+def _fields(items: List[Any]) -> List[str]:
+    return list(type(items[0]).model_fields) if items else []
+
+
+def to_columns(items: List[Any]) -> Dict[str, Any]:
+    """
+    تحويل قائمة نماذج (Property / PropertyMarker) إلى أعمدة قابلة للتسلسل بـ MessagePack
+
+    القيم تُقرأ من النماذج مباشرة بدون .dict() لكل عقار
+    """
+    columns = {}
+    for name in _fields(items):
+        values = list(map(attrgetter(name), items))
+        kind = _kind(name)
+        if kind in ('f4', 'f8'):
+            data = np.array([np.nan if v is None else v for v in values], dtype='<' + kind).tobytes()
+        elif kind == 'i4':
+            data = np.array([-1 if v is None else v for v in values], dtype='<i4').tobytes()
+        elif kind == 'dict':
+            data = _dictionary(values)
+        else:
+            data = values
+        columns[name] = {'kind': kind, 'data': data}
+    return columns
+
+
+def decode_columns(columns: Dict[str, Any]) -> Dict[str, Any]:
+    """أعمدة to_columns كمصفوفات NumPy (الأرقام) أو قوائم (بدون بناء صفوف)"""
+    decoded = {}
+    for name, column in columns.items():
+        kind, data = column['kind'], column['data']
+        if kind in ('f4', 'f8', 'i4'):
+            decoded[name] = np.frombuffer(data, dtype='<' + kind)
+        elif kind == 'dict':
+            decoded[name] = np.array(data['values'], dtype=object)[np.frombuffer(data['codes'], dtype='<u2')]
+        else:
+            decoded[name] = data
+    return decoded
+
+
+def from_columns(columns: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """عكس to_columns: أعمدة إلى صفوف بنفس شكل JSON (NaN و -1 تعود None)"""
+    decoded = {}
+    for name, values in decode_columns(columns).items():
+        kind = columns[name]['kind']
+        if kind in ('f4', 'f8'):
+            decoded[name] = [None if v != v else v for v in values.astype(float).tolist()]
+        elif kind == 'i4':
+            decoded[name] = [None if v < 0 else v for v in values.tolist()]
+        else:
+            decoded[name] = list(values)
+    count = len(next(iter(decoded.values()), []))
+    return [dict(zip(decoded, row)) for row in zip(*decoded.values())] if decoded else [{} for _ in range(count)]
+
+
+# ═══════════════════════════════════════════════════════
+# MessagePack
+# ═══════════════════════════════════════════════════════
+def encode_msgpack(response) -> bytes:
+    """ترميز استجابة (SearchResponse) كـ MessagePack عمودي"""
+    envelope = json.loads(response.json(exclude=set(ITEM_FIELDS)))
+    payload = {'v': COLUMNAR_VERSION, **envelope}
+    for key in ITEM_FIELDS:
+        items = getattr(response, key, None)
+        payload[key] = None if items is None else {'count': len(items), 'columns': to_columns(items)}
+    return msgpack.packb(payload, use_bin_type=True)
+
+
+def decode_msgpack(data: bytes, rows: bool = True) -> Dict[str, Any]:
+    """
+    فك ترميز encode_msgpack
+
+    Args:
+        rows: True = نفس شكل استجابة JSON، False = أعمدة (decode_columns)
+    """
+    payload = msgpack.unpackb(data, raw=False)
+    payload.pop('v', None)
+    for key in ITEM_FIELDS:
+        if isinstance(payload.get(key), dict):
+            columns = payload[key]['columns']
+            payload[key] = from_columns(columns) if rows else decode_columns(columns)
+    return payload
+
+
+# ═══════════════════════════════════════════════════════
+# Arrow IPC
+# ═══════════════════════════════════════════════════════
+def encode_arrow(response, items_field: str = 'properties') -> bytes:
+    """
+    ترميز قائمة العقارات كجدول Arrow IPC (stream)
+
+    الغلاف (الرسالة، المؤشر...) في metadata الخاصة بالـ schema، والخدمات
+    القريبة كنص JSON لكل عقار لأن عناصرها غير متجانسة
+    """
+    pa = _arrow()
+    if pa is None:
+        raise RuntimeError("pyarrow غير مثبتة")
+
+    if getattr(response, 'markers', None) is not None:
+        items_field = 'markers'
+    items = getattr(response, items_field) or []
+    arrays, names = [], []
+    for name in _fields(items):
+        values = list(map(attrgetter(name), items))
+        kind = _kind(name)
+        if kind == 'f4':
+            array = pa.array(values, type=pa.float32())
+        elif kind == 'f8':
+            array = pa.array(values, type=pa.float64())
+        elif kind == 'i4':
+            array = pa.array(values, type=pa.int32())
+        elif kind == 'dict':
+            array = pa.array(values, type=pa.string()).dictionary_encode()
+        elif kind == 'nested':
+            array = pa.array([None if v is None else json.dumps(v, ensure_ascii=False) for v in values],
+                             type=pa.string())
+        else:
+            array = pa.array(values, type=pa.string())
+        arrays.append(array)
+        names.append(name)
+
+    envelope = response.json(exclude={items_field})
+    table = pa.Table.from_arrays(arrays, names=names) if arrays else pa.table({})
+    table = table.replace_schema_metadata({'envelope': envelope, 'items_field': items_field,
+                                           'v': str(COLUMNAR_VERSION)})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def decode_arrow(data: bytes, rows: bool = True) -> Dict[str, Any]:
+    """
+    فك ترميز encode_arrow
+
+    Args:
+        rows: True = نفس شكل استجابة JSON، False = جدول pyarrow كما هو
+    """
+    pa = _arrow()
+    if pa is None:
+        raise RuntimeError("pyarrow غير مثبتة")
+
+    table = pa.ipc.open_stream(data).read_all()
+    metadata = {k.decode(): v.decode() for k, v in (table.schema.metadata or {}).items()}
+    if not rows:
+        return {**json.loads(metadata['envelope']), metadata['items_field']: table}
+    rows = table.to_pylist()
+    for row in rows:
+        for name in NESTED_FIELDS & set(row):
+            if row[name] is not None:
+                row[name] = json.loads(row[name])
+    return {**json.loads(metadata['envelope']), metadata['items_field']: rows}
+
+
+def encode(response, media_type: str) -> bytes:
+    """ترميز الاستجابة بالصيغة التي اختارها negotiate"""
+    if media_type == ARROW_MEDIA_TYPE:
+        return encode_arrow(response)
+    return encode_msgpack(response)
@@ -0,0 +1,432 @@
+"""
+فهرس مكاني داخل الذاكرة للخدمات (المدارس، المساجد، الجامعات)
+يُحمَّل مرة واحدة في كل worker ويجيب على سؤال "هل توجد خدمة مطابقة ضمن X متر
+من كل عقار؟" باستدعاء واحد (Batch) بدلاً من RPC لكل عقار
+"""
+from config import settings
+from typing import List, Optional, Dict, Any, Sequence, Tuple
+from arabic_utils import normalize_arabic_text
+import numpy as np
+import threading
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_M = 6371000.0
+METERS_PER_DEGREE_LAT = 111320.0
+
+LEVELS_TRANSLATION_MAP = {
+    "ابتدائي": "elementary",
+    "متوسط": "middle",
+    "ثانوي": "high",
+    "روضة": "kindergarten",
+    "حضانة": "nursery"
+}
+
+# كل مرحلة دراسية تأخذ bit واحد حتى تصبح فلترة المراحل عملية AND واحدة
+SCHOOL_LEVEL_BITS = {
+    "kindergarten": 1,
+    "nursery": 2,
+    "elementary": 4,
+    "middle": 8,
+    "high": 16
+}
+
+GENDER_TRANSLATION_MAP = {
+    "بنين": "boys",
+    "بنات": "girls",
+    "boys": "boys",
+    "girls": "girls"
+}
+
+
+def haversine_meters(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """
+    حساب المسافة (Haversine) بالأمتار بشكل متجهي
+
+    يقبل أرقاماً مفردة أو مصفوفات NumPy قابلة للبث (Broadcasting)
+    """
+    lat1 = np.radians(lat1)
+    lat2 = np.radians(lat2)
+    dlat = lat2 - lat1
+    dlon = np.radians(lon2) - np.radians(lon1)
+
+    a = np.sin(dlat / 2.0) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2.0) ** 2
+    return 2.0 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def normalize_gender(gender: Optional[str]) -> Optional[str]:
+    """توحيد قيمة جنس المدرسة (بنين/بنات/boys/girls) إلى boys أو girls"""
+    if not gender:
+        return None
+    return GENDER_TRANSLATION_MAP.get(str(gender).strip().lower())
+
+
+def levels_to_bits(levels: Optional[Sequence[str]]) -> int:
+    """تحويل قائمة مراحل (بالعربي أو الإنجليزي) إلى bitmask"""
+    bits = 0
+    for level in levels or []:
+        if not level:
+            continue
+        key = LEVELS_TRANSLATION_MAP.get(level.strip(), level.strip().lower())
+        bits |= SCHOOL_LEVEL_BITS.get(key, 0)
+    return bits
+
+
+def _parse_school_levels(row: Dict[str, Any]) -> int:
+    """قراءة مراحل المدرسة من levels_pg_array (مثل {elementary,middle}) أو primary_level"""
+    raw = row.get('levels_pg_array')
+    levels: List[str] = []
+
+    if isinstance(raw, (list, tuple)):
+        levels.extend(str(l) for l in raw)
+    elif isinstance(raw, str) and raw:
+        levels.extend(part.strip().strip('"') for part in raw.strip('{}').split(','))
+
+    if row.get('primary_level'):
+        levels.append(str(row['primary_level']))
+
+    return levels_to_bits(levels)
+
+
+class PointSet:
+    """
+    مجموعة نقاط (lat/lon) مع شبكة منتظمة (Grid) للبحث السريع
+
+    النقاط مرتبة حسب مفتاح الخلية (row * width + col) بحيث تكون خلايا
+    كل صف متجاورة في الذاكرة، فيصبح جلب المرشحين عملية searchsorted واحدة
+    """
+
+    def __init__(self, rows: List[Dict[str, Any]], cell_degrees: float = 0.01,
+                 lat_field: str = 'lat', lon_field: str = 'lon'):
+        self.cell_degrees = cell_degrees
+        self.rows: List[Dict[str, Any]] = []
+
+        lats, lons = [], []
+        for row in rows:
+            lat, lon = row.get(lat_field), row.get(lon_field)
+            if lat is None or lon is None:
+                continue
+            try:
+                lat, lon = float(lat), float(lon)
+            except (TypeError, ValueError):
+                continue
+            if lat == 0 and lon == 0:
+                continue
+            self.rows.append(row)
+            lats.append(lat)
+            lons.append(lon)
+
+        self.lat = np.asarray(lats, dtype=np.float64)
+        self.lon = np.asarray(lons, dtype=np.float64)
+
+        if len(self.rows) == 0:
+            self._row0 = self._col0 = 0
+            self._height = self._width = 0
+            self._sorted_keys = np.empty(0, dtype=np.int64)
+            self._order = np.empty(0, dtype=np.int64)
+            return
+
+        cell_rows = np.floor(self.lat / cell_degrees).astype(np.int64)
+        cell_cols = np.floor(self.lon / cell_degrees).astype(np.int64)
+        self._row0, self._col0 = int(cell_rows.min()), int(cell_cols.min())
+        self._height = int(cell_rows.max()) - self._row0 + 1
+        self._width = int(cell_cols.max()) - self._col0 + 1
+
+        keys = (cell_rows - self._row0) * self._width + (cell_cols - self._col0)
+        self._order = np.argsort(keys, kind='stable')
+        self._sorted_keys = keys[self._order]
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def pairs_within(self, lats, lons, radius_meters,
+                     mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        جميع أزواج (نقطة استعلام، نقطة من المجموعة) ضمن نصف القطر
+
+        Args:
+            lats, lons: إحداثيات نقاط الاستعلام (N)
+            radius_meters: نصف القطر (رقم واحد أو مصفوفة بطول N)
+            mask: فلتر منطقي على نقاط المجموعة (اختياري)
+
+        Returns:
+            (query_idx, point_idx, distance_meters)
+        """
+        lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+        lons = np.atleast_1d(np.asarray(lons, dtype=np.float64))
+        radius = np.broadcast_to(np.asarray(radius_meters, dtype=np.float64), lats.shape)
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0))
+
+        if len(self) == 0 or lats.size == 0:
+            return empty
+
+        # نطاق الخلايا (صفوف وأعمدة) الذي يغطي مربع نصف القطر لكل نقطة
+        dlat = radius / METERS_PER_DEGREE_LAT
+        dlon = dlat / np.maximum(np.cos(np.radians(lats)), 1e-6)
+        row_lo = np.floor((lats - dlat) / self.cell_degrees).astype(np.int64) - self._row0
+        row_hi = np.floor((lats + dlat) / self.cell_degrees).astype(np.int64) - self._row0
+        col_lo = np.floor((lons - dlon) / self.cell_degrees).astype(np.int64) - self._col0
+        col_hi = np.floor((lons + dlon) / self.cell_degrees).astype(np.int64) - self._col0
+
+        row_lo = np.clip(row_lo, 0, self._height)
+        row_hi = np.clip(row_hi, -1, self._height - 1)
+        col_lo = np.clip(col_lo, 0, self._width)
+        col_hi = np.clip(col_hi, -1, self._width - 1)
+        valid = (row_hi >= row_lo) & (col_hi >= col_lo)
+
+        # زوج (نقطة، صف خلايا) لكل صف يغطيه مربع البحث
+        rows_per_query = np.where(valid, row_hi - row_lo + 1, 0)
+        query_of_band = np.repeat(np.arange(lats.size), rows_per_query)
+        if query_of_band.size == 0:
+            return empty
+        band_offset = np.arange(query_of_band.size) - np.repeat(np.cumsum(rows_per_query) - rows_per_query, rows_per_query)
+        band_row = row_lo[query_of_band] + band_offset
+
+        key_lo = band_row * self._width + col_lo[query_of_band]
+        key_hi = band_row * self._width + col_hi[query_of_band]
+        starts = np.searchsorted(self._sorted_keys, key_lo, side='left')
+        ends = np.searchsorted(self._sorted_keys, key_hi, side='right')
+
+        # توسيع النطاقات [start, end) إلى فهارس المرشحين دون حلقات بايثون
+        counts = ends - starts
+        band_of_candidate = np.repeat(np.arange(counts.size), counts)
+        if band_of_candidate.size == 0:
+            return empty
+        candidate_offset = np.arange(band_of_candidate.size) - np.repeat(np.cumsum(counts) - counts, counts)
+        point_idx = self._order[starts[band_of_candidate] + candidate_offset]
+        query_idx = query_of_band[band_of_candidate]
+
+        if mask is not None:
+            keep = mask[point_idx]
+            point_idx, query_idx = point_idx[keep], query_idx[keep]
+
+        distances = haversine_meters(lats[query_idx], lons[query_idx], self.lat[point_idx], self.lon[point_idx])
+        inside = distances <= radius[query_idx]
+        return query_idx[inside], point_idx[inside], distances[inside]
+
+    def any_within(self, lats, lons, radius_meters, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """لكل نقطة استعلام: هل توجد نقطة واحدة على الأقل ضمن نصف القطر؟"""
+        lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+        query_idx, _, _ = self.pairs_within(lats, lons, radius_meters, mask)
+        result = np.zeros(lats.size, dtype=bool)
+        result[query_idx] = True
+        return result
+
+    def nearest(self, lats, lons, radius_meters, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """لكل نقطة استعلام: المسافة لأقرب نقطة ضمن نصف القطر (inf إذا لم توجد)"""
+        lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+        query_idx, _, distances = self.pairs_within(lats, lons, radius_meters, mask)
+        result = np.full(lats.size, np.inf)
+        np.minimum.at(result, query_idx, distances)
+        return result
+
+    def within(self, lat: float, lon: float, radius_meters: float,
+               mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """النقاط ضمن نصف القطر من نقطة واحدة، مرتبة حسب المسافة"""
+        _, point_idx, distances = self.pairs_within([lat], [lon], radius_meters, mask)
+        order = np.argsort(distances, kind='stable')
+        return point_idx[order], distances[order]
+
+
+class POIIndex:
+    """
+    فهرس الخدمات (مدارس/مساجد/جامعات) لكل worker
+
+    يُحمَّل عند أول استخدام ويُعاد تحميله بعد POI_INDEX_REFRESH_SECONDS
+    """
+
+    KINDS = ('schools', 'mosques', 'universities')
+
+    def __init__(self, cell_degrees: float = 0.01, refresh_seconds: int = 3600):
+        self.cell_degrees = cell_degrees
+        self.refresh_seconds = refresh_seconds
+        self._sets: Dict[str, PointSet] = {}
+        self._school_gender = np.empty(0, dtype=object)
+        self._school_levels = np.empty(0, dtype=np.int64)
+        self._names: Dict[str, List[str]] = {}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    # ═══════════════════════════════════════════════════════
+    # التحميل
+    # ═══════════════════════════════════════════════════════
+    def build(self, schools: List[Dict[str, Any]], mosques: List[Dict[str, Any]],
+              universities: List[Dict[str, Any]]):
+        """بناء الفهرس من صفوف الجداول مباشرة"""
+        sets = {
+            'schools': PointSet(schools, self.cell_degrees),
+            'mosques': PointSet(mosques, self.cell_degrees),
+            'universities': PointSet(universities, self.cell_degrees)
+        }
+
+        school_rows = sets['schools'].rows
+        school_gender = np.array([normalize_gender(r.get('gender')) for r in school_rows], dtype=object)
+        school_levels = np.array([_parse_school_levels(r) for r in school_rows], dtype=np.int64)
+
+        # الأسماء المطبَّعة مسبقاً لفلترة الاسم (بديل ILIKE)
+        names = {
+            'schools': [normalize_arabic_text(r.get('name') or '') for r in school_rows],
+            'mosques': [normalize_arabic_text(r.get('name') or '') for r in sets['mosques'].rows],
+            'universities': [
+                normalize_arabic_text(f"{r.get('name_ar') or ''} | {r.get('name_en') or ''}")
+                for r in sets['universities'].rows
+            ]
+        }
+
+        # تبديل المراجع دفعة واحدة حتى لا يرى أي طلب فهرساً نصف محمّل
+        self._sets, self._names = sets, names
+        self._school_gender, self._school_levels = school_gender, school_levels
+        self._loaded_at = time.time()
+
+        logger.info(
+            f"🗺️ تم بناء فهرس الخدمات: {len(sets['schools'])} مدرسة، "
+            f"{len(sets['mosques'])} مسجد، {len(sets['universities'])} جامعة"
+        )
+
+    def load(self):
+        """تحميل جداول الخدمات من Supabase وبناء الفهرس"""
+        from database import db
+
+        self.build(
+            schools=db.fetch_all('schools', 'id, name, lat, lon, gender, levels_pg_array, primary_level, district'),
+            mosques=db.fetch_all('mosques', 'id, name, lat, lon, district'),
+            universities=db.fetch_all('universities', 'name_ar, name_en, lat, lon')
+        )
+
+    def is_loaded(self) -> bool:
+        return bool(self._sets)
+
+    @property
+    def version(self) -> float:
+        """وقت آخر تحميل (يتغير مع كل إعادة بناء، لمفاتيح النتائج المشتقة من الفهرس)"""
+        return self._loaded_at
+
+    def ensure_loaded(self) -> bool:
+        """
+        التأكد من جاهزية الفهرس (مع إعادة التحميل عند انتهاء المدة)
+
+        Returns:
+            True إذا كان الفهرس جاهزاً للاستخدام
+        """
+        if not settings.POI_INDEX_ENABLED:
+            return False
+
+        if self.is_loaded() and time.time() - self._loaded_at < self.refresh_seconds:
+            return True
+
+        with self._lock:
+            if self.is_loaded() and time.time() - self._loaded_at < self.refresh_seconds:
+                return True
+            try:
+                self.load()
+            except Exception as e:
+                logger.error(f"❌ فشل تحميل فهرس الخدمات: {e}")
+                # نستمر بالنسخة القديمة إن وجدت، ونحاول مجدداً لاحقاً
+                self._loaded_at = time.time() if self.is_loaded() else 0.0
+
+        return self.is_loaded()
+
+    # ═══════════════════════════════════════════════════════
+    # الفلاتر
+    # ═══════════════════════════════════════════════════════
+    def _mask(self, kind: str, gender: Optional[str] = None, levels: Optional[List[str]] = None,
+              name: Optional[str] = None) -> Optional[np.ndarray]:
+        """بناء فلتر الخصائص (الجنس/المراحل/الاسم) لنوع خدمة معين"""
+        mask = None
+
+        if kind == 'schools':
+            gender = normalize_gender(gender)
+            if gender:
+                mask = self._school_gender == gender
+            level_bits = levels_to_bits(levels)
+            if level_bits:
+                level_mask = (self._school_levels & level_bits) != 0
+                mask = level_mask if mask is None else mask & level_mask
+
+        if name:
+            needle = normalize_arabic_text(name)
+            name_mask = np.fromiter((needle in n for n in self._names[kind]), dtype=bool,
+                                    count=len(self._names[kind]))
+            mask = name_mask if mask is None else mask & name_mask
+
+        return mask
+
+    # ═══════════════════════════════════════════════════════
+    # الاستعلامات
+    # ═══════════════════════════════════════════════════════
+    def any_within(self, kind: str, lats, lons, radius_meters,
+                   gender: Optional[str] = None, levels: Optional[List[str]] = None,
+                   name: Optional[str] = None) -> np.ndarray:
+        """
+        لكل عقار: هل توجد خدمة مطابقة ضمن نصف القطر؟ (استدعاء واحد لكل الدفعة)
+
+        Args:
+            kind: schools / mosques / universities
+            lats, lons: إحداثيات العقارات
+            radius_meters: نصف القطر بالمتر (رقم أو مصفوفة)
+            gender, levels: فلاتر المدارس (اختياري)
+            name: جزء من اسم الخدمة (اختياري)
+
+        Returns:
+            مصفوفة bool بطول عدد العقارات
+        """
+        mask = self._mask(kind, gender, levels, name)
+        return self._sets[kind].any_within(lats, lons, radius_meters, mask)
+
+    def nearest_meters(self, kind: str, lats, lons, radius_meters,
+                       gender: Optional[str] = None, levels: Optional[List[str]] = None,
+                       name: Optional[str] = None) -> np.ndarray:
+        """لكل عقار: المسافة لأقرب خدمة مطابقة ضمن نصف القطر (inf إذا لم توجد)"""
+        mask = self._mask(kind, gender, levels, name)
+        return self._sets[kind].nearest(lats, lons, radius_meters, mask)
+
+    def nearby(self, kind: str, lat: float, lon: float, radius_meters: float,
+               gender: Optional[str] = None, levels: Optional[List[str]] = None,
+               name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        الخدمات القريبة من نقطة واحدة بنفس شكل مخرجات دوال العرض (RPC)
+        مرتبة من الأقرب للأبعد
+        """
+        point_set = self._sets[kind]
+        mask = self._mask(kind, gender, levels, name)
+        indices, distances = point_set.within(lat, lon, radius_meters, mask)
+
+        results = []
+        for i, d in zip(indices, distances):
+            row = point_set.rows[i]
+            if kind == 'universities':
+                item = {'name_ar': row.get('name_ar'), 'name_en': row.get('name_en')}
+            else:
+                item = {'id': row.get('id'), 'name': row.get('name')}
+            item.update({
+                'lat': float(point_set.lat[i]),
+                'lon': float(point_set.lon[i]),
+                'distance_meters': float(d)
+            })
+            results.append(item)
+        return results
+
+    def points(self, kind: str, gender: Optional[str] = None, levels: Optional[List[str]] = None,
+               name: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """إحداثيات الخدمات المطابقة للفلاتر (مصادر حساب زمن التنقل)"""
+        point_set = self._sets[kind]
+        mask = self._mask(kind, gender, levels, name)
+        if mask is None:
+            return point_set.lat, point_set.lon
+        return point_set.lat[mask], point_set.lon[mask]
+
+    def rows_within(self, kind: str, lat: float, lon: float, radius_meters: float,
+                    gender: Optional[str] = None) -> List[Tuple[Dict[str, Any], float]]:
+        """الصفوف الكاملة ضمن نصف القطر مع المسافة بالمتر"""
+        point_set = self._sets[kind]
+        indices, distances = point_set.within(lat, lon, radius_meters, self._mask(kind, gender))
+        return [(point_set.rows[i], float(d)) for i, d in zip(indices, distances)]
+
+
+# إنشاء instance واحد لكل worker
+poi_index = POIIndex(
+    cell_degrees=settings.POI_INDEX_CELL_DEGREES,
+    refresh_seconds=settings.POI_INDEX_REFRESH_SECONDS
+)
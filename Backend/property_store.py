@@ -0,0 +1,426 @@
+"""
+مخزن العقارات العمودي داخل الذاكرة (Columnar Property Store)
+
+يحتفظ بجدول properties كمصفوفات NumPy (عمود لكل حقل) ويُقيّم فلاتر
+PropertyCriteria كأقنعة منطقية متجهية بدلاً من استعلام PostgREST لكل طلب.
+يُحدَّث تدريجياً بسحب الصفوف المعدّلة حسب updated_at، مع إعادة تحميل كاملة دورية
+لالتقاط الحذف.
+"""
+from config import settings
+from database import PROPERTY_COLUMNS
+from models import PropertyCriteria
+from pagination import SortKey, sort_tuple
+from typing import List, Optional, Dict, Any, Callable, Tuple
+import numpy as np
+import bisect
+import threading
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# الأعمدة المحفوظة في الذاكرة (بدون embedding أو search_text)
+STORE_COLUMNS = PROPERTY_COLUMNS
+
+# (الصف القديم أو None، الصف الجديد أو None) لكل عقار تغيّر
+PropertyChange = Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]
+
+
+class _Dictionary:
+    """ترميز قاموسي (Dictionary Encoding) لعمود نصي"""
+
+    def __init__(self):
+        self.values: List[Optional[str]] = []
+        self._codes: Dict[Optional[str], int] = {}
+
+    def encode(self, value: Optional[str]) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self._codes[value] = code
+            self.values.append(value)
+        return code
+
+    def code_of(self, value: Optional[str]) -> int:
+        """كود القيمة أو -1 إذا لم تظهر في البيانات (لا يطابق أي صف)"""
+        return self._codes.get(value, -1)
+
+    def copy(self) -> "_Dictionary":
+        other = _Dictionary()
+        other.values = list(self.values)
+        other._codes = dict(self._codes)
+        return other
+
+
+def _float_or_nan(value) -> float:
+    if value is None or value == '':
+        return np.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+DICTIONARY_COLUMNS = ('purpose', 'property_type', 'district', 'city')
+# الأعداد كـ float32 حتى تعامل NaN معاملة NULL في SQL (أي مقارنة معها = False)
+NUMERIC_COLUMNS = (('rooms', np.float32), ('baths', np.float32), ('halls', np.float32),
+                   ('area_m2', np.float64), ('price_num', np.float64))
+
+
+class _Snapshot:
+    """لقطة ثابتة من الأعمدة؛ لا تُعدَّل بعد إنشائها (التحديث ينتج لقطة جديدة)"""
+
+    def __init__(self, rows: List[Dict[str, Any]]):
+        self.rows = rows
+        self.dictionaries = {name: _Dictionary() for name in DICTIONARY_COLUMNS}
+        self._set_columns(self._encode(rows))
+        self._ids = np.array([str(r.get('id')) for r in rows], dtype=str)
+        self.position = {str(r.get('id')): i for i, r in enumerate(rows)}
+        self._index()
+
+    def _encode(self, rows: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+        """تحويل صفوف إلى أعمدة بقواميس هذه اللقطة"""
+        n = len(rows)
+        columns = {
+            name: np.fromiter((d.encode(r.get(name)) for r in rows), dtype=np.int32, count=n)
+            for name, d in self.dictionaries.items()
+        }
+        for name, dtype in NUMERIC_COLUMNS + (('final_lat', np.float64), ('final_lon', np.float64)):
+            columns[name] = np.fromiter((_float_or_nan(r.get(name)) for r in rows), dtype=dtype, count=n)
+        return columns
+
+    def _columns(self) -> Dict[str, np.ndarray]:
+        return {**self.codes, **self.numeric, 'final_lat': self.final_lat, 'final_lon': self.final_lon}
+
+    def _set_columns(self, columns: Dict[str, np.ndarray]):
+        self.codes = {name: columns[name] for name in DICTIONARY_COLUMNS}
+        self.numeric = {name: columns[name] for name, _ in NUMERIC_COLUMNS}
+        self.final_lat = columns['final_lat']
+        self.final_lon = columns['final_lon']
+
+    def _index(self):
+        """الأعمدة المشتقة: وجود الموقع وترتيب السعر"""
+        self.has_location = ~np.isnan(self.final_lat) & (self.final_lat != 0)
+        # ترتيب ثابت: السعر تصاعدياً (NULL في الآخر) ثم id، مثل order('price_num').order('id')
+        price = self.numeric['price_num']
+        self.price_order = np.lexsort((self._ids, np.nan_to_num(price, nan=0.0), np.isnan(price)))
+
+    def patched(self, rows: List[Dict[str, Any]]) -> Tuple["_Snapshot", List[PropertyChange]]:
+        """
+        لقطة جديدة بعد upsert حسب id: تُنسخ الأعمدة ويُعاد ترميز الصفوف المتغيرة فقط
+        بدلاً من بناء كل الأعمدة من القواميس (اللقطة الحالية تبقى سليمة لمن يقرأها)
+        """
+        updated: Dict[int, Dict[str, Any]] = {}
+        appended: List[Dict[str, Any]] = []
+        position = self.position
+        changes: List[PropertyChange] = []
+        n = len(self.rows)
+        for row in rows:
+            row = dict(row)
+            key = str(row.get('id'))
+            i = position.get(key)
+            if i is None:
+                if position is self.position:
+                    position = dict(position)
+                position[key] = n + len(appended)
+                appended.append(row)
+                changes.append((None, row))
+            elif i >= n:
+                changes.append((appended[i - n], row))
+                appended[i - n] = row
+            else:
+                changes.append((updated.get(i, self.rows[i]), row))
+                updated[i] = row
+
+        snapshot = _Snapshot.__new__(_Snapshot)
+        snapshot.rows = list(self.rows)
+        for i, row in updated.items():
+            snapshot.rows[i] = row
+        snapshot.rows.extend(appended)
+        snapshot.position = position
+        snapshot.dictionaries = {name: d.copy() for name, d in self.dictionaries.items()}
+
+        changed = np.fromiter(updated.keys(), dtype=np.intp, count=len(updated))
+        patch = snapshot._encode(list(updated.values()))
+        extra = snapshot._encode(appended)
+        columns = {}
+        for name, column in self._columns().items():
+            column = np.concatenate((column, extra[name])) if appended else column.copy()
+            column[changed] = patch[name]
+            columns[name] = column
+        snapshot._set_columns(columns)
+        snapshot._ids = np.concatenate((self._ids, [str(r.get('id')) for r in appended])) if appended else self._ids
+        snapshot._index()
+        return snapshot, changes
+
+    def start_after(self, after: SortKey) -> int:
+        """موقع أول عقار في price_order مفتاحه أكبر من after (بحث ثنائي)"""
+        price = self.numeric['price_num']
+        target = sort_tuple(after)
+        return bisect.bisect_right(
+            range(len(self.price_order)), target,
+            key=lambda k: sort_tuple((None if np.isnan(price[self.price_order[k]]) else float(price[self.price_order[k]]),
+                                      str(self._ids[self.price_order[k]])))
+        )
+
+    def mask_for(self, criteria: PropertyCriteria) -> np.ndarray:
+        """تقييم فلاتر المعايير كقناع منطقي واحد"""
+        mask = self.has_location.copy()
+
+        for name, value in (('purpose', criteria.purpose.value),
+                            ('property_type', criteria.property_type.value),
+                            ('city', criteria.city),
+                            ('district', criteria.district)):
+            if value:
+                mask &= self.codes[name] == self.dictionaries[name].code_of(value)
+
+        for name in ('rooms', 'baths', 'halls'):
+            flt = getattr(criteria, name)
+            if not flt:
+                continue
+            column = self.numeric[name]
+            if flt.exact is not None:
+                mask &= column == flt.exact
+            else:
+                if flt.min is not None: mask &= column >= flt.min
+                if flt.max is not None: mask &= column <= flt.max
+
+        for name, flt in (('area_m2', criteria.area_m2), ('price_num', criteria.price)):
+            if not flt:
+                continue
+            column = self.numeric[name]
+            if flt.min is not None: mask &= column >= flt.min
+            if flt.max is not None: mask &= column <= flt.max
+
+        return mask
+
+
+def matches_criteria(criteria: PropertyCriteria, rows: List[Dict[str, Any]]) -> np.ndarray:
+    """تقييم فلاتر البحث المطابق على قائمة صفوف صغيرة (قناع منطقي)"""
+    return _Snapshot(rows).mask_for(criteria) if rows else np.zeros(0, dtype=bool)
+
+
+class PropertyStore:
+    """
+    مخزن العقارات داخل الذاكرة مع تحديث تدريجي
+
+    التحديث يتم عند الاستخدام (بدون خيوط خلفية) حتى يعمل بنفس الطريقة
+    داخل كل worker من gunicorn
+    """
+
+    def __init__(self, poll_seconds: int = 60, full_reload_seconds: int = 3600,
+                 updated_at_column: Optional[str] = "updated_at"):
+        self.poll_seconds = poll_seconds
+        self.full_reload_seconds = full_reload_seconds
+        self.updated_at_column = updated_at_column
+        self._snapshot: Optional[_Snapshot] = None
+        self._watermark: Optional[str] = None
+        self._last_poll = 0.0
+        self._last_full_load = 0.0
+        self._listeners: List[Callable[[List[PropertyChange]], None]] = []
+        self._lock = threading.Lock()
+
+    # ═══════════════════════════════════════════════════════
+    # الاشتراك في التغييرات
+    # ═══════════════════════════════════════════════════════
+    def subscribe(self, listener: Callable[[List[PropertyChange]], None]):
+        """تسجيل دالة تُستدعى بقائمة التغييرات بعد كل تحديث"""
+        self._listeners.append(listener)
+
+    def _notify(self, changes: List[PropertyChange]):
+        if not changes:
+            return
+        for listener in self._listeners:
+            try:
+                listener(changes)
+            except Exception as e:
+                logger.error(f"❌ خطأ في مستمع تغييرات العقارات: {e}")
+
+    # ═══════════════════════════════════════════════════════
+    # التحميل والتحديث
+    # ═══════════════════════════════════════════════════════
+    def build(self, rows: List[Dict[str, Any]]):
+        """بناء المخزن من صفوف جاهزة (مع إشعار المستمعين بالفروقات)"""
+        old = self._snapshot
+        new_rows = [dict(r) for r in rows]
+        self._snapshot = _Snapshot(new_rows)
+        self._watermark = self._max_updated_at(new_rows)
+        self._last_full_load = self._last_poll = time.time()
+
+        changes: List[PropertyChange] = []
+        old_by_id = {str(r.get('id')): r for r in old.rows} if old else {}
+        for row in new_rows:
+            previous = old_by_id.pop(str(row.get('id')), None)
+            if previous != row:
+                changes.append((previous, row))
+        changes.extend((row, None) for row in old_by_id.values())
+
+        logger.info(f"🗄️ تم تحميل مخزن العقارات: {len(new_rows)} عقار ({len(changes)} تغيير)")
+        self._notify(changes)
+
+    def apply_changes(self, rows: List[Dict[str, Any]]):
+        """دمج صفوف جديدة/معدّلة (upsert حسب id) بتعديل الأعمدة المتأثرة فقط"""
+        if not rows:
+            return
+        if self._snapshot is None:
+            self._snapshot, changes = _Snapshot([]).patched(rows)
+        else:
+            self._snapshot, changes = self._snapshot.patched(rows)
+        self._watermark = max(filter(None, [self._watermark, self._max_updated_at(rows)]), default=None)
+        logger.info(f"🔄 تحديث تدريجي لمخزن العقارات: {len(rows)} صف")
+        self._notify(changes)
+
+    def _max_updated_at(self, rows: List[Dict[str, Any]]) -> Optional[str]:
+        if not self.updated_at_column:
+            return None
+        values = [r.get(self.updated_at_column) for r in rows if r.get(self.updated_at_column)]
+        return max(values) if values else None
+
+    def _columns(self) -> str:
+        if self.updated_at_column:
+            return f"{STORE_COLUMNS}, {self.updated_at_column}"
+        return STORE_COLUMNS
+
+    def load(self):
+        """تحميل كامل لجدول العقارات"""
+        from database import db
+
+        try:
+            rows = db.fetch_all('properties', self._columns(), order_by='id')
+        except Exception:
+            if not self.updated_at_column:
+                raise
+            # الجدول لا يحتوي عمود updated_at بعد: نعتمد على إعادة التحميل الكاملة فقط
+            logger.warning(f"⚠️ العمود {self.updated_at_column} غير متوفر، سيتم تعطيل التحديث التدريجي")
+            self.updated_at_column = None
+            rows = db.fetch_all('properties', self._columns(), order_by='id')
+        self.build(rows)
+
+    def poll(self):
+        """سحب الصفوف المعدّلة منذ آخر updated_at معروف"""
+        self._last_poll = time.time()
+        if not self.updated_at_column or not self._watermark:
+            return
+
+        from database import db, POSTGREST_MAX_ROWS
+
+        # gte وليس gt: صف يُحفظ لاحقاً بنفس الطابع الزمني للـ watermark لا يضيع
+        changed: Dict[str, Dict[str, Any]] = {}
+        start = 0
+        while True:
+            result = db.client.table('properties')\
+                .select(self._columns())\
+                .gte(self.updated_at_column, self._watermark)\
+                .order(self.updated_at_column)\
+                .order('id')\
+                .range(start, start + POSTGREST_MAX_ROWS - 1)\
+                .execute()
+            batch = result.data or []
+            for row in batch:
+                changed[str(row.get('id'))] = row
+            if len(batch) < POSTGREST_MAX_ROWS:
+                break
+            start += POSTGREST_MAX_ROWS
+
+        # الصفوف عند الـ watermark نفسه تعود في كل سحب: نتجاهل ما هو مطابق للقطة الحالية
+        snapshot = self._snapshot
+        if snapshot is not None:
+            changed = {
+                key: row for key, row in changed.items()
+                if key not in snapshot.position or snapshot.rows[snapshot.position[key]] != row
+            }
+        self.apply_changes(list(changed.values()))
+
+    def is_loaded(self) -> bool:
+        return self._snapshot is not None
+
+    def ensure_loaded(self) -> bool:
+        """
+        التأكد من جاهزية المخزن وتحديثه إذا حان وقت السحب أو إعادة التحميل
+
+        Returns:
+            True إذا كان المخزن جاهزاً للاستخدام
+        """
+        now = time.time()
+        needs_full = not self.is_loaded() or now - self._last_full_load >= self.full_reload_seconds
+        needs_poll = now - self._last_poll >= self.poll_seconds
+        if not needs_full and not needs_poll:
+            return True
+
+        # طلب واحد فقط يحدّث المخزن؛ الباقون يستخدمون اللقطة الحالية
+        if not self._lock.acquire(blocking=not self.is_loaded()):
+            return True
+        try:
+            if needs_full:
+                self.load()
+            elif needs_poll:
+                self.poll()
+        except Exception as e:
+            logger.error(f"❌ فشل تحديث مخزن العقارات: {e}")
+            self._last_poll = now
+        finally:
+            self._lock.release()
+
+        return self.is_loaded()
+
+    # ═══════════════════════════════════════════════════════
+    # البحث
+    # ═══════════════════════════════════════════════════════
+    def search(self, criteria: PropertyCriteria, limit: int,
+               after: Optional[SortKey] = None) -> List[Dict[str, Any]]:
+        """
+        تطبيق فلاتر البحث المطابق وإرجاع أرخص limit عقار
+
+        Args:
+            after: مفتاح (السعر، id) لآخر عقار في الصفحة السابقة
+
+        Returns:
+            نسخ من صفوف العقارات (آمنة للتعديل من المستدعي)
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            return []
+
+        order = snapshot.price_order[snapshot.start_after(after):] if after is not None else snapshot.price_order
+        ordered = order[snapshot.mask_for(criteria)[order]]
+        return [dict(snapshot.rows[i]) for i in ordered[:limit]]
+
+    def snapshot(self) -> Optional[_Snapshot]:
+        """اللقطة الحالية (من يقرأ منها أكثر من مرة يأخذها مرة واحدة حتى لا يخلط لقطتين)"""
+        return self._snapshot
+
+    def points(self, purpose: str, property_type: str,
+               snapshot: Optional[_Snapshot] = None) -> Dict[str, np.ndarray]:
+        """
+        أعمدة العقارات ذات الموقع لغرض ونوع معينين (للتجميع المتجهي مثل الخرائط الحرارية)
+
+        Args:
+            snapshot: لقطة محددة بدلاً من الحالية
+
+        Returns:
+            final_lat, final_lon, price_num, area_m2 كمصفوفات (NaN = NULL)
+        """
+        snapshot = snapshot or self._snapshot
+        if snapshot is None:
+            return {name: np.zeros(0) for name in ('final_lat', 'final_lon', 'price_num', 'area_m2')}
+        mask = snapshot.has_location & ~np.isnan(snapshot.final_lon)
+        for name, value in (('purpose', purpose), ('property_type', property_type)):
+            mask &= snapshot.codes[name] == snapshot.dictionaries[name].code_of(value)
+        return {
+            'final_lat': snapshot.final_lat[mask],
+            'final_lon': snapshot.final_lon[mask],
+            'price_num': snapshot.numeric['price_num'][mask],
+            'area_m2': snapshot.numeric['area_m2'][mask],
+        }
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """جميع الصفوف في اللقطة الحالية (للقراءة فقط)"""
+        return self._snapshot.rows if self._snapshot else []
+
+
+# إنشاء instance واحد لكل worker
+property_store = PropertyStore(
+    poll_seconds=settings.PROPERTY_STORE_POLL_SECONDS,
+    full_reload_seconds=settings.PROPERTY_STORE_FULL_RELOAD_SECONDS,
+    updated_at_column=settings.PROPERTY_STORE_UPDATED_AT_COLUMN or None
+)
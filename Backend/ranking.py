@@ -0,0 +1,200 @@
+"""
+ترتيب طبقة العقارات المشابهة (Multi-Signal Ranking)
+
+كل المرشحين يُقيَّمون دفعة واحدة بـ NumPy: لكل إشارة درجة بين 0 و1، والدرجة
+النهائية متوسط موزون بأوزان config.Settings على الإشارات المتاحة لكل عقار
+فقط (عقار بلا سعر لا يُعاقب على السعر، وطلب بلا موقع لا يُقيَّم جغرافياً):
+
+- التشابه الدلالي من البحث المتجهي (0.7 للمرشحين من البحث الرقمي البديل)
+- قرب السعر من النطاق المطلوب (1 داخله، وينخفض خطياً حتى حد التسامح)
+- القرب من الموقع المرجعي (جامعة/مسجد/مركز الحي)
+- ملاءمة الغرف والمساحة
+- زمن الوصول لأقرب خدمة مطلوبة (مدرسة/مسجد/جامعة)
+- نفس الحي المطلوب
+
+ثم اختيار أفضل k بـ argpartition بدلاً من ترتيب القوائم كاملة.
+"""
+from config import settings
+from models import PropertyCriteria
+from poi_index import haversine_meters
+from typing import List, Optional, Dict, Any, Sequence, Tuple
+import numpy as np
+
+# درجة التشابه للمرشحين بدون similarity (مثل البحث الرقمي البديل)
+DEFAULT_SIMILARITY = 0.7
+# 100 محجوزة لنتائج البحث المطابق
+MAX_SIMILAR_SCORE = 99
+
+
+def weights() -> Dict[str, float]:
+    """أوزان الإشارات من الإعدادات (تُقرأ في كل طلب حتى تُضبط بدون إعادة تشغيل)"""
+    return {
+        'vector': settings.RANK_VECTOR_WEIGHT,
+        'price': settings.RANK_PRICE_WEIGHT,
+        'geo': settings.RANK_GEO_WEIGHT,
+        'fit': settings.RANK_FIT_WEIGHT,
+        'services': settings.RANK_SERVICE_WEIGHT,
+        'district': settings.RANK_DISTRICT_WEIGHT,
+    }
+
+
+def column(rows: Sequence[Dict[str, Any]], key: str) -> np.ndarray:
+    """عمود رقمي من الصفوف (NaN للقيم الفارغة أو غير الرقمية)"""
+    try:
+        return np.array([row.get(key) for row in rows], dtype=np.float64)
+    except (TypeError, ValueError):
+        values = []
+        for row in rows:
+            try:
+                values.append(float(row.get(key)))
+            except (TypeError, ValueError):
+                values.append(np.nan)
+        return np.array(values, dtype=np.float64)
+
+
+def range_fit(values: np.ndarray, low: Optional[float], high: Optional[float],
+              tolerance: float) -> Optional[np.ndarray]:
+    """
+    ملاءمة قيمة لنطاق: 1 داخل النطاق، وتنخفض خطياً إلى 0 عند تجاوز الحد
+    بنسبة tolerance منه
+
+    Returns:
+        مصفوفة درجات (NaN للقيم الفارغة) أو None إذا لم يُحدد نطاق
+    """
+    if low is None and high is None:
+        return None
+    gap = np.zeros_like(values)
+    if low:
+        gap = np.maximum(gap, (low - values) / (low * tolerance))
+    if high:
+        gap = np.maximum(gap, (values - high) / (high * tolerance))
+    return np.clip(1.0 - gap, 0.0, 1.0)
+
+
+def distance_decay(lats: np.ndarray, lons: np.ndarray, target_lat: Optional[float],
+                   target_lon: Optional[float], scale_km: float) -> Optional[np.ndarray]:
+    """القرب من الموقع المرجعي: exp(-المسافة / scale) (NaN للعقارات بدون إحداثيات)"""
+    if target_lat is None or target_lon is None:
+        return None
+    meters = haversine_meters(lats, lons, target_lat, target_lon)
+    score = np.exp(-meters / (scale_km * 1000.0))
+    return np.where((lats == 0) | np.isnan(lats), np.nan, score)
+
+
+def service_fit(minutes: np.ndarray, limit: float, tolerance: float) -> np.ndarray:
+    """
+    درجة خدمة واحدة: داخل الحد من 1 (ملاصقة) إلى 0.5 (على الحد)، وبعده
+    تنخفض إلى 0 عند انتهاء التسامح
+    """
+    limit = max(limit, 1e-6)
+    within = 1.0 - 0.5 * minutes / limit
+    beyond = 0.5 * np.clip(1.0 - (minutes - limit) / max(tolerance, 1e-6), 0.0, 1.0)
+    return np.where(minutes <= limit, within, beyond)
+
+
+def _nanmean(parts: List[np.ndarray]) -> Optional[np.ndarray]:
+    if not parts:
+        return None
+    stacked = np.vstack(parts)
+    counts = np.sum(~np.isnan(stacked), axis=0)
+    total = np.nansum(stacked, axis=0)
+    return np.where(counts > 0, total / np.maximum(counts, 1), np.nan)
+
+
+def signals(rows: Sequence[Dict[str, Any]], criteria: PropertyCriteria, similarity: np.ndarray,
+            target: Tuple[Optional[float], Optional[float]] = (None, None),
+            service_minutes: Sequence[Tuple[np.ndarray, float]] = ()) -> Dict[str, np.ndarray]:
+    """
+    درجات الإشارات لكل المرشحين (الإشارات غير المطلوبة لا تظهر)
+
+    Args:
+        rows: صفوف العقارات المرشحة
+        criteria: معايير البحث
+        similarity: التشابه الدلالي لكل صف (NaN = غير معروف)
+        target: الموقع المرجعي (lat, lon)
+        service_minutes: لكل خدمة مطلوبة (زمن الوصول لأقرب خدمة لكل صف، الحد بالدقائق)
+    """
+    result = {'vector': np.where(np.isnan(similarity), DEFAULT_SIMILARITY, np.clip(similarity, 0.0, 1.0))}
+    tolerance = settings.RANK_RANGE_TOLERANCE
+
+    if criteria.price:
+        price = range_fit(column(rows, 'price_num'), criteria.price.min, criteria.price.max, tolerance)
+        if price is not None:
+            result['price'] = price
+
+    geo = distance_decay(column(rows, 'final_lat'), column(rows, 'final_lon'), target[0], target[1],
+                         settings.RANK_GEO_SCALE_KM)
+    if geo is not None:
+        result['geo'] = geo
+
+    fits = []
+    if criteria.rooms:
+        fits.append(range_fit(column(rows, 'rooms'), criteria.rooms.min, criteria.rooms.max, tolerance))
+    if criteria.area_m2:
+        fits.append(range_fit(column(rows, 'area_m2'), criteria.area_m2.min, criteria.area_m2.max, tolerance))
+    fit = _nanmean([f for f in fits if f is not None])
+    if fit is not None:
+        result['fit'] = fit
+
+    services = _nanmean([service_fit(minutes, limit, settings.RANK_SERVICE_TOLERANCE_MINUTES)
+                         for minutes, limit in service_minutes])
+    if services is not None:
+        result['services'] = services
+
+    if criteria.district:
+        result['district'] = np.array([row.get('district') == criteria.district for row in rows], dtype=np.float64)
+
+    return result
+
+
+def combine(parts: Dict[str, np.ndarray], signal_weights: Optional[Dict[str, float]] = None) -> np.ndarray:
+    """متوسط موزون على الإشارات المتاحة لكل صف"""
+    signal_weights = signal_weights or weights()
+    names = [name for name in parts if signal_weights.get(name, 0) > 0]
+    if not names:
+        return parts['vector']
+    stacked = np.vstack([parts[name] for name in names])
+    w = np.array([signal_weights[name] for name in names])[:, None] * ~np.isnan(stacked)
+    total = np.sum(w, axis=0)
+    return np.where(total > 0, np.nansum(stacked * w, axis=0) / np.maximum(total, 1e-12), parts['vector'])
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    فهارس أفضل k درجة مرتبة تنازلياً (التعادل بترتيب المرشحين الأصلي)
+
+    argpartition يختار أفضل k في O(n) ثم تُرتب هي فقط
+    """
+    n = scores.size
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.arange(n) if k == n else np.argpartition(-scores, k - 1)[:k]
+    # حد الاختيار قد يقطع مجموعة متعادلة: نأخذ أقدم المرشحين منها
+    if k < n:
+        threshold = scores[candidates].min()
+        candidates = np.concatenate([np.flatnonzero(scores > threshold),
+                                     np.flatnonzero(scores == threshold)])[:k]
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order]
+
+
+def rank(rows: List[Dict[str, Any]], criteria: PropertyCriteria, similarity: np.ndarray,
+         target: Tuple[Optional[float], Optional[float]] = (None, None),
+         service_minutes: Sequence[Tuple[np.ndarray, float]] = (), k: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    ترتيب المرشحين وإضافة match_score لأفضل k منهم
+
+    Returns:
+        أفضل k صف مرتبة تنازلياً
+    """
+    if not rows:
+        return []
+    scores = combine(signals(rows, criteria, similarity, target, service_minutes))
+    selected = top_k(scores, len(rows) if k is None else k)
+    ranked = []
+    for i in selected:
+        row = rows[i]
+        row['match_score'] = int(min(round(float(scores[i]) * 100), MAX_SIMILAR_SCORE))
+        ranked.append(row)
+    return ranked
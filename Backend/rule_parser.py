@@ -0,0 +1,608 @@
+"""
+محلل قواعد سريع لطلبات المستخدم (Rule-Based Fast Path)
+
+أغلب الطلبات صيغ متكررة ("ابي شقة للايجار في النرجس ٣ غرف") أو تعديلات
+بسيطة ("خلها اربع غرف بدل ثلاث")، ولا تحتاج رحلة كاملة إلى النموذج اللغوي:
+
+- قاموس اللهجة نفسه الموجود في الـ system prompt: مرادفات النوع والغرض
+  وفترة السعر، والأرقام العربية الهندية وأسماء الأعداد، و"k" و"ألف"
+- أسماء الأحياء من دليل الأماكن (gazetteer)، والجامعات من القائمة الرسمية
+- عبارات التعديل ("بدل"، "خله"، "مو ... خله ...") تنتج UPDATE_CRITERIA
+- الثقة = نسبة الكلمات التي فهمتها القواعد؛ أي كلمة مجهولة (مدرسة، مترو،
+  مدينة أخرى...) تخفض الثقة فيرجع الطلب إلى النموذج اللغوي
+"""
+from config import settings
+from arabic_utils import normalize_arabic_text, find_best_match
+from gazetteer import gazetteer, DISTRICTS, MOSQUES
+from models import PropertyCriteria, PropertyPurpose, PropertyType, PricePeriod
+from typing import List, Optional, Dict, Any, Tuple
+from functools import lru_cache
+import threading
+import re
+
+DIGITS = str.maketrans('٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹٫', '01234567890123456789.')
+
+# أطول عبارة اسم (حي/جامعة/مسجد) تُجمع بعد الكلمة الدالة عليها
+MAX_PLACE_WORDS = 4
+MAX_UNIVERSITY_WORDS = 8
+
+DEFAULT_UNIVERSITY_MINUTES = 15
+DEFAULT_MOSQUE_MINUTES = 5
+
+ROOMS, BATHS, HALLS = 'rooms', 'baths', 'halls'
+AREA, PRICE, MINUTES = 'area_m2', 'price', 'minutes'
+
+FIELD_LABELS = {
+    'purpose': 'الغرض',
+    'property_type': 'نوع العقار',
+    'district': 'الحي',
+    ROOMS: 'عدد الغرف',
+    BATHS: 'عدد الحمامات',
+    HALLS: 'عدد الصالات',
+    AREA: 'المساحة',
+    PRICE: 'الميزانية',
+    'university_requirements': 'الجامعة',
+    'mosque_requirements': 'المسجد',
+}
+
+
+def _table(groups: Dict[Any, Tuple[str, ...]]) -> Dict[str, Any]:
+    """{القيمة: (الكلمات...)} ← {الكلمة المطبَّعة: القيمة}"""
+    return {normalize_arabic_text(word): value for value, words in groups.items() for word in words}
+
+
+PROPERTY_TYPES = _table({
+    PropertyType.VILLA: ('فيلا', 'فيله', 'فله', 'فلل', 'فيلات'),
+    PropertyType.HOUSE: ('بيت', 'بيوت', 'منزل', 'منازل'),
+    PropertyType.APARTMENT: ('شقة', 'شقه', 'شقق'),
+    PropertyType.STUDIO: ('استوديو', 'ستوديو', 'استديو', 'استوديوهات'),
+    PropertyType.FLOOR: ('دور', 'ادوار'),
+    PropertyType.TOWNHOUSE: ('تاونهاوس',),
+    PropertyType.DUPLEX: ('دوبلكس', 'دبلكس', 'دوبليكس'),
+    PropertyType.BUILDING: ('عمارة', 'عمارات', 'عمائر'),
+})
+
+PURPOSES = _table({
+    PropertyPurpose.SALE: ('بيع', 'للبيع', 'البيع', 'شراء', 'اشتري', 'تمليك', 'تملك'),
+    PropertyPurpose.RENT: ('إيجار', 'للإيجار', 'الإيجار', 'اجار', 'للاجار', 'تأجير', 'استأجر'),
+})
+
+PRICE_PERIODS = _table({
+    PricePeriod.YEARLY: ('سنوي', 'سنوياً', 'سنويا', 'بالسنة', 'سنة', 'السنة', 'سنوية'),
+    PricePeriod.MONTHLY: ('شهري', 'شهرياً', 'شهريا', 'بالشهر', 'شهر', 'الشهر', 'شهرية'),
+    PricePeriod.DAILY: ('يومي', 'يومياً', 'يوميا', 'باليوم', 'يوم', 'الليلة'),
+})
+
+# (الحقل، العدد الضمني): "غرفتين" = 2، "غرفة" وحدها = 1، "غرف" بدون عدد
+COUNT_NOUNS = _table({
+    (ROOMS, None): ('غرف', 'الغرف', 'حجر'),
+    (ROOMS, 1): ('غرفة', 'حجرة'),
+    (ROOMS, 2): ('غرفتين', 'غرفتان'),
+    (BATHS, None): ('حمامات', 'الحمامات'),
+    (BATHS, 1): ('حمام',),
+    (BATHS, 2): ('حمامين',),
+    (HALLS, None): ('صالات', 'الصالات'),
+    (HALLS, 1): ('صالة',),
+    (HALLS, 2): ('صالتين',),
+})
+
+NUMBER_WORDS = _table({
+    1: ('واحد', 'واحدة', 'وحدة'),
+    2: ('اثنين', 'اثنان', 'ثنتين', 'اثنتين'),
+    3: ('ثلاث', 'ثلاثة'),
+    4: ('أربع', 'أربعة'),
+    5: ('خمس', 'خمسة'),
+    6: ('ست', 'ستة'),
+    7: ('سبع', 'سبعة'),
+    8: ('ثمان', 'ثماني', 'ثمانية'),
+    9: ('تسع', 'تسعة'),
+    10: ('عشر', 'عشرة'),
+    20: ('عشرين',), 30: ('ثلاثين',), 40: ('أربعين',), 50: ('خمسين',),
+    60: ('ستين',), 70: ('سبعين',), 80: ('ثمانين',), 90: ('تسعين',),
+    100: ('مية', 'ميه', 'مئة', 'مائة'),
+    200: ('ميتين', 'مئتين'),
+})
+
+# "k" و"ألف" تضرب العدد قبلها؛ "ألفين" و"مليونين" أعداد بذاتها
+MULTIPLIERS = _table({
+    1000: ('k', 'ك', 'ألف', 'آلاف', 'الاف'),
+    1000000: ('مليون', 'ملايين'),
+})
+MULTIPLE_WORDS = _table({
+    2000: ('ألفين',),
+    2000000: ('مليونين',),
+})
+
+UNITS = _table({
+    AREA: ('م', 'متر', 'مترمربع', 'أمتار'),
+    PRICE: ('ريال', 'الريال'),
+    MINUTES: ('د', 'دقيقة', 'دقايق', 'دقائق'),
+})
+
+# كلمات تجعل العدد التالي سعراً أو مساحة حتى بدون وحدة
+CONTEXT_WORDS = _table({
+    PRICE: ('ميزانية', 'الميزانية', 'ميزانيتي', 'بميزانية', 'سعر', 'السعر', 'بسعر', 'سعره', 'سعرها'),
+    AREA: ('مساحة', 'المساحة', 'بمساحة', 'مساحتها'),
+})
+
+# عبارات الحدود (الأطول أولاً)
+QUALIFIERS = [
+    (tuple(normalize_arabic_text(w) for w in phrase.split()), kind)
+    for phrase, kind in sorted([
+        ('اقل شي', 'min'), ('على الأقل', 'min'), ('اكثر من', 'above'), ('أكبر من', 'above'),
+        ('ما يقل عن', 'min'), ('فوق', 'above'), ('من', 'from'), ('بين', 'from'),
+        ('اقصى شي', 'max'), ('حد أقصى', 'max'), ('أقصى', 'max'), ('اقل من', 'below'), ('تحت', 'below'),
+        ('ما يتعدى', 'max'), ('ما يزيد عن', 'max'), ('بحدود', 'max'), ('حدود', 'max'),
+    ], key=lambda item: -len(item[0].split()))
+]
+RANGE_JOINERS = frozenset(normalize_arabic_text(w) for w in ('و', 'إلى', 'الى', 'لين', 'حتى', '-'))
+
+# كلمات لها دور في الجملة
+MARKERS = _table({
+    'update': ('هونت', 'غيرت', 'رأيي', 'رايي', 'لخبطت', 'عدل', 'عدلها', 'غير', 'غيرها', 'زود', 'زيد', 'نزل',
+               'قلل', 'بعد', 'كمان', 'أيضا', 'أيضاً'),
+    'replace': ('خله', 'خلها', 'خليه', 'خليها', 'خلي', 'خلوها', 'اجعلها', 'اجعله', 'بدلها'),
+    'instead': ('بدل', 'بدال', 'عوض'),
+    # النفي مفهوم فقط بجانب الاستبدال ("مو بيع خله ايجار")، وغير ذلك يرجع للنموذج
+    'negation': ('لا', 'مو', 'مب', 'مهب', 'ماهو', 'مش'),
+    # "في النرجس او الياسمين": الحقول تحمل قيمة واحدة، فالبدائل للنموذج
+    'alternative': ('او', 'أو', 'ولا'),
+    'district': ('حي', 'بحي', 'الحي'),
+    'in': ('في', 'ب', 'داخل'),
+    'near': ('قريب', 'قريبة', 'قريبه', 'جنب', 'بجنب', 'بالقرب', 'قرب', 'يم'),
+    'university': ('جامعة', 'الجامعة', 'كلية', 'الكلية'),
+    'mosque': ('مسجد', 'جامع', 'المسجد', 'الجامع', 'مساجد'),
+    'walking': ('مشي', 'مشياً', 'سير', 'الأقدام', 'بالمشي'),
+    'driving': ('بالسيارة', 'سيارة', 'بالعربية', 'سواقة'),
+    'filler': ('ابي', 'ابغى', 'ابغا', 'ابا', 'ودي', 'أريد', 'ابحث', 'أدور', 'عن', 'ابيها', 'ابيه', 'ابغاها',
+               'فيها', 'فيه', 'مع', 'و', 'نوم', 'لي', 'لنا', 'حق', 'على', 'عليها', 'تكون', 'يكون',
+               'الرياض', 'بالرياض', 'مدينة', 'تقريبا', 'تقريباً', 'حوالي', 'يا', 'لو', 'سمحت', 'الله',
+               'يعطيك', 'العافية', 'بس', 'عادي', 'شي', 'عدد', 'اللي', 'الي', 'ل', 'لل', 'عندي', 'تكفى',
+               'طيب', 'اوكي', 'ok', 'مربع', 'عقار', 'مسكن', 'سكن', 'تكفون', 'نص', 'نصف'),
+})
+
+# كلمات تنهي عبارة الاسم (كل ما له معنى في القواعد)
+VOCABULARY = frozenset().union(PROPERTY_TYPES, PURPOSES, PRICE_PERIODS, COUNT_NOUNS, NUMBER_WORDS, MULTIPLIERS,
+                               MULTIPLE_WORDS, UNITS, CONTEXT_WORDS, MARKERS, RANGE_JOINERS,
+                               (word for phrase, _ in QUALIFIERS for word in phrase))
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """كلمات مطبَّعة: الأرقام العربية الهندية إلى 0-9، والأرقام مفصولة عن الحروف ("٣غرف"، "50k")"""
+    text = normalize_arabic_text((text or '').translate(DIGITS).replace('ـ', ''))
+    text = re.sub(r'(?<=\d)[,٬](?=\d{3})', '', text)
+    text = re.sub(r'تاون\s+هاوس', 'تاونهاوس', text)
+    text = re.sub(r'(?<=م)\s*[2²](?!\d)', '', text)  # م2 / م² ← م
+    tokens = []
+    for token in re.findall(r'\d+(?:\.\d+)?|[^\W\d_]+|-', text):
+        # "وثلاث"، "وحمامين": واو العطف ملتصقة بكلمة معروفة
+        if token not in VOCABULARY and token.startswith('و') and token[1:] in VOCABULARY:
+            tokens.extend(('و', token[1:]))
+        else:
+            tokens.append(token)
+    return tokens
+
+
+@lru_cache(maxsize=1024)
+def match_university(phrase: str, threshold: float = 0.8) -> Optional[str]:
+    """الاسم الرسمي للجامعة (نفس القائمة التي يوحّد بها النموذج اللغوي)"""
+    from llm_parser import OFFICIAL_UNIVERSITIES
+    name, _ = find_best_match(phrase, OFFICIAL_UNIVERSITIES, threshold)
+    return name
+
+
+class _Extraction:
+    """مرور واحد على الكلمات: كل كلمة مفهومة تُعلَّم، والحقول تُجمع في dict بصيغة الـ function call"""
+
+    def __init__(self, tokens: List[str]):
+        self.tokens = tokens
+        self.known = [False] * len(tokens)
+        self.fields: Dict[str, Any] = {}
+        self.update = False
+        # شروط القرب بترتيب ذكرها: [الحقل، dict الشرط]
+        self.places: List[Tuple[str, Dict[str, Any]]] = []
+        self.minutes: List[Tuple[int, int, float]] = []
+        self.walking: Optional[bool] = None
+        self.context: Optional[str] = None
+        self.qualifier: Optional[str] = None
+        self.instead = False
+        # عبارة لا تعبّر عنها الحقول ("مو قريب من مسجد"): الثقة صفر مهما كان طول الطلب
+        self.unsupported = False
+
+    # ───────────────────────────────────────────────────────
+    # أدوات
+    # ───────────────────────────────────────────────────────
+    def _mark(self, start: int, end: int):
+        for i in range(start, min(end, len(self.tokens))):
+            self.known[i] = True
+
+    def _token(self, i: int) -> Optional[str]:
+        return self.tokens[i] if 0 <= i < len(self.tokens) else None
+
+    def _number(self, i: int) -> Optional[Tuple[float, int, bool]]:
+        """(القيمة، موضع ما بعدها، فيها مضاعف) للعدد عند i"""
+        token = self._token(i)
+        if token is None:
+            return None
+        if re.fullmatch(r'\d+(?:\.\d+)?', token):
+            value = float(token)
+        elif token in NUMBER_WORDS:
+            value = float(NUMBER_WORDS[token])
+        elif token in MULTIPLE_WORDS:
+            return float(MULTIPLE_WORDS[token]), i + 1, True
+        elif token in MULTIPLIERS and token not in ('k', 'ك'):
+            # "مليون" وحدها
+            value, i = 1.0, i - 1
+        else:
+            return None
+        j = i + 1
+        # "خمسة وعشرين"
+        tens = NUMBER_WORDS.get(self._token(j + 1)) if self._token(j) == 'و' else None
+        if value < 10 and tens and tens % 10 == 0 and 20 <= tens < 100:
+            value, j = value + tens, j + 2
+        multiplier = MULTIPLIERS.get(self._token(j))
+        if multiplier:
+            value, j = value * multiplier, j + 1
+            # "مليون ونص"
+            if self._token(j) == 'و' and self._token(j + 1) in ('نص', 'نصف'):
+                value, j = value + multiplier / 2, j + 2
+        return value, j, bool(multiplier)
+
+    def _phrase(self, i: int, limit: int) -> int:
+        """نهاية عبارة الاسم التي تبدأ عند i (كلمات خارج القاموس فقط)"""
+        j = i
+        while j < len(self.tokens) and j - i < limit and self.tokens[j] not in VOCABULARY \
+                and self._number(j) is None and self.tokens[j] != '-':
+            j += 1
+        return j
+
+    def _negation(self, i: int) -> bool:
+        """
+        هل النفي عند i جزء من استبدال؟
+
+        "لا لخبطت"/"لا خلها": تمهيد للتعديل. "مو بيع خله ايجار" و"خله بيع مو ايجار":
+        القيمة بعد النفي قديمة. غير ذلك ("مو قريب من مسجد"، "لا في الملقا") قيد
+        سلبي لا تعبّر عنه الحقول.
+        """
+        following = self._token(i + 1)
+        if MARKERS.get(following) in ('update', 'replace'):
+            self.update = True
+            return True
+        nearby = [MARKERS.get(self._token(k)) for k in (i - 2, i - 1, i + 2, i + 3)]
+        if 'replace' not in nearby and 'instead' not in nearby:
+            return False
+        if following in PROPERTY_TYPES or following in PURPOSES or self._number(i + 1) \
+                or (following is not None and following not in VOCABULARY):
+            self.update = self.instead = True
+            return True
+        return False
+
+    def _qualifier(self, i: int) -> Tuple[Optional[str], int]:
+        for phrase, kind in QUALIFIERS:
+            if tuple(self.tokens[i:i + len(phrase)]) == phrase:
+                return kind, len(phrase)
+        return None, 0
+
+    # ───────────────────────────────────────────────────────
+    # الكميات: غرف/حمامات/صالات، المساحة، السعر، الدقائق
+    # ───────────────────────────────────────────────────────
+    def _quantity(self, i: int) -> int:
+        low, j, has_multiplier = self._number(i)
+        high = None
+        following = self._number(j + 1) if self._token(j) in RANGE_JOINERS else None
+        # "٣ غرف و ٢ حمام" ليس نطاقاً: الواو تربط حدّين فقط بعد "بين"/"من"
+        if following and following[0] > low and (self._token(j) != 'و' or self.qualifier == 'from'):
+            high, k, high_multiplier = following
+            # "بين ٣ و ٥ آلاف" ← 3000-5000
+            if high_multiplier and not has_multiplier:
+                for multiplier in sorted(set(MULTIPLIERS.values()), reverse=True):
+                    if low * multiplier <= high:
+                        low *= multiplier
+                        break
+            has_multiplier = has_multiplier or high_multiplier
+            j = k
+
+        unit = None
+        token = self._token(j)
+        if token in COUNT_NOUNS:
+            unit = COUNT_NOUNS[token][0]
+            j += 1
+        elif token in UNITS:
+            unit = UNITS[token]
+            j += 1
+        elif has_multiplier:
+            unit = PRICE
+        elif self.context:
+            # "ميزانيتي ٥٠٠٠"، "غرف ٣"
+            unit = self.context
+        elif low >= 1000:
+            unit = PRICE
+        if unit is None and not self.instead:
+            return j
+
+        self._mark(i, j)
+        if self.instead:
+            # "اربع غرف بدل ثلاث": القيمة القديمة تُفهم ولا تُستخدم
+            self.instead = False
+        elif unit == MINUTES:
+            self.minutes.append((i, j, low))
+        else:
+            self._assign(unit, low, high)
+        self.qualifier, self.context = None, None
+        return j
+
+    def _assign(self, unit: str, low: float, high: Optional[float]):
+        qualifier = self.qualifier
+        if unit in (ROOMS, BATHS, HALLS):
+            low, high = int(low), int(high) if high is not None else None
+            value = {'min': None, 'max': None, 'exact': None}
+            if high is not None:
+                value.update(min=low, max=high)
+            elif qualifier in ('min', 'above'):
+                # "اكثر من ٣ غرف" لا تشمل الثلاث
+                value['min'] = low + 1 if qualifier == 'above' else low
+            elif qualifier in ('max', 'below'):
+                value['max'] = low - 1 if qualifier == 'below' else low
+            else:
+                value['exact'] = low
+            self.fields[unit] = value
+        elif unit == AREA:
+            # البحث يصفّي المساحة بالحدود فقط: المساحة المفردة حد أدنى
+            if high is not None:
+                self.fields[AREA] = {'min': low, 'max': high}
+            elif qualifier in ('max', 'below'):
+                self.fields[AREA] = {'min': None, 'max': low}
+            else:
+                self.fields[AREA] = {'min': low, 'max': None}
+        elif unit == PRICE:
+            price = self.fields.setdefault(PRICE, {})
+            if high is not None:
+                price.update(min=low, max=high)
+            elif qualifier in ('min', 'above'):
+                price['min'] = low
+            else:
+                # الميزانية المفردة حد أعلى
+                price['max'] = low
+
+    # ───────────────────────────────────────────────────────
+    # الأماكن: الحي، الجامعة، المسجد
+    # ───────────────────────────────────────────────────────
+    def _district(self, i: int, explicit: bool, threshold: Optional[float] = None) -> int:
+        """أطول عبارة بعد "حي"/"في" تطابق حياً معروفاً في الدليل"""
+        end = self._phrase(i, MAX_PLACE_WORDS)
+        if end == i or not gazetteer.ensure_loaded():
+            return i
+        for stop in range(end, i, -1):
+            phrase = ' '.join(self.tokens[i:stop])
+            place = gazetteer.resolve(DISTRICTS, phrase, threshold=threshold or settings.GAZETTEER_DISTRICT_THRESHOLD)
+            if place:
+                self._mark(i, stop)
+                if self.instead:
+                    self.instead = False
+                else:
+                    self.fields['district'] = place['name']
+                return stop
+        # "بدل النرجس" بعد تحديد الحي الجديد: اسم قديم لا يحتاج مطابقة
+        if self.instead and explicit:
+            self._mark(i, end)
+            self.instead = False
+            return end
+        return i
+
+    def _university(self, i: int) -> int:
+        end = self._phrase(i + 1, MAX_UNIVERSITY_WORDS)
+        reqs = {'required': True, 'max_distance_minutes': DEFAULT_UNIVERSITY_MINUTES}
+        self._mark(i, i + 1)
+        for stop in range(end, i + 1, -1):
+            name = match_university(' '.join(self.tokens[i:stop]))
+            if name:
+                reqs['university_name'] = name
+                self._mark(i, stop)
+                end = stop
+                break
+        else:
+            end = i + 1
+        self.fields['university_requirements'] = reqs
+        self.places.append(('university_requirements', reqs))
+        return end
+
+    def _mosque(self, i: int) -> int:
+        reqs = {'required': True, 'max_distance_minutes': DEFAULT_MOSQUE_MINUTES, 'walking': True}
+        self._mark(i, i + 1)
+        end = self._phrase(i + 1, MAX_PLACE_WORDS)
+        if end > i + 1 and gazetteer.ensure_loaded():
+            for stop in range(end, i + 1, -1):
+                place = gazetteer.resolve(MOSQUES, ' '.join(self.tokens[i:stop]), threshold=0.8)
+                if place:
+                    reqs['mosque_name'] = place['name']
+                    self._mark(i, stop)
+                    break
+        self.fields['mosque_requirements'] = reqs
+        self.places.append(('mosque_requirements', reqs))
+        return i + 1
+
+    # ───────────────────────────────────────────────────────
+    # المرور الرئيسي
+    # ───────────────────────────────────────────────────────
+    def run(self) -> '_Extraction':
+        i = 0
+        while i < len(self.tokens):
+            if self.known[i]:
+                i += 1
+                continue
+            token = self.tokens[i]
+
+            qualifier, length = self._qualifier(i)
+            if qualifier and self._number(i + length):
+                self._mark(i, i + length)
+                self.qualifier = qualifier
+                i += length
+                continue
+
+            if self._number(i):
+                i = self._quantity(i)
+                continue
+
+            role = MARKERS.get(token)
+            if token in PROPERTY_TYPES or token in PURPOSES:
+                field = 'property_type' if token in PROPERTY_TYPES else 'purpose'
+                if self.instead:
+                    self.instead = False
+                else:
+                    self.fields[field] = (PROPERTY_TYPES.get(token) or PURPOSES[token]).value
+                self.known[i] = True
+            elif token in PRICE_PERIODS:
+                self.fields.setdefault(PRICE, {})['period'] = PRICE_PERIODS[token].value
+                self.known[i] = True
+            elif token in COUNT_NOUNS:
+                field, implied = COUNT_NOUNS[token]
+                self.known[i] = True
+                following = self._number(i + 1)
+                if following and self._token(following[1]) not in COUNT_NOUNS and \
+                        self._token(following[1]) not in UNITS:
+                    self.context = field
+                elif implied and not self.instead:
+                    self._assign(field, implied, None)
+                    self.qualifier = None
+                elif implied:
+                    self.instead = False
+            elif token in CONTEXT_WORDS:
+                self.context = CONTEXT_WORDS[token]
+                self.known[i] = True
+            elif token in UNITS:
+                self.known[i] = True
+            elif role in ('update', 'replace'):
+                self.update = True
+                self.known[i] = True
+            elif role == 'alternative':
+                self.unsupported = True
+            elif role == 'negation':
+                if self._negation(i):
+                    self.known[i] = True
+                else:
+                    self.unsupported = True
+            elif role == 'instead':
+                self.update = True
+                self.instead = True
+                self.known[i] = True
+            elif role == 'district':
+                self.known[i] = True
+                i = self._district(i + 1, explicit=True)
+                continue
+            elif role == 'in':
+                self.known[i] = True
+                i = self._district(i + 1, explicit=False)
+                continue
+            elif role == 'university':
+                i = self._university(i)
+                continue
+            elif role == 'mosque':
+                i = self._mosque(i)
+                continue
+            elif role == 'walking':
+                self.walking = True
+                self.known[i] = True
+            elif role == 'driving':
+                self.walking = False
+                self.known[i] = True
+            elif role in ('near', 'filler') or token in RANGE_JOINERS or self._qualifier(i)[0]:
+                self.known[i] = True
+            elif token not in VOCABULARY:
+                # اسم بدون "حي"/"في": القديم بعد "بدل"، أو حي مطابق تماماً
+                end = self._district(i, explicit=self.instead, threshold=None if self.instead else 1.0)
+                i = max(end, i + 1)
+                continue
+            i += 1
+
+        self._attach_minutes()
+        return self
+
+    def _attach_minutes(self):
+        """الدقائق ووسيلة التنقل لأقرب شرط قرب مذكور"""
+        if not self.places:
+            # دقائق بدون مكان (مترو، مدرسة...) لا تفهمها القواعد
+            for start, end, _ in self.minutes:
+                self.known[start:end] = [False] * (end - start)
+            return
+        for _, _, minutes in self.minutes:
+            self.places[-1][1]['max_distance_minutes'] = minutes
+        if self.walking is not None:
+            for field, reqs in self.places:
+                if field == 'mosque_requirements':
+                    reqs['walking'] = self.walking
+
+    @property
+    def confidence(self) -> float:
+        if not self.tokens or self.unsupported:
+            return 0.0
+        return sum(self.known) / len(self.tokens)
+
+
+class RuleParser:
+    """
+    الطريق السريع قبل النموذج اللغوي: نفس مخرجات extract_property_criteria
+    (action_type + الحقول) مع درجة ثقة
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {'handled': 0, 'fallbacks': 0}
+
+    def parse(self, user_query: str, previous_criteria: Optional[PropertyCriteria] = None) -> Dict[str, Any]:
+        """
+        Returns:
+            {'arguments': dict بصيغة الـ function call أو None، 'confidence': 0-1}
+        """
+        tokens = tokenize(user_query)
+        extraction = _Extraction(tokens).run()
+        fields = extraction.fields
+        complete = 'purpose' in fields and 'property_type' in fields
+        if previous_criteria and (extraction.update or not complete):
+            action_type = 'UPDATE_CRITERIA'
+            ready = bool(fields)
+        else:
+            action_type = 'NEW_SEARCH'
+            ready = complete
+
+        confidence = round(extraction.confidence, 3) if ready else 0.0
+        arguments = None
+        if ready:
+            arguments = {'action_type': action_type, **fields}
+            if action_type == 'UPDATE_CRITERIA':
+                arguments['changes_summary'] = self._describe_changes(previous_criteria, fields)
+        return {'arguments': arguments, 'confidence': confidence}
+
+    def accept(self, result: Dict[str, Any]) -> bool:
+        """هل تكفي الثقة لتخطي النموذج اللغوي؟ (مع عدّ النتيجة)"""
+        accepted = result['arguments'] is not None and result['confidence'] >= settings.RULE_PARSER_MIN_CONFIDENCE
+        with self._lock:
+            self._counts['handled' if accepted else 'fallbacks'] += 1
+        return accepted
+
+    def _describe_changes(self, previous: PropertyCriteria, fields: Dict[str, Any]) -> str:
+        old = previous.dict(exclude_none=True)
+        changes = []
+        for field, value in fields.items():
+            label = FIELD_LABELS.get(field, field)
+            before = old.get(field)
+            if isinstance(value, dict):
+                shown = {k: v for k, v in value.items() if v is not None}
+                if isinstance(before, dict) and before.get('exact') is not None and shown.get('exact') is not None:
+                    changes.append(f"تم تعديل {label} من {before['exact']} إلى {shown['exact']}")
+                else:
+                    changes.append(f"تم تعديل {label}" if before else f"تمت إضافة شرط {label}")
+            elif before is not None and before != value:
+                changes.append(f"تم تعديل {label} من {getattr(before, 'value', before)} إلى {value}")
+            elif before is None:
+                changes.append(f"تمت إضافة {label}: {value}")
+        return '، '.join(changes) or None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self._counts)
+        total = counts['handled'] + counts['fallbacks']
+        return {**counts, 'hit_rate': round(counts['handled'] / total, 3) if total else 0.0}
+
+
+# إنشاء instance واحد لكل worker
+rule_parser = RuleParser()
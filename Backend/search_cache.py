@@ -0,0 +1,281 @@
+"""
+ذاكرة مؤقتة لنتائج البحث (Search Result Cache)
+
+المفتاح هو بصمة قانونية (canonical hash) لمعايير البحث + نوع البحث، مع
+إخراج الأقدم استخداماً (LRU) وانتهاء صلاحية (TTL). تُحذف المدخلات المتأثرة
+عند وصول تغييرات على العقارات من property_store، أو من ListingChangeWatcher
+عندما لا يكون المخزن محمّلاً (الإعداد الافتراضي).
+"""
+from config import settings
+from models import PropertyCriteria, SearchMode
+from property_store import property_store
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import hashlib
+import json
+import threading
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _canonical(value: Any) -> Any:
+    """تحويل القيمة لشكل ثابت: مسافات موحّدة، أرقام float، قوائم مرتبة"""
+    if isinstance(value, dict):
+        return {k: _canonical(v) for k, v in value.items() if v is not None}
+    if isinstance(value, (list, tuple, set)):
+        return sorted((_canonical(v) for v in value), key=lambda v: json.dumps(v, ensure_ascii=False))
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        return " ".join(value.split())
+    return value
+
+
+def criteria_fingerprint(criteria: PropertyCriteria, mode: SearchMode, namespace: str = "results") -> str:
+    """
+    بصمة المعايير: طلبان بنفس الفلاتر يعطيان نفس المفتاح مهما اختلف ترتيب
+    الحقول أو المسافات. النص الأصلي لا يؤثر في البحث المطابق فيُستبعد منه.
+    """
+    data = criteria.dict(exclude_none=True)
+    if mode == SearchMode.EXACT:
+        data.pop('original_query', None)
+    payload = json.dumps([namespace, mode.value, _canonical(data)], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _segments(changes) -> Tuple[set, set]:
+    """
+    (الغرض، النوع، المدينة) و(الغرض، النوع) لكل عقار تغيّر قبل التغيير وبعده؛
+    هذه هي الفلاتر المشتركة بين البحث المطابق والمشابه
+    """
+    with_city, without_city = set(), set()
+    for old, new in changes:
+        for row in (old, new):
+            if row is not None:
+                with_city.add((row.get('purpose'), row.get('property_type'), row.get('city')))
+                without_city.add((row.get('purpose'), row.get('property_type')))
+    return with_city, without_city
+
+
+def _affected(criteria: PropertyCriteria, segments: Tuple[set, set]) -> bool:
+    """هل يمكن أن يظهر أحد العقارات المتغيرة في نتائج هذه المعايير؟"""
+    with_city, without_city = segments
+    if criteria.city:
+        return (criteria.purpose.value, criteria.property_type.value, criteria.city) in with_city
+    return (criteria.purpose.value, criteria.property_type.value) in without_city
+
+
+SEGMENT_COLUMNS = "id, purpose, property_type, city"
+
+
+class ListingChangeWatcher:
+    """
+    مصدر تغييرات العقارات لذاكرة البحث بدون property_store
+
+    خيط خلفي يحمّل أعمدة الفلاتر المشتركة فقط (id، الغرض، النوع، المدينة)، ثم
+    يسحب الصفوف المعدّلة حسب updated_at كل poll_seconds ويعيد التحميل كل
+    full_reload_seconds لالتقاط الحذف. كل تغيير يصل بحالته القديمة والجديدة
+    حتى يُحذف القطاع الذي خرج منه العقار والذي دخل إليه.
+    """
+
+    def __init__(self, on_changes: Callable[[List[Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]]], None],
+                 poll_seconds: float = 60, full_reload_seconds: float = 3600,
+                 updated_at_column: Optional[str] = "updated_at"):
+        self.on_changes = on_changes
+        self.poll_seconds = poll_seconds
+        self.full_reload_seconds = full_reload_seconds
+        self.updated_at_column = updated_at_column
+        self._rows: Optional[Dict[str, Dict[str, Any]]] = None
+        self._watermark: Optional[str] = None
+        self._last_full_load = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """بدء الخيط الخلفي (مرة واحدة لكل worker)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="search-cache-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"❌ فشل سحب تغييرات العقارات لذاكرة البحث: {e}")
+            if self._stop.wait(self.poll_seconds):
+                return
+
+    def refresh(self):
+        """سحب أو إعادة تحميل حسب الوقت (property_store المحمّل يرسل تغييراته بنفسه)"""
+        if property_store.is_loaded():
+            return
+        if self._rows is None or time.time() - self._last_full_load >= self.full_reload_seconds:
+            self.load()
+        else:
+            self.poll()
+
+    def _columns(self) -> str:
+        if self.updated_at_column:
+            return f"{SEGMENT_COLUMNS}, {self.updated_at_column}"
+        return SEGMENT_COLUMNS
+
+    def _advance(self, rows: List[Dict[str, Any]]):
+        if self.updated_at_column:
+            values = [r.get(self.updated_at_column) for r in rows if r.get(self.updated_at_column)]
+            self._watermark = max(filter(None, [self._watermark, *values]), default=None)
+
+    def load(self):
+        """تحميل كامل؛ بعد أول تحميل تُرسل الفروقات (ومنها الحذف)"""
+        from database import db
+
+        try:
+            rows = db.fetch_all('properties', self._columns(), order_by='id')
+        except Exception:
+            if not self.updated_at_column:
+                raise
+            logger.warning(f"⚠️ العمود {self.updated_at_column} غير متوفر، ذاكرة البحث تعتمد على إعادة التحميل الكاملة")
+            self.updated_at_column = None
+            rows = db.fetch_all('properties', self._columns(), order_by='id')
+
+        new = {str(r.get('id')): r for r in rows}
+        old, self._rows = self._rows, new
+        self._last_full_load = time.time()
+        self._advance(rows)
+        if old is None:
+            return
+        changes = [(old.get(key), row) for key, row in new.items() if old.get(key) != row]
+        changes.extend((row, None) for key, row in old.items() if key not in new)
+        if changes:
+            self.on_changes(changes)
+
+    def poll(self):
+        """الصفوف المعدّلة منذ آخر updated_at معروف (gte: نفس منطق property_store.poll)"""
+        if not self.updated_at_column or not self._watermark:
+            return
+
+        from database import db, POSTGREST_MAX_ROWS
+
+        changes = []
+        start = 0
+        while True:
+            result = db.client.table('properties')\
+                .select(self._columns())\
+                .gte(self.updated_at_column, self._watermark)\
+                .order(self.updated_at_column)\
+                .order('id')\
+                .range(start, start + POSTGREST_MAX_ROWS - 1)\
+                .execute()
+            batch = result.data or []
+            for row in batch:
+                key = str(row.get('id'))
+                if self._rows.get(key) != row:
+                    changes.append((self._rows.get(key), row))
+                    self._rows[key] = row
+            self._advance(batch)
+            if len(batch) < POSTGREST_MAX_ROWS:
+                break
+            start += POSTGREST_MAX_ROWS
+        if changes:
+            self.on_changes(changes)
+
+
+class SearchCache:
+    """LRU + TTL مع عدادات للمراقبة"""
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 300, enabled: bool = True):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self._entries: "OrderedDict[str, Tuple[float, PropertyCriteria, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def key(self, criteria: PropertyCriteria, mode: SearchMode, namespace: str = "results") -> str:
+        return criteria_fingerprint(criteria, mode, namespace)
+
+    def get(self, key: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            expires_at, _, value = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                self._counters["expirations"] += 1
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return value
+
+    def put(self, key: str, value: Any, criteria: PropertyCriteria):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, criteria, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._counters["invalidations"] += len(self._entries)
+            self._entries.clear()
+
+    def on_property_changes(self, changes: List[Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]]):
+        """
+        مستمع تغييرات property_store: حذف المدخلات التي قد يظهر فيها
+        أي عقار تغيّر (قبل التغيير أو بعده)
+        """
+        segments = _segments(changes)
+        with self._lock:
+            stale = [key for key, (_, criteria, _) in self._entries.items() if _affected(criteria, segments)]
+            for key in stale:
+                del self._entries[key]
+            self._counters["invalidations"] += len(stale)
+        if stale:
+            logger.info(f"🧹 حذف {len(stale)} نتيجة من ذاكرة البحث بعد {len(changes)} تغيير")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return {
+                **self._counters,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hit_rate": round(self._counters["hits"] / lookups, 4) if lookups else 0.0,
+            }
+
+
+# إنشاء instance واحد لكل worker
+search_cache = SearchCache(
+    max_entries=settings.SEARCH_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.SEARCH_CACHE_TTL_SECONDS,
+    enabled=settings.SEARCH_CACHE_ENABLED
+)
+
+# الحذف يعتمد على تغييرات العقارات: من المخزن إذا كان محمّلاً، وإلا من المراقب
+# (يبدأ عند تشغيل التطبيق، انظر main.py)
+property_store.subscribe(search_cache.on_property_changes)
+listing_watcher = ListingChangeWatcher(
+    search_cache.on_property_changes,
+    poll_seconds=settings.PROPERTY_STORE_POLL_SECONDS,
+    full_reload_seconds=settings.PROPERTY_STORE_FULL_RELOAD_SECONDS,
+    updated_at_column=settings.PROPERTY_STORE_UPDATED_AT_COLUMN or None
+)
@@ -2,14 +2,40 @@
 محرك البحث المطور (Hybrid + Geospatial)
 يستخدم تقنيات البحث المتجهي (Vector Search) والبحث المكاني (PostGIS)
 """
-from models import PropertyCriteria, Property, SearchMode
-from database import db
+from models import PropertyCriteria, Property, PropertyMarker, SearchMode, SearchView, IntRangeFilter, RangeFilter
+from database import db, PROPERTY_COLUMNS, POSTGREST_MAX_ROWS
+from postgrest.exceptions import APIError
 from config import settings
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple, AsyncIterator
+from dataclasses import replace
 import logging
+import time
+import numpy as np
 from arabic_utils import normalize_arabic_text, calculate_similarity_score
 # استيراد مولد المتجهات للبحث الهجين
 from embedding_generator import embedding_generator
+from executors import executors
+# منفّذ مراحل البحث الهجين
+from search_pipeline import SearchContext, Stage, StageGraph
+# ذاكرة نتائج البحث المؤقتة
+from search_cache import search_cache
+# ترقيم الصفحات بالمؤشر
+from pagination import (Cursor, SearchPage, SortKey, RankedEntry, TIER_EXACT, TIER_SIMILAR,
+                        decode_cursor, encode_cursor, sort_key)
+# فهرس الخدمات داخل الذاكرة (بديل RPC لكل عقار)
+from poi_index import poi_index, haversine_meters, LEVELS_TRANSLATION_MAP
+# مخزن العقارات العمودي داخل الذاكرة (اختياري)
+from property_store import property_store, matches_criteria
+# فهرس المتجهات المحلي (اختياري)
+from vector_index import vector_index
+# دليل أسماء الجامعات/المساجد/الأحياء داخل الذاكرة
+from gazetteer import gazetteer, UNIVERSITIES, MOSQUES, DISTRICTS
+# فهرس BM25 النصي على العنوان والوصف (اختياري)
+from lexical_index import lexical_index, reciprocal_rank_fusion
+# زمن التنقل على شبكة الطرق (اختياري، بديل تحويل الدقائق بسرعة ثابتة)
+from travel_time import travel_time_engine, DRIVE, WALK
+# ترتيب طبقة المشابه بعدة إشارات دفعة واحدة
+import ranking
 
 logger = logging.getLogger(__name__)
 
@@ -33,6 +59,11 @@ def _get_district_coordinates(district_name: str) -> Optional[tuple]:
     """
     if not district_name:
         return None
+
+    if gazetteer.ensure_loaded():
+        place = gazetteer.resolve(DISTRICTS, district_name, threshold=settings.GAZETTEER_DISTRICT_THRESHOLD)
+        if place:
+            return (place['lat'], place['lon'])
     
     try:
         # جلب متوسط إحداثيات العقارات في الحي
@@ -63,19 +94,14 @@ def _get_district_coordinates(district_name: str) -> Optional[tuple]:
         return None
 
 
-LEVELS_TRANSLATION_MAP = {
-    "ابتدائي": "elementary",
-    "متوسط": "middle",
-    "ثانوي": "high",
-    "روضة": "kindergarten",
-    "حضانة": "nursery"
-}
-
-
 def _find_matching_university(query_name: str, threshold: float = 0.5) -> Optional[str]:
-    """البحث عن أفضل تطابق لاسم الجامعة من قاعدة البيانات"""
+    """البحث عن أفضل تطابق لاسم الجامعة (من دليل الأماكن، أو من قاعدة البيانات إذا لم يتوفر)"""
     if not query_name:
         return None
+
+    if gazetteer.ensure_loaded():
+        place = gazetteer.resolve(UNIVERSITIES, query_name, threshold)
+        return place['name'] if place else None
     
     try:
         result = db.client.table('universities').select('name_ar, name_en').execute()
@@ -116,16 +142,53 @@ def _find_matching_university(query_name: str, threshold: float = 0.5) -> Option
 class SearchEngine:
     def __init__(self):
         self.db = db
-        self.exact_limit = 30
-        self.similar_limit = 100
+        self.exact_limit = settings.SEARCH_PAGE_SIZE
+        self.similar_limit = settings.SIMILAR_MATCH_COUNT
+        # الدوال التي رفضت تحديد الأعمدة (select) على نتيجتها
+        self._unprojectable_rpcs = set()
+
+    def _rpc_rows(self, name: str, params: Dict[str, Any], columns: str) -> List[Dict[str, Any]]:
+        """
+        استدعاء RPC مع جلب الأعمدة المطلوبة فقط (بدون embedding وغيره)
+
+        إذا كان نوع إرجاع الدالة لا يحتوي هذه الأعمدة نعود للاستدعاء الكامل
+        ونتذكر ذلك لبقية عمر الـ worker. النتيجة تُجلب على صفحات لأن PostgREST
+        يحد كل استجابة بـ POSTGREST_MAX_ROWS صف
+        """
+        if name not in self._unprojectable_rpcs:
+            try:
+                return self._rpc_pages(name, params, columns)
+            except APIError as e:
+                logger.warning(f"⚠️ الدالة {name} لا تدعم تحديد الأعمدة ({e})، سيتم جلب النتيجة كاملة")
+                self._unprojectable_rpcs.add(name)
+        return self._rpc_pages(name, params, None)
+
+    def _rpc_pages(self, name: str, params: Dict[str, Any], columns: Optional[str]) -> List[Dict[str, Any]]:
+        rows, start = [], 0
+        while True:
+            query = self.db.client.rpc(name, params)
+            if columns:
+                query = query.select(columns)
+            batch = query.range(start, start + POSTGREST_MAX_ROWS - 1).execute().data or []
+            rows.extend(batch)
+            if len(batch) < POSTGREST_MAX_ROWS:
+                return rows
+            start += POSTGREST_MAX_ROWS
     
     def _get_entity_location(self, entity_name: str, table_name: str) -> Optional[tuple]:
         """جلب إحداثيات كيان (جامعة/مسجد) بالاسم"""
+        if gazetteer.ensure_loaded():
+            place = gazetteer.resolve(table_name, entity_name)
+            if place:
+                logger.info(f"📍 تم العثور على موقع {entity_name} ({place['name']}): {place['lat']}, {place['lon']}")
+                return (place['lat'], place['lon'])
+
         try:
-            # البحث باستخدام ILIKE للتغلب على مشاكل الحالة
+            # البحث باستخدام ILIKE للتغلب على مشاكل الحالة (اسم المسجد في عمود name)
+            name_column = 'name' if table_name == MOSQUES else 'name_ar'
             response = self.db.client.table(table_name)\
                 .select('lat, lon')\
-                .ilike('name_ar', f'%{entity_name}%')\
+                .ilike(name_column, f'%{entity_name}%')\
                 .limit(1)\
                 .execute()
             
@@ -141,60 +204,304 @@ class SearchEngine:
             logger.error(f"❌ خطأ في جلب إحداثيات {entity_name}: {e}")
             return None
 
-    def search(self, criteria: PropertyCriteria, mode: SearchMode = SearchMode.EXACT) -> List[Property]:
-        """نقطة الدخول الرئيسية للبحث"""
+    def search(self, criteria: PropertyCriteria, mode: SearchMode = SearchMode.EXACT,
+               ctx: Optional[SearchContext] = None) -> List[Property]:
+        """نقطة الدخول الرئيسية للبحث (الصفحة الأولى)"""
+        return self.search_page(criteria, mode, ctx=ctx).items
+
+    def search_page(self, criteria: PropertyCriteria, mode: SearchMode = SearchMode.EXACT,
+                    cursor: Optional[str] = None, page_size: Optional[int] = None,
+                    ctx: Optional[SearchContext] = None, view: SearchView = SearchView.FULL) -> SearchPage:
+        """
+        صفحة واحدة من نتائج البحث
+
+        Args:
+            cursor: المؤشر المُعتم من الصفحة السابقة (None للصفحة الأولى)
+            page_size: عدد العقارات في الصفحة (الافتراضي SEARCH_PAGE_SIZE)
+            view: full = Property كاملة، map = PropertyMarker فقط (بدون الخدمات القريبة)
+
+        Raises:
+            InvalidCursor: إذا كان المؤشر تالفاً أو يخص معايير أخرى
+        """
+        page_size = min(max(1, page_size or self.exact_limit), settings.SEARCH_MAX_PAGE_SIZE)
+        criteria = self._canonical_criteria(criteria)
+        fingerprint = search_cache.key(criteria, mode)
+        position = decode_cursor(cursor, fingerprint)
+
         try:
+            cache_key = search_cache.key(criteria, mode, namespace=f"page:{view.value}:{cursor or ''}:{page_size}")
+            cached = search_cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"⚡ نتيجة من ذاكرة البحث: {len(cached.items)} عقار")
+                return SearchPage(list(cached.items), cached.next_cursor)
+
+            ctx = ctx or SearchContext(criteria, view)
             if mode == SearchMode.EXACT:
-                results = self._exact_search(criteria)
+                rows, next_position = self._exact_search(ctx, position, page_size)
             else:
-                results = self._flexible_search(criteria)
+                rows, next_position = self._flexible_search(ctx, position, page_size)
             
             # تحويل النتائج إلى Property objects
-            properties = [self._row_to_property(row) for row in results]
+            page = SearchPage(
+                [self._row_to_item(row, ctx.view) for row in rows],
+                encode_cursor(next_position, fingerprint) if next_position else None
+            )
+            
+            # لا نحفظ نتائج طلب فشلت إحدى مراحله
+            if not ctx.errors:
+                search_cache.put(cache_key, page, criteria)
             
-            logger.info(f"✅ تم إرجاع {len(properties)} عقار")
-            return properties
+            logger.info(f"✅ تم إرجاع {len(page.items)} عقار (has_more={page.has_more})")
+            return page
             
         except Exception as e:
             logger.error(f"خطأ في البحث: {e}")
             import traceback
             traceback.print_exc()
-            return []
+            return SearchPage()
+
+    async def search_async(self, criteria: PropertyCriteria, mode: SearchMode = SearchMode.EXACT) -> List[Property]:
+        """نسخة غير حاجبة من search (تعمل في مجمّع search)"""
+        return await executors.run("search", self.search, criteria, mode)
+
+    async def search_page_async(self, criteria: PropertyCriteria, mode: SearchMode = SearchMode.EXACT,
+                                cursor: Optional[str] = None, page_size: Optional[int] = None,
+                                view: SearchView = SearchView.FULL) -> SearchPage:
+        """نسخة غير حاجبة من search_page (تعمل في مجمّع search)"""
+        return await executors.run("search", self.search_page, criteria, mode, cursor, page_size, None, view)
+
+    def search_stream(self, criteria: PropertyCriteria, mode: SearchMode = SearchMode.EXACT,
+                      cursor: Optional[str] = None, page_size: Optional[int] = None,
+                      batch_size: Optional[int] = None,
+                      view: SearchView = SearchView.FULL) -> AsyncIterator[Dict[str, Any]]:
+        """
+        نسخة متدفقة من search_page: نفس عقارات الصفحة لكن على دفعات
+
+        الأحداث بالترتيب:
+            {'event': 'exact', 'properties': [...]}      فور انتهاء البحث المطابق
+            {'event': 'similar', 'properties': [...]}    دفعات من طبقة المشابه (مع match_score)
+            {'event': 'summary', 'total_count', 'next_cursor', 'has_more', 'timings'}
+
+        Raises:
+            InvalidCursor: قبل بدء التدفق إذا كان المؤشر غير صالح
+        """
+        page_size = min(max(1, page_size or self.exact_limit), settings.SEARCH_MAX_PAGE_SIZE)
+        criteria = self._canonical_criteria(criteria)
+        fingerprint = search_cache.key(criteria, mode)
+        position = decode_cursor(cursor, fingerprint)
+        return self._stream_page(criteria, mode, position, page_size,
+                                 batch_size or settings.SEARCH_STREAM_BATCH_SIZE, fingerprint, view)
+
+    async def _stream_page(self, criteria: PropertyCriteria, mode: SearchMode, position: Cursor,
+                           page_size: int, batch_size: int, fingerprint: str,
+                           view: SearchView = SearchView.FULL) -> AsyncIterator[Dict[str, Any]]:
+        ctx = SearchContext(criteria, view)
+        started = time.perf_counter()
+
+        count, next_position = 0, None
+        if position.tier == TIER_EXACT:
+            rows, next_position = await executors.run("search", self._exact_search, ctx, position, page_size)
+            if mode == SearchMode.SIMILAR:
+                for row in rows:
+                    row['match_score'] = 100
+            count = len(rows)
+            yield {'event': 'exact', 'properties': [self._row_to_item(row, view) for row in rows]}
+
+        similar_rows = []
+        if mode == SearchMode.SIMILAR and next_position is not None:
+            # المطابق له صفحة تالية: طبقة المشابه لا تُستهلك في هذه الصفحة فلا تُبنى
+            next_position = replace(next_position, ranked=position.ranked)
+        elif mode == SearchMode.SIMILAR:
+            # انتهى المطابق أو المؤشر في طبقة المشابه: تُبنى الطبقة الآن (إلا إذا حملها المؤشر)
+            ranked, tier = position.ranked, None
+            if ranked is None:
+                tier = await executors.run("search", self._similar_tier, ctx)
+                ranked = self._ranked_entries(tier)
+            similar_rows, next_position = await executors.run(
+                "search", self._similar_slice, ranked, tier, page_size - count)
+
+        for i in range(0, len(similar_rows), batch_size):
+            batch = await executors.run("search", self._add_nearby_services,
+                                        similar_rows[i:i + batch_size], criteria, ctx)
+            count += len(batch)
+            yield {'event': 'similar', 'properties': [self._row_to_item(row, view) for row in batch]}
+
+        ctx.record('total', started)
+        yield {
+            'event': 'summary',
+            'total_count': count,
+            'next_cursor': encode_cursor(next_position, fingerprint) if next_position else None,
+            'has_more': next_position is not None,
+            'timings': ctx.timings,
+        }
+
+    def matching_rows(self, criteria: PropertyCriteria, limit: int) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        كل عقارات البحث المطابق حتى limit (بدون الخدمات القريبة) لتجميع الخريطة
+
+        Returns:
+            (الصفوف، هل قُطعت النتائج عند limit)
+        """
+        ctx = SearchContext(self._canonical_criteria(criteria), SearchView.MAP)
+        rows, next_position = self._exact_tier(ctx, Cursor(), limit)
+        if ctx.errors:
+            raise RuntimeError(ctx.errors.get('exact'))
+        return rows, next_position is not None
+
+    def _canonical_criteria(self, criteria: PropertyCriteria) -> PropertyCriteria:
+        """
+        استبدال اسم الحي كما كتبه المستخدم ("حي النرجص") باسمه في جدول العقارات
+        حتى تعمل المطابقة الحرفية للحي (الفلتر، الترتيب، مفتاح الذاكرة)
+        """
+        if not criteria.district or not gazetteer.ensure_loaded():
+            return criteria
+        place = gazetteer.resolve(DISTRICTS, criteria.district, threshold=settings.GAZETTEER_DISTRICT_THRESHOLD)
+        if not place or place['name'] == criteria.district:
+            return criteria
+        logger.info(f"🏘️ الحي '{criteria.district}' ← '{place['name']}' ({place['score']})")
+        return criteria.copy(update={'district': place['name']})
+
+    # ═══════════════════════════════════════════════════════
+    # الموقع المرجعي (يُحسب مرة واحدة لكل طلب عبر السياق)
+    # ═══════════════════════════════════════════════════════
+    def _matched_university(self, ctx: SearchContext) -> Optional[str]:
+        """أقرب اسم جامعة في قاعدة البيانات لما ذكره المستخدم"""
+        reqs = ctx.criteria.university_requirements
+        if not reqs or not reqs.university_name:
+            return None
+        place = self._university_place(ctx)
+        if place:
+            return place['name']
+        return ctx.shared('university_name', lambda: _find_matching_university(reqs.university_name))
+
+    def _university_place(self, ctx: SearchContext) -> Optional[Dict[str, Any]]:
+        """الجامعة من دليل الأماكن: الاسم الرسمي والإحداثيات في بحث واحد"""
+        reqs = ctx.criteria.university_requirements
+        if not reqs or not reqs.university_name:
+            return None
+        return ctx.shared('university_place', lambda: gazetteer.resolve(UNIVERSITIES, reqs.university_name)
+                          if gazetteer.ensure_loaded() else None)
+
+    def _resolve_anchor(self, ctx: SearchContext) -> Optional[Dict[str, Any]]:
+        """موقع الجامعة أو المسجد المحدد بالاسم مع نصف قطر البحث"""
+        return ctx.shared('anchor', lambda: self._lookup_anchor(ctx))
+
+    def _lookup_anchor(self, ctx: SearchContext) -> Optional[Dict[str, Any]]:
+        criteria = ctx.criteria
+
+        # أ) هل حدد جامعة بالاسم؟
+        if criteria.university_requirements and criteria.university_requirements.university_name:
+            place = self._university_place(ctx)
+            if place:
+                matched_name, loc = place['name'], (place['lat'], place['lon'])
+            else:
+                matched_name = self._matched_university(ctx) or criteria.university_requirements.university_name
+                loc = self._get_entity_location(matched_name, 'universities')
+            if loc:
+                mins = criteria.university_requirements.max_distance_minutes or 15
+                return self._anchor(loc, 'university', matched_name, mins, walking=False)
+
+        # ب) هل حدد مسجداً بالاسم؟ (إذا لم تكن الجامعة محددة)
+        elif criteria.mosque_requirements and criteria.mosque_requirements.mosque_name:
+            mosque_name = criteria.mosque_requirements.mosque_name
+            loc = self._get_entity_location(mosque_name, 'mosques')
+            if loc:
+                mins = criteria.mosque_requirements.max_distance_minutes or 5
+                return self._anchor(loc, 'mosque', mosque_name, mins, walking=criteria.mosque_requirements.walking)
+
+        return None
+
+    def _anchor(self, loc: tuple, kind: str, name: str, minutes: float, walking: bool) -> Dict[str, Any]:
+        """
+        الموقع المرجعي مع نصف قطر البحث
+
+        مع شبكة الطرق: نصف القطر يحيط بما يمكن الوصول إليه فعلاً خلال N دقيقة،
+        وتُفلتر نتائج الاستعلام المكاني بزمن التنقل (_within_anchor)
+        """
+        anchor = {'lat': loc[0], 'lon': loc[1], 'kind': kind, 'name': name, 'minutes': minutes,
+                  'mode': WALK if walking else DRIVE, 'radius_meters': _minutes_to_meters(minutes, walking=walking),
+                  'travel_time': False}
+        if travel_time_engine.ensure_loaded():
+            radius = travel_time_engine.reach_radius_meters(loc[0], loc[1], anchor['mode'], minutes)
+            if radius is not None:
+                anchor.update(radius_meters=radius, travel_time=True)
+        return anchor
+
+    def _within_anchor(self, anchor: Dict[str, Any], rows: List[Dict[str, Any]]) -> np.ndarray:
+        """لكل عقار: هل يقع ضمن زمن الوصول إلى الموقع المرجعي؟"""
+        lats = np.array([float(r.get('final_lat') or 0) for r in rows])
+        lons = np.array([float(r.get('final_lon') or 0) for r in rows])
+        distances = haversine_meters(lats, lons, anchor['lat'], anchor['lon'])
+        if not anchor.get('travel_time'):
+            return distances <= anchor['radius_meters']
+
+        minutes = travel_time_engine.minutes_to_point(anchor['lat'], anchor['lon'], lats, lons,
+                                                      anchor['mode'], anchor['minutes'])
+        # العقارات خارج الشبكة (بلا طريق قريب) تبقى بالدائرة بالسرعة الثابتة
+        circle = distances <= _minutes_to_meters(anchor['minutes'], walking=anchor['mode'] == WALK)
+        return np.where(np.isnan(minutes), circle, minutes <= anchor['minutes'])
+
+    def _resolve_target(self, ctx: SearchContext) -> tuple:
+        """
+        إحداثيات توجيه البحث الدلالي
+        الأولوية: جامعة/مسجد محدد > مركز الحي
+        """
+        anchor = self._resolve_anchor(ctx)
+        if anchor:
+            logger.info(f"📍 استخدام موقع {anchor['name']}")
+            return anchor['lat'], anchor['lon']
+
+        if ctx.criteria.district:
+            loc = ctx.shared('district_center', lambda: _get_district_coordinates(ctx.criteria.district))
+            if loc:
+                logger.info(f" استخدام مركز حي {ctx.criteria.district}")
+                return loc
+
+        return None, None
     
-    def _exact_search(self, criteria: PropertyCriteria) -> List[Dict[str, Any]]:
+
+    def _exact_search(self, ctx: SearchContext, position: Cursor, page_size: int) -> Tuple[List[Dict[str, Any]], Optional[Cursor]]:
         """بحث دقيق - يستخدم البحث المكاني المباشر (RPC) عند توفر موقع"""
+        rows, next_position = self._exact_tier(ctx, position, page_size)
+        return self._add_nearby_services(rows, ctx.criteria, ctx), next_position
+
+    def _exact_tier(self, ctx: SearchContext, position: Cursor, limit: int) -> Tuple[List[Dict[str, Any]], Optional[Cursor]]:
+        """
+        صفحة من نتائج البحث الدقيق بدون معلومات الخدمات للعرض
+
+        تُحفظ في ذاكرة البحث حتى يعيد البحث المشابه استخدامها بعد البحث المطابق
+        """
+        cache_key = search_cache.key(ctx.criteria, SearchMode.EXACT,
+                                     namespace=f"exact_rows:{position.after}:{position.position}:{limit}")
+        cached = search_cache.get(cache_key)
+        if cached is None:
+            cached = self._query_exact_tier(ctx, position, limit)
+            if 'exact' not in ctx.errors:
+                search_cache.put(cache_key, cached, ctx.criteria)
+        rows, next_position = cached
+        # نسخ حتى لا تعدّل مراحل الدمج والعرض الصفوف المحفوظة
+        return [dict(row) for row in rows], next_position
+
+    def _needs_strict_service_filter(self, criteria: PropertyCriteria) -> bool:
+        """تصفية إضافية للخدمات في البحث الدقيق (للبحث العام مثل "أي مسجد")"""
+        return bool(criteria.metro_time_max or
+                    (criteria.university_requirements and not criteria.university_requirements.university_name) or
+                    (criteria.mosque_requirements and not criteria.mosque_requirements.mosque_name) or
+                    (criteria.school_requirements and criteria.school_requirements.required))
+
+    def _query_exact_tier(self, ctx: SearchContext, position: Cursor, limit: int) -> Tuple[List[Dict[str, Any]], Optional[Cursor]]:
+        criteria = ctx.criteria
         try:
             # 1. التحقق مما إذا كان البحث يعتمد على موقع محدد (جامعة أو مسجد بالاسم)
-            target_lat = None
-            target_lon = None
-            radius_meters = None
-
-            # أ) هل حدد جامعة بالاسم؟
-            if criteria.university_requirements and criteria.university_requirements.university_name:
-                uni_name = criteria.university_requirements.university_name
-                matched_name = _find_matching_university(uni_name) or uni_name
-                loc = self._get_entity_location(matched_name, 'universities')
-                if loc:
-                    target_lat, target_lon = loc
-                    mins = criteria.university_requirements.max_distance_minutes or 15
-                    radius_meters = _minutes_to_meters(mins, walking=False)
-
-            # ب) هل حدد مسجداً بالاسم؟ (إذا لم تكن الجامعة محددة)
-            elif criteria.mosque_requirements and criteria.mosque_requirements.mosque_name:
-                mosque_name = criteria.mosque_requirements.mosque_name
-                loc = self._get_entity_location(mosque_name, 'mosques')
-                if loc:
-                    target_lat, target_lon = loc
-                    mins = criteria.mosque_requirements.max_distance_minutes or 5
-                    radius_meters = _minutes_to_meters(mins, walking=criteria.mosque_requirements.walking)
+            anchor = self._resolve_anchor(ctx)
 
             # 2. إذا وجدنا موقعاً مستهدفاً، نستخدم دالة البحث المكاني السريع (RPC)
-            if target_lat and target_lon and radius_meters:
+            if anchor and anchor['lat'] and anchor['lon'] and anchor['radius_meters']:
                 try:
                     rpc_params = {
-                        'ref_lat': target_lat,
-                        'ref_lon': target_lon,
-                        'radius_meters': radius_meters,
+                        'ref_lat': anchor['lat'],
+                        'ref_lon': anchor['lon'],
+                        'radius_meters': anchor['radius_meters'],
                         'p_purpose': criteria.purpose.value,
                         'p_property_type': criteria.property_type.value,
                         'p_city': criteria.city,
@@ -205,294 +512,569 @@ class SearchEngine:
                     }
                     
                     logger.info("🚀 استدعاء دالة البحث المكاني search_properties_nearby...")
-                    result = self.db.client.rpc('search_properties_nearby', rpc_params).execute()
-                    
-                    if result.data:
-                        properties_data = result.data
-                        properties_data = self._add_nearby_services(properties_data, criteria)
-                        return properties_data
-                    else:
-                        return []
+                    # الـ RPC يرجع كل العقارات داخل النطاق بترتيبه، فنرقّم بالموقع
+                    rows = self._rpc_rows('search_properties_nearby', rpc_params, PROPERTY_COLUMNS)
+                    if anchor['travel_time']:
+                        rows = [r for r, keep in zip(rows, self._within_anchor(anchor, rows)) if keep]
+                    end = position.position + limit
+                    next_position = Cursor(TIER_EXACT, position=end) if len(rows) > end else None
+                    return rows[position.position:end], next_position
                         
                 except Exception as rpc_error:
                     logger.error(f"فشل RPC، العودة للبحث التقليدي: {rpc_error}")
 
             # 3. البحث التقليدي (إذا لم يكن هناك موقع محدد أو فشل الـ RPC)
-            logger.info("🔍 استخدام البحث التقليدي (فلاتر عادية)")
-            query = self.db.client.table('properties').select('*')
-            
-            query = query.not_.is_('final_lat', 'null')
-            query = query.not_.eq('final_lat', 0)
-            query = query.eq('purpose', criteria.purpose.value)
-            query = query.eq('property_type', criteria.property_type.value)
-            
-            if criteria.city:
-                query = query.eq('city', criteria.city)
-            
-            if criteria.district:
-                query = query.eq('district', criteria.district)
-            
-            # الفلاتر الرقمية
-            if criteria.rooms:
-                if criteria.rooms.exact is not None:
-                    query = query.eq('rooms', criteria.rooms.exact)
-                else:
-                    if criteria.rooms.min is not None: query = query.gte('rooms', criteria.rooms.min)
-                    if criteria.rooms.max is not None: query = query.lte('rooms', criteria.rooms.max)
-            
-            # فلتر الحمامات
-            if criteria.baths:
-                if criteria.baths.exact is not None:
-                    query = query.eq('baths', criteria.baths.exact)
-                else:
-                    if criteria.baths.min is not None: query = query.gte('baths', criteria.baths.min)
-                    if criteria.baths.max is not None: query = query.lte('baths', criteria.baths.max)
-            
-            #  فلتر الصالات 
-            if criteria.halls:
-                if criteria.halls.exact is not None:
-                    query = query.eq('halls', criteria.halls.exact)
+            # ترقيم بمفتاح الترتيب (السعر، id): كل صفحة تبدأ بعد آخر عقار أُرسل
+            use_store = settings.PROPERTY_STORE_ENABLED and property_store.ensure_loaded()
+            logger.info(f"🔍 استخدام البحث التقليدي ({'مخزن العقارات داخل الذاكرة' if use_store else 'فلاتر عادية'})")
+            needs_services = self._needs_strict_service_filter(criteria)
+            # كل طلب PostgREST يرجع POSTGREST_MAX_ROWS صف على الأكثر، والباقي بصفحات keyset
+            batch_size = min(max(limit * 2, 50) if needs_services else limit + 1, POSTGREST_MAX_ROWS)
+
+            page, after = [], position.after
+            while True:
+                if use_store:
+                    batch = property_store.search(criteria, batch_size, after=after)
                 else:
-                    if criteria.halls.min is not None: query = query.gte('halls', criteria.halls.min)
-                    if criteria.halls.max is not None: query = query.lte('halls', criteria.halls.max)
-            
-            #  فلتر المساحة 
-            if criteria.area_m2:
-                if criteria.area_m2.min is not None: query = query.gte('area_m2', criteria.area_m2.min)
-                if criteria.area_m2.max is not None: query = query.lte('area_m2', criteria.area_m2.max)
-            
-            if criteria.price:
-                if criteria.price.min is not None: query = query.gte('price_num', criteria.price.min)
-                if criteria.price.max is not None: query = query.lte('price_num', criteria.price.max)
-            
-            result = query.order('price_num').limit(self.exact_limit).execute()
-            
-            if not result.data:
-                return []
-            
-            properties_data = result.data
-            
-            # تصفية إضافية للخدمات (للبحث العام مثل "أي مسجد")
-            if criteria.metro_time_max or \
-               (criteria.university_requirements and not criteria.university_requirements.university_name) or \
-               (criteria.mosque_requirements and not criteria.mosque_requirements.mosque_name) or \
-               (criteria.school_requirements and criteria.school_requirements.required):
-                properties_data = self._filter_by_services(properties_data, criteria, strict=True)
-            
-            properties_data = self._add_nearby_services(properties_data, criteria)
-            return properties_data
+                    batch = self._query_properties(criteria, batch_size, after=after)
+                page.extend(self._filter_by_services(batch, criteria, strict=True) if needs_services else batch)
+                # صف إضافي واحد يكفي لمعرفة وجود صفحة تالية بدون عدّ كامل
+                if len(page) > limit or len(batch) < batch_size:
+                    break
+                after = sort_key(batch[-1])
+
+            page = page[:limit + 1]
+            next_position = Cursor(TIER_EXACT, after=sort_key(page[limit - 1])) if len(page) > limit else None
+            return page[:limit], next_position
             
         except Exception as e:
             logger.error(f"خطأ في البحث الدقيق: {e}")
+            ctx.errors['exact'] = str(e)
             import traceback
             traceback.print_exc()
-            return []
+            return [], None
+
+    def _exact_tier_members(self, ctx: SearchContext, rows: List[Dict[str, Any]]) -> set:
+        """
+        معرفات العقارات (من قائمة صغيرة) التي تنتمي لطبقة البحث المطابق،
+        حتى لا تتكرر في طبقة المشابه مهما كانت صفحة المطابق التي وصلها المستخدم
+        """
+        if not rows:
+            return set()
+        criteria = ctx.criteria
+        anchor = self._resolve_anchor(ctx)
+
+        if anchor and anchor['lat'] and anchor['lon'] and anchor['radius_meters']:
+            # نفس فلاتر search_properties_nearby
+            rpc_criteria = criteria.copy(update={
+                'district': None, 'baths': None, 'halls': None,
+                'rooms': IntRangeFilter(min=criteria.rooms.min) if criteria.rooms else None,
+                'area_m2': RangeFilter(min=criteria.area_m2.min) if criteria.area_m2 else None,
+            })
+            mask = matches_criteria(rpc_criteria, rows) & self._within_anchor(anchor, rows)
+            return {str(r.get('id')) for r, m in zip(rows, mask) if m}
+
+        members = [r for r, m in zip(rows, matches_criteria(criteria, rows)) if m]
+        if self._needs_strict_service_filter(criteria):
+            members = self._filter_by_services(members, criteria, strict=True)
+        return {str(r.get('id')) for r in members}
     
-    def _flexible_search(self, criteria: PropertyCriteria) -> List[Dict[str, Any]]:
+
+    def _query_properties(self, criteria: PropertyCriteria, limit: int,
+                          after: Optional[SortKey] = None) -> List[Dict[str, Any]]:
+        """
+        تطبيق فلاتر البحث المطابق عبر استعلام PostgREST (مرتبة حسب السعر)
+
+        Args:
+            after: مفتاح (السعر، id) لآخر عقار في الصفحة السابقة
+        """
+        query = self.db.client.table('properties').select(PROPERTY_COLUMNS)
+        
+        query = query.not_.is_('final_lat', 'null')
+        query = query.not_.eq('final_lat', 0)
+        query = query.eq('purpose', criteria.purpose.value)
+        query = query.eq('property_type', criteria.property_type.value)
+        
+        if criteria.city:
+            query = query.eq('city', criteria.city)
+        
+        if criteria.district:
+            query = query.eq('district', criteria.district)
+        
+        # الفلاتر الرقمية
+        if criteria.rooms:
+            if criteria.rooms.exact is not None:
+                query = query.eq('rooms', criteria.rooms.exact)
+            else:
+                if criteria.rooms.min is not None: query = query.gte('rooms', criteria.rooms.min)
+                if criteria.rooms.max is not None: query = query.lte('rooms', criteria.rooms.max)
+        
+        # فلتر الحمامات
+        if criteria.baths:
+            if criteria.baths.exact is not None:
+                query = query.eq('baths', criteria.baths.exact)
+            else:
+                if criteria.baths.min is not None: query = query.gte('baths', criteria.baths.min)
+                if criteria.baths.max is not None: query = query.lte('baths', criteria.baths.max)
+        
+        #  فلتر الصالات 
+        if criteria.halls:
+            if criteria.halls.exact is not None:
+                query = query.eq('halls', criteria.halls.exact)
+            else:
+                if criteria.halls.min is not None: query = query.gte('halls', criteria.halls.min)
+                if criteria.halls.max is not None: query = query.lte('halls', criteria.halls.max)
+        
+        #  فلتر المساحة 
+        if criteria.area_m2:
+            if criteria.area_m2.min is not None: query = query.gte('area_m2', criteria.area_m2.min)
+            if criteria.area_m2.max is not None: query = query.lte('area_m2', criteria.area_m2.max)
+        
+        if criteria.price:
+            if criteria.price.min is not None: query = query.gte('price_num', criteria.price.min)
+            if criteria.price.max is not None: query = query.lte('price_num', criteria.price.max)
+        
+        # Keyset: ما بعد آخر عقار بنفس ترتيب order('price_num').order('id') (NULL في الآخر)
+        if after is not None:
+            price, property_id = after
+            if price is None:
+                query = query.is_('price_num', 'null').gt('id', property_id)
+            else:
+                query = query.or_(f'price_num.gt.{price},and(price_num.eq.{price},id.gt."{property_id}"),price_num.is.null')
+        
+        # id كترتيب ثانوي حتى تكون النتائج ثابتة عند تساوي السعر
+        result = query.order('price_num').order('id').limit(limit).execute()
+        return result.data or []
+    
+
+    def _flexible_search(self, ctx: SearchContext, position: Cursor, page_size: int) -> Tuple[List[Dict[str, Any]], Optional[Cursor]]:
         """
         بحث هجين ذكي (Hybrid Search):
         يدمج نتائج البحث المطابق + عقارات إضافية مشابهة من البحث الدلالي
         
-        المنطق: المشابه = المطابق + الإضافات المشابهة
+        المنطق: المشابه = المطابق (كل صفحاته) ثم الإضافات المشابهة
+        
+        في الصفحة الأولى تعمل المراحل المستقلة بالتوازي:
+            anchor ──► exact ─────────────────────────┐
+               │                                      ├──► الدمج
+               └──► similar ◄── embedding             │
+                       └──► details ──────────────────┘
+        طبقة المشابه المرتبة تُحمل في المؤشر (المعرفات ودرجاتها)، فالصفحات التالية
+        لا تعيد توليد الـ embedding ولا البحث المتجهي ولا الترتيب.
         """
         try:
             logger.info(" بدء البحث الهجين (Smart Hybrid Search)...")
-            
-            # ════════════════════════════════════════════════════════════
-            # الخطوة 1: جلب نتائج البحث المطابق أولاً
-            # ════════════════════════════════════════════════════════════
-            logger.info(" جلب نتائج البحث المطابق أولاً...")
-            exact_results = self._exact_search(criteria)
-            exact_ids = {str(p.get('id')) for p in exact_results}
-            logger.info(f" البحث المطابق أرجع {len(exact_results)} عقار")
-            
-            # ════════════════════════════════════════════════════════════
-            # الخطوة 2: تجهيز إحداثيات البحث
-            # الأولوية: جامعة/مسجد محدد > مركز الحي
-            # ════════════════════════════════════════════════════════════
-            target_lat = None
-            target_lon = None
-            
-            # أولاً: هل حدد جامعة بالاسم؟
-            if criteria.university_requirements and criteria.university_requirements.university_name:
-                uni_name = criteria.university_requirements.university_name
-                matched_name = _find_matching_university(uni_name) or uni_name
-                loc = self._get_entity_location(matched_name, 'universities')
-                if loc: 
-                    target_lat, target_lon = loc
-                    logger.info(f"📍 استخدام موقع الجامعة: {matched_name}")
-            
-            # ثانياً: هل حدد مسجد بالاسم؟
-            elif criteria.mosque_requirements and criteria.mosque_requirements.mosque_name:
-                loc = self._get_entity_location(criteria.mosque_requirements.mosque_name, 'mosques')
-                if loc: 
-                    target_lat, target_lon = loc
-                    logger.info(f" استخدام موقع المسجد")
-            
-            # ثالثاً:  - استخدام مركز الحي إذا ما في جامعة/مسجد
-            if not target_lat and criteria.district:
-                loc = _get_district_coordinates(criteria.district)
-                if loc:
-                    target_lat, target_lon = loc
-                    logger.info(f" استخدام مركز حي {criteria.district}")
-
-            # ════════════════════════════════════════════════════════════
-            # الخطوة 3: البحث الدلالي للعقارات الإضافية
-            # ════════════════════════════════════════════════════════════
-            hybrid_results = []
-            if criteria.original_query:
-                try:
-                    logger.info("🔍 توليد Embedding للبحث الدلالي...")
-                    query_vector = embedding_generator.generate(criteria.original_query)
-                    
-                    if query_vector:
-                        rpc_params = {
-                            'query_embedding': query_vector,
-                            'match_threshold': 0.3,
-                            'match_count': 100,
-                            'p_purpose': criteria.purpose.value,
-                            'p_property_type': criteria.property_type.value,
-                            'p_city': criteria.city,
-                            'p_district': None,  # لا نحدد الحي - نعتمد على الإحداثيات
-                            'min_price': criteria.price.min * 0.5 if criteria.price and criteria.price.min else None,
-                            'max_price': criteria.price.max * 1.5 if criteria.price and criteria.price.max else None,
-                            'p_lat': target_lat,  #  إحداثيات الجامعة/المسجد/الحي
-                            'p_lon': target_lon
-                        }
-                        
-                        logger.info(f" استدعاء search_properties_hybrid (target: {target_lat}, {target_lon})...")
-                        result = self.db.client.rpc('search_properties_hybrid', rpc_params).execute()
-                        hybrid_results = result.data or []
-                        logger.info(f" البحث الدلالي أرجع {len(hybrid_results)} عقار")
-                except Exception as vec_error:
-                    logger.error(f"فشل البحث المتجهي: {vec_error}")
-                    hybrid_results = []
+            criteria = ctx.criteria
+            exact_results, exact_next = [], None
+            tier = None
 
-            # ════════════════════════════════════════════════════════════
-            # الخطوة 4: Fallback إذا لم نجد نتائج بالبحث الهجين
-            # ════════════════════════════════════════════════════════════
-            if not hybrid_results:
-                logger.info(" استخدام البحث الرقمي البديل (Weighted Search)...")
-                
-                target_price = 0
-                if criteria.price:
-                    if criteria.price.min and criteria.price.max:
-                        target_price = (criteria.price.min + criteria.price.max) / 2
-                    elif criteria.price.max:
-                        target_price = criteria.price.max
-                    elif criteria.price.min:
-                        target_price = criteria.price.min
-                
-                if target_price > 0:
-                    try:
-                        rpc_params = {
-                            'target_price': target_price,
-                            'target_lat': target_lat,
-                            'target_lon': target_lon,
-                            'p_purpose': criteria.purpose.value,
-                            'p_property_type': criteria.property_type.value,
-                            'p_city': criteria.city
-                        }
-                        res = self.db.client.rpc('search_properties_flexible_ranked', rpc_params).execute()
-                        hybrid_results = res.data or []
-                    except Exception as e:
-                        logger.error(f"فشل البحث الرقمي: {e}")
+            if position.tier == TIER_EXACT:
+                first_page = position.after is None and position.position == 0
+                if first_page and search_cache.get(self._similar_tier_key(criteria)) is None:
+                    StageGraph([
+                        Stage('exact', lambda c: self._exact_tier(c, position, page_size), deps=('anchor',), default=([], None)),
+                        *self._similar_stages(),
+                    ]).run(ctx)
+                    exact_results, exact_next = ctx.results['exact']
+                else:
+                    exact_results, exact_next = self._exact_tier(ctx, position, page_size)
+                if position.ranked is None and (first_page or exact_next is None):
+                    # طبقة المشابه تُبنى مرة واحدة (من مراحل الصفحة الأولى أو عند انتهاء المطابق)
+                    tier = self._similar_tier(ctx)
+                logger.info(f" البحث المطابق أرجع {len(exact_results)} عقار")
 
-            # ════════════════════════════════════════════════════════════
-            # الخطوة 5: جلب التفاصيل الكاملة للعقارات من البحث الدلالي
-            # ════════════════════════════════════════════════════════════
-            additional_properties = []
-            if hybrid_results:
-                new_ids = [str(item['id']) for item in hybrid_results if str(item['id']) not in exact_ids]
-                
-                if new_ids:
-                    properties_response = self.db.client.table('properties')\
-                        .select('*')\
-                        .in_('id', new_ids)\
-                        .execute()
-                    
-                    full_properties_map = {str(p['id']): p for p in properties_response.data}
-                    
-                    for item in hybrid_results:
-                        p_id = str(item['id'])
-                        if p_id in full_properties_map and p_id not in exact_ids:
-                            prop = full_properties_map[p_id]
-                            prop['match_score'] = round(item.get('similarity', 0) * 100) if 'similarity' in item else 70
-                            additional_properties.append(prop)
-            
-            logger.info(f" عقارات إضافية مشابهة: {len(additional_properties)}")
-            
-            # ════════════════════════════════════════════════════════════
-            # الخطوة 6: دمج النتائج (المطابق أولاً + المشابه)
-            # ════════════════════════════════════════════════════════════
+            # أولاً: نتائج البحث المطابق (مع نسبة 100%)
             final_results = []
-            
-            # أولاً: إضافة نتائج البحث المطابق (مع نسبة 100%)
             for prop in exact_results:
                 prop['match_score'] = 100
                 final_results.append(prop)
-            
-            # ثانياً: تصفية العقارات الإضافية حسب الخدمات (مع تسامح +5 دقائق)
-            if additional_properties:
-                if criteria.metro_time_max or \
-                   (criteria.university_requirements and criteria.university_requirements.required) or \
-                   (criteria.mosque_requirements and criteria.mosque_requirements.required) or \
-                   (criteria.school_requirements and criteria.school_requirements.required):
-                    additional_properties = self._filter_by_services(additional_properties, criteria, strict=False)
-            
-            # ════════════════════════════════════════════════════════════
-            # الخطوة 7:  ترتيب العقارات المشابهة (نفس الحي أولاً)
-            # ════════════════════════════════════════════════════════════
-            if criteria.district and additional_properties:
-                # فصل العقارات: نفس الحي vs أحياء أخرى
-                same_district = []
-                other_districts = []
-                
-                for prop in additional_properties:
-                    if prop.get('district') == criteria.district:
-                        same_district.append(prop)
-                    else:
-                        other_districts.append(prop)
-                
-                # ترتيب: نفس الحي أولاً (مع نسبة أعلى)
-                for prop in same_district:
-                    prop['match_score'] = min(prop.get('match_score', 70) + 15, 95)  # +15% لنفس الحي
-                    final_results.append(prop)
-                
-                # ثم الأحياء الأخرى
-                for prop in other_districts:
-                    final_results.append(prop)
-                
-                logger.info(f" الترتيب: {len(same_district)} من نفس الحي + {len(other_districts)} من أحياء قريبة")
+
+            ranked = self._ranked_entries(tier) if tier is not None else position.ranked
+            next_position = exact_next
+            if exact_next is not None:
+                # نسخة: مؤشر المطابق محفوظ في ذاكرة البحث مع صفحته
+                next_position = replace(exact_next, ranked=ranked)
             else:
-                # إذا ما في حي محدد، أضف الكل
-                for prop in additional_properties:
-                    final_results.append(prop)
-            
-            logger.info(f" إجمالي النتائج: {len(exact_results)} مطابق + {len(additional_properties)} مشابه = {len(final_results)}")
+                # انتهى المطابق: نكمل الصفحة من طبقة المشابه
+                similar_rows, next_position = self._similar_slice(ranked, tier, page_size - len(final_results))
+                final_results.extend(similar_rows)
+
+            logger.info(f" إجمالي الصفحة: {len(exact_results)} مطابق + {len(final_results) - len(exact_results)} مشابه")
             
             # ════════════════════════════════════════════════════════════
-            # الخطوة 8: إضافة معلومات الخدمات القريبة للعرض
+            # إضافة معلومات الخدمات القريبة للعرض (لعقارات الصفحة فقط)
             # ════════════════════════════════════════════════════════════
-            final_results = self._add_nearby_services(final_results, criteria)
+            started = time.perf_counter()
+            final_results = self._add_nearby_services(final_results, criteria, ctx)
+            ctx.record('nearby_services', started)
             
-            return final_results
+            return final_results, next_position
 
         except Exception as e:
             logger.error(f"خطأ في البحث الهجين: {e}")
+            ctx.errors['flexible'] = str(e)
             import traceback
             traceback.print_exc()
+            return [], None
+
+    def _ranked_entries(self, tier: List[Dict[str, Any]]) -> List[RankedEntry]:
+        return [(str(prop['id']), int(prop['match_score'])) for prop in tier]
+
+    def _similar_slice(self, ranked: Optional[List[RankedEntry]], tier: Optional[List[Dict[str, Any]]],
+                       room: int) -> Tuple[List[Dict[str, Any]], Optional[Cursor]]:
+        """
+        الجزء التالي من طبقة المشابه لملء room مكان في الصفحة، مع مؤشر ما بعده
+
+        Args:
+            ranked: ما تبقى من الطبقة المرتبة (من المؤشر أو من الطبقة المبنية الآن)
+            tier: صفوف الطبقة إذا بُنيت في هذا الطلب، وإلا تُجلب صفوف الصفحة بالمعرف
+        """
+        ranked = ranked or []
+        room = max(room, 0)
+        page, rest = ranked[:room], ranked[room:]
+        if tier is not None:
+            rows_by_id = {str(prop['id']): prop for prop in tier}
+        else:
+            rows_by_id = self._rows_by_id([property_id for property_id, _ in page])
+        # عقار حُذف بعد الترتيب يُتخطى، والترتيب والدرجة كما حُسبا أول مرة
+        rows = [dict(rows_by_id[property_id], match_score=score)
+                for property_id, score in page if property_id in rows_by_id]
+        next_position = Cursor(TIER_SIMILAR, ranked=rest) if rest else None
+        return rows, next_position
+
+    def _similar_tier_key(self, criteria: PropertyCriteria) -> str:
+        return search_cache.key(criteria, SearchMode.SIMILAR, namespace='similar_tier')
+
+    def _similar_stages(self) -> List[Stage]:
+        return [
+            Stage('anchor', self._resolve_anchor),
+            Stage('embedding', self._embed_query),
+            Stage('lexical', self._lexical_candidates, default=[]),
+            Stage('similar', self._similar_candidates, deps=('anchor', 'embedding', 'lexical'), default=[]),
+            Stage('details', self._fetch_details, deps=('similar',), default={}),
+        ]
+
+    def _similar_tier(self, ctx: SearchContext) -> List[Dict[str, Any]]:
+        """
+        طبقة العقارات المشابهة كاملة ومرتبة (بدون المطابق)، محفوظة في ذاكرة البحث
+        """
+        cache_key = self._similar_tier_key(ctx.criteria)
+        cached = search_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        if 'details' not in ctx.results:
+            StageGraph(self._similar_stages()).run(ctx)
+
+        started = time.perf_counter()
+        tier = self._build_similar_tier(ctx)
+        ctx.record('similar_tier', started)
+        if not ctx.errors:
+            search_cache.put(cache_key, tier, ctx.criteria)
+        return tier
+
+    def _build_similar_tier(self, ctx: SearchContext) -> List[Dict[str, Any]]:
+        criteria = ctx.criteria
+        full_properties_map = ctx.results.get('details') or {}
+
+        # ════════════════════════════════════════════════════════════
+        # العقارات الإضافية من البحث الدلالي (بدون ما ينتمي للمطابق)
+        # ════════════════════════════════════════════════════════════
+        additional_properties = []
+        similarity = {}
+        for item in ctx.results.get('similar') or []:
+            p_id = str(item['id'])
+            if p_id in full_properties_map and p_id not in similarity:
+                similarity[p_id] = item['similarity'] if item.get('similarity') is not None else np.nan
+                additional_properties.append(dict(full_properties_map[p_id]))
+
+        exact_ids = self._exact_tier_members(ctx, additional_properties)
+        additional_properties = [p for p in additional_properties if str(p['id']) not in exact_ids]
+        logger.info(f" عقارات إضافية مشابهة: {len(additional_properties)}")
+        
+        # تصفية العقارات الإضافية حسب الخدمات (مع تسامح +5 دقائق)
+        if additional_properties:
+            if criteria.metro_time_max or \
+               (criteria.university_requirements and criteria.university_requirements.required) or \
+               (criteria.mosque_requirements and criteria.mosque_requirements.required) or \
+               (criteria.school_requirements and criteria.school_requirements.required):
+                additional_properties = self._filter_by_services(additional_properties, criteria, strict=False)
+        
+        # ════════════════════════════════════════════════════════════
+        #  ترتيب العقارات المشابهة (كل الإشارات دفعة واحدة)
+        # ════════════════════════════════════════════════════════════
+        if not additional_properties:
+            return []
+        started = time.perf_counter()
+        ranked = ranking.rank(
+            additional_properties, criteria,
+            similarity=np.array([similarity[str(p['id'])] for p in additional_properties], dtype=np.float64),
+            target=self._resolve_target(ctx),
+            service_minutes=self._service_minutes(additional_properties, criteria),
+            k=self.similar_limit
+        )
+        ctx.record('ranking', started)
+        logger.info(f" الترتيب: {len(ranked)} عقار مشابه (أعلى درجة {ranked[0]['match_score']})")
+        return ranked
+
+    # ═══════════════════════════════════════════════════════
+    # مراحل البحث الهجين
+    # ═══════════════════════════════════════════════════════
+    def _embed_query(self, ctx: SearchContext) -> Optional[List[float]]:
+        """توليد Embedding لنص الطلب (ضمن دفعة أو في مجمّع embedding)"""
+        if not ctx.criteria.original_query:
+            return None
+        # الموديل بارد: لا ننتظر تحميله، يكفي الفهرس النصي لهذا الطلب
+        if settings.LEXICAL_INDEX_ENABLED and not embedding_generator.is_ready() and lexical_index.is_loaded():
+            embedding_generator.load_in_background()
+            # طبقة ناقصة: لا تُحفظ في ذاكرة البحث
+            ctx.errors['embedding'] = 'الموديل قيد التحميل'
+            return None
+        logger.info("🔍 توليد Embedding للبحث الدلالي...")
+        return embedding_generator.generate_from_thread(ctx.criteria.original_query) or None
+
+    def _lexical_candidates(self, ctx: SearchContext) -> List[Dict[str, Any]]:
+        """بحث BM25 في العنوان والوصف (بالتوازي مع توليد الـ embedding)"""
+        criteria = ctx.criteria
+        if not settings.LEXICAL_INDEX_ENABLED or not criteria.original_query or not lexical_index.ensure_loaded():
             return []
+        results = lexical_index.search(
+            criteria.original_query,
+            k=self.similar_limit,
+            purpose=criteria.purpose.value,
+            property_type=criteria.property_type.value,
+            city=criteria.city,
+            min_price=criteria.price.min * 0.5 if criteria.price and criteria.price.min else None,
+            max_price=criteria.price.max * 1.5 if criteria.price and criteria.price.max else None
+        )
+        logger.info(f" البحث النصي (BM25) أرجع {len(results)} عقار")
+        return results
+
+    def _similar_candidates(self, ctx: SearchContext) -> List[Dict[str, Any]]:
+        """
+        البحث الدلالي للعقارات الإضافية، مع بحث رقمي بديل (Weighted Search)
+        إذا لم يرجع نتائج
+        """
+        criteria = ctx.criteria
+        target_lat, target_lon = self._resolve_target(ctx)
+        query_vector = ctx.results.get('embedding')
+
+        hybrid_results = []
+        if query_vector:
+            try:
+                rpc_params = {
+                    'query_embedding': query_vector,
+                    'match_threshold': 0.3,
+                    'match_count': self.similar_limit,
+                    'p_purpose': criteria.purpose.value,
+                    'p_property_type': criteria.property_type.value,
+                    'p_city': criteria.city,
+                    'p_district': None,  # لا نحدد الحي - نعتمد على الإحداثيات
+                    'min_price': criteria.price.min * 0.5 if criteria.price and criteria.price.min else None,
+                    'max_price': criteria.price.max * 1.5 if criteria.price and criteria.price.max else None,
+                    'p_lat': target_lat,  #  إحداثيات الجامعة/المسجد/الحي
+                    'p_lon': target_lon
+                }
+                
+                if settings.VECTOR_INDEX_ENABLED and vector_index.ensure_loaded():
+                    logger.info(f" البحث في فهرس المتجهات المحلي (target: {target_lat}, {target_lon})...")
+                    hybrid_results = vector_index.search(
+                        query_vector,
+                        k=rpc_params['match_count'],
+                        threshold=rpc_params['match_threshold'],
+                        purpose=rpc_params['p_purpose'],
+                        property_type=rpc_params['p_property_type'],
+                        city=rpc_params['p_city'],
+                        min_price=rpc_params['min_price'],
+                        max_price=rpc_params['max_price'],
+                        lat=target_lat,
+                        lon=target_lon
+                    )
+                else:
+                    logger.info(f" استدعاء search_properties_hybrid (target: {target_lat}, {target_lon})...")
+                    hybrid_results = self._rpc_rows('search_properties_hybrid', rpc_params, 'id, similarity')
+                logger.info(f" البحث الدلالي أرجع {len(hybrid_results)} عقار")
+            except Exception as vec_error:
+                logger.error(f"فشل البحث المتجهي: {vec_error}")
+                ctx.errors['similar'] = str(vec_error)
+                hybrid_results = []
+
+        # دمج نتائج BM25 (RRF)، أو استخدامها وحدها إذا لم يتوفر البحث المتجهي
+        lexical_results = ctx.results.get('lexical') or []
+        if hybrid_results and lexical_results:
+            hybrid_results = reciprocal_rank_fusion(
+                [hybrid_results, [dict(item, similarity=None) for item in lexical_results]],
+                limit=self.similar_limit, k=settings.LEXICAL_RRF_K
+            )
+            logger.info(f" الدمج مع البحث النصي: {len(hybrid_results)} عقار")
+        elif lexical_results:
+            logger.info(" استخدام نتائج البحث النصي كمرحلة أولى (لا يوجد embedding)")
+            hybrid_results = lexical_results
+
+        # Fallback إذا لم نجد نتائج بالبحث الهجين
+        if not hybrid_results:
+            logger.info(" استخدام البحث الرقمي البديل (Weighted Search)...")
+            
+            target_price = 0
+            if criteria.price:
+                if criteria.price.min and criteria.price.max:
+                    target_price = (criteria.price.min + criteria.price.max) / 2
+                elif criteria.price.max:
+                    target_price = criteria.price.max
+                elif criteria.price.min:
+                    target_price = criteria.price.min
+            
+            if target_price > 0:
+                try:
+                    rpc_params = {
+                        'target_price': target_price,
+                        'target_lat': target_lat,
+                        'target_lon': target_lon,
+                        'p_purpose': criteria.purpose.value,
+                        'p_property_type': criteria.property_type.value,
+                        'p_city': criteria.city
+                    }
+                    hybrid_results = self._rpc_rows('search_properties_flexible_ranked', rpc_params, 'id')
+                except Exception as e:
+                    logger.error(f"فشل البحث الرقمي: {e}")
+                    ctx.errors['similar_fallback'] = str(e)
+
+        return hybrid_results
+
+    def _fetch_details(self, ctx: SearchContext) -> Dict[str, Dict[str, Any]]:
+        """
+        جلب التفاصيل الكاملة لنتائج البحث الدلالي
+
+        تعمل بالتوازي مع البحث المطابق، لذلك تجلب كل المعرفات (≤ 100) ويُستبعد
+        المكرر مع المطابق عند الدمج
+        """
+        ids = list(dict.fromkeys(str(item['id']) for item in ctx.results.get('similar') or []))
+        return self._rows_by_id(ids)
+
+    def _rows_by_id(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """صفوف العقارات الكاملة لقائمة معرفات (استعلام واحد)"""
+        if not ids:
+            return {}
+        response = self.db.client.table('properties')\
+            .select(PROPERTY_COLUMNS)\
+            .in_('id', ids)\
+            .execute()
+        return {str(p['id']): p for p in response.data or []}
     
+
     def _filter_by_services(self, properties: List[Dict[str, Any]], criteria: PropertyCriteria, strict: bool = True) -> List[Dict[str, Any]]:
         """
         فلترة العقارات بناءً على الخدمات
         
+        تُنفَّذ دفعة واحدة على فهرس الخدمات داخل الذاكرة، وتعود لاستدعاءات
+        RPC لكل عقار فقط إذا لم يكن الفهرس جاهزاً
+        
         Args:
             properties: قائمة العقارات
             criteria: معايير البحث
             strict: True = بحث مطابق (بدون تسامح)، False = بحث مشابه (+5 دقائق تسامح)
         """
+        if not properties:
+            return []
+        
+        if not poi_index.ensure_loaded():
+            return self._filter_by_services_rpc(properties, criteria, strict)
+        
+        #  التسامح الموحد للبحث المشابه: +5 دقائق لكل الخدمات
+        TOLERANCE_MINUTES = 0 if strict else 5
+        
+        lats = np.array([p.get('final_lat') or 0 for p in properties], dtype=np.float64)
+        lons = np.array([p.get('final_lon') or 0 for p in properties], dtype=np.float64)
+        keep = (lats != 0) & (lons != 0)
+        
+        #  الميترو
+        if criteria.metro_time_max:
+            max_metro = criteria.metro_time_max + TOLERANCE_MINUTES
+            for i, prop in enumerate(properties):
+                prop_metro_time = prop.get('time_to_metro_min')
+                if prop_metro_time is not None and prop_metro_time > max_metro:
+                    keep[i] = False
+        
+        #  الجامعات (بحث عام)
+        uni_reqs = criteria.university_requirements
+        if uni_reqs and uni_reqs.required and not uni_reqs.university_name:
+            keep &= self._services_within('universities', lats, lons, (uni_reqs.max_distance_minutes or 20) + TOLERANCE_MINUTES)
+        
+        #  المساجد (بحث عام)
+        mosque_reqs = criteria.mosque_requirements
+        if mosque_reqs and mosque_reqs.required and not mosque_reqs.mosque_name:
+            keep &= self._services_within('mosques', lats, lons, (mosque_reqs.max_distance_minutes or 10) + TOLERANCE_MINUTES,
+                                          walking=mosque_reqs.walking)
+        
+        #  المدارس (بحث عام)
+        school_reqs = criteria.school_requirements
+        if school_reqs and school_reqs.required:
+            gender = school_reqs.gender.value if school_reqs.gender else None
+            keep &= self._services_within('schools', lats, lons, (school_reqs.max_distance_minutes or 15) + TOLERANCE_MINUTES,
+                                          walking=school_reqs.walking, gender=gender, levels=school_reqs.levels)
+        
+        return [prop for prop, k in zip(properties, keep) if k]
+    
+    def _services_within(self, kind: str, lats: np.ndarray, lons: np.ndarray, minutes: float, walking: bool = False,
+                         gender: Optional[str] = None, levels: Optional[List[str]] = None) -> np.ndarray:
+        """
+        لكل عقار: هل توجد خدمة مطابقة خلال N دقيقة؟
+        
+        بزمن التنقل على شبكة الطرق إن كانت متاحة، وبدائرة السرعة الثابتة
+        عند تعطيلها أو للعقارات خارج الشبكة فقط
+        """
+        max_dist = _minutes_to_meters(minutes, walking=walking)
+        times = None
+        if travel_time_engine.ensure_loaded():
+            times = travel_time_engine.minutes_to_nearest(kind, lats, lons, WALK if walking else DRIVE,
+                                                          gender=gender, levels=levels)
+        if times is None:
+            return poi_index.any_within(kind, lats, lons, max_dist, gender=gender, levels=levels)
+        
+        keep = times <= minutes
+        unknown = np.isnan(times)
+        if unknown.any():
+            keep[unknown] = poi_index.any_within(kind, lats[unknown], lons[unknown], max_dist, gender=gender, levels=levels)
+        return keep
+    
+    def _service_minutes(self, properties: List[Dict[str, Any]],
+                         criteria: PropertyCriteria) -> List[Tuple[np.ndarray, float]]:
+        """
+        زمن الوصول لأقرب خدمة مطلوبة لكل عقار مع حدها بالدقائق (لإشارة الخدمات في الترتيب)
+        
+        بزمن الشبكة إن كانت متاحة، وإلا من المسافة المباشرة بالسرعة الثابتة
+        """
+        requirements = []
+        uni_reqs = criteria.university_requirements
+        if uni_reqs and uni_reqs.required and not uni_reqs.university_name:
+            requirements.append(('universities', uni_reqs.max_distance_minutes or 20, False, {}))
+        mosque_reqs = criteria.mosque_requirements
+        if mosque_reqs and mosque_reqs.required and not mosque_reqs.mosque_name:
+            requirements.append(('mosques', mosque_reqs.max_distance_minutes or 10, mosque_reqs.walking, {}))
+        school_reqs = criteria.school_requirements
+        if school_reqs and school_reqs.required:
+            requirements.append(('schools', school_reqs.max_distance_minutes or 15, school_reqs.walking, {
+                'gender': school_reqs.gender.value if school_reqs.gender else None, 'levels': school_reqs.levels}))
+        if not properties or not requirements or not poi_index.ensure_loaded():
+            return []
+        
+        lats = np.array([p.get('final_lat') or 0 for p in properties], dtype=np.float64)
+        lons = np.array([p.get('final_lon') or 0 for p in properties], dtype=np.float64)
+        result = []
+        for kind, limit, walking, filters in requirements:
+            minutes = None
+            if travel_time_engine.ensure_loaded():
+                minutes = travel_time_engine.minutes_to_nearest(kind, lats, lons, WALK if walking else DRIVE, **filters)
+            if minutes is None or np.isnan(minutes).any():
+                horizon = _minutes_to_meters(limit + settings.RANK_SERVICE_TOLERANCE_MINUTES, walking=walking)
+                meters = poi_index.nearest_meters(kind, lats, lons, horizon, **filters)
+                estimate = meters / _minutes_to_meters(1, walking=walking)
+                minutes = estimate if minutes is None else np.where(np.isnan(minutes), estimate, minutes)
+            result.append((minutes, limit))
+        return result
+    
+    def _filter_by_services_rpc(self, properties: List[Dict[str, Any]], criteria: PropertyCriteria, strict: bool = True) -> List[Dict[str, Any]]:
+        """فلترة الخدمات عبر RPC لكل عقار (المسار الاحتياطي عند عدم جاهزية الفهرس)"""
         filtered = []
         
         #  التسامح الموحد للبحث المشابه: +5 دقائق لكل الخدمات
@@ -592,9 +1174,15 @@ class SearchEngine:
             filtered.append(prop)
         return filtered
     
-    def _add_nearby_services(self, properties: List[Dict[str, Any]], criteria: PropertyCriteria) -> List[Dict[str, Any]]:
+    def _add_nearby_services(self, properties: List[Dict[str, Any]], criteria: PropertyCriteria,
+                             ctx: Optional[SearchContext] = None) -> List[Dict[str, Any]]:
         """إضافة معلومات الخدمات القريبة"""
         if not properties: return []
+        # الخريطة لا تعرض الخدمات؛ تُجلب مع تفاصيل العقار عند الطلب
+        if ctx is not None and ctx.view == SearchView.MAP: return properties
+        
+        # مطابقة اسم الجامعة مرة واحدة لكل الطلب (مشتركة مع الموقع المرجعي)
+        uni_name = self._matched_university(ctx or SearchContext(criteria))
         
         for prop in properties:
             prop_lat = prop.get('final_lat')
@@ -605,19 +1193,64 @@ class SearchEngine:
                 prop['nearby_schools'] = self._get_nearby_schools(prop_lat, prop_lon, criteria.school_requirements)
             
             if criteria.university_requirements and criteria.university_requirements.required:
-                prop['nearby_universities'] = self._get_nearby_universities_for_display(prop_lat, prop_lon, criteria.university_requirements)
+                prop['nearby_universities'] = self._get_nearby_universities_for_display(prop_lat, prop_lon, criteria.university_requirements, uni_name)
                 
             if criteria.mosque_requirements and criteria.mosque_requirements.required:
                  prop['nearby_mosques'] = self._get_nearby_mosques_for_display(prop_lat, prop_lon, criteria.mosque_requirements)
                  
         return properties
 
+    def _display_radius(self, lat, lon, minutes: float, walking: bool) -> float:
+        """نصف قطر جلب الخدمات للعرض (يحيط بما يمكن الوصول إليه بالسيارة على الشبكة)"""
+        dist = _minutes_to_meters(minutes, walking=walking)
+        # المشي بسرعة ثابتة: الدائرة تحيط بمسار الشبكة دائماً
+        if not walking and travel_time_engine.ensure_loaded():
+            radius = travel_time_engine.reach_radius_meters(lat, lon, DRIVE, minutes, outbound=True)
+            if radius is not None:
+                return max(radius, dist)
+        return dist
+
+    def _with_travel_minutes(self, items: List[Dict[str, Any]], lat, lon, minutes: float,
+                             walking: bool) -> List[Dict[str, Any]]:
+        """
+        إضافة زمن التنقل (drive_minutes أو walk_minutes) لكل خدمة معروضة
+
+        بزمن الشبكة إن كانت متاحة مع حذف ما لا يُوصل إليه خلال N دقيقة،
+        وإلا بالسرعة الثابتة من المسافة المباشرة
+        """
+        key, speed = ('walk_minutes', 5.0) if walking else ('drive_minutes', 30.0)
+        estimates = [round((item.get('distance_meters', 0) / 1000.0) / speed * 60.0, 1) for item in items]
+        
+        times = None
+        if items and all(item.get('lat') is not None and item.get('lon') is not None for item in items) \
+                and travel_time_engine.ensure_loaded():
+            times = travel_time_engine.minutes_from_point(lat, lon, [item['lat'] for item in items],
+                                                          [item['lon'] for item in items],
+                                                          WALK if walking else DRIVE, minutes)
+        if times is None:
+            for item, estimate in zip(items, estimates):
+                item[key] = estimate
+            return items
+        
+        reachable = []
+        for item, estimate, t in zip(items, estimates, times):
+            value = estimate if np.isnan(t) else round(float(t), 1)
+            if value <= minutes:
+                item[key] = value
+                reachable.append(item)
+        return reachable
+
     def _get_nearby_schools(self, lat, lon, reqs):
         try:
-            dist = _minutes_to_meters(reqs.max_distance_minutes or 15, walking=reqs.walking)
+            minutes = reqs.max_distance_minutes or 15
+            dist = self._display_radius(lat, lon, minutes, reqs.walking)
             levels = [LEVELS_TRANSLATION_MAP.get(l, l) for l in reqs.levels] if reqs.levels else None
             gender = 'girls' if reqs.gender == 'بنات' else 'boys' if reqs.gender == 'بنين' else None
             
+            if poi_index.ensure_loaded():
+                data = poi_index.nearby('schools', lat, lon, dist, gender=gender, levels=levels)
+                return self._with_travel_minutes(data, lat, lon, minutes, reqs.walking)
+            
             res = self.db.client.rpc('get_nearby_schools', {
                 'p_lat': lat, 'p_lon': lon, 'p_distance_meters': dist,
                 'p_gender': gender, 'p_levels': levels
@@ -625,42 +1258,53 @@ class SearchEngine:
             return res.data if res.data else []
         except: return []
 
-    def _get_nearby_universities_for_display(self, lat, lon, reqs):
+    def _get_nearby_universities_for_display(self, lat, lon, reqs, uni_name: Optional[str] = None):
         try:
-            dist = _minutes_to_meters((reqs.max_distance_minutes or 15) + 5)
-            uni_name = _find_matching_university(reqs.university_name) if reqs.university_name else None
+            minutes = (reqs.max_distance_minutes or 15) + 5
+            dist = self._display_radius(lat, lon, minutes, walking=False)
             
-            res = self.db.client.rpc('get_universities_for_display', {
-                'center_lat': lat, 'center_lon': lon,
-                'max_distance_meters': dist, 'university_name': uni_name
-            }).execute()
+            if poi_index.ensure_loaded():
+                data = poi_index.nearby('universities', lat, lon, dist, name=uni_name)
+            else:
+                res = self.db.client.rpc('get_universities_for_display', {
+                    'center_lat': lat, 'center_lon': lon,
+                    'max_distance_meters': dist, 'university_name': uni_name
+                }).execute()
+                data = res.data or []
             
-            data = res.data or []
-            for item in data:
-                d = item.get('distance_meters', 0)
-                item['drive_minutes'] = round((d / 1000.0) / 30.0 * 60.0, 1)
-            return data
+            return self._with_travel_minutes(data, lat, lon, minutes, walking=False)
         except: return []
 
     def _get_nearby_mosques_for_display(self, lat, lon, reqs):
         try:
-            dist = _minutes_to_meters((reqs.max_distance_minutes or 5) + 2, walking=reqs.walking)
+            minutes = (reqs.max_distance_minutes or 5) + 2
+            dist = self._display_radius(lat, lon, minutes, reqs.walking)
             
-            res = self.db.client.rpc('get_mosques_for_display', {
-                'center_lat': lat, 'center_lon': lon,
-                'max_distance_meters': dist, 'mosque_name': reqs.mosque_name
-            }).execute()
+            if poi_index.ensure_loaded():
+                data = poi_index.nearby('mosques', lat, lon, dist, name=reqs.mosque_name)
+            else:
+                res = self.db.client.rpc('get_mosques_for_display', {
+                    'center_lat': lat, 'center_lon': lon,
+                    'max_distance_meters': dist, 'mosque_name': reqs.mosque_name
+                }).execute()
+                data = res.data or []
             
-            data = res.data or []
-            for item in data:
-                d = item.get('distance_meters', 0)
-                if reqs.walking:
-                    item['walk_minutes'] = round((d / 1000.0) / 5.0 * 60.0, 1)
-                else:
-                    item['drive_minutes'] = round((d / 1000.0) / 30.0 * 60.0, 1)
-            return data
+            return self._with_travel_minutes(data, lat, lon, minutes, reqs.walking)
         except: return []
 
+    def _row_to_item(self, row: Dict[str, Any], view: SearchView):
+        return self._row_to_marker(row) if view == SearchView.MAP else self._row_to_property(row)
+
+    def _row_to_marker(self, row: Dict[str, Any]) -> PropertyMarker:
+        return PropertyMarker(
+            id=str(row.get('id')),
+            final_lat=row.get('final_lat'),
+            final_lon=row.get('final_lon'),
+            price_num=float(row['price_num']) if row.get('price_num') else None,
+            property_type=row.get('property_type'),
+            match_score=row.get('match_score')
+        )
+
     def _row_to_property(self, row: Dict[str, Any]) -> Property:
         return Property(
             id=str(row.get('id')),
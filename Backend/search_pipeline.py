@@ -0,0 +1,111 @@
+"""
+منفّذ مراحل البحث (Stage Scheduler)
+
+يُعبَّر عن خط البحث كرسم بياني من المراحل المعتمدة على بعضها؛ كل مرحلة
+تبدأ فور انتهاء المراحل التي تعتمد عليها، فتعمل المراحل المستقلة (البحث
+المطابق، توليد الـ embedding، تحديد الموقع المرجعي) بالتوازي.
+سياق الطلب (SearchContext) يحمل النتائج المشتركة وزمن كل مرحلة.
+"""
+from executors import executors
+from models import PropertyCriteria, SearchView
+from concurrent.futures import wait, FIRST_COMPLETED
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence
+import threading
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class SearchContext:
+    """سياق طلب بحث واحد: القيم المشتركة بين المراحل + الأزمنة"""
+
+    def __init__(self, criteria: PropertyCriteria, view: SearchView = SearchView.FULL):
+        self.criteria = criteria
+        self.view = view  # map = بدون معلومات الخدمات القريبة
+        self.results: Dict[str, Any] = {}
+        self.timings: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+        self._shared: Dict[str, Any] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def shared(self, key: str, compute: Callable[[], Any]) -> Any:
+        """
+        قيمة تُحسب مرة واحدة لكل طلب حتى لو طلبتها عدة مراحل بالتوازي
+        (مثل الموقع المرجعي للجامعة/المسجد)
+        """
+        with self._lock:
+            if key in self._shared:
+                return self._shared[key]
+            lock = self._locks.setdefault(key, threading.Lock())
+
+        with lock:
+            if key not in self._shared:
+                started = time.perf_counter()
+                self._shared[key] = compute()
+                self.record(key, started)
+            return self._shared[key]
+
+    def record(self, name: str, started: float):
+        """تسجيل زمن مرحلة بالمللي ثانية"""
+        self.timings[name] = round((time.perf_counter() - started) * 1000, 1)
+
+
+@dataclass
+class Stage:
+    """مرحلة في خط البحث؛ fn تستقبل السياق وتقرأ نتائج المراحل السابقة من ctx.results"""
+    name: str
+    fn: Callable[[SearchContext], Any]
+    deps: Sequence[str] = field(default_factory=tuple)
+    default: Any = None  # النتيجة عند فشل المرحلة (المراحل التابعة تكمل بها)
+
+
+class StageGraph:
+    """تنفيذ المراحل حسب الاعتماديات في مجمّع الخيوط stages"""
+
+    def __init__(self, stages: List[Stage], pool: str = "stages"):
+        names = {s.name for s in stages}
+        for stage in stages:
+            missing = set(stage.deps) - names
+            if missing:
+                raise ValueError(f"المرحلة {stage.name} تعتمد على مراحل غير معرّفة: {missing}")
+        self.stages = list(stages)
+        self.pool = pool
+
+    def _run_stage(self, stage: Stage, ctx: SearchContext):
+        started = time.perf_counter()
+        try:
+            return stage.fn(ctx)
+        except Exception as e:
+            logger.error(f"❌ فشلت مرحلة {stage.name}: {e}")
+            ctx.errors[stage.name] = str(e)
+            return stage.default
+        finally:
+            ctx.record(stage.name, started)
+
+    def run(self, ctx: SearchContext, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """تشغيل كل المراحل وإرجاع نتائجها (ctx.results)"""
+        started = time.perf_counter()
+        pool = executors.get(self.pool)
+        pending = list(self.stages)
+        running = {}
+
+        while pending or running:
+            for stage in [s for s in pending if all(d in ctx.results for d in s.deps)]:
+                pending.remove(stage)
+                running[pool.submit(self._run_stage, stage, ctx)] = stage
+
+            if not running:
+                raise RuntimeError(f"اعتماديات دائرية بين المراحل: {[s.name for s in pending]}")
+
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                raise TimeoutError(f"انتهت مهلة المراحل: {[s.name for s in running.values()]}")
+            for future in done:
+                ctx.results[running.pop(future).name] = future.result()
+
+        ctx.record("total", started)
+        logger.info(f"⏱️ أزمنة المراحل (ms): {ctx.timings}")
+        return ctx.results
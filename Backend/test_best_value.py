@@ -0,0 +1,176 @@
+"""
+Test script for the precomputed best-value rankings
+Tests:
+1. Rankings match a full recomputation (below-average listings by discount, per type and all types)
+2. Heap updates follow inserts, price changes and removals of ranked listings
+3. /api/best-value and /api/best-value/batch
+"""
+import sys
+import os
+import random
+import asyncio
+
+# Add Backend to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import httpx
+
+from test_property_store import _random_rows
+
+DISTRICTS = ["النرجس", "الياسمين", "الملقا", "العليا"]
+TYPES = ["شقق", "فلل", "دور"]
+
+
+def _rows(n, seed):
+    """Random rows with (mostly) distinct price per m²"""
+    rows = _random_rows(n, seed)
+    rng = random.Random(seed)
+    for row in rows:
+        if row["price_num"] is not None:
+            row["price_num"] += rng.random()
+    return rows
+
+
+def _expected(rows, district, purpose, property_type, limit):
+    """Reference ranking: compare each listing with its (district, purpose, type) average"""
+    ranked = []
+    for t in ([property_type] if property_type else TYPES):
+        group = [r for r in rows if (r["district"], r["purpose"], r["property_type"]) == (district, purpose, t)
+                 and r["price_num"] and r["area_m2"]]
+        if not group:
+            continue
+        avg = sum(r["price_num"] / r["area_m2"] for r in group) / len(group)
+        ranked += [((avg - r["price_num"] / r["area_m2"]) / avg * 100, r["id"]) for r in group
+                   if r["price_num"] / r["area_m2"] < avg]
+    ranked.sort(key=lambda item: (-item[0], item[1]))
+    return ranked[:limit]
+
+
+def _assert_rankings(index, rows, limit=5):
+    checked = 0
+    for district in DISTRICTS:
+        for purpose in ("للبيع", "للايجار"):
+            for property_type in TYPES + [None]:
+                got = index.best_value(district, purpose, property_type, limit)
+                want = _expected(rows, district, purpose, property_type, limit)
+                assert [r["id"] for r in got] == [i for _, i in want], (district, purpose, property_type)
+                for row, (discount, _) in zip(got, want):
+                    assert abs(row["discount_pct"] - discount) < 0.01
+                    assert row["price_per_m2"] < row["avg_price_per_m2"]
+                checked += 1
+    return checked
+
+
+def _index(rows, top_n=20):
+    from property_store import PropertyStore
+    from best_value import BestValueIndex
+
+    store = PropertyStore(updated_at_column=None)
+    index = BestValueIndex(store, top_n=top_n)
+    store.subscribe(index.on_property_changes)
+    store.build(rows)
+    return store, index
+
+
+def test_rankings_match_recomputation():
+    """Test precomputed rankings against the view's read-time comparison"""
+    print("\n" + "=" * 60)
+    print("TEST 1: Rankings vs recomputation")
+    print("=" * 60)
+
+    rows = _rows(3000, seed=31)
+    _, index = _index(rows)
+    checked = _assert_rankings(index, rows)
+    assert index.best_value("غير موجود", "للبيع") == []
+    print(f"  ✅ {checked} district/purpose/type rankings match")
+
+
+def test_incremental_heap_updates():
+    """Test heaps follow listing changes, including removal of ranked listings"""
+    print("\n" + "=" * 60)
+    print("TEST 2: Incremental heap updates")
+    print("=" * 60)
+
+    rows = _rows(2000, seed=32)
+    store, index = _index(rows, top_n=10)
+    index.ensure_loaded()
+    by_id = {r["id"]: r for r in rows}
+
+    rng = random.Random(33)
+    for round_no in range(5):
+        # أغلب التعديلات تستهدف العقارات الأفضل حالياً حتى تخرج من القوائم
+        ranked_ids = [r["id"] for d in DISTRICTS for r in index.best_value(d, "للبيع", "شقق", 10)]
+        targets = rng.sample(ranked_ids, min(10, len(ranked_ids))) + rng.sample(list(by_id), 40)
+        changed = []
+        for property_id in targets:
+            row = dict(by_id[property_id])
+            row["price_num"] = rng.choice([None, rng.randint(20, 200) * 1000 + rng.random()])
+            row["district"] = rng.choice(DISTRICTS)
+            changed.append(row)
+        new_row = dict(rows[0], id=f"new{round_no}", price_num=1000.5, area_m2=500.0)
+        store.apply_changes(changed + [new_row])
+        for row in changed + [new_row]:
+            by_id[row["id"]] = row
+
+    stats = index.stats()
+    checked = _assert_rankings(index, list(by_id.values()), limit=10)
+    print(f"  ✅ 5 rounds of updates, {checked} rankings match ({stats['dirty_groups']} groups awaiting refill)")
+
+
+def test_best_value_endpoints():
+    """Test the single and batch endpoints"""
+    print("\n" + "=" * 60)
+    print("TEST 3: /api/best-value and /api/best-value/batch")
+    print("=" * 60)
+
+    from main import app
+    from best_value import best_value_index
+    from property_store import PropertyStore
+
+    rows = _rows(1000, seed=34)
+    original = best_value_index.store
+    best_value_index.store = PropertyStore(updated_at_column=None)
+    best_value_index.store.build(rows)
+
+    async def fetch_all():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return (
+                await client.get("/api/best-value", params={"district": "الملقا", "purpose": "للبيع",
+                                                            "property_type": "شقق", "limit": 3}),
+                await client.post("/api/best-value/batch", json={"districts": DISTRICTS, "purpose": "للايجار",
+                                                                 "limit": 4}),
+                await client.post("/api/best-value/batch", json={"districts": [], "purpose": "للايجار"}),
+            )
+
+    try:
+        single, batch, empty = asyncio.run(fetch_all())
+    finally:
+        best_value_index.store = original
+        best_value_index._source = None
+
+    assert single.status_code == 200, single.text
+    assert [p["id"] for p in single.json()] == [i for _, i in _expected(rows, "الملقا", "للبيع", "شقق", 3)]
+    assert {"discount_pct", "savings_per_m2", "avg_price_per_m2", "district_properties_count"} <= set(single.json()[0])
+
+    results = batch.json()["results"]
+    assert set(results) == set(DISTRICTS)
+    for district in DISTRICTS:
+        assert [p["id"] for p in results[district]] == [i for _, i in _expected(rows, district, "للايجار", None, 4)]
+    assert empty.status_code == 422
+    print(f"  ✅ single={len(single.json())}, batch={ {d: len(v) for d, v in results.items()} }")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Best-Value Rankings - Tests")
+    print("=" * 60)
+
+    test_rankings_match_recomputation()
+    test_incremental_heap_updates()
+    test_best_value_endpoints()
+
+    print("\n✅ All tests passed!")
@@ -0,0 +1,263 @@
+"""
+Test script for the resumable bulk embedding pipeline
+Tests:
+1. Embedding text, text hash and pgvector formatting
+2. Unchanged rows are skipped, edited rows and backend changes are re-embedded
+3. An interrupted run resumes from the last fully written page
+4. Rows deleted between the page read and the write are skipped, never re-created
+"""
+import sys
+import os
+import tempfile
+
+# Add Backend to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import numpy as np
+
+
+class _Table:
+    """In-memory properties table with keyset pages and bulk UPDATE write-back"""
+
+    def __init__(self, count):
+        self.rows = {f"p{i:05d}": {"id": f"p{i:05d}", "title": f"شقة للايجار رقم {i}",
+                                   "description": "مدخل خاص  ومؤثثة" if i % 3 else None,
+                                   "district": ["النرجس", "الملقا", "العارض"][i % 3], "property_type": "شقق",
+                                   "embedding": None, "embedding_text_hash": None}
+                     for i in range(count)}
+        self.writes = []
+        self.fail_on_write = None
+
+    def fetch_page(self, after_id, limit):
+        ids = sorted(i for i in self.rows if after_id is None or i > after_id)[:limit]
+        return [{k: v for k, v in self.rows[i].items() if k != "embedding"} for i in ids]
+
+    def write(self, records):
+        if self.fail_on_write is not None and len(self.writes) == self.fail_on_write:
+            raise ConnectionError("connection lost")
+        self.writes.append([r["id"] for r in records])
+        updated = 0
+        for record in records:
+            if record["id"] in self.rows:
+                self.rows[record["id"]].update(record)
+                updated += 1
+        return updated
+
+
+class _Model:
+    def __init__(self):
+        self.encoded = []
+        self.batch_sizes = []
+
+    def encode(self, texts, batch_size=32, normalize_embeddings=True):
+        self.encoded.extend(texts)
+        self.batch_sizes.append(batch_size)
+        vectors = np.array([[len(t), sum(map(ord, t)) % 101, 1.0] for t in texts], dtype=np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_text_hash_and_format():
+    """Test the embedding text, its fingerprint and the pgvector literal"""
+    print("\n" + "=" * 60)
+    print("TEST 1: Embedding text and vector format")
+    print("=" * 60)
+
+    from bulk_embedding import build_embedding_text, text_hash, format_pgvector
+    from vector_index import parse_pgvector
+
+    row = {"title": " فيلا  للبيع ", "property_type": "فلل", "district": "الملقا", "description": "مسبح\tوحديقة"}
+    assert build_embedding_text(row) == "فيلا للبيع\nفلل - الملقا\nمسبح وحديقة"
+    assert build_embedding_text({"title": None, "district": "النرجس"}) == "النرجس"
+    assert build_embedding_text({}) == ""
+    assert len(build_embedding_text({"description": "ا" * 5000})) == 2000
+
+    text = build_embedding_text(row)
+    assert text_hash(text, "onnx-int8-512") == text_hash(text, "onnx-int8-512")
+    assert text_hash(text, "onnx-int8-512") != text_hash(text, "sentence_transformers")
+    assert len(text_hash(text, "k")) == 32
+
+    vector = np.random.default_rng(3).standard_normal(1024).astype(np.float32)
+    assert np.array_equal(parse_pgvector(format_pgvector(vector)), vector)
+    print("  ✅ text layout, backend-aware hash and lossless float32 pgvector literal")
+
+
+def test_skip_unchanged_rows():
+    """Test hash-based skipping across runs"""
+    print("\n" + "=" * 60)
+    print("TEST 2: Skipping unchanged rows")
+    print("=" * 60)
+
+    from bulk_embedding import BulkEmbedder
+    from vector_index import parse_pgvector
+
+    table, model = _Table(250), _Model()
+    with tempfile.TemporaryDirectory() as tmp:
+        checkpoint = os.path.join(tmp, "checkpoint.json")
+        first = BulkEmbedder(table, model, "st", checkpoint, page_size=40, batch_size=128).run()
+        assert first["done"] and first["embedded"] == 250 and first["skipped"] == 0 and first["pages"] == 7
+        assert all(parse_pgvector(r["embedding"]).shape == (3,) for r in table.rows.values())
+        assert set(model.batch_sizes) == {128} and first["embedded_rows_per_second"] > 0
+
+        # تشغيل مكتمل: يبدأ من جديد ويتخطى كل شيء
+        model.encoded.clear()
+        second = BulkEmbedder(table, model, "st", checkpoint, page_size=40).run()
+        assert second["resumed_from"] is None and second["skipped"] == 250 and model.encoded == []
+        assert all(ids == [] for ids in table.writes[-7:])
+
+        table.rows["p00007"]["title"] = "شقة مجددة بالكامل"
+        third = BulkEmbedder(table, model, "st", checkpoint, page_size=40).run()
+        assert third["embedded"] == 1 and model.encoded == [
+            "شقة مجددة بالكامل\nشقق - الملقا\nمدخل خاص ومؤثثة"]
+
+        model.encoded.clear()
+        forced = BulkEmbedder(table, model, "st", checkpoint, page_size=40, force=True).run()
+        other_backend = BulkEmbedder(table, model, "onnx-int8-512", checkpoint, page_size=40).run()
+        assert forced["embedded"] == 250 and other_backend["embedded"] == 250
+    print(f"  ✅ first run {first['rows_per_second']} rows/s, re-runs skip unchanged rows")
+
+
+def test_resume_after_interruption():
+    """Test that the checkpoint never runs ahead of the written pages"""
+    print("\n" + "=" * 60)
+    print("TEST 3: Resume after interruption")
+    print("=" * 60)
+
+    from bulk_embedding import BulkEmbedder, Checkpoint
+
+    table, model = _Table(230), _Model()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "state", "checkpoint.json")
+        table.fail_on_write = 3
+        try:
+            BulkEmbedder(table, model, "st", path, page_size=50).run()
+            raise AssertionError("expected the write failure to stop the run")
+        except ConnectionError:
+            pass
+
+        # الصفحات 1-3 كُتبت، الرابعة فشلت: الاستئناف بعد آخر id في الصفحة الثالثة
+        state = Checkpoint(path).load()
+        assert state["last_id"] == "p00149" and not state.get("done")
+        assert sum(len(ids) for ids in table.writes) == 150
+        assert not os.path.exists(path + ".tmp")
+
+        table.fail_on_write = None
+        writes_before = len(table.writes)
+        resumed = BulkEmbedder(table, model, "st", path, page_size=50).run()
+        assert resumed["resumed_from"] == "p00149" and resumed["done"]
+        assert resumed["session_scanned"] == 80 and resumed["scanned"] == 230
+        written = [i for ids in table.writes[writes_before:] for i in ids]
+        assert written == sorted(i for i in table.rows if i > "p00149")
+        assert all(r["embedding_text_hash"] for r in table.rows.values())
+
+        # حد الصفحات: توقف مقصود يُستأنف لاحقاً
+        table.rows["p00001"]["title"] = "عنوان جديد"
+        partial = BulkEmbedder(table, model, "st", path, page_size=50).run(max_pages=1)
+        assert not partial["done"] and partial["embedded"] == 1
+        rest = BulkEmbedder(table, model, "st", path, page_size=50).run()
+        assert rest["resumed_from"] == "p00049" and rest["done"] and rest["scanned"] == 230
+    print(f"  ✅ resumed after id {resumed['resumed_from']}: {resumed}")
+
+
+class _Result:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Client:
+    """Supabase client stand-in for UPDATE-only write-back (RPC or per-row update)"""
+
+    def __init__(self, rows, rpc_available=True):
+        self.rows = rows
+        self.rpc_available = rpc_available
+        self.calls = []
+
+    def rpc(self, name, params):
+        from postgrest.exceptions import APIError
+
+        client = self
+
+        class Call:
+            def execute(self):
+                client.calls.append(name)
+                if not client.rpc_available:
+                    raise APIError({"message": "function not found", "code": "PGRST202"})
+                updated = [r for r in params["p_rows"] if r["id"] in client.rows]
+                for record in updated:
+                    client.rows[record["id"]].update(record)
+                return _Result(len(updated))
+        return Call()
+
+    def table(self, name):
+        client = self
+
+        class Update:
+            def update(self, values):
+                self.values = values
+                return self
+
+            def eq(self, column, value):
+                self.id = value
+                return self
+
+            def execute(self):
+                client.calls.append("update")
+                if self.id not in client.rows:
+                    return _Result([])
+                client.rows[self.id].update(self.values)
+                return _Result([client.rows[self.id]])
+
+            def upsert(self, *args, **kwargs):
+                raise AssertionError("write-back must never upsert")
+        return Update()
+
+
+def test_deleted_rows_not_recreated():
+    """Test a listing deleted between fetch and the asynchronous write"""
+    print("\n" + "=" * 60)
+    print("TEST 4: Rows deleted before the write")
+    print("=" * 60)
+
+    from bulk_embedding import BulkEmbedder, SupabasePropertyTable
+
+    class DeletingTable(_Table):
+        """يحذف عقاراً من الصفحة بعد قراءتها وقبل كتابتها"""
+
+        def fetch_page(self, after_id, limit):
+            page = super().fetch_page(after_id, limit)
+            if after_id is None:
+                del self.rows["p00003"]
+            return page
+
+    table = DeletingTable(60)
+    summary = BulkEmbedder(table, _Model(), "st", None, page_size=25).run()
+    assert summary["done"] and "p00003" not in table.rows and len(table.rows) == 59
+    assert all(r["embedding_text_hash"] for r in table.rows.values())
+
+    # دالة الـ RPC، أو التحديث صفاً صفاً إذا لم يُطبق الـ migration بعد
+    for rpc_available, calls in ((True, ["update_property_embeddings"]),
+                                 (False, ["update_property_embeddings"] + ["update"] * 3)):
+        rows = {i: {"id": i, "title": "شقة", "embedding": None, "embedding_text_hash": None} for i in ("a", "c")}
+        supabase = SupabasePropertyTable.__new__(SupabasePropertyTable)
+        supabase.client, supabase.table, supabase._bulk_update = _Client(rows, rpc_available), "properties", True
+        records = [{"id": i, "embedding": "[1,0]", "embedding_text_hash": "h"} for i in ("a", "b", "c")]
+        assert supabase.write(records) == 2
+        assert sorted(rows) == ["a", "c"] and rows["a"]["title"] == "شقة" and rows["c"]["embedding"] == "[1,0]"
+        assert supabase.client.calls == calls
+    print(f"  ✅ deleted listing skipped ({summary['embedded']} embedded), write-back is UPDATE only")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Bulk Embedding Pipeline - Tests")
+    print("=" * 60)
+
+    test_text_hash_and_format()
+    test_skip_unchanged_rows()
+    test_resume_after_interruption()
+    test_deleted_rows_not_recreated()
+
+    print("\n✅ All tests passed!")
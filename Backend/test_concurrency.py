@@ -0,0 +1,131 @@
+"""
+Concurrency test for the FastAPI request path
+Tests:
+1. A slow (blocking) LLM call does not stall /health or /api/search on the same worker
+2. Several slow LLM calls run in parallel inside the bounded llm pool
+
+The OpenAI client and the search engine are replaced by blocking fakes
+(time.sleep), which is exactly how the synchronous clients behave.
+"""
+import sys
+import os
+import time
+import asyncio
+from contextlib import contextmanager
+
+# Add Backend to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import httpx
+
+SLOW_LLM_SECONDS = 1.0
+
+SEARCH_BODY = {
+    "mode": "exact",
+    "criteria": {"purpose": "للبيع", "property_type": "شقق", "original_query": "شقة للبيع"},
+}
+
+
+@contextmanager
+def _slow_backends():
+    """Swap the OpenAI call and the search engine for blocking fakes"""
+    from main import app
+    from llm_parser import llm_parser
+    from search_engine import search_engine
+    from models import CriteriaExtractionResponse, ActionType
+
+    def slow_extract(user_query, previous_criteria=None):
+        time.sleep(SLOW_LLM_SECONDS)
+        return CriteriaExtractionResponse(success=True, message="ok", action_type=ActionType.NEW_SEARCH)
+
+    def fast_search(criteria, mode):
+        time.sleep(0.05)
+        return []
+
+    llm_parser.extract_criteria = slow_extract
+    search_engine.search = fast_search
+    try:
+        yield app
+    finally:
+        del llm_parser.extract_criteria
+        del search_engine.search
+
+
+def _client(app):
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+def test_slow_llm_does_not_block_other_requests():
+    """Test /health and /api/search while an LLM call is in flight"""
+    print("\n" + "=" * 60)
+    print("TEST 1: Slow LLM call vs /health and /api/search")
+    print("=" * 60)
+
+    async def scenario(app):
+        async with _client(app) as client:
+            slow = asyncio.create_task(client.post("/api/chat/query", json={"message": "ابي شقة"}))
+            await asyncio.sleep(0.1)
+
+            started = time.perf_counter()
+            health = await client.get("/health")
+            health_elapsed = time.perf_counter() - started
+
+            started = time.perf_counter()
+            search = await client.post("/api/search", json=SEARCH_BODY)
+            search_elapsed = time.perf_counter() - started
+
+            assert not slow.done(), "LLM call finished too early for the test to be meaningful"
+            chat = await slow
+            return health, health_elapsed, search, search_elapsed, chat
+
+    with _slow_backends() as app:
+        health, health_elapsed, search, search_elapsed, chat = asyncio.run(scenario(app))
+
+    assert health.status_code == 200
+    assert search.status_code == 200
+    assert chat.status_code == 200
+    assert health_elapsed < SLOW_LLM_SECONDS / 2, f"/health took {health_elapsed:.2f}s"
+    assert search_elapsed < SLOW_LLM_SECONDS / 2, f"/api/search took {search_elapsed:.2f}s"
+    print(f"  ✅ /health {health_elapsed * 1000:.0f}ms, /api/search {search_elapsed * 1000:.0f}ms "
+          f"while a {SLOW_LLM_SECONDS:.0f}s LLM call was running")
+
+
+def test_llm_calls_run_in_parallel():
+    """Test that concurrent LLM calls overlap"""
+    print("\n" + "=" * 60)
+    print("TEST 2: Parallel LLM calls")
+    print("=" * 60)
+
+    from executors import executors
+
+    concurrent = min(4, executors.sizes["llm"])
+
+    async def scenario(app):
+        async with _client(app) as client:
+            started = time.perf_counter()
+            responses = await asyncio.gather(*[
+                client.post("/api/chat/query", json={"message": f"طلب {i}"}) for i in range(concurrent)
+            ])
+            return responses, time.perf_counter() - started
+
+    with _slow_backends() as app:
+        responses, elapsed = asyncio.run(scenario(app))
+
+    assert all(r.status_code == 200 for r in responses)
+    assert elapsed < SLOW_LLM_SECONDS * 2, f"{concurrent} calls took {elapsed:.2f}s"
+    print(f"  ✅ {concurrent} LLM calls finished in {elapsed:.2f}s (serial would be {concurrent * SLOW_LLM_SECONDS:.0f}s)")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("FastAPI Concurrency - Tests")
+    print("=" * 60)
+
+    test_slow_llm_does_not_block_other_requests()
+    test_llm_calls_run_in_parallel()
+
+    print("\n✅ All tests passed!")
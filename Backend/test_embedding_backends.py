@@ -0,0 +1,170 @@
+"""
+Test script for the pluggable embedding backends
+Tests:
+1. ONNX fp32 export reproduces the SentenceTransformer reference (CLS pooling, batches)
+2. int8 dynamic quantization stays within the cosine parity budget
+3. Benchmark report and EmbeddingGenerator wiring through EMBEDDING_BACKEND
+
+A small randomly initialised XLM-RoBERTa (the BGE-m3 architecture) is built
+locally so the tests never download the real model.
+"""
+import sys
+import os
+import tempfile
+
+# Add Backend to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import numpy as np
+
+_TMP = tempfile.TemporaryDirectory()
+
+
+def _tiny_model() -> str:
+    """Save a tiny SentenceTransformer (XLM-R + CLS pooling + normalize) once per run"""
+    path = os.path.join(_TMP.name, "tiny-bge")
+    if os.path.exists(path):
+        return path
+
+    import torch
+    from tokenizers import Tokenizer, models, pre_tokenizers
+    from tokenizers.processors import TemplateProcessing
+    from transformers import PreTrainedTokenizerFast, XLMRobertaConfig, XLMRobertaModel
+    from sentence_transformers import SentenceTransformer, models as st_models
+    from embedding_backends import SAMPLE_QUERIES
+
+    vocab = {"<s>": 0, "<pad>": 1, "</s>": 2, "<unk>": 3}
+    for word in " ".join(SAMPLE_QUERIES).split():
+        vocab.setdefault(word, len(vocab))
+    tokenizer = Tokenizer(models.WordLevel(vocab, unk_token="<unk>"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizer.post_processor = TemplateProcessing(single="<s> $A </s>", special_tokens=[("<s>", 0), ("</s>", 2)])
+    fast = PreTrainedTokenizerFast(tokenizer_object=tokenizer, bos_token="<s>", eos_token="</s>", unk_token="<unk>",
+                                   pad_token="<pad>", cls_token="<s>", sep_token="</s>")
+
+    torch.manual_seed(0)
+    config = XLMRobertaConfig(vocab_size=len(vocab), hidden_size=128, num_hidden_layers=2, num_attention_heads=4,
+                              intermediate_size=256, max_position_embeddings=130, pad_token_id=1)
+    raw = os.path.join(_TMP.name, "raw")
+    XLMRobertaModel(config).save_pretrained(raw)
+    fast.save_pretrained(raw)
+
+    transformer = st_models.Transformer(raw, max_seq_length=128)
+    model = SentenceTransformer(modules=[transformer, st_models.Pooling(128, "cls"), st_models.Normalize()],
+                                device="cpu")
+    model.save(path)
+    return path
+
+
+def _exported() -> str:
+    out = os.path.join(_TMP.name, "onnx")
+    if not os.path.exists(out):
+        from embedding_backends import export_onnx
+        export_onnx(_tiny_model(), out, max_seq_length=64)
+    return out
+
+
+def test_fp32_export_matches_reference():
+    """Test that the exported graph matches sentence_transformers"""
+    print("\n" + "=" * 60)
+    print("TEST 1: ONNX fp32 vs SentenceTransformer")
+    print("=" * 60)
+
+    from sentence_transformers import SentenceTransformer
+    from embedding_backends import OnnxEmbeddingBackend, SAMPLE_QUERIES, cosine_parity
+
+    reference = SentenceTransformer(_tiny_model(), device="cpu").encode(SAMPLE_QUERIES, normalize_embeddings=True)
+    backend = OnnxEmbeddingBackend(_exported(), quantized=False)
+    assert backend.pooling == "cls" and backend.name == "onnx-fp32-64"
+
+    batched = backend.encode(SAMPLE_QUERIES, normalize_embeddings=True, batch_size=3)
+    single = np.vstack([backend.encode(q, normalize_embeddings=True) for q in SAMPLE_QUERIES])
+    assert batched.shape == reference.shape
+    assert np.allclose(np.linalg.norm(batched, axis=1), 1.0, atol=1e-5)
+    # الحشو داخل الدفعة لا يغيّر المتجه
+    assert np.allclose(batched, single, atol=1e-5)
+    parity = cosine_parity(reference, batched)
+    assert parity["min"] > 0.9999, parity
+    print(f"  ✅ fp32 parity: {parity}")
+
+
+def test_int8_parity():
+    """Test cosine similarity of the int8 model against the fp32 reference"""
+    print("\n" + "=" * 60)
+    print("TEST 2: int8 parity")
+    print("=" * 60)
+
+    from sentence_transformers import SentenceTransformer
+    from embedding_backends import OnnxEmbeddingBackend, SAMPLE_QUERIES, cosine_parity, INT8_FILE, FP32_FILE
+
+    out = _exported()
+    reference = SentenceTransformer(_tiny_model(), device="cpu").encode(SAMPLE_QUERIES, normalize_embeddings=True)
+    backend = OnnxEmbeddingBackend(out)
+    assert backend.name == "onnx-int8-64"
+    parity = cosine_parity(reference, backend.encode(SAMPLE_QUERIES))
+    assert parity["mean"] > 0.99 and parity["min"] > 0.98, parity
+
+    # ترتيب الجيران يبقى كما هو: أقرب نص لكل طلب بين عينات القياس
+    quantized = backend.encode(SAMPLE_QUERIES)
+    assert np.array_equal(np.argsort(-(reference @ reference.T), axis=1)[:, :2],
+                          np.argsort(-(quantized @ quantized.T), axis=1)[:, :2])
+    ratio = os.path.getsize(os.path.join(out, INT8_FILE)) / os.path.getsize(os.path.join(out, FP32_FILE))
+    assert ratio < 0.6, ratio
+    print(f"  ✅ int8 parity: {parity}, model size x{ratio:.2f}")
+
+
+def test_benchmark_and_generator_wiring():
+    """Test the benchmark report and backend selection in EmbeddingGenerator"""
+    print("\n" + "=" * 60)
+    print("TEST 3: Benchmark and EmbeddingGenerator backend")
+    print("=" * 60)
+
+    from sentence_transformers import SentenceTransformer
+    from config import settings
+    from embedding_backends import OnnxEmbeddingBackend, benchmark
+    import embedding_generator as generator_module
+    from embedding_cache import EmbeddingCache
+
+    out = _exported()
+    report = benchmark({
+        "fp32": lambda: SentenceTransformer(_tiny_model(), device="cpu"),
+        "onnx-int8": lambda: OnnxEmbeddingBackend(out),
+    }, repeats=2)
+    assert set(report) == {"fp32", "onnx-int8"} and "cosine" not in report["fp32"]
+    assert report["onnx-int8"]["cosine"]["mean"] > 0.99
+    assert all(r["p50_ms"] > 0 and "memory_mb" in r for r in report.values())
+
+    generator = generator_module.embedding_generator
+    names = ("EMBEDDING_BACKEND", "EMBEDDING_ONNX_PATH", "EMBEDDING_ONNX_QUANTIZED", "EMBEDDING_MAX_SEQ_LENGTH")
+    original = ({name: getattr(settings, name) for name in names}, generator._model, generator_module.embedding_cache)
+    try:
+        fp32_namespace = generator.cache_namespace
+        settings.EMBEDDING_BACKEND, settings.EMBEDDING_ONNX_PATH = "onnx", out
+        settings.EMBEDDING_ONNX_QUANTIZED, settings.EMBEDDING_MAX_SEQ_LENGTH = True, 32
+        generator._model = None
+        generator_module.embedding_cache = EmbeddingCache(max_entries=8)
+        vector = generator.generate("ابي شقة للايجار في النرجس ٣ غرف")
+        assert isinstance(generator._model, OnnxEmbeddingBackend) and generator._model.max_seq_length == 32
+        assert len(vector) == 128 and abs(np.linalg.norm(vector) - 1) < 1e-5
+        assert generator.cache_namespace != fp32_namespace
+    finally:
+        for name, value in original[0].items():
+            setattr(settings, name, value)
+        generator._model, generator_module.embedding_cache = original[1], original[2]
+    print(f"  ✅ benchmark: {report}")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Embedding Backends - Tests")
+    print("=" * 60)
+
+    test_fp32_export_matches_reference()
+    test_int8_parity()
+    test_benchmark_and_generator_wiring()
+
+    print("\n✅ All tests passed!")
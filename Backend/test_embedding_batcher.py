@@ -0,0 +1,191 @@
+"""
+Test script for the embedding micro-batching queue
+Tests:
+1. Concurrent callers get their own vectors from shared batches (dedup, errors)
+2. Backpressure rejects when the queue is full, timed-out requests are dropped
+3. Throughput curve at 8, 32 and 128 concurrent requests, and EmbeddingGenerator wiring
+"""
+import sys
+import os
+import threading
+import time
+
+# Add Backend to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import numpy as np
+
+
+class _CostModel:
+    """Encoder whose latency is a fixed per-call cost plus a small per-item cost (like a CPU forward pass)"""
+
+    def __init__(self, fixed_ms=4.0, per_item_ms=0.2):
+        self.fixed = fixed_ms / 1000
+        self.per_item = per_item_ms / 1000
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def __call__(self, texts):
+        with self._lock:
+            self.batches.append(list(texts))
+        time.sleep(self.fixed + self.per_item * len(texts))
+        return np.array([[len(t), sum(map(ord, t)) % 997, 1.0] for t in texts], dtype=np.float32)
+
+
+def _expected(text):
+    return np.array([len(text), sum(map(ord, text)) % 997, 1.0], dtype=np.float32)
+
+
+def _run_clients(count, fn):
+    results, errors = [None] * count, []
+
+    def client(i):
+        try:
+            results[i] = fn(i)
+        except Exception as e:  # noqa: BLE001 - collected for the assertion
+            errors.append(e)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+def test_batches_and_results():
+    """Test that concurrent requests share batches and get the right vectors"""
+    print("\n" + "=" * 60)
+    print("TEST 1: Batched results")
+    print("=" * 60)
+
+    from embedding_batcher import EmbeddingBatcher
+
+    model = _CostModel()
+    batcher = EmbeddingBatcher(model, max_batch_size=16, max_wait_ms=5)
+    texts = [f"شقة للايجار {i % 40}" for i in range(64)]
+    results, errors = _run_clients(len(texts), lambda i: batcher.encode(texts[i]))
+    assert not errors, errors
+    for text, vector in zip(texts, results):
+        assert np.array_equal(vector, _expected(text))
+
+    stats = batcher.stats()
+    assert all(len(batch) <= 16 for batch in model.batches)
+    assert stats["batches"] == len(model.batches) < len(texts)
+    assert stats["avg_batch_size"] > 2 and stats["queue_depth"] == 0
+    assert sum(len(b) for b in model.batches) + stats["deduplicated"] == len(texts)
+
+    # خطأ الموديل يصل لكل طلبات الدفعة ثم يستمر الخيط في العمل
+    failing = EmbeddingBatcher(lambda texts: 1 / 0, max_wait_ms=5)
+    _, errors = _run_clients(8, lambda i: failing.encode(f"نص {i}"))
+    assert len(errors) == 8 and all(isinstance(e, ZeroDivisionError) for e in errors)
+    failing.encode_batch = model
+    assert np.array_equal(failing.encode("فيلا"), _expected("فيلا"))
+    batcher.close()
+    failing.close()
+    print(f"  ✅ {len(texts)} requests in {stats['batches']} batches: {stats}")
+
+
+def test_backpressure_and_timeouts():
+    """Test queue-depth rejection and per-request timeouts"""
+    print("\n" + "=" * 60)
+    print("TEST 2: Backpressure and timeouts")
+    print("=" * 60)
+
+    from embedding_batcher import EmbeddingBatcher, EmbeddingOverloaded
+
+    release = threading.Event()
+    encoded = []
+
+    def blocking(texts):
+        encoded.extend(texts)
+        release.wait(5)
+        return np.ones((len(texts), 2), dtype=np.float32)
+
+    batcher = EmbeddingBatcher(blocking, max_batch_size=1, max_wait_ms=0, max_queue_depth=3, timeout_seconds=0.05)
+    first = batcher.submit("الدفعة الجارية")
+    deadline = time.monotonic() + 2
+    while not encoded and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+    # الخيط مشغول: ثلاثة تنتظر ثم الرفض
+    try:
+        batcher.encode("ينتهي مهلته")
+        raise AssertionError("expected a timeout")
+    except TimeoutError:
+        pass
+    queued = [batcher.submit(f"منتظر {i}") for i in range(2)]
+    try:
+        batcher.submit("زائد")
+        raise AssertionError("expected EmbeddingOverloaded")
+    except EmbeddingOverloaded:
+        pass
+
+    release.set()
+    assert first.result(2).shape == (2,)
+    assert all(f.result(2).shape == (2,) for f in queued)
+    batcher.close()
+    # الطلب الملغى لم يدخل أي دفعة
+    assert "ينتهي مهلته" not in encoded
+    stats = batcher.stats()
+    assert (stats["rejected"], stats["timeouts"], stats["batches"]) == (1, 1, 3)
+    print(f"  ✅ rejected and timed-out requests handled: {stats}")
+
+
+def test_throughput_curve_and_generator():
+    """Test batching gains at 8/32/128 clients and generate() going through the batcher"""
+    print("\n" + "=" * 60)
+    print("TEST 3: Throughput curve and EmbeddingGenerator")
+    print("=" * 60)
+
+    from embedding_batcher import throughput_curve
+    import embedding_generator as generator_module
+    from embedding_cache import EmbeddingCache
+
+    texts = [f"فيلا للبيع في الملقا {i}" for i in range(512)]
+    curve = throughput_curve(_CostModel(), texts, concurrency=(8, 32, 128), requests_per_client=2,
+                             max_batch_size=64, max_wait_ms=2)
+    print(f"  curve: {curve}")
+    assert curve[8]["speedup"] > 1.5
+    assert curve[128]["speedup"] > curve[8]["speedup"] and curve[128]["speedup"] > 4
+    assert curve[128]["avg_batch_size"] > curve[8]["avg_batch_size"]
+
+    class _Model:
+        def __init__(self):
+            self.encode_batch = _CostModel()
+
+        def encode(self, texts, normalize_embeddings=True):
+            vectors = self.encode_batch([texts] if isinstance(texts, str) else texts)
+            return vectors[0] if isinstance(texts, str) else vectors
+
+    generator = generator_module.embedding_generator
+    original = (generator._model, generator._batcher, generator_module.embedding_cache)
+    try:
+        generator._model, generator._batcher = _Model(), None
+        generator_module.embedding_cache = EmbeddingCache(max_entries=64)
+        queries = [f"شقة في النرجس {i}" for i in range(32)]
+        results, errors = _run_clients(len(queries), lambda i: generator.generate_from_thread(queries[i]))
+        assert not errors and all(r == _expected(q).tolist() for r, q in zip(results, queries))
+        assert max(len(b) for b in generator._model.encode_batch.batches) > 1
+        assert generator.stats()["batching"]["requests"] == len(queries)
+    finally:
+        if generator._batcher is not None:
+            generator._batcher.close()
+        generator._model, generator._batcher, generator_module.embedding_cache = original
+    print("  ✅ generate() requests are batched")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Embedding Micro-Batching - Tests")
+    print("=" * 60)
+
+    test_batches_and_results()
+    test_backpressure_and_timeouts()
+    test_throughput_curve_and_generator()
+
+    print("\n✅ All tests passed!")
@@ -0,0 +1,162 @@
+"""
+Test script for the query-embedding cache
+Tests:
+1. Normalized keys, LRU eviction and generate() skipping the model on hits
+2. The mmap disk tier survives a restart and is shared between instances
+3. Corrupt or mismatched disk slots are misses, hit rate and saved time are reported
+"""
+import sys
+import os
+import tempfile
+import time
+
+# Add Backend to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import numpy as np
+
+
+class _FakeModel:
+    """Deterministic stand-in for SentenceTransformer (no download)"""
+
+    def __init__(self, dim=8, delay=0.0):
+        self.dim = dim
+        self.delay = delay
+        self.calls = []
+
+    def encode(self, texts, normalize_embeddings=True):
+        batch = [texts] if isinstance(texts, str) else list(texts)
+        self.calls.extend(batch)
+        time.sleep(self.delay)
+        vectors = []
+        for text in batch:
+            rng = np.random.default_rng(abs(hash(text)) % (2 ** 32))
+            vector = rng.standard_normal(self.dim).astype(np.float32)
+            vectors.append(vector / np.linalg.norm(vector))
+        return vectors[0] if isinstance(texts, str) else np.vstack(vectors)
+
+
+def test_memory_tier_and_generator():
+    """Test normalized keys, LRU order and cache use inside generate()"""
+    print("\n" + "=" * 60)
+    print("TEST 1: Memory tier and EmbeddingGenerator")
+    print("=" * 60)
+
+    import embedding_generator as generator_module
+    from embedding_cache import EmbeddingCache
+
+    cache = EmbeddingCache(max_entries=2)
+    cache.put("شقة للإيجار  في النرجس", [1.0, 0.0])
+    # همزة مختلفة، تاء مربوطة/هاء، مسافات زائدة
+    assert cache.get("  شقه للايجار في   النرجس ") == [1.0, 0.0]
+    assert cache.get("شقة للإيجار في النرجس", namespace="other-model") is None
+    cache.put("b", [2.0])
+    cache.put("c", [3.0])
+    assert cache.get("b") == [2.0] and cache.get("c") == [3.0]
+    assert cache.get("شقة للإيجار في النرجس") is None, "oldest entry should be evicted"
+
+    generator = generator_module.embedding_generator
+    model = _FakeModel()
+    original = (generator._model, generator_module.embedding_cache)
+    try:
+        generator._model = model
+        generator_module.embedding_cache = EmbeddingCache(max_entries=16)
+        first = generator.generate("فيلا في الملقا")
+        second = generator.generate("فيلا  في  الملقا")
+        assert first == second and len(first) == model.dim
+        assert model.calls == ["فيلا في الملقا"]
+        # الأخطاء لا تُحفظ
+        model.encode = lambda text, normalize_embeddings=True: 1 / 0
+        assert generator.generate("نص يفشل") == []
+        assert generator_module.embedding_cache.get("نص يفشل") is None
+    finally:
+        generator._model, generator_module.embedding_cache = original
+    print("  ✅ normalized keys hit, LRU evicts, generate() encodes once and never caches failures")
+
+
+def test_disk_tier_persistence():
+    """Test restart survival and sharing through the mmap file"""
+    print("\n" + "=" * 60)
+    print("TEST 2: Disk tier persistence and sharing")
+    print("=" * 60)
+
+    from embedding_cache import EmbeddingCache
+
+    rng = np.random.default_rng(17)
+    queries = [f"شقة {i} غرف في حي رقم {i}" for i in range(300)]
+    vectors = {q: rng.standard_normal(32).astype(np.float32) for q in queries}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cache", "embeddings.bin")
+        writer = EmbeddingCache(max_entries=8, disk_path=path, disk_slots=1024)
+        # عامل آخر فتح الملف قبل الكتابة
+        reader = EmbeddingCache(max_entries=8, disk_path=path, disk_slots=1024)
+        reader.put(queries[0], vectors[queries[0]].tolist())
+        for q in queries[1:]:
+            writer.put(q, vectors[q].tolist())
+
+        # بعد إعادة التشغيل: الذاكرة فارغة والقرص يحمل كل شيء
+        restarted = EmbeddingCache(max_entries=8, disk_path=path, disk_slots=1024)
+        for q in queries:
+            got = restarted.get(q)
+            assert got is not None and np.allclose(got, vectors[q]), q
+        assert np.allclose(writer.get(queries[0]), vectors[queries[0]])
+        assert np.allclose(reader.get(queries[-1]), vectors[queries[-1]])
+
+        stats = restarted.stats()
+        assert stats["disk_hits"] == len(queries) and stats["memory_hits"] == 0
+        assert stats["entries"] == 8
+        assert restarted.get(queries[-1]) is not None and restarted.stats()["memory_hits"] == 1
+        print(f"  ✅ {len(queries)} vectors read back after restart, writers share one file")
+
+
+def test_corruption_and_stats():
+    """Test CRC validation, dimension mismatch and hit-rate reporting"""
+    print("\n" + "=" * 60)
+    print("TEST 3: Corrupt slots and stats")
+    print("=" * 60)
+
+    from embedding_cache import EmbeddingCache, cache_digest, SLOT_HEADER
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "embeddings.bin")
+        cache = EmbeddingCache(max_entries=4, disk_path=path, disk_slots=64)
+        cache.put("دوبلكس في الياسمين", [0.5] * 16, compute_seconds=0.2)
+        cache.put("ارض في العارض", [0.25] * 16, compute_seconds=0.4)
+        cache.clear()
+
+        # تلف بايت واحد من المتجه = إخفاق عادي لا متجه خاطئ
+        table = cache._disk
+        digest = cache_digest("دوبلكس في الياسمين")
+        offset = next(o for o in table._offsets(digest) if table._map[o:o + 16] == digest)
+        table._map[offset + SLOT_HEADER.size] ^= 0xFF
+        assert cache.get("دوبلكس في الياسمين") is None
+        assert cache.get("ارض في العارض") == [0.25] * 16
+        assert cache.get("ارض في العارض") == [0.25] * 16
+
+        stats = cache.stats()
+        assert (stats["memory_hits"], stats["disk_hits"], stats["misses"]) == (1, 1, 1)
+        assert abs(stats["hit_rate"] - 2 / 3) < 1e-3
+        assert stats["avg_compute_ms"] == 300.0 and stats["saved_seconds"] == 0.6
+
+        # ملف بأبعاد مختلفة: تعطيل القرص والاكتفاء بالذاكرة
+        other = EmbeddingCache(max_entries=4, disk_path=path, disk_slots=64)
+        other.put("فيلا", [1.0] * 8)
+        assert other.stats()["disk_enabled"] is False and other.get("فيلا") == [1.0] * 8
+    print(f"  ✅ corrupt slot rejected, stats: {stats}")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Query Embedding Cache - Tests")
+    print("=" * 60)
+
+    test_memory_tier_and_generator()
+    test_disk_tier_persistence()
+    test_corruption_and_stats()
+
+    print("\n✅ All tests passed!")
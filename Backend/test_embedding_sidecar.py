@@ -0,0 +1,285 @@
+"""
+Test script for the shared embedding sidecar
+Tests:
+1. Several clients share one model over the UNIX socket and their requests batch together
+2. Clients reconnect after a sidecar restart and fail fast when it is down
+3. A worker process with EMBEDDING_BACKEND=sidecar embeds without importing torch
+4. The supervisor restarts a dead sidecar process and reports its liveness
+   (/api/metrics probes it off the event loop)
+"""
+import sys
+import os
+import json
+import subprocess
+import tempfile
+import threading
+import time
+
+# Add Backend to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import numpy as np
+
+
+class _Model:
+    """SentenceTransformer-like model with a fixed per-call cost"""
+
+    def __init__(self, dim=16):
+        self.dim = dim
+        self.batches = []
+        self.fail = False
+
+    def encode(self, texts, normalize_embeddings=True):
+        batch = [texts] if isinstance(texts, str) else list(texts)
+        self.batches.append(len(batch))
+        if self.fail:
+            raise ValueError("model exploded")
+        time.sleep(0.003)
+        return np.vstack([_vector(t, self.dim) for t in batch])
+
+
+def _vector(text, dim=16):
+    rng = np.random.default_rng(sum(map(ord, text)))
+    vector = rng.standard_normal(dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def _socket_path(tmp):
+    return os.path.join(tmp, "run", "embedding.sock")
+
+
+def test_clients_share_batches():
+    """Test concurrent clients against one sidecar"""
+    print("\n" + "=" * 60)
+    print("TEST 1: Shared model over the UNIX socket")
+    print("=" * 60)
+
+    from embedding_sidecar import EmbeddingSidecar, SidecarClient
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model = _Model()
+        sidecar = EmbeddingSidecar(model, _socket_path(tmp), max_batch_size=64, max_wait_ms=5).start()
+        try:
+            # عميل لكل worker، وعدة خيوط داخل كل worker
+            clients = [SidecarClient(_socket_path(tmp)) for _ in range(3)]
+            results, errors = {}, []
+
+            def call(client, i):
+                try:
+                    text = f"شقة في النرجس {i}"
+                    results[text] = client.encode(text, normalize_embeddings=True)
+                except Exception as e:  # noqa: BLE001 - collected for the assertion
+                    errors.append(e)
+
+            threads = [threading.Thread(target=call, args=(clients[i % 3], i)) for i in range(48)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert not errors, errors
+            assert all(np.allclose(vector, _vector(text)) for text, vector in results.items())
+
+            batch = clients[0].encode(["فيلا", "ارض", "فيلا"])
+            assert batch.shape == (3, 16) and np.allclose(batch[0], batch[2])
+
+            server = clients[1].server_stats()
+            # اتصال دائم لكل خيط (اتصالات الخيوط المنتهية تُغلق مع انتهائها)
+            assert server["pid"] == os.getpid() and server["connections"] >= 2
+            assert server["batching"]["max_batch"] > 1 and max(model.batches) > 1
+            assert sum(c.stats()["requests"] for c in clients) == 49
+        finally:
+            sidecar.close()
+        assert not os.path.exists(_socket_path(tmp))
+    print(f"  ✅ 48 concurrent requests from 3 clients in {len(model.batches)} model calls")
+
+
+def test_restart_and_failures():
+    """Test reconnects, fail-fast when down and model errors"""
+    print("\n" + "=" * 60)
+    print("TEST 2: Restarts and failures")
+    print("=" * 60)
+
+    from embedding_sidecar import EmbeddingSidecar, SidecarClient
+    import embedding_generator as generator_module
+    from embedding_cache import EmbeddingCache
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = _socket_path(tmp)
+        client = SidecarClient(path, timeout_seconds=2)
+        model = _Model()
+        sidecar = EmbeddingSidecar(model, path).start()
+        assert np.allclose(client.encode("مسجد"), _vector("مسجد"))
+        sidecar.close()
+
+        # العملية متوقفة: فشل سريع بدلاً من الانتظار
+        started = time.perf_counter()
+        try:
+            client.encode("مسجد")
+            raise AssertionError("expected ConnectionError")
+        except OSError:
+            pass
+        assert time.perf_counter() - started < 1
+
+        # إعادة التشغيل: الاتصال القديم أُغلق والعميل يتصل من جديد
+        sidecar = EmbeddingSidecar(model, path).start()
+        try:
+            assert np.allclose(client.encode("جامعة"), _vector("جامعة"))
+            sidecar.close()
+            sidecar = EmbeddingSidecar(model, path).start()
+            # الاتصال المحفوظ منقطع: إعادة اتصال واحدة شفافة
+            assert np.allclose(client.encode("مدرسة"), _vector("مدرسة"))
+            assert client.stats()["reconnects"] >= 1
+
+            model.fail = True
+            try:
+                client.encode("نص")
+                raise AssertionError("expected RuntimeError")
+            except RuntimeError as e:
+                assert "model exploded" in str(e)
+
+            # EmbeddingGenerator يرجع [] فيستخدم البحث الرقمي البديل
+            generator = generator_module.embedding_generator
+            original = (generator._model, generator._batcher, generator_module.embedding_cache)
+            try:
+                generator._model, generator._batcher = client, None
+                generator_module.embedding_cache = EmbeddingCache(max_entries=8)
+                assert generator.generate("شقة") == []
+                model.fail = False
+                assert np.allclose(generator.generate("شقة"), _vector("شقة"))
+                assert generator.stats()["sidecar"]["socket"] == path
+            finally:
+                if generator._batcher is not None:
+                    generator._batcher.close()
+                generator._model, generator._batcher, generator_module.embedding_cache = original
+        finally:
+            sidecar.close()
+    print(f"  ✅ client stats after restarts: {client.stats()}")
+
+
+def test_thin_worker_process():
+    """Test that a worker configured for the sidecar never loads a model"""
+    print("\n" + "=" * 60)
+    print("TEST 3: Thin worker process")
+    print("=" * 60)
+
+    from embedding_sidecar import EmbeddingSidecar
+
+    worker = (
+        "import json, sys\n"
+        "from embedding_generator import embedding_generator\n"
+        "vector = embedding_generator.generate('شقة للايجار في الملقا')\n"
+        "stats = embedding_generator.stats()\n"
+        "print(json.dumps({'vector': vector, 'backend': stats['backend'],\n"
+        "                  'model_modules': sorted(m for m in ('torch', 'sentence_transformers', 'onnxruntime')\n"
+        "                                          if m in sys.modules)}))\n"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        path = _socket_path(tmp)
+        sidecar = EmbeddingSidecar(_Model(), path).start()
+        try:
+            env = dict(os.environ, EMBEDDING_BACKEND="sidecar", EMBEDDING_SIDECAR_SOCKET=path,
+                       EMBEDDING_SIDECAR_BACKEND="onnx")
+            output = subprocess.run([sys.executable, "-c", worker], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                    env=env, capture_output=True, text=True, timeout=120)
+            assert output.returncode == 0, output.stderr
+            result = json.loads(output.stdout.strip().splitlines()[-1])
+        finally:
+            sidecar.close()
+    assert np.allclose(result["vector"], _vector("شقة للايجار في الملقا"), atol=1e-6)
+    assert result["model_modules"] == []
+    # مفتاح الذاكرة المؤقتة يتبع الخلفية داخل العملية المشتركة
+    assert result["backend"] == "onnx-int8-64"
+    print(f"  ✅ worker embedded over the socket without loading a model: {result['backend']}")
+
+
+def test_supervisor_restarts():
+    """Test that a killed sidecar process is restarted and clients recover"""
+    print("\n" + "=" * 60)
+    print("TEST 4: Supervisor")
+    print("=" * 60)
+
+    from embedding_sidecar import SidecarSupervisor, SidecarClient, sidecar_health
+
+    serve = (
+        "import sys\n"
+        "from test_embedding_sidecar import _Model\n"
+        "from embedding_sidecar import EmbeddingSidecar\n"
+        "EmbeddingSidecar(_Model(), sys.argv[1]).serve_forever()\n"
+    )
+    backend = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = _socket_path(tmp)
+        supervisor = SidecarSupervisor(path, check_seconds=0.1, spawn=lambda: subprocess.Popen(
+            [sys.executable, "-c", serve, path], cwd=backend))
+        client = SidecarClient(path, timeout_seconds=5)
+        try:
+            assert supervisor.start(60)
+            first = sidecar_health(path)
+            assert first["alive"] and first["pid"] == supervisor.process.pid
+            assert np.allclose(client.encode("شقة"), _vector("شقة"))
+
+            supervisor.process.kill()
+            deadline = time.monotonic() + 60
+            health = sidecar_health(path)
+            while not (health["alive"] and health["pid"] != first["pid"]) and time.monotonic() < deadline:
+                time.sleep(0.1)
+                health = sidecar_health(path)
+            assert health["alive"] and health["pid"] != first["pid"], health
+            assert supervisor.stats() == {"alive": True, "pid": health["pid"], "restarts": 1}
+            assert np.allclose(client.encode("فيلا"), _vector("فيلا"))
+            metrics = _metrics_with_sidecar(path)
+        finally:
+            supervisor.stop()
+        assert supervisor.process.poll() is not None
+        assert sidecar_health(path)["alive"] is False
+    assert metrics["health"]["alive"] and metrics["health"]["pid"] == health["pid"]
+    assert metrics["probe_threads"] and all(name.startswith("pool-embedding") for name in metrics["probe_threads"])
+    print(f"  ✅ sidecar restarted after being killed: pid {first['pid']} -> {health['pid']}")
+
+
+def _metrics_with_sidecar(path):
+    """/api/metrics لعامل مضبوط على العملية المشتركة: الفحص يعمل في مجمّع embedding"""
+    import asyncio
+    import httpx
+    import embedding_generator as eg
+    from config import settings
+    from main import app
+
+    threads = []
+
+    def probe(socket_path):
+        threads.append(threading.current_thread().name)
+        return sidecar_health(socket_path)
+
+    async def fetch():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return (await client.get("/api/metrics")).json()
+
+    from embedding_sidecar import sidecar_health
+    saved = settings.EMBEDDING_BACKEND, settings.EMBEDDING_SIDECAR_SOCKET
+    settings.EMBEDDING_BACKEND, settings.EMBEDDING_SIDECAR_SOCKET = "sidecar", path
+    eg.sidecar_health = probe
+    try:
+        assert "sidecar_health" not in eg.embedding_generator.stats()
+        embedding = asyncio.run(fetch())["embedding"]
+    finally:
+        eg.sidecar_health = sidecar_health
+        settings.EMBEDDING_BACKEND, settings.EMBEDDING_SIDECAR_SOCKET = saved
+    return {"health": embedding["sidecar_health"], "probe_threads": threads}
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Embedding Sidecar - Tests")
+    print("=" * 60)
+
+    test_clients_share_batches()
+    test_restart_and_failures()
+    test_thin_worker_process()
+    test_supervisor_restarts()
+
+    print("\n✅ All tests passed!")
@@ -0,0 +1,230 @@
+"""
+Test script for the in-memory place gazetteer
+Tests:
+1. University, mosque and district names resolve with their coordinates despite typos
+2. Trigram candidates keep re-ranking cheap on large tables
+3. The search engine resolves anchors and districts without database round-trips
+4. Expired gazetteer / lexical / vector indexes rebuild in the background while requests use the old one
+"""
+import sys
+import os
+import threading
+import time
+
+# Add Backend to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+UNIVERSITIES = [
+    {"name_ar": "جامعة الملك سعود", "name_en": "King Saud University", "lat": 24.716, "lon": 46.619},
+    {"name_ar": "جامعة الملك عبدالعزيز", "name_en": "King Abdulaziz University", "lat": 21.493, "lon": 39.250},
+    {"name_ar": "جامعة الإمام محمد بن سعود الإسلامية", "name_en": "Imam Mohammad Ibn Saud Islamic University",
+     "lat": 24.815, "lon": 46.701},
+    {"name_ar": "جامعة بلا موقع", "name_en": None, "lat": None, "lon": None},
+]
+MOSQUES = [
+    {"name": "جامع الراجحي", "lat": 24.690, "lon": 46.780},
+    {"name": "مسجد الملك خالد", "lat": 24.640, "lon": 46.700},
+]
+PROPERTIES = [
+    {"district": "النرجس", "final_lat": 24.80, "final_lon": 46.60},
+    {"district": "النرجس", "final_lat": 24.90, "final_lon": 46.70},
+    {"district": "الملقا", "final_lat": 24.78, "final_lon": 46.59},
+    {"district": "الياسمين", "final_lat": 0, "final_lon": 0},
+    {"district": None, "final_lat": 24.7, "final_lon": 46.7},
+]
+
+
+def _gazetteer(mosques=MOSQUES):
+    from gazetteer import Gazetteer
+    g = Gazetteer()
+    g.build(UNIVERSITIES, mosques, PROPERTIES)
+    return g
+
+
+def test_resolve_names():
+    """Test exact, normalized, typo and alias lookups"""
+    print("\n" + "=" * 60)
+    print("TEST 1: Resolving names")
+    print("=" * 60)
+
+    from gazetteer import UNIVERSITIES as U, MOSQUES as M, DISTRICTS as D
+
+    g = _gazetteer()
+    assert g.resolve(U, "جامعة الملك سعود") == {"name": "جامعة الملك سعود", "lat": 24.716, "lon": 46.619, "score": 1.0}
+    assert g.resolve(U, "king saud university")["name"] == "جامعة الملك سعود"
+    assert g.resolve(U, "جامعه الامام محمد بن سعود")["name"] == "جامعة الإمام محمد بن سعود الإسلامية"
+    typo = g.resolve(U, "جامعة الملك سعوود")
+    assert typo["name"] == "جامعة الملك سعود" and typo["score"] < 1.0
+    assert g.resolve(U, "جامعة الملك فهد") is None
+    assert g.resolve(U, "جامعة بلا موقع") is None
+
+    # "مسجد" و"جامع" كلمات عامة
+    assert g.resolve(M, "مسجد الراجحي")["lat"] == 24.690
+    assert g.resolve(M, "الراجحى")["name"] == "جامع الراجحي"
+
+    center = g.resolve(D, "حي النرجس")
+    assert center["name"] == "النرجس" and abs(center["lat"] - 24.85) < 1e-9 and abs(center["lon"] - 46.65) < 1e-9
+    assert g.resolve(D, "النرجص")["name"] == "النرجس"
+    assert g.resolve(D, "الياسمين") is None and g.resolve(D, "الروضة") is None
+    assert g.resolve(D, "") is None and g.resolve("unknown", "النرجس") is None
+    print(f"  ✅ typo '{typo['name']}' ({typo['score']}), district center {center}")
+
+
+def test_candidates_on_large_tables():
+    """Test that only the top trigram candidates are re-ranked"""
+    print("\n" + "=" * 60)
+    print("TEST 2: Trigram candidates on a large table")
+    print("=" * 60)
+
+    import gazetteer as gazetteer_module
+    from config import settings
+
+    mosques = MOSQUES + [{"name": f"مسجد حي {i} الشمالي", "lat": 24.5 + i * 1e-4, "lon": 46.6} for i in range(5000)]
+    g = _gazetteer(mosques)
+    calls = []
+    original = gazetteer_module.calculate_similarity_score
+    try:
+        gazetteer_module.calculate_similarity_score = lambda a, b: calls.append(b) or original(a, b)
+        assert g.resolve("mosques", "مسجد الرجحي")["name"] == "جامع الراجحي"
+        assert 0 < len(calls) <= 2 * g.candidates
+        calls.clear()
+        assert g.resolve("mosques", "مسجد الرجحي")["name"] == "جامع الراجحي" and calls == []
+    finally:
+        gazetteer_module.calculate_similarity_score = original
+
+    started = time.perf_counter()
+    for i in range(200):
+        g._resolved.clear()
+        g.resolve("mosques", f"مسجد الملك خالد {i % 3}")
+    uncached_ms = (time.perf_counter() - started) / 200 * 1000
+    assert uncached_ms < 5, uncached_ms
+
+    stats = g.stats()
+    assert stats["mosques"] == 5002 and stats["universities"] == 3 and stats["districts"] == 2
+
+    enabled = settings.GAZETTEER_ENABLED
+    try:
+        settings.GAZETTEER_ENABLED = False
+        assert not g.ensure_loaded()
+    finally:
+        settings.GAZETTEER_ENABLED = enabled
+    assert g.ensure_loaded()
+    print(f"  ✅ {uncached_ms * 1000:.0f}µs per uncached lookup over {stats['mosques']} mosques")
+
+
+def test_search_engine_uses_gazetteer():
+    """Test anchors, university matching and district canonicalization"""
+    print("\n" + "=" * 60)
+    print("TEST 3: Search engine integration")
+    print("=" * 60)
+
+    import search_engine as se
+    from models import PropertyCriteria, UniversityRequirements, MosqueRequirements
+    from search_pipeline import SearchContext
+
+    class _NoNetwork:
+        def __getattr__(self, name):
+            raise AssertionError(f"unexpected database call: {name}")
+
+    engine = se.SearchEngine()
+    engine.db = _NoNetwork()
+    original = (se.gazetteer, se.db)
+    try:
+        se.gazetteer, se.db = _gazetteer(), _NoNetwork()
+
+        assert se._find_matching_university("جامعة الملك سعود") == "جامعة الملك سعود"
+        lat, lon = se._get_district_coordinates("النرجس")
+        assert abs(lat - 24.85) < 1e-9 and abs(lon - 46.65) < 1e-9
+
+        criteria = PropertyCriteria(purpose="للايجار", property_type="شقق", city="الرياض",
+                                    university_requirements=UniversityRequirements(
+                                        university_name="جامعه الملك سعوود", max_distance_minutes=10))
+        ctx = SearchContext(criteria)
+        anchor = engine._resolve_anchor(ctx)
+        assert anchor["name"] == "جامعة الملك سعود" and (anchor["lat"], anchor["lon"]) == (24.716, 46.619)
+        assert engine._matched_university(ctx) == "جامعة الملك سعود"
+
+        mosque = SearchContext(PropertyCriteria(purpose="للايجار", property_type="شقق", city="الرياض",
+                                                mosque_requirements=MosqueRequirements(mosque_name="مسجد الراجحي")))
+        assert engine._resolve_anchor(mosque)["lat"] == 24.690
+
+        typed = PropertyCriteria(purpose="للايجار", property_type="شقق", city="الرياض", district="حي النرجص")
+        canonical = engine._canonical_criteria(typed)
+        assert canonical.district == "النرجس" and typed.district == "حي النرجص"
+        assert engine._canonical_criteria(canonical) is canonical
+        unknown = typed.model_copy(update={"district": "حي غير معروف"})
+        assert engine._canonical_criteria(unknown) is unknown
+    finally:
+        se.gazetteer, se.db = original
+    print(f"  ✅ anchor {anchor['name']} and district {canonical.district} resolved in memory")
+
+
+def test_background_refresh():
+    """Test that only the first load blocks and refreshes keep serving the previous index"""
+    print("\n" + "=" * 60)
+    print("TEST 4: Background refresh")
+    print("=" * 60)
+
+    from lexical_index import LexicalIndex
+    from vector_index import VectorIndex
+
+    g = _gazetteer()
+    gate, threads = threading.Event(), []
+    renamed = [dict(MOSQUES[0], name="جامع الراجحي الجديد")]
+
+    def slow_load():
+        threads.append(threading.current_thread().name)
+        gate.wait(5)
+        g.build(UNIVERSITIES, renamed, PROPERTIES)
+
+    g.load = slow_load
+    g._loaded_at -= g.refresh_seconds + 1
+    started = time.perf_counter()
+    assert g.ensure_loaded() and g.ensure_loaded()
+    # الدليل السابق يخدم الطلبات حتى يكتمل البديل
+    assert g.resolve("mosques", "جامع الراجحي")["name"] == "جامع الراجحي"
+    blocked_ms = (time.perf_counter() - started) * 1000
+    gate.set()
+    deadline = time.monotonic() + 5
+    while (g.resolve("mosques", "جامع الراجحي الجديد") or {}).get("name") != "جامع الراجحي الجديد":
+        assert time.monotonic() < deadline, "background refresh never swapped the gazetteer"
+        time.sleep(0.01)
+    assert threads == ["gazetteer-refresh"] and blocked_ms < 1000
+
+    for index in (LexicalIndex(), VectorIndex()):
+        gate, loads = threading.Event(), []
+
+        def load(index=index, loads=loads, gate=gate):
+            loads.append(threading.current_thread().name)
+            if len(loads) > 1:
+                gate.wait(5)
+            index._loaded_at = time.time()
+
+        index.load, index.is_loaded = load, lambda loads=loads: bool(loads)
+        assert index.ensure_loaded() and loads == [threading.current_thread().name]
+        index._loaded_at -= index.refresh_seconds + 1
+        assert index.ensure_loaded() and index.ensure_loaded() and len(loads) == 2
+        assert loads[1].endswith("-index-refresh")
+        gate.set()
+        deadline = time.monotonic() + 5
+        while time.time() - index._loaded_at >= index.refresh_seconds:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+    print(f"  ✅ expired indexes served in {blocked_ms:.1f}ms while rebuilding on a background thread")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Gazetteer - Tests")
+    print("=" * 60)
+
+    test_resolve_names()
+    test_candidates_on_large_tables()
+    test_search_engine_uses_gazetteer()
+    test_background_refresh()
+
+    print("\n✅ All tests passed!")
@@ -0,0 +1,222 @@
+"""
+Test script for the precomputed heatmap grids
+Tests:
+1. Vectorized grid matches a per-row reference (counts, mean price, mean price/m²)
+2. Incremental refresh after listing changes equals a full rebuild
+3. /api/heatmap returns the grid for a purpose/type and validates the viewport
+4. A refresh landing while a grid is being built is counted exactly once
+"""
+import sys
+import os
+import random
+import asyncio
+import threading
+import time
+
+# Add Backend to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import httpx
+
+from test_property_store import _random_rows
+
+
+def _reference(rows, purpose, property_type, zoom, cells_per_tile):
+    """Per-row grid computed without numpy vectorization"""
+    import numpy as np
+    from map_clusters import grid_cells, cell_centers
+
+    cells = {}
+    for r in rows:
+        if r["purpose"] != purpose or r["property_type"] != property_type or not r["final_lat"]:
+            continue
+        ix, iy, n = grid_cells(np.array([r["final_lat"]]), np.array([r["final_lon"]]), zoom, cells_per_tile)
+        cell = cells.setdefault((int(ix[0]), int(iy[0])), {"count": 0, "prices": [], "ppm": []})
+        cell["count"] += 1
+        if r["price_num"] is not None:
+            cell["prices"].append(r["price_num"])
+            if r["area_m2"]:
+                cell["ppm"].append(r["price_num"] / r["area_m2"])
+
+    result = {}
+    for (ix, iy), cell in cells.items():
+        lat, lon = cell_centers(np.array([ix]), np.array([iy]), n)
+        result[(round(float(lat[0]), 6), round(float(lon[0]), 6))] = (
+            cell["count"],
+            round(sum(cell["prices"]) / len(cell["prices"]), 2) if cell["prices"] else None,
+            round(sum(cell["ppm"]) / len(cell["ppm"]), 2) if cell["ppm"] else None,
+        )
+    return result
+
+
+def _as_dict(cells):
+    return {(c["lat"], c["lon"]): (c["count"], c["mean_price"], c["mean_price_per_m2"]) for c in cells}
+
+
+def _assert_grid(service, rows, purpose, property_type, zoom):
+    got = _as_dict(service.grid(purpose, property_type, zoom)["cells"])
+    want = _reference(rows, purpose, property_type, zoom, service.cells_per_tile)
+    assert got.keys() == want.keys(), (len(got), len(want))
+    for key, (count, price, ppm) in want.items():
+        g_count, g_price, g_ppm = got[key]
+        assert g_count == count, (key, g_count, count)
+        assert (g_price is None) == (price is None) and (price is None or abs(g_price - price) < 0.02), (g_price, price)
+        assert (g_ppm is None) == (ppm is None) and (ppm is None or abs(g_ppm - ppm) < 0.02), (g_ppm, ppm)
+    return got
+
+
+def _service(rows):
+    from property_store import PropertyStore
+    from heatmap import HeatmapService
+
+    store = PropertyStore(updated_at_column=None)
+    service = HeatmapService(store, cells_per_tile=8)
+    store.subscribe(service.on_property_changes)
+    store.build(rows)
+    return store, service
+
+
+def test_grid_matches_reference():
+    """Test vectorized binning against a per-row computation"""
+    print("\n" + "=" * 60)
+    print("TEST 1: Grid vs per-row reference")
+    print("=" * 60)
+
+    rows = _random_rows(3000, seed=3)
+    _, service = _service(rows)
+    for zoom in (6, 12, 15):
+        for purpose, property_type in (("للبيع", "شقق"), ("للايجار", "فلل")):
+            got = _assert_grid(service, rows, purpose, property_type, zoom)
+            print(f"  ✅ {purpose}/{property_type} zoom={zoom}: {len(got)} cells")
+
+
+def test_incremental_refresh():
+    """Test grids follow listing changes without a rebuild"""
+    print("\n" + "=" * 60)
+    print("TEST 2: Incremental refresh")
+    print("=" * 60)
+
+    rows = _random_rows(2000, seed=5)
+    store, service = _service(rows)
+    zooms = (10, 14)
+    for zoom in zooms:
+        service.grid("للبيع", "شقق", zoom)
+        service.grid("للايجار", "دور", zoom)
+    built = [id(g) for g in service._grids.values()]
+
+    rng = random.Random(9)
+    changed = []
+    for row in rng.sample(rows, 200):
+        row = dict(row)
+        row["price_num"] = rng.choice([None, float(rng.randint(20, 200) * 1000)])
+        row["final_lat"] = rng.choice([None, 24.7 + rng.uniform(-0.1, 0.1)])
+        row["property_type"] = rng.choice(["شقق", "فلل", "دور"])
+        changed.append(row)
+    new_rows = _random_rows(50, seed=6)
+    for i, row in enumerate(new_rows):
+        row["id"] = f"new{i}"
+    store.apply_changes(changed + new_rows)
+
+    by_id = {r["id"]: r for r in rows}
+    by_id.update({r["id"]: r for r in changed + new_rows})
+    current = list(by_id.values())
+
+    assert [id(g) for g in service._grids.values()] == built, "grids must be updated in place"
+    for zoom in zooms:
+        _assert_grid(service, current, "للبيع", "شقق", zoom)
+        _assert_grid(service, current, "للايجار", "دور", zoom)
+    print(f"  ✅ {len(changed)} updates + {len(new_rows)} inserts applied to {len(built)} grids in place")
+
+
+def test_heatmap_endpoint():
+    """Test the HTTP endpoint and viewport filtering"""
+    print("\n" + "=" * 60)
+    print("TEST 3: /api/heatmap")
+    print("=" * 60)
+
+    from main import app
+    from heatmap import heatmap_service
+    from property_store import PropertyStore
+
+    rows = _random_rows(1000, seed=8)
+    original = heatmap_service.store
+    heatmap_service.store = PropertyStore(updated_at_column=None)
+    heatmap_service.store.build(rows)
+    params = {"purpose": "للبيع", "property_type": "شقق", "zoom": 12}
+
+    async def fetch_all():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return (
+                await client.get("/api/heatmap", params=params),
+                await client.get("/api/heatmap", params=dict(params, south=24.7, west=46.0, north=25.0, east=47.0)),
+                await client.get("/api/heatmap", params=dict(params, south=24.7)),
+                await client.get("/api/heatmap", params=dict(params, zoom=30)),
+            )
+
+    try:
+        world, north, partial, too_deep = asyncio.run(fetch_all())
+    finally:
+        heatmap_service.store = original
+        heatmap_service._grids.clear()
+        heatmap_service._source = None
+
+    assert world.status_code == 200, world.text
+    data = world.json()
+    expected = sum(1 for r in rows if r["purpose"] == "للبيع" and r["property_type"] == "شقق" and r["final_lat"])
+    assert data["total_count"] == expected == sum(c["count"] for c in data["cells"])
+    assert 0 < len(north.json()["cells"]) < len(data["cells"])
+    assert all(c["lat"] >= 24.7 for c in north.json()["cells"])
+    assert partial.status_code == 400 and too_deep.status_code == 422
+    print(f"  ✅ {len(data['cells'])} cells ({len(world.content)} bytes) for {expected} listings")
+
+
+def test_refresh_during_build():
+    """Test a poll racing the first grid build is not double-counted"""
+    print("\n" + "=" * 60)
+    print("TEST 4: Refresh during grid build")
+    print("=" * 60)
+
+    from property_store import PropertyStore
+    from heatmap import HeatmapService
+
+    rows = _random_rows(1000, seed=12)
+    added = [dict(r, id=f"late{i}", purpose="للبيع", property_type="شقق", final_lat=24.7)
+             for i, r in enumerate(_random_rows(40, seed=13))]
+
+    class RacingStore(PropertyStore):
+        """تحديث من worker آخر يصل بعد قراءة اللقطة وقبل قراءة النقاط"""
+
+        def points(self, purpose, property_type, snapshot=None):
+            before = self._snapshot
+            self.poller = threading.Thread(target=self.apply_changes, args=(added,))
+            self.poller.start()
+            while self._snapshot is before:
+                time.sleep(0.001)
+            return super().points(purpose, property_type, snapshot)
+
+    store = RacingStore(updated_at_column=None)
+    service = HeatmapService(store, cells_per_tile=8)
+    store.subscribe(service.on_property_changes)
+    store.build(rows)
+
+    service.grid("للبيع", "شقق", 12)
+    store.poller.join()
+    _assert_grid(service, rows + added, "للبيع", "شقق", 12)
+    print(f"  ✅ {len(added)} rows added mid-build counted once")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Heatmap Grids - Tests")
+    print("=" * 60)
+
+    test_grid_matches_reference()
+    test_incremental_refresh()
+    test_heatmap_endpoint()
+    test_refresh_during_build()
+
+    print("\n✅ All tests passed!")
@@ -0,0 +1,215 @@
+"""
+Test script for the BM25 lexical index
+Tests:
+1. Arabic tokenization with light stemming and compressed postings
+2. BM25 top-k matches a brute-force reference, with title weight and filters
+3. Fusion with vector results and lexical-only first stage when the model is cold
+"""
+import sys
+import os
+import math
+from collections import Counter
+
+import numpy as np
+
+# Add Backend to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+WORDS = ["شقة", "فيلا", "مؤثثة", "مفروشة", "مدخل", "خاص", "مسبح", "حديقة", "مطبخ", "راكب", "شارع",
+         "الأمير", "سلطان", "قريبة", "مسجد", "غرفة", "صالة", "ملحق", "سطح", "مكيفة", "واسعة", "جديدة"]
+
+
+def _rows(n=600, seed=0):
+    rng = np.random.default_rng(seed)
+    return [
+        {
+            "id": f"p{i:04d}",
+            "title": " ".join(rng.choice(WORDS, 3)),
+            "description": " ".join(rng.choice(WORDS + [f"كلمة{j}" for j in range(40)], 25)) if i % 7 else None,
+            "purpose": "للبيع" if i % 2 else "للايجار",
+            "property_type": ["شقق", "فلل"][i % 2],
+            "city": "الرياض",
+            "final_lat": 24.7 + 0.001 * (i % 50),
+            "final_lon": 46.7,
+            "price_num": float(1000 * (i % 100)),
+        }
+        for i in range(n)
+    ]
+
+
+def test_tokenizer_and_postings():
+    """Test normalization, light stemming and the varint postings"""
+    print("\n" + "=" * 60)
+    print("TEST 1: Tokenizer and compressed postings")
+    print("=" * 60)
+
+    from lexical_index import tokenize, encode_varints, decode_varints, LexicalIndex
+
+    assert tokenize("شقّة مؤثثة بمدخل خاص") == ["شقه", "مؤثث", "مدخل", "خاص"]
+    assert tokenize("ابي شقه في المفروشات") == tokenize("شقة مفروشة")
+    assert tokenize("والمسبح والحديقة") == ["مسبح", "حديق"]
+    assert tokenize("أمير") == tokenize("الأمير") == ["امير"]
+    assert tokenize("") == [] and tokenize(None) == []
+
+    values = np.array([0, 1, 127, 128, 300, 16383, 16384, 2 ** 35 + 7], dtype=np.uint64)
+    encoded = encode_varints(values)
+    assert len(encoded) == 1 + 1 + 1 + 2 + 2 + 2 + 3 + 6
+    assert np.array_equal(decode_varints(encoded), values)
+
+    rows = _rows()
+    index = LexicalIndex()
+    index.build(rows)
+    docs, tfs = index.postings_for("مؤثث")
+    expected = [i for i, row in enumerate(rows)
+                if "مؤثث" in tokenize(row["title"]) + tokenize(row["description"])]
+    assert docs.tolist() == expected and np.all(tfs >= 1)
+    assert index.postings_for("غير-موجود")[0].size == 0
+
+    stats = index.stats()
+    assert stats["postings_bytes"] * 3 < stats["uncompressed_bytes"]
+    print(f"  ✅ {stats}")
+
+
+def _reference_bm25(rows, query, k1=1.2, b=0.75, title_weight=2):
+    from lexical_index import tokenize
+
+    docs = []
+    for row in rows:
+        counts = Counter(tokenize(row["description"]))
+        for term, tf in Counter(tokenize(row["title"])).items():
+            counts[term] += title_weight * tf
+        docs.append(counts)
+    avgdl = sum(sum(d.values()) for d in docs) / len(docs)
+    scores = []
+    for counts in docs:
+        score = 0.0
+        length = sum(counts.values())
+        for term in dict.fromkeys(tokenize(query)):
+            df = sum(1 for d in docs if term in d)
+            if counts.get(term):
+                idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+                tf = counts[term]
+                score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avgdl))
+        scores.append(score)
+    return scores
+
+
+def test_bm25_matches_reference():
+    """Test BM25 ranking, title weighting and metadata filters"""
+    print("\n" + "=" * 60)
+    print("TEST 2: BM25 top-k")
+    print("=" * 60)
+
+    from lexical_index import LexicalIndex
+
+    rows = _rows()
+    index = LexicalIndex()
+    index.build(rows)
+
+    query = "ابي شقة مؤثثة بمدخل خاص قريبة من شارع الأمير سلطان"
+    reference = _reference_bm25(rows, query)
+    results = index.search(query, k=20)
+    expected = sorted(range(len(rows)), key=lambda i: -reference[i])[:20]
+    assert [r["id"] for r in results] == [rows[i]["id"] for i in expected]
+    assert np.allclose([r["bm25"] for r in results], [reference[i] for i in expected], rtol=1e-4)
+    assert results[0]["similarity"] == 1.0 and all(0 < r["similarity"] <= 1 for r in results)
+
+    # كلمة في العنوان أثقل من نفس الكلمة في الوصف
+    small = LexicalIndex()
+    small.build([{"id": "title", "title": "شقة مؤثثة", "description": "واسعة جديدة"},
+                 {"id": "description", "title": "شقة واسعة", "description": "مؤثثة جديدة"},
+                 {"id": "other", "title": "فيلا", "description": "حديقة"}])
+    assert [r["id"] for r in small.search("مؤثثه")] == ["title", "description"]
+
+    filtered = index.search(query, k=50, purpose="للبيع", property_type="فلل", min_price=20000, max_price=60000,
+                            lat=24.7, lon=46.7)
+    assert filtered and all(rows[int(r["id"][1:])]["purpose"] == "للبيع" for r in filtered)
+    assert all(20000 <= r["price_num"] <= 60000 and r["dist_meters"] is not None for r in filtered)
+    assert index.search(query, purpose="غير موجود") == [] and index.search("كلمات لا توجد") == []
+    assert LexicalIndex().search(query) == []
+    print(f"  ✅ top-20 equals the reference BM25, {len(filtered)} filtered results")
+
+
+def test_fusion_and_cold_model():
+    """Test RRF fusion in the similar tier and the lexical-only first stage"""
+    print("\n" + "=" * 60)
+    print("TEST 3: Fusion with vector search")
+    print("=" * 60)
+
+    import search_engine as se
+    from config import settings
+    from lexical_index import LexicalIndex, reciprocal_rank_fusion
+    from models import PropertyCriteria
+    from search_pipeline import SearchContext
+
+    fused = reciprocal_rank_fusion([[{"id": "a", "similarity": 0.9}, {"id": "b", "similarity": 0.8}],
+                                    [{"id": "b", "similarity": None}, {"id": "c", "similarity": None}]], limit=3)
+    assert [r["id"] for r in fused] == ["b", "a", "c"] and fused[0]["similarity"] == 0.8
+
+    rows = _rows()
+    index = LexicalIndex()
+    index.build(rows)
+    criteria = PropertyCriteria(purpose="للبيع", property_type="فلل", city="الرياض",
+                                original_query="فيلا مع مسبح وملحق وسطح")
+
+    engine = se.SearchEngine()
+    generator = se.embedding_generator
+    warmups = []
+    dense_calls = []
+    original = (se.lexical_index, settings.LEXICAL_INDEX_ENABLED, generator._model,
+                generator.load_in_background, engine._rpc_rows)
+    try:
+        se.lexical_index = index
+        settings.LEXICAL_INDEX_ENABLED = True
+        generator._model = None
+        generator.load_in_background = lambda: warmups.append(True)
+
+        # الموديل بارد: BM25 وحده كمرحلة أولى بدون انتظار التحميل
+        ctx = SearchContext(criteria)
+        ctx.results = {"anchor": None, "embedding": engine._embed_query(ctx), "lexical": engine._lexical_candidates(ctx)}
+        assert ctx.results["embedding"] is None and warmups == [True] and "embedding" in ctx.errors
+        lexical_only = engine._similar_candidates(ctx)
+        assert lexical_only and lexical_only == ctx.results["lexical"]
+        assert all(rows[int(r["id"][1:])]["purpose"] == "للبيع" for r in lexical_only)
+
+        # الموديل جاهز: نتائج المتجهات تُدمج مع BM25
+        def dense(name, params, columns):
+            dense_calls.append(name)
+            return [{"id": "p0001", "similarity": 0.81}, {"id": lexical_only[0]["id"], "similarity": 0.8},
+                    {"id": "p0003", "similarity": 0.7}]
+
+        engine._rpc_rows = dense
+        ctx = SearchContext(criteria)
+        ctx.results = {"anchor": None, "embedding": [0.1] * 8, "lexical": engine._lexical_candidates(ctx)}
+        merged = engine._similar_candidates(ctx)
+        ids = [r["id"] for r in merged]
+        assert dense_calls == ["search_properties_hybrid"] and ids[0] == lexical_only[0]["id"]
+        assert {"p0001", "p0003"} <= set(ids) and len(ids) == len(set(ids)) <= engine.similar_limit
+        similarity = {r["id"]: r["similarity"] for r in merged}
+        assert similarity["p0001"] == 0.81 and similarity[ids[0]] == 0.8
+        assert all(similarity[i] is None for i in ids if i not in {"p0001", "p0003", ids[0]})
+
+        settings.LEXICAL_INDEX_ENABLED = False
+        assert engine._lexical_candidates(SearchContext(criteria)) == []
+    finally:
+        (se.lexical_index, settings.LEXICAL_INDEX_ENABLED, generator._model,
+         generator.load_in_background, engine._rpc_rows) = original
+        if "load_in_background" in vars(generator):
+            del generator.load_in_background
+    print(f"  ✅ cold model -> {len(lexical_only)} BM25 candidates, warm -> {len(merged)} fused")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Lexical Index - Tests")
+    print("=" * 60)
+
+    test_tokenizer_and_postings()
+    test_bm25_matches_reference()
+    test_fusion_and_cold_model()
+
+    print("\n✅ All tests passed!")
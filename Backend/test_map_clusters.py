@@ -0,0 +1,213 @@
+"""
+Test script for server-side map clustering
+Tests:
+1. Grid aggregation: counts, centroids, price ranges, singletons at high zoom
+2. /api/search/clusters caches per zoom and filters by viewport without re-searching
+3. Matching rows are paged past PostgREST's 1000-row response cap
+"""
+import sys
+import os
+import re
+import asyncio
+import numpy as np
+
+# Add Backend to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import httpx
+
+# Two neighbourhoods in Riyadh ~15km apart, plus one listing in Jeddah
+NORTH = [(24.80 + i * 1e-4, 46.63 + i * 1e-4, 1000.0 * (i + 1)) for i in range(40)]
+SOUTH = [(24.65 + i * 1e-4, 46.71 + i * 1e-4, None if i == 0 else 500.0 * i) for i in range(20)]
+JEDDAH = [(21.54, 39.17, 750000.0)]
+ROWS = [{"id": f"p{i}", "final_lat": lat, "final_lon": lon, "price_num": price}
+        for i, (lat, lon, price) in enumerate(NORTH + SOUTH + JEDDAH)]
+
+
+def test_cluster_points():
+    """Test grid aggregation math"""
+    print("\n" + "=" * 60)
+    print("TEST 1: Grid aggregation")
+    print("=" * 60)
+
+    from map_clusters import cluster_points
+
+    lats = np.array([r["final_lat"] for r in ROWS])
+    lons = np.array([r["final_lon"] for r in ROWS])
+    prices = np.array([np.nan if r["price_num"] is None else r["price_num"] for r in ROWS])
+    ids = [r["id"] for r in ROWS]
+
+    coarse = cluster_points(lats, lons, prices, ids, zoom=5)
+    assert sum(c["count"] for c in coarse) == len(ROWS)
+    assert sorted(c["count"] for c in coarse) == [1, 60], coarse
+    riyadh = max(coarse, key=lambda c: c["count"])
+    assert abs(riyadh["lat"] - lats[:60].mean()) < 1e-9 and abs(riyadh["lon"] - lons[:60].mean()) < 1e-9
+    assert riyadh["min_price"] == 500.0 and riyadh["max_price"] == 40000.0
+    assert riyadh["property_id"] is None
+    jeddah = min(coarse, key=lambda c: c["count"])
+    assert jeddah["property_id"] == "p60"
+
+    city = cluster_points(lats, lons, prices, ids, zoom=11)
+    assert sorted(c["count"] for c in city) == [1, 20, 40], [c["count"] for c in city]
+
+    street = cluster_points(lats, lons, prices, ids, zoom=22)
+    assert len(street) == len(ROWS) and all(c["property_id"] for c in street)
+    assert cluster_points(lats[:0], lons[:0], prices[:0], [], zoom=3) == []
+    print(f"  ✅ zoom 5 -> {len(coarse)}, zoom 11 -> {len(city)}, zoom 22 -> {len(street)} clusters")
+
+
+def test_clusters_endpoint():
+    """Test per-zoom caching and viewport filtering"""
+    print("\n" + "=" * 60)
+    print("TEST 2: /api/search/clusters")
+    print("=" * 60)
+
+    from main import app
+    from search_engine import search_engine
+    from search_cache import search_cache
+
+    searches = []
+
+    def fake_matching_rows(criteria, limit):
+        searches.append(limit)
+        return [dict(r) for r in ROWS], False
+
+    body = {"criteria": {"purpose": "للبيع", "property_type": "شقق"}, "zoom": 11}
+    riyadh = {"south": 24.5, "west": 46.5, "north": 25.0, "east": 47.0}
+    north_only = {"south": 24.75, "west": 46.5, "north": 25.0, "east": 47.0}
+
+    async def fetch_all():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return [await client.post("/api/search/clusters", json=b) for b in (
+                body,
+                dict(body, bounds=riyadh),
+                dict(body, bounds=north_only),
+                dict(body, zoom=5),
+            )]
+
+    search_engine.matching_rows = fake_matching_rows
+    search_cache.clear()
+    try:
+        world, in_riyadh, in_north, zoomed_out = asyncio.run(fetch_all())
+    finally:
+        del search_engine.matching_rows
+        search_cache.clear()
+
+    for response in (world, in_riyadh, in_north, zoomed_out):
+        assert response.status_code == 200, response.text
+    assert len(searches) == 2, "panning within a zoom level must reuse the cached clusters"
+    assert [c["count"] for c in sorted(world.json()["clusters"], key=lambda c: c["count"])] == [1, 20, 40]
+    assert len(in_riyadh.json()["clusters"]) == 2
+    assert [c["count"] for c in in_north.json()["clusters"]] == [40]
+    assert in_north.json()["total_count"] == len(ROWS)
+    assert zoomed_out.json()["zoom"] == 5 and len(zoomed_out.json()["clusters"]) == 2
+    print(f"  ✅ 4 requests, {len(searches)} searches; viewport -> {len(in_north.json()['clusters'])} cluster")
+
+
+class _CappedQuery:
+    """PostgREST query builder that, like max-rows, never returns more than 1000 rows"""
+
+    MAX_ROWS = 1000
+
+    def __init__(self, rows, requests):
+        self._rows = rows
+        self._requests = requests
+        self._filters = []
+        self._limit = None
+        self._negate = False
+
+    @property
+    def not_(self):
+        self._negate = True
+        return self
+
+    def _add(self, predicate):
+        negate, self._negate = self._negate, False
+        self._filters.append((lambda r: not predicate(r)) if negate else predicate)
+        return self
+
+    def select(self, columns):
+        return self
+
+    def is_(self, column, value):
+        return self._add(lambda r: r.get(column) is None)
+
+    def eq(self, column, value):
+        return self._add(lambda r: r.get(column) == value)
+
+    def or_(self, expression):
+        # keyset بعد (السعر، id) كما يبنيه _query_properties
+        price, _, property_id = re.match(r'price_num\.gt\.([\d.]+),and\(price_num\.eq\.([\d.]+),id\.gt\."([^"]+)"\)',
+                                         expression).groups()
+        price = float(price)
+        return self._add(lambda r: r["price_num"] > price or (r["price_num"] == price and r["id"] > property_id))
+
+    def order(self, column):
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def execute(self):
+        self._requests.append(self._limit)
+        rows = sorted((r for r in self._rows if all(f(r) for f in self._filters)),
+                      key=lambda r: (r["price_num"], r["id"]))
+        data = [dict(r) for r in rows[:min(self._limit, self.MAX_ROWS)]]
+        return type("Result", (), {"data": data})()
+
+
+def test_matching_rows_past_response_cap():
+    """Test that clustering pages past the 1000-row PostgREST cap"""
+    print("\n" + "=" * 60)
+    print("TEST 3: Paging past the PostgREST row cap")
+    print("=" * 60)
+
+    from map_clusters import MapClusterer
+    from models import PropertyCriteria
+    from search_engine import search_engine
+    from search_cache import search_cache
+    from config import settings
+
+    rows = [{"id": f"p{i:05d}", "purpose": "للبيع", "property_type": "شقق", "city": "الرياض",
+             "final_lat": 24.6 + (i % 50) * 1e-3, "final_lon": 46.6 + (i // 50) * 1e-3,
+             "price_num": 1000.0 * (i // 3)} for i in range(2500)]
+    requests = []
+    client = type("Client", (), {"table": lambda self, name: _CappedQuery(rows, requests)})()
+    criteria = PropertyCriteria(purpose="للبيع", property_type="شقق")
+
+    original_db, store_enabled = search_engine.db, settings.PROPERTY_STORE_ENABLED
+    search_engine.db = type("FakeDB", (), {"client": client})()
+    settings.PROPERTY_STORE_ENABLED = False
+    search_cache.clear()
+    try:
+        everything = MapClusterer(max_points=5000).clusters(criteria, zoom=5)
+        full_requests = list(requests)
+        search_cache.clear()
+        capped = MapClusterer(max_points=2000).clusters(criteria, zoom=5)
+    finally:
+        search_engine.db, settings.PROPERTY_STORE_ENABLED = original_db, store_enabled
+        search_cache.clear()
+
+    assert everything["total_count"] == 2500 and not everything["truncated"]
+    assert sum(c["count"] for c in everything["clusters"]) == 2500
+    assert full_requests == [1000, 1000, 1000], full_requests
+    assert capped["total_count"] == 2000 and capped["truncated"]
+    print(f"  ✅ {everything['total_count']} listings over {len(full_requests)} requests; "
+          f"max_points=2000 -> truncated={capped['truncated']}")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Map Clustering - Tests")
+    print("=" * 60)
+
+    test_cluster_points()
+    test_clusters_endpoint()
+    test_matching_rows_past_response_cap()
+
+    print("\n✅ All tests passed!")
@@ -0,0 +1,166 @@
+"""
+Test script for the map view and column projection
+Tests:
+1. view=map returns lightweight markers, skips nearby services and is much smaller than view=full
+2. /api/properties/details returns full properties in the requested order
+3. RPC projection falls back to the full result when the function rejects select()
+"""
+import sys
+import os
+import json
+import asyncio
+from contextlib import contextmanager
+
+# Add Backend to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import httpx
+
+ROWS = [{"id": f"p{i}", "url": f"https://example.com/{i}", "purpose": "للبيع", "property_type": "شقق",
+         "city": "الرياض", "district": "حي الملقا", "title": f"شقة للبيع رقم {i}",
+         "description": "شقة واسعة قريبة من الخدمات " * 20, "image_url": f"https://example.com/{i}.jpg",
+         "final_lat": 24.8, "final_lon": 46.6, "price_num": 1000.0 * (i + 1), "rooms": 3}
+        for i in range(30)]
+
+SEARCH_BODY = {
+    "mode": "exact",
+    "criteria": {"purpose": "للبيع", "property_type": "شقق",
+                 "school_requirements": {"required": True}},
+}
+
+
+@contextmanager
+def _fake_backends(engine):
+    """Canned exact tier and a counting nearby-schools lookup"""
+    from search_cache import search_cache
+
+    calls = []
+    engine._query_exact_tier = lambda ctx, position, limit: ([dict(r) for r in ROWS[:limit]], None)
+    engine._get_nearby_schools = lambda lat, lon, reqs: calls.append((lat, lon)) or [{"name": "مدرسة"}]
+    search_cache.clear()
+    try:
+        yield calls
+    finally:
+        for name in ("_query_exact_tier", "_get_nearby_schools"):
+            delattr(engine, name)
+        search_cache.clear()
+
+
+def _post(path, body):
+    from main import app
+
+    async def fetch():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.post(path, json=body)
+
+    return asyncio.run(fetch())
+
+
+def test_map_view_markers():
+    """Test marker shape, skipped services and payload size"""
+    print("\n" + "=" * 60)
+    print("TEST 1: view=map markers")
+    print("=" * 60)
+
+    from search_engine import search_engine
+
+    with _fake_backends(search_engine) as calls:
+        full = _post("/api/search", SEARCH_BODY)
+        full_calls = len(calls)
+        map_view = _post("/api/search", dict(SEARCH_BODY, view="map"))
+
+    assert full.status_code == 200 and map_view.status_code == 200, map_view.text
+    assert full_calls == len(ROWS) and len(calls) == full_calls, "map view must not compute nearby services"
+
+    data = map_view.json()
+    assert data["properties"] == [] and data["total_count"] == len(ROWS)
+    assert [m["id"] for m in data["markers"]] == [r["id"] for r in ROWS]
+    assert set(data["markers"][0]) == {"id", "final_lat", "final_lon", "price_num", "property_type", "match_score"}
+
+    full_size, map_size = len(full.content), len(map_view.content)
+    assert map_size * 5 < full_size, (map_size, full_size)
+    print(f"  ✅ {len(data['markers'])} markers, payload {full_size} -> {map_size} bytes")
+
+
+def test_details_endpoint():
+    """Test batch details in request order"""
+    print("\n" + "=" * 60)
+    print("TEST 2: /api/properties/details")
+    print("=" * 60)
+
+    from database import db
+
+    requested = []
+
+    def fake_by_ids(ids):
+        requested.append(list(ids))
+        by_id = {r["id"]: r for r in ROWS}
+        return [by_id[i] for i in ids if i in by_id]
+
+    db.get_properties_by_ids = fake_by_ids
+    try:
+        response = _post("/api/properties/details", {"ids": ["p5", "missing", "p1"]})
+        empty = _post("/api/properties/details", {"ids": []})
+    finally:
+        del db.get_properties_by_ids
+
+    assert response.status_code == 200, response.text
+    assert [p["id"] for p in response.json()] == ["p5", "p1"]
+    assert response.json()[0]["description"] == ROWS[5]["description"]
+    assert empty.status_code == 422
+    print(f"  ✅ details for {requested[0]} -> {[p['id'] for p in response.json()]}")
+
+
+def test_rpc_projection_fallback():
+    """Test select() projection and the fallback for RPCs that reject it"""
+    print("\n" + "=" * 60)
+    print("TEST 3: RPC projection fallback")
+    print("=" * 60)
+
+    from postgrest.exceptions import APIError
+    from search_engine import SearchEngine
+
+    selects = []
+
+    class FakeRPC:
+        def __init__(self, name):
+            self.name = name
+            self.columns = None
+
+        def select(self, columns):
+            self.columns = columns
+            return self
+
+        def range(self, start, end):
+            return self
+
+        def execute(self):
+            selects.append((self.name, self.columns))
+            if self.name == "legacy_rpc" and self.columns:
+                raise APIError({"message": "column does not exist", "code": "42703"})
+            return type("Result", (), {"data": [{"id": "p1"}]})()
+
+    engine = SearchEngine()
+    engine.db = type("FakeDB", (), {"client": type("Client", (), {"rpc": lambda self, name, params: FakeRPC(name)})()})()
+
+    assert engine._rpc_rows("hybrid_rpc", {}, "id, similarity") == [{"id": "p1"}]
+    assert engine._rpc_rows("legacy_rpc", {}, "id") == [{"id": "p1"}]
+    assert engine._rpc_rows("legacy_rpc", {}, "id") == [{"id": "p1"}]
+    assert selects == [("hybrid_rpc", "id, similarity"), ("legacy_rpc", "id"), ("legacy_rpc", None), ("legacy_rpc", None)]
+    print(f"  ✅ projected once, then remembered fallback: {selects}")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Map View & Projection - Tests")
+    print("=" * 60)
+
+    test_map_view_markers()
+    test_details_endpoint()
+    test_rpc_projection_fallback()
+
+    print("\n✅ All tests passed!")
@@ -0,0 +1,196 @@
+"""
+Test script for the incremental district market statistics
+Tests:
+1. Aggregates match a full recomputation (count, avg price, avg price/m², centroid)
+2. Listing updates, moves between districts and deletions are applied incrementally
+3. /api/market-stats serves single districts and city-wide lists
+4. Purpose spellings are grouped like normalized_purpose in the district_market_stats view
+"""
+import sys
+import os
+import random
+import asyncio
+
+# Add Backend to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import httpx
+
+from test_property_store import _random_rows
+
+
+def _expected(rows, city, district, purpose, property_type=None):
+    group = [r for r in rows if (r["city"], r["district"], r["purpose"]) == (city, district, purpose)
+             and (property_type is None or r["property_type"] == property_type)]
+    priced = [r for r in group if r["price_num"] is not None]
+    per_m2 = [r["price_num"] / r["area_m2"] for r in priced if r["area_m2"]]
+    located = [r for r in group if r["final_lat"] and r["final_lon"] is not None]
+    return {
+        "properties_count": len(group),
+        "avg_price": sum(r["price_num"] for r in priced) / len(priced) if priced else None,
+        "avg_price_per_m2": sum(per_m2) / len(per_m2) if per_m2 else None,
+        "avg_lat": sum(r["final_lat"] for r in located) / len(located) if located else None,
+    }
+
+
+def _assert_matches(stats, rows):
+    groups = {(r["city"], r["district"], r["purpose"], r["property_type"]) for r in rows}
+    checked = 0
+    for city, district, purpose, property_type in groups:
+        for type_filter in (property_type, None):
+            aggregate = stats.get(city, district, purpose, type_filter)
+            want = _expected(rows, city, district, purpose, type_filter)
+            got = aggregate.to_dict()
+            assert got["properties_count"] == want["properties_count"], (got, want)
+            for field in ("avg_price", "avg_price_per_m2", "avg_lat"):
+                if want[field] is None:
+                    assert got[field] is None, (field, got, want)
+                else:
+                    assert abs(got[field] - want[field]) < 0.01, (field, got[field], want[field])
+            checked += 1
+    return checked
+
+
+def _service(rows):
+    from property_store import PropertyStore
+    from market_stats import MarketStats
+
+    store = PropertyStore(updated_at_column=None)
+    stats = MarketStats(store)
+    store.subscribe(stats.on_property_changes)
+    store.build(rows)
+    return store, stats
+
+
+def test_aggregates_match_recomputation():
+    """Test the in-memory aggregates against a full recomputation"""
+    print("\n" + "=" * 60)
+    print("TEST 1: Aggregates vs recomputation")
+    print("=" * 60)
+
+    rows = _random_rows(3000, seed=21)
+    _, stats = _service(rows)
+    checked = _assert_matches(stats, rows)
+    assert stats.get("الرياض", "لا يوجد", "للبيع") is None
+    print(f"  ✅ {checked} district/type lookups match")
+
+
+def test_incremental_updates():
+    """Test updates and deletions are applied without a rebuild"""
+    print("\n" + "=" * 60)
+    print("TEST 2: Incremental updates")
+    print("=" * 60)
+
+    rows = _random_rows(2000, seed=22)
+    store, stats = _service(rows)
+    stats.ensure_loaded()
+    groups_before = id(stats._aggregates)
+
+    rng = random.Random(23)
+    changed = []
+    for row in rng.sample(rows, 300):
+        row = dict(row)
+        row["district"] = rng.choice(["النرجس", "الياسمين", "الملقا", "العليا", "حي جديد"])
+        row["price_num"] = rng.choice([None, float(rng.randint(20, 200) * 1000)])
+        row["area_m2"] = rng.choice([None, float(rng.randint(60, 600))])
+        changed.append(row)
+    store.apply_changes(changed)
+    assert id(stats._aggregates) == groups_before, "aggregates must be updated in place"
+
+    by_id = {r["id"]: r for r in rows}
+    by_id.update({r["id"]: r for r in changed})
+    current = list(by_id.values())
+    checked = _assert_matches(stats, current)
+
+    # حذف (إعادة تحميل كاملة بدون بعض الصفوف)
+    remaining = current[:1500]
+    store.build(remaining)
+    _assert_matches(stats, remaining)
+    print(f"  ✅ {len(changed)} updates + {len(current) - len(remaining)} deletions, {checked} lookups match")
+
+
+def test_market_stats_endpoint():
+    """Test single-district and list responses"""
+    print("\n" + "=" * 60)
+    print("TEST 3: /api/market-stats")
+    print("=" * 60)
+
+    from main import app
+    from market_stats import market_stats
+    from property_store import PropertyStore
+
+    rows = _random_rows(1000, seed=24)
+    original = market_stats.store
+    market_stats.store = PropertyStore(updated_at_column=None)
+    market_stats.store.build(rows)
+
+    async def fetch_all():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return (
+                await client.get("/api/market-stats", params={"purpose": "للبيع", "city": "الرياض"}),
+                await client.get("/api/market-stats", params={"purpose": "للبيع", "city": "الرياض",
+                                                              "district": "الملقا", "property_type": "شقق"}),
+                await client.get("/api/market-stats", params={"purpose": "بيع"}),
+            )
+
+    try:
+        listing, single, invalid = asyncio.run(fetch_all())
+    finally:
+        market_stats.store = original
+        market_stats._source = None
+
+    assert listing.status_code == 200, listing.text
+    districts = listing.json()["stats"]
+    assert {s["district"] for s in districts} == {"النرجس", "الياسمين", "الملقا", "العليا"}
+    values = [s["avg_price_per_m2"] for s in districts]
+    assert values == sorted(values, reverse=True)
+    want = _expected(rows, "الرياض", "الملقا", "للبيع")
+    malqa = next(s for s in districts if s["district"] == "الملقا")
+    assert malqa["properties_count"] == want["properties_count"]
+
+    assert len(single.json()["stats"]) == 1
+    assert single.json()["stats"][0]["properties_count"] == _expected(rows, "الرياض", "الملقا", "للبيع", "شقق")["properties_count"]
+    assert invalid.status_code == 422
+    print(f"  ✅ {len(districts)} districts, single lookup ok")
+
+
+def test_purpose_normalization():
+    """Test that spelling variants of a purpose share one aggregate"""
+    print("\n" + "=" * 60)
+    print("TEST 4: Normalized purpose")
+    print("=" * 60)
+
+    from market_stats import normalize_purpose
+
+    assert {normalize_purpose(p) for p in ("للبيع", "بيع", " للبيع ")} == {"بيع"}
+    assert {normalize_purpose(p) for p in ("للايجار", "للإيجار", "إيجار", "ايجار")} == {"إيجار"}
+
+    rows = _random_rows(600, seed=25)
+    spellings = {"للبيع": ["للبيع", "بيع"], "للايجار": ["للايجار", "للإيجار", "إيجار"]}
+    varied = [dict(r, purpose=spellings[r["purpose"]][i % len(spellings[r["purpose"]])]) for i, r in enumerate(rows)]
+    _, stats = _service(varied)
+
+    for purpose, query in (("للبيع", "بيع"), ("للايجار", "للإيجار")):
+        want = _expected(rows, "الرياض", "الملقا", purpose)
+        for spelling in (purpose, query):
+            assert stats.get("الرياض", "الملقا", spelling).to_dict()["properties_count"] == want["properties_count"]
+        listed = {s["district"]: s["properties_count"] for s in stats.districts(query, city="الرياض")}
+        assert listed["الملقا"] == want["properties_count"]
+    print("  ✅ spelling variants grouped under بيع / إيجار")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Market Stats - Tests")
+    print("=" * 60)
+
+    test_aggregates_match_recomputation()
+    test_incremental_updates()
+    test_market_stats_endpoint()
+    test_purpose_normalization()
+
+    print("\n✅ All tests passed!")
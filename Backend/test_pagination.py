@@ -0,0 +1,176 @@
+"""
+Test script for cursor (keyset) pagination
+Tests:
+1. Cursor round trip and rejection of tampered / foreign cursors
+2. EXACT pages walked with cursors equal the full ordered result (in-memory store path)
+3. SIMILAR pages move from the exact tier to the similar tier without re-running the embedding,
+   even when every page misses the search cache (other worker, expired TTL, cache disabled)
+"""
+import sys
+import os
+
+# Add Backend to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+from test_property_store import _random_rows
+
+
+def test_cursor_round_trip():
+    """Test encoding and validation"""
+    print("\n" + "=" * 60)
+    print("TEST 1: Cursor round trip")
+    print("=" * 60)
+
+    from pagination import Cursor, InvalidCursor, decode_cursor, encode_cursor, TIER_EXACT, TIER_SIMILAR
+
+    cursor = Cursor(TIER_EXACT, after=(120000.0, "00042"))
+    token = encode_cursor(cursor, "f" * 64)
+    assert decode_cursor(token, "f" * 64) == cursor
+    assert decode_cursor(None, "f" * 64) == Cursor()
+    similar = Cursor(TIER_SIMILAR, ranked=[("00007", 91), ("00003", 64)])
+    assert decode_cursor(encode_cursor(similar, "f" * 64), "f" * 64) == similar
+
+    for bad in ("not-a-cursor", token[:-3], encode_cursor(Cursor(TIER_SIMILAR), "f" * 64)):
+        try:
+            decode_cursor(bad, "f" * 64)
+            assert False, "tampered cursor accepted"
+        except InvalidCursor:
+            pass
+    try:
+        decode_cursor(token, "0" * 64)
+        assert False, "cursor from other criteria accepted"
+    except InvalidCursor:
+        pass
+    print(f"  ✅ {token} decodes back; tampered and foreign cursors rejected")
+
+
+def test_exact_pages_match_full_result():
+    """Test that walking pages reproduces the full ordering"""
+    print("\n" + "=" * 60)
+    print("TEST 2: EXACT keyset pages (in-memory store)")
+    print("=" * 60)
+
+    from config import settings
+    from models import PropertyCriteria, SearchMode
+    from property_store import property_store
+    from search_cache import search_cache
+    from search_engine import SearchEngine
+
+    rows = _random_rows(2000, seed=21)
+    # many equal prices so the id tie-breaker is exercised
+    for row in rows:
+        if row["price_num"] is not None:
+            row["price_num"] = float(round(row["price_num"], -4))
+    property_store.build(rows)
+    criteria = PropertyCriteria(purpose="للبيع", property_type="شقق", city="الرياض")
+    expected = [r["id"] for r in property_store.search(criteria, 10_000)]
+
+    engine = SearchEngine()
+    enabled = settings.PROPERTY_STORE_ENABLED
+    settings.PROPERTY_STORE_ENABLED = True
+    search_cache.clear()
+    try:
+        seen, cursor, pages = [], None, 0
+        while True:
+            page = engine.search_page(criteria, SearchMode.EXACT, cursor=cursor, page_size=25)
+            seen.extend(p.id for p in page.items)
+            pages += 1
+            if not page.has_more:
+                break
+            assert len(page.items) == 25
+            cursor = page.next_cursor
+    finally:
+        settings.PROPERTY_STORE_ENABLED = enabled
+        property_store._snapshot = None
+        search_cache.clear()
+
+    assert seen == expected, "paged ids differ from the full ordered result"
+    print(f"  ✅ {len(seen)} properties over {pages} pages, same order as a single query")
+
+
+def test_similar_pages_cross_tiers():
+    """Test exact -> similar tier transition"""
+    print("\n" + "=" * 60)
+    print("TEST 3: SIMILAR pages across tiers")
+    print("=" * 60)
+
+    import search_engine as se
+    from models import PropertyCriteria, SearchMode
+    from pagination import Cursor, TIER_EXACT
+
+    exact_rows = [{"id": f"e{i}", "purpose": "للبيع", "property_type": "شقق", "city": "الرياض",
+                   "final_lat": 24.8, "final_lon": 46.6, "price_num": 1000.0 * i} for i in range(3)]
+    similar_rows = [dict(r, id=f"s{i}", property_type="فلل") for i, r in enumerate(exact_rows * 2)]
+    embeddings = []
+
+    def query_exact(ctx, position, limit):
+        start = 0 if position.after is None else [r["id"] for r in exact_rows].index(position.after[1]) + 1
+        page = exact_rows[start:start + limit]
+        has_more = start + limit < len(exact_rows)
+        return page, Cursor(TIER_EXACT, after=(page[-1]["price_num"], page[-1]["id"])) if has_more else None
+
+    def embed(ctx):
+        embeddings.append(ctx.criteria.original_query)
+        return [0.1]
+
+    engine = se.SearchEngine()
+    engine._query_exact_tier = query_exact
+    engine._embed_query = embed
+    engine._similar_candidates = lambda ctx: [{"id": r["id"], "similarity": 0.8} for r in similar_rows + exact_rows[:1]]
+    listings = {r["id"]: r for r in similar_rows + exact_rows}
+    engine._rows_by_id = lambda ids: {i: dict(listings[i]) for i in ids if i in listings}
+
+    criteria = PropertyCriteria(purpose="للبيع", property_type="شقق", original_query="شقة للبيع")
+
+    def walk(clear_between_pages):
+        pages, cursor = [], None
+        while True:
+            page = engine.search_page(criteria, SearchMode.SIMILAR, cursor=cursor, page_size=2)
+            pages.append([(p.id, p.match_score) for p in page.items])
+            if not page.has_more:
+                return pages
+            cursor = page.next_cursor
+            if clear_between_pages:
+                # الصفحة التالية على worker آخر أو بعد انتهاء TTL
+                se.search_cache.clear()
+
+    se.search_cache.clear()
+    enabled = se.search_cache.enabled
+    try:
+        pages = walk(False)
+        ids = [pid for page in pages for pid, _ in page]
+        assert ids == ["e0", "e1", "e2", "s0", "s1", "s2", "s3", "s4", "s5"], ids
+        assert all(score == 100 for page in pages for pid, score in page if pid.startswith("e"))
+        assert all(score == 80 for page in pages for pid, score in page if pid.startswith("s"))
+        assert len(embeddings) == 1, f"embedding ran {len(embeddings)} times"
+
+        se.search_cache.clear()
+        assert walk(True) == pages and len(embeddings) == 2
+        se.search_cache.enabled = False
+        assert walk(False) == pages and len(embeddings) == 3
+
+        # عقار حُذف بين الصفحات يُتخطى بدون إعادة ترتيب
+        cursor = engine.search_page(criteria, SearchMode.SIMILAR, page_size=4).next_cursor
+        del listings["s1"]
+        page = engine.search_page(criteria, SearchMode.SIMILAR, cursor=cursor, page_size=2)
+        assert [p.id for p in page.items] == ["s2"] and len(embeddings) == 4
+    finally:
+        se.search_cache.enabled = enabled
+        se.search_cache.clear()
+    print(f"  ✅ {len(pages)} pages, one embedding per walk with or without the cache: {pages}")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Pagination - Unit Tests")
+    print("=" * 60)
+
+    test_cursor_round_trip()
+    test_exact_pages_match_full_result()
+    test_similar_pages_cross_tiers()
+
+    print("\n✅ All tests passed!")
@@ -0,0 +1,142 @@
+"""
+Test script for columnar binary search payloads
+Tests:
+1. Accept header negotiation (q-values, JSON preference, Arrow only when pyarrow is installed)
+2. MessagePack and Arrow round-trips reproduce the JSON response (float32 coordinates)
+3. /api/search answers with MessagePack when asked and JSON otherwise
+"""
+import sys
+import os
+import json
+import asyncio
+
+# Add Backend to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import httpx
+
+MSGPACK = "application/x-msgpack"
+ARROW = "application/vnd.apache.arrow.stream"
+
+
+def _assert_same(decoded, expected):
+    """Compare JSON-shaped payloads, allowing float32 rounding on coordinates"""
+    assert set(decoded) == set(expected), set(decoded) ^ set(expected)
+    for key, value in expected.items():
+        if key in ("properties", "markers") and value:
+            assert len(decoded[key]) == len(value)
+            for got, want in zip(decoded[key], value):
+                for field, v in want.items():
+                    if isinstance(v, float):
+                        assert abs(got[field] - v) < 1e-4, (field, got[field], v)
+                    else:
+                        assert got[field] == v, (field, got[field], v)
+        else:
+            assert decoded[key] == value, (key, decoded[key], value)
+
+
+def test_negotiation():
+    """Test Accept header parsing"""
+    print("\n" + "=" * 60)
+    print("TEST 1: Accept negotiation")
+    print("=" * 60)
+
+    import payload_encoding
+    from payload_encoding import negotiate
+
+    assert negotiate(None) is None
+    assert negotiate("*/*") is None
+    assert negotiate("application/json") is None
+    assert negotiate(MSGPACK) == MSGPACK
+    assert negotiate("application/msgpack") == MSGPACK
+    assert negotiate(f"application/json, {MSGPACK}") is None
+    assert negotiate(f"application/json;q=0.5, {MSGPACK}") == MSGPACK
+    assert negotiate(f"{MSGPACK};q=0") is None
+
+    has_arrow = payload_encoding._arrow() is not None
+    assert negotiate(f"{ARROW}, {MSGPACK};q=0.9") == (ARROW if has_arrow else MSGPACK)
+    print(f"  ✅ negotiation ok (pyarrow installed: {has_arrow})")
+
+
+def test_round_trips():
+    """Test decoded payloads match the JSON response"""
+    print("\n" + "=" * 60)
+    print("TEST 2: MessagePack / Arrow round-trips")
+    print("=" * 60)
+
+    import payload_encoding
+    from benchmark_payload_encoding import synthetic_response
+
+    for view in ("full", "map"):
+        response = synthetic_response(50, view)
+        if view == "full":
+            response.properties[3].price_num = None
+            response.properties[4].rooms = None
+        expected = json.loads(response.model_dump_json())
+
+        packed = payload_encoding.encode_msgpack(response)
+        _assert_same(payload_encoding.decode_msgpack(packed), expected)
+        columns = payload_encoding.decode_msgpack(packed, rows=False)
+        items = columns["markers" if view == "map" else "properties"]
+        assert items["final_lat"].dtype.str == "<f4" and len(items["id"]) == 50
+
+        sizes = f"json={len(response.model_dump_json())} msgpack={len(packed)}"
+        if payload_encoding._arrow() is not None:
+            arrow = payload_encoding.encode_arrow(response)
+            _assert_same(payload_encoding.decode_arrow(arrow), expected)
+            sizes += f" arrow={len(arrow)}"
+        assert len(packed) < len(response.model_dump_json())
+        print(f"  ✅ view={view}: {sizes} bytes")
+
+    empty = synthetic_response(0)
+    assert payload_encoding.decode_msgpack(payload_encoding.encode_msgpack(empty))["properties"] == []
+
+
+def test_search_endpoint():
+    """Test content negotiation on /api/search"""
+    print("\n" + "=" * 60)
+    print("TEST 3: /api/search content negotiation")
+    print("=" * 60)
+
+    import payload_encoding
+    from main import app
+    from search_engine import search_engine
+    from search_cache import search_cache
+
+    rows = [{"id": f"p{i}", "purpose": "للبيع", "property_type": "شقق", "city": "الرياض", "district": "حي الملقا",
+             "final_lat": 24.8, "final_lon": 46.6, "price_num": 1000.0 * (i + 1)} for i in range(10)]
+    body = {"mode": "exact", "criteria": {"purpose": "للبيع", "property_type": "شقق"}}
+
+    async def fetch(accept):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.post("/api/search", json=body, headers={"accept": accept})
+
+    search_engine._query_exact_tier = lambda ctx, position, limit: ([dict(r) for r in rows[:limit]], None)
+    search_cache.clear()
+    try:
+        as_json = asyncio.run(fetch("application/json"))
+        as_msgpack = asyncio.run(fetch(MSGPACK))
+    finally:
+        del search_engine._query_exact_tier
+        search_cache.clear()
+
+    assert as_json.headers["content-type"].startswith("application/json")
+    assert as_msgpack.headers["content-type"].startswith(MSGPACK)
+    _assert_same(payload_encoding.decode_msgpack(as_msgpack.content), as_json.json())
+    print(f"  ✅ json={len(as_json.content)} bytes, msgpack={len(as_msgpack.content)} bytes")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Columnar Payload Encoding - Tests")
+    print("=" * 60)
+
+    test_negotiation()
+    test_round_trips()
+    test_search_endpoint()
+
+    print("\n✅ All tests passed!")
@@ -0,0 +1,129 @@
+"""
+Test script for the in-memory POI index (schools / mosques / universities)
+Tests:
+1. Batched radius queries match brute-force haversine
+2. School gender / level filters
+3. Display-shaped results sorted by distance
+"""
+import sys
+import os
+import math
+import random
+
+# Add Backend to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+# The index reads its defaults from config.Settings
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+
+def _brute_force_distance(lat1, lon1, lat2, lon2):
+    """Reference haversine (same formula as Database._calculate_distance) in meters"""
+    r = 6371000.0
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) ** 2
+    return 2 * r * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def _random_rows(n, seed):
+    rng = random.Random(seed)
+    return [
+        {
+            "id": str(i),
+            "name": f"poi {i}",
+            "lat": 24.6 + rng.uniform(-0.2, 0.2),
+            "lon": 46.7 + rng.uniform(-0.2, 0.2),
+            "gender": rng.choice(["boys", "girls", "بنات"]),
+            "levels_pg_array": rng.choice(["{elementary}", "{middle,high}", "{kindergarten}", None]),
+        }
+        for i in range(n)
+    ]
+
+
+def test_batched_queries_match_brute_force():
+    """Test any_within against a brute-force scan"""
+    print("\n" + "=" * 60)
+    print("TEST 1: Batched radius queries vs brute force")
+    print("=" * 60)
+
+    from poi_index import POIIndex
+
+    mosques = _random_rows(800, seed=1)
+    index = POIIndex(cell_degrees=0.01)
+    index.build(schools=[], mosques=mosques, universities=[])
+
+    rng = random.Random(2)
+    points = [(24.6 + rng.uniform(-0.25, 0.25), 46.7 + rng.uniform(-0.25, 0.25)) for _ in range(200)]
+    lats = [p[0] for p in points]
+    lons = [p[1] for p in points]
+
+    for radius in (250.0, 1200.0, 7500.0):
+        result = index.any_within("mosques", lats, lons, radius)
+        expected = [
+            any(_brute_force_distance(lat, lon, m["lat"], m["lon"]) <= radius for m in mosques)
+            for lat, lon in points
+        ]
+        assert list(result) == expected, f"mismatch at radius {radius}"
+        print(f"  ✅ radius={radius:.0f}m: {sum(expected)}/{len(points)} points have a mosque nearby")
+
+
+def test_school_filters():
+    """Test gender and level filters"""
+    print("\n" + "=" * 60)
+    print("TEST 2: School gender / level filters")
+    print("=" * 60)
+
+    from poi_index import POIIndex
+
+    schools = [
+        {"id": "a", "name": "A", "lat": 24.70, "lon": 46.70, "gender": "girls", "levels_pg_array": "{elementary}"},
+        {"id": "b", "name": "B", "lat": 24.70, "lon": 46.70, "gender": "boys", "levels_pg_array": "{middle,high}"},
+    ]
+    index = POIIndex()
+    index.build(schools=schools, mosques=[], universities=[])
+
+    point = ([24.7005], [46.7005])
+    assert index.any_within("schools", *point, 500, gender="بنات", levels=["ابتدائي"])[0]
+    assert not index.any_within("schools", *point, 500, gender="girls", levels=["ثانوي"])[0]
+    assert index.any_within("schools", *point, 500, gender="boys", levels=["high"])[0]
+    assert index.any_within("schools", *point, 500)[0]
+    print("  ✅ gender and levels filters behave like get_nearby_schools")
+
+
+def test_nearby_display_results():
+    """Test display-shaped nearby results"""
+    print("\n" + "=" * 60)
+    print("TEST 3: Display results")
+    print("=" * 60)
+
+    from poi_index import POIIndex
+
+    universities = [
+        {"name_ar": "جامعة الملك سعود", "name_en": "King Saud University", "lat": 24.716, "lon": 46.619},
+        {"name_ar": "جامعة الأميرة نورة", "name_en": "PNU", "lat": 24.846, "lon": 46.725},
+    ]
+    index = POIIndex()
+    index.build(schools=[], mosques=[], universities=universities)
+
+    results = index.nearby("universities", 24.72, 46.63, 30000)
+    assert [r["name_ar"] for r in results] == ["جامعة الملك سعود", "جامعة الأميرة نورة"]
+    assert results[0]["distance_meters"] < results[1]["distance_meters"]
+
+    named = index.nearby("universities", 24.72, 46.63, 30000, name="جامعه الملك سعود")
+    assert len(named) == 1
+    print(f"  ✅ {len(results)} universities sorted by distance, name filter returned {len(named)}")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("POI Index - Unit Tests")
+    print("=" * 60)
+
+    test_batched_queries_match_brute_force()
+    test_school_filters()
+    test_nearby_display_results()
+
+    print("\n✅ All tests passed!")
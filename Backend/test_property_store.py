@@ -0,0 +1,272 @@
+"""
+Parity test for the in-memory columnar property store
+Tests:
+1. property_store.search returns exactly what the Supabase query path returns
+2. Incremental refresh (upserts) keeps parity and notifies listeners
+3. poll() re-reads rows at the watermark (gte) without re-applying unchanged ones
+
+The Supabase path is exercised through SearchEngine._query_properties against a
+small in-memory PostgREST emulator (eq / gte / lte / not.is / not.eq / order / limit
+with SQL NULL semantics), so no database connection is needed.
+"""
+import sys
+import os
+import random
+
+import numpy as np
+
+# Add Backend to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+
+class FakeQuery:
+    """Minimal PostgREST query builder over a list of dicts"""
+
+    def __init__(self, rows, negate=False, parent=None):
+        self._rows = rows
+        self._filters = [] if parent is None else parent._filters
+        self._order = [] if parent is None else parent._order
+        self._limit = None if parent is None else parent._limit
+        self._offset = 0 if parent is None else parent._offset
+        self._negate = negate
+
+    @property
+    def not_(self):
+        return FakeQuery(self._rows, negate=True, parent=self)
+
+    def _add(self, predicate):
+        if self._negate:
+            # NOT (NULL op x) is still NULL -> row excluded
+            self._filters.append(lambda r, p=predicate: p(r) is False)
+        else:
+            self._filters.append(lambda r, p=predicate: p(r) is True)
+        parent = FakeQuery(self._rows)
+        parent._filters, parent._order, parent._limit = self._filters, self._order, self._limit
+        parent._offset = self._offset
+        return parent
+
+    @staticmethod
+    def _cmp(row, column, op):
+        value = row.get(column)
+        return None if value is None else op(value)
+
+    def select(self, columns):
+        return self
+
+    def is_(self, column, value):
+        return self._add(lambda r: r.get(column) is None)
+
+    def eq(self, column, value):
+        return self._add(lambda r: self._cmp(r, column, lambda v: v == value))
+
+    def gte(self, column, value):
+        return self._add(lambda r: self._cmp(r, column, lambda v: v >= value))
+
+    def lte(self, column, value):
+        return self._add(lambda r: self._cmp(r, column, lambda v: v <= value))
+
+    def order(self, column):
+        self._order.append(column)
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def range(self, start, end):
+        self._offset, self._limit = start, end - start + 1
+        return self
+
+    def execute(self):
+        rows = [r for r in self._rows if all(f(r) for f in self._filters)]
+        for column in reversed(self._order):
+            # ASC NULLS LAST, stable so earlier keys win
+            rows.sort(key=lambda r: (r.get(column) is None, r.get(column) if r.get(column) is not None else 0))
+        rows = rows[self._offset:]
+        rows = rows[: self._limit] if self._limit is not None else rows
+
+        class Result:
+            data = [dict(r) for r in rows]
+        return Result()
+
+
+class FakeDB:
+    def __init__(self, rows):
+        rows_ref = rows
+
+        class Client:
+            def table(self, name):
+                return FakeQuery(rows_ref)
+        self.client = Client()
+
+
+def _random_rows(n, seed):
+    rng = random.Random(seed)
+    districts = ["النرجس", "الياسمين", "الملقا", "العليا", None]
+    rows = []
+    for i in range(n):
+        rows.append({
+            "id": f"{i:05d}",
+            "purpose": rng.choice(["للبيع", "للايجار"]),
+            "property_type": rng.choice(["شقق", "فلل", "دور"]),
+            "city": rng.choice(["الرياض", "الرياض", "جدة"]),
+            "district": rng.choice(districts),
+            "rooms": rng.choice([None, 1, 2, 3, 4, 5]),
+            "baths": rng.choice([None, 1, 2, 3]),
+            "halls": rng.choice([None, 1, 2]),
+            "area_m2": rng.choice([None, float(rng.randint(60, 600))]),
+            "price_num": rng.choice([None, float(rng.randint(20, 200) * 1000)]),
+            "final_lat": rng.choice([None, 0, 24.7 + rng.uniform(-0.1, 0.1)]),
+            "final_lon": 46.7,
+            "title": f"عقار {i}",
+        })
+    return rows
+
+
+def _random_criteria(rng):
+    from models import PropertyCriteria, IntRangeFilter, RangeFilter, PriceFilter
+
+    def maybe_int_range():
+        kind = rng.choice([None, "exact", "range"])
+        if kind == "exact":
+            return IntRangeFilter(exact=rng.randint(1, 5))
+        if kind == "range":
+            return IntRangeFilter(min=rng.choice([None, 1, 2]), max=rng.choice([None, 3, 4]))
+        return None
+
+    return PropertyCriteria(
+        purpose=rng.choice(["للبيع", "للايجار"]),
+        property_type=rng.choice(["شقق", "فلل", "دور", "استوديو"]),
+        city=rng.choice(["الرياض", "جدة", None]),
+        district=rng.choice([None, "النرجس", "الملقا", "حي غير موجود"]),
+        rooms=maybe_int_range(),
+        baths=maybe_int_range(),
+        halls=maybe_int_range(),
+        area_m2=rng.choice([None, RangeFilter(min=100), RangeFilter(min=80, max=300)]),
+        price=rng.choice([None, PriceFilter(max=100000), PriceFilter(min=50000, max=150000)]),
+    )
+
+
+def test_store_matches_supabase_path():
+    """Test store results against the PostgREST query path"""
+    print("\n" + "=" * 60)
+    print("TEST 1: Columnar store vs Supabase query path")
+    print("=" * 60)
+
+    from property_store import PropertyStore
+    from search_engine import SearchEngine
+
+    rows = _random_rows(3000, seed=7)
+    engine = SearchEngine()
+    engine.db = FakeDB(rows)
+
+    store = PropertyStore(updated_at_column=None)
+    store.build(rows)
+
+    rng = random.Random(11)
+    non_empty = 0
+    for _ in range(300):
+        criteria = _random_criteria(rng)
+        expected = [r["id"] for r in engine._query_properties(criteria, 30)]
+        actual = [r["id"] for r in store.search(criteria, 30)]
+        assert actual == expected, f"parity mismatch for {criteria.dict(exclude_none=True)}"
+        non_empty += bool(expected)
+
+    print(f"  ✅ 300 random criteria matched ({non_empty} with results)")
+
+
+def test_incremental_refresh():
+    """Test upserts keep parity and notify listeners"""
+    print("\n" + "=" * 60)
+    print("TEST 2: Incremental refresh")
+    print("=" * 60)
+
+    from property_store import PropertyStore
+    from search_engine import SearchEngine
+
+    rows = _random_rows(500, seed=3)
+    store = PropertyStore(updated_at_column="updated_at")
+    store.build(rows)
+
+    seen = []
+    store.subscribe(seen.extend)
+
+    changed = dict(rows[0], price_num=1.0, final_lat=24.7, purpose="للبيع", property_type="شقق", city="الرياض")
+    added = dict(rows[1], id="new-1", price_num=2.0, final_lat=24.7, purpose="للبيع", property_type="شقق", city="الرياض")
+    store.apply_changes([changed, added])
+
+    all_rows = [changed if r["id"] == changed["id"] else r for r in rows] + [added]
+    engine = SearchEngine()
+    engine.db = FakeDB(all_rows)
+
+    rng = random.Random(5)
+    for _ in range(100):
+        criteria = _random_criteria(rng)
+        assert [r["id"] for r in store.search(criteria, 30)] == [r["id"] for r in engine._query_properties(criteria, 30)]
+
+    assert len(seen) == 2 and seen[0][0]["id"] == changed["id"] and seen[1][0] is None
+
+    # الأعمدة المعدّلة في مكانها تطابق لقطة مبنية من الصفر
+    from property_store import _Snapshot
+    rebuilt = _Snapshot(all_rows)
+    snapshot = store._snapshot
+    assert snapshot.rows == rebuilt.rows and snapshot.position == rebuilt.position
+    for name in ("purpose", "property_type", "district", "city"):
+        decoded = [snapshot.dictionaries[name].values[c] for c in snapshot.codes[name]]
+        assert decoded == [r.get(name) for r in all_rows], name
+    for name, column in snapshot.numeric.items():
+        assert np.array_equal(column, rebuilt.numeric[name], equal_nan=True), name
+    assert np.array_equal(snapshot.has_location, rebuilt.has_location)
+    assert np.array_equal(snapshot.price_order, rebuilt.price_order)
+    print("  ✅ upserts applied and 2 changes delivered to listeners")
+
+
+def test_poll_at_watermark():
+    """Test that poll() uses gte on updated_at and skips rows it already has"""
+    print("\n" + "=" * 60)
+    print("TEST 3: Polling at the watermark")
+    print("=" * 60)
+
+    import database
+    from property_store import PropertyStore
+
+    rows = [dict(r, updated_at=f"2024-01-01T00:00:{i % 60:02d}") for i, r in enumerate(_random_rows(200, seed=9))]
+    store = PropertyStore(updated_at_column="updated_at")
+    store.build(rows)
+    watermark = store._watermark
+
+    seen = []
+    store.subscribe(seen.extend)
+    table = [dict(r) for r in rows]
+    original = database.db
+    try:
+        database.db = FakeDB(table)
+        store.poll()
+        assert seen == [], "rows already in the snapshot must not be re-applied"
+
+        # صف حُفظ بعد آخر سحب لكن بنفس الطابع الزمني للـ watermark
+        late = dict(table[5], price_num=1.0, updated_at=watermark)
+        table[5] = late
+        store.poll()
+        store.poll()
+        assert [new["id"] for _, new in seen] == [late["id"]]
+        assert store.rows()[store._snapshot.position[late["id"]]]["price_num"] == 1.0
+    finally:
+        database.db = original
+    print("  ✅ same-timestamp update picked up once, unchanged rows skipped")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Property Store - Parity Tests")
+    print("=" * 60)
+
+    test_store_matches_supabase_path()
+    test_incremental_refresh()
+    test_poll_at_watermark()
+
+    print("\n✅ All tests passed!")
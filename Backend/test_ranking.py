@@ -0,0 +1,183 @@
+"""
+Test script for the vectorized SIMILAR-tier ranking
+Tests:
+1. Vectorized scores match a per-row reference (weighted mean over available signals)
+2. argpartition top-k equals a full stable sort, ties included
+3. _build_similar_tier orders candidates by all signals and honours the configured weights
+"""
+import sys
+import os
+import math
+import random
+import time
+
+# Add Backend to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import numpy as np
+
+from test_property_store import _random_rows
+
+
+def _criteria(**overrides):
+    from models import PropertyCriteria
+
+    values = {"purpose": "للبيع", "property_type": "شقق", "district": "الملقا",
+              "price": {"min": 600000, "max": 900000}, "rooms": {"min": 3, "max": 4}, "area_m2": {"min": 150}}
+    values.update(overrides)
+    return PropertyCriteria(**values)
+
+
+def _reference_score(row, similarity, criteria, target, services, weights, tolerance, scale_km, service_tol):
+    """Per-row score written without NumPy"""
+    def fit(value, low, high):
+        if value is None:
+            return None
+        gap = 0.0
+        if low:
+            gap = max(gap, (low - value) / (low * tolerance))
+        if high:
+            gap = max(gap, (value - high) / (high * tolerance))
+        return min(max(1.0 - gap, 0.0), 1.0)
+
+    parts = {"vector": 0.7 if similarity is None else similarity,
+             "price": fit(row["price_num"], criteria.price.min, criteria.price.max),
+             "district": 1.0 if row["district"] == criteria.district else 0.0}
+    if row["final_lat"]:
+        lat1, lat2 = math.radians(row["final_lat"]), math.radians(target[0])
+        a = (math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2)
+             * math.sin(math.radians(target[1] - row["final_lon"]) / 2) ** 2)
+        parts["geo"] = math.exp(-2 * 6371000.0 * math.asin(math.sqrt(a)) / (scale_km * 1000))
+    fits = [f for f in (fit(row["rooms"], criteria.rooms.min, criteria.rooms.max),
+                        fit(row["area_m2"], criteria.area_m2.min, None)) if f is not None]
+    if fits:
+        parts["fit"] = sum(fits) / len(fits)
+    service = []
+    for minutes, limit in services:
+        if minutes <= limit:
+            service.append(1 - 0.5 * minutes / limit)
+        else:
+            service.append(0.5 * min(max(1 - (minutes - limit) / service_tol, 0.0), 1.0))
+    parts["services"] = sum(service) / len(service)
+
+    available = {k: v for k, v in parts.items() if v is not None}
+    total = sum(weights[k] for k in available)
+    return sum(weights[k] * v for k, v in available.items()) / total
+
+
+def test_scores_match_reference():
+    """Test every signal and the weighted combination against a scalar reference"""
+    print("\n" + "=" * 60)
+    print("TEST 1: Vectorized scores vs per-row reference")
+    print("=" * 60)
+
+    import ranking
+    from config import settings
+
+    rows = _random_rows(2000, seed=51)
+    rng = random.Random(52)
+    for row in rows:
+        row["rooms"] = rng.choice([None, 1, 2, 3, 4, 5, 6])
+    similarity = np.array([rng.choice([np.nan, rng.uniform(0.3, 1.0)]) for _ in rows])
+    mosque_minutes = np.array([rng.uniform(0, 20) for _ in rows])
+    school_minutes = np.array([rng.choice([np.inf, rng.uniform(0, 30)]) for _ in rows])
+    services = [(mosque_minutes, 10.0), (school_minutes, 15.0)]
+    criteria, target = _criteria(), (24.77, 46.62)
+
+    started = time.perf_counter()
+    scores = ranking.combine(ranking.signals(rows, criteria, similarity, target, services))
+    elapsed = (time.perf_counter() - started) * 1000
+
+    for i, row in enumerate(rows):
+        want = _reference_score(row, None if np.isnan(similarity[i]) else similarity[i], criteria, target,
+                                [(mosque_minutes[i], 10.0), (school_minutes[i], 15.0)], ranking.weights(),
+                                settings.RANK_RANGE_TOLERANCE, settings.RANK_GEO_SCALE_KM,
+                                settings.RANK_SERVICE_TOLERANCE_MINUTES)
+        assert abs(scores[i] - want) < 1e-9, (i, scores[i], want)
+    assert np.all((scores >= 0) & (scores <= 1))
+    print(f"  ✅ {len(rows)} candidates scored in {elapsed:.1f}ms, all match the reference")
+
+
+def test_top_k_matches_full_sort():
+    """Test argpartition selection against a stable full sort"""
+    print("\n" + "=" * 60)
+    print("TEST 2: top-k vs full sort")
+    print("=" * 60)
+
+    from ranking import top_k
+
+    rng = np.random.default_rng(53)
+    for n in (1, 7, 100, 5000):
+        # درجات مقرّبة حتى تكثر حالات التعادل
+        scores = np.round(rng.random(n), 2)
+        full = sorted(range(n), key=lambda i: (-scores[i], i))
+        for k in (1, 5, n // 2, n, n + 3):
+            assert list(top_k(scores, k)) == full[:k], (n, k)
+    assert top_k(np.array([]), 5).size == 0
+    print("  ✅ selection and order match for n in (1, 7, 100, 5000)")
+
+
+def test_similar_tier_ranking():
+    """Test ranking inside _build_similar_tier and the weights from Settings"""
+    print("\n" + "=" * 60)
+    print("TEST 3: SIMILAR tier ordering")
+    print("=" * 60)
+
+    from config import settings
+    from search_engine import SearchEngine
+    from search_pipeline import SearchContext
+
+    base = {"purpose": "للبيع", "property_type": "فلل", "city": "الرياض", "rooms": 3, "area_m2": 200.0,
+            "final_lat": 24.77, "final_lon": 46.62, "district": "الملقا"}
+    candidates = [
+        dict(base, id="far_pricey", price_num=2000000.0, final_lat=24.60, district="العليا"),
+        dict(base, id="in_range_other_district", price_num=800000.0, district="النرجس"),
+        dict(base, id="perfect", price_num=750000.0),
+        dict(base, id="no_price", price_num=None),
+    ]
+    similar = [{"id": "far_pricey", "similarity": 0.95}, {"id": "in_range_other_district", "similarity": 0.8},
+               {"id": "perfect", "similarity": 0.8}, {"id": "no_price"}]
+
+    def build():
+        ctx = SearchContext(_criteria())
+        ctx.shared("anchor", lambda: None)
+        ctx.shared("district_center", lambda: (24.77, 46.62))
+        ctx.results.update(similar=similar, details={c["id"]: dict(c) for c in candidates})
+        tier = SearchEngine()._build_similar_tier(ctx)
+        return [(p["id"], p["match_score"]) for p in tier], ctx
+
+    ranked, ctx = build()
+    assert [i for i, _ in ranked][:2] == ["perfect", "in_range_other_district"], ranked
+    assert ranked[-1][0] == "far_pricey" and all(score < 100 for _, score in ranked)
+    assert "ranking" in ctx.timings
+
+    weight_names = ("RANK_PRICE_WEIGHT", "RANK_GEO_WEIGHT", "RANK_FIT_WEIGHT", "RANK_SERVICE_WEIGHT",
+                    "RANK_DISTRICT_WEIGHT")
+    original = {name: getattr(settings, name) for name in weight_names}
+    try:
+        # التشابه الدلالي وحده: نفس ترتيب البحث المتجهي القديم
+        for name in weight_names:
+            setattr(settings, name, 0.0)
+        vector_only, _ = build()
+    finally:
+        for name, value in original.items():
+            setattr(settings, name, value)
+    assert vector_only == [("far_pricey", 95), ("in_range_other_district", 80), ("perfect", 80), ("no_price", 70)]
+    print(f"  ✅ all signals: {ranked}")
+    print(f"  ✅ vector only: {vector_only}")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Similar-Tier Ranking - Tests")
+    print("=" * 60)
+
+    test_scores_match_reference()
+    test_top_k_matches_full_sort()
+    test_similar_tier_ranking()
+
+    print("\n✅ All tests passed!")
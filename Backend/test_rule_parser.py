@@ -0,0 +1,229 @@
+"""
+Test script for the rule-based fast-path criteria parser
+Tests:
+1. Dialect synonyms, Arabic-Indic digits, number words, multipliers and place names
+2. Update phrases ("بدل"، "خله") merge into the previous criteria without an LLM call
+3. Unknown words lower the confidence and fall back to the LLM
+"""
+import sys
+import os
+import json
+import time
+
+# Add Backend to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+MOSQUES = [{"name": "جامع الراجحي", "lat": 24.690, "lon": 46.780}]
+PROPERTIES = [
+    {"district": "النرجس", "final_lat": 24.85, "final_lon": 46.65},
+    {"district": "الياسمين", "final_lat": 24.82, "final_lon": 46.64},
+    {"district": "الملقا", "final_lat": 24.78, "final_lon": 46.59},
+]
+
+
+def _with_gazetteer(test):
+    """تشغيل الاختبار مع دليل أماكن صغير بدلاً من قاعدة البيانات"""
+    import rule_parser as rule_parser_module
+    from gazetteer import Gazetteer
+
+    g = Gazetteer()
+    g.build([], MOSQUES, PROPERTIES)
+    original = rule_parser_module.gazetteer
+    try:
+        rule_parser_module.gazetteer = g
+        return test()
+    finally:
+        rule_parser_module.gazetteer = original
+
+
+class _FakeCompletions:
+    """OpenAI client يسجل الاستدعاءات ويرجع function call ثابتاً"""
+
+    def __init__(self, arguments):
+        self.arguments = arguments
+        self.calls = 0
+
+    def create(self, **kwargs):
+        from types import SimpleNamespace
+        self.calls += 1
+        call = SimpleNamespace(arguments=json.dumps(self.arguments, ensure_ascii=False))
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(function_call=call))])
+
+
+def _parser(arguments=None):
+    from types import SimpleNamespace
+    from llm_parser import LLMParser
+
+    parser = LLMParser()
+    completions = _FakeCompletions(arguments or {})
+    parser.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return parser, completions
+
+
+def test_new_search_rules():
+    """Test synonyms, digits, number words and multipliers"""
+    print("\n" + "=" * 60)
+    print("TEST 1: New search parsing")
+    print("=" * 60)
+
+    from rule_parser import RuleParser, tokenize
+
+    assert tokenize("٣غرف و50k") == ["3", "غرف", "و", "50", "k"]
+    assert tokenize("تاون هاوس ٤٠٠م²") == ["تاونهاوس", "400", "م"]
+
+    def run():
+        rules = RuleParser()
+        parsed = rules.parse("ابي شقة للإيجار في النرجس ٣ غرف")
+        assert parsed["confidence"] == 1.0
+        assert parsed["arguments"] == {
+            "action_type": "NEW_SEARCH", "property_type": "شقق", "purpose": "للايجار", "district": "النرجس",
+            "rooms": {"min": None, "max": None, "exact": 3},
+        }
+
+        args = rules.parse("شقه للاجار بحي الملقى بين ٣ و ٥ آلاف بالشهر غرفتين وحمامين")["arguments"]
+        assert args["district"] == "الملقا"
+        assert args["price"] == {"min": 3000.0, "max": 5000.0, "period": "شهري"}
+        assert args["rooms"]["exact"] == 2 and args["baths"]["exact"] == 2
+
+        args = rules.parse("ابغى فيلا للبيع مساحة 400 م2 اقل شي خمس غرف ميزانيتي ٢ مليون ونص")["arguments"]
+        assert args["property_type"] == "فلل" and args["purpose"] == "للبيع"
+        assert args["area_m2"] == {"min": 400.0, "max": None}
+        assert args["rooms"] == {"min": 5, "max": None, "exact": None}
+        assert args["price"] == {"max": 2500000.0}
+
+        # "اقل من"/"اكثر من" حدود غير شاملة للأعداد الصحيحة
+        assert rules.parse("شقة للايجار اقل من ٣ غرف")["arguments"]["rooms"] == {"min": None, "max": 2, "exact": None}
+        assert rules.parse("فيلا للبيع اكثر من اربع غرف")["arguments"]["rooms"] == {"min": 5, "max": None, "exact": None}
+
+        args = rules.parse("استوديو للايجار 50k سنوي")["arguments"]
+        assert args["price"] == {"max": 50000.0, "period": "سنوي"}
+
+        args = rules.parse("ابي فيلا للبيع قريب من جامعه الملك سعود ١٠ دقايق")["arguments"]
+        assert args["university_requirements"] == {
+            "required": True, "university_name": "جامعة الملك سعود", "max_distance_minutes": 10.0}
+
+        args = rules.parse("تاون هاوس للبيع قريب من مسجد الراجحي مشي")["arguments"]
+        assert args["property_type"] == "تاون هاوس"
+        assert args["mosque_requirements"] == {
+            "required": True, "mosque_name": "جامع الراجحي", "max_distance_minutes": 5, "walking": True}
+        return args
+
+    _with_gazetteer(run)
+    print("  ✅ types, purposes, digits, number words, k/ألف/مليون, districts and anchors parsed")
+
+
+def test_update_phrases():
+    """Test multi-turn edits handled without the LLM"""
+    print("\n" + "=" * 60)
+    print("TEST 2: Update phrases")
+    print("=" * 60)
+
+    from models import PropertyCriteria, IntRangeFilter, ActionType
+
+    previous = PropertyCriteria(purpose="للايجار", property_type="شقق", district="النرجس",
+                                rooms=IntRangeFilter(min=3))
+
+    def run():
+        parser, completions = _parser()
+
+        result = parser.extract_criteria("لا لخبطت، خلها اربع غرف بدل ثلاث", previous)
+        assert result.success and result.action_type == ActionType.UPDATE_CRITERIA
+        assert result.criteria.rooms == IntRangeFilter(exact=4)
+        assert result.criteria.district == "النرجس" and result.criteria.property_type.value == "شقق"
+
+        result = parser.extract_criteria("خلها في حي الياسمين بدل النرجس", previous)
+        assert result.criteria.district == "الياسمين" and result.criteria.rooms.min == 3
+        assert result.changes_summary == "تم تعديل الحي من النرجس إلى الياسمين"
+
+        result = parser.extract_criteria("غيرت رأيي، خله بيع مو إيجار", previous)
+        assert result.criteria.purpose.value == "للبيع"
+
+        result = parser.extract_criteria("زود الميزانية لـ ٥ آلاف", previous)
+        assert result.criteria.price.max == 5000 and result.criteria.district == "النرجس"
+
+        result = parser.extract_criteria("ابي قريب من مسجد بعد", previous)
+        assert result.criteria.mosque_requirements.required and result.criteria.rooms.min == 3
+
+        # رسالة جديدة كاملة بدون عبارة تعديل = بحث جديد
+        result = parser.extract_criteria("ابي فيلا للبيع في الملقا", previous)
+        assert result.action_type == ActionType.NEW_SEARCH and result.criteria.rooms is None
+
+        assert completions.calls == 0
+        return result
+
+    _with_gazetteer(run)
+    print("  ✅ بدل/خله/مو edits merged locally with no LLM call")
+
+
+def test_low_confidence_falls_back():
+    """Test that unknown words go to the LLM and known turns stay fast"""
+    print("\n" + "=" * 60)
+    print("TEST 3: Confidence and fallback")
+    print("=" * 60)
+
+    from config import settings
+    from models import PropertyCriteria
+    from rule_parser import rule_parser
+
+    def run():
+        parser, completions = _parser({"action_type": "NEW_SEARCH", "purpose": "للايجار", "property_type": "شقق",
+                                       "school_requirements": {"required": True, "gender": "بنات"}})
+
+        # شرط المدرسة لا تفهمه القواعد
+        parsed = rule_parser.parse("شقة للايجار قريبة من مدرسة بنات")
+        assert parsed["confidence"] < settings.RULE_PARSER_MIN_CONFIDENCE
+        result = parser.extract_criteria("شقة للايجار قريبة من مدرسة بنات")
+        assert completions.calls == 1 and result.criteria.school_requirements.required
+
+        # مدينة غير معروفة، ونقص النوع أو الغرض بدون طلب سابق
+        assert rule_parser.parse("ابي بيت للبيع في جدة")["confidence"] < settings.RULE_PARSER_MIN_CONFIDENCE
+        assert rule_parser.parse("خلها اربع غرف") == {"arguments": None, "confidence": 0.0}
+
+        # النفي خارج عبارة الاستبدال، والبدائل بـ"او": قيود لا تعبّر عنها الحقول
+        previous = PropertyCriteria(purpose="للايجار", property_type="شقق", district="النرجس")
+        for negated in ("شقة للايجار لا في الملقا", "لا في النرجس ولا الياسمين", "مو قريب من مسجد",
+                        "بس مو قريبة من جامعة الملك سعود", "مو في النرجس",
+                        "ابي شقة للايجار في حي النرجس ثلاث غرف مو قريب من مسجد",
+                        "في النرجس او الياسمين", "شقة للايجار في النرجس او الياسمين ثلاث غرف",
+                        "فيلا للبيع خمس او ست غرف"):
+            for context in (None, previous):
+                assert rule_parser.parse(negated, context)["confidence"] < settings.RULE_PARSER_MIN_CONFIDENCE, negated
+        parser.extract_criteria("ابي بيت للبيع في جدة")
+        assert completions.calls == 2
+
+        enabled = settings.RULE_PARSER_ENABLED
+        try:
+            settings.RULE_PARSER_ENABLED = False
+            parser.extract_criteria("ابي شقة للايجار في النرجس ٣ غرف")
+            assert completions.calls == 3
+        finally:
+            settings.RULE_PARSER_ENABLED = enabled
+
+        started = time.perf_counter()
+        for _ in range(200):
+            result = parser.extract_criteria("ابي شقة للايجار في النرجس ٣ غرف")
+        per_turn_ms = (time.perf_counter() - started) / 200 * 1000
+        assert completions.calls == 3 and result.success and result.criteria.rooms.exact == 3
+        assert per_turn_ms < 5, per_turn_ms
+        return per_turn_ms
+
+    per_turn_ms = _with_gazetteer(run)
+    stats = rule_parser.stats()
+    assert stats["handled"] >= 200 and stats["fallbacks"] >= 2
+    print(f"  ✅ fallback on low confidence, {per_turn_ms * 1000:.0f}µs per fast-path turn")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Rule-Based Criteria Parser - Tests")
+    print("=" * 60)
+
+    test_new_search_rules()
+    test_update_phrases()
+    test_low_confidence_falls_back()
+
+    print("\n✅ All tests passed!")
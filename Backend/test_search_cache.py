@@ -0,0 +1,219 @@
+"""
+Test script for the search result cache
+Tests:
+1. Canonical criteria keys (field order, whitespace, list order, EXACT ignores the query text)
+2. LRU eviction, TTL expiry and metrics
+3. Invalidation driven by property_store changes
+4. SIMILAR reuses the cached exact tier and repeated searches skip the database
+5. Default config (no property_store): the listing watcher's updated_at poll drives invalidation
+"""
+import sys
+import os
+import time
+
+# Add Backend to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+
+def _criteria(**overrides):
+    from models import PropertyCriteria
+    data = {"purpose": "للايجار", "property_type": "شقق", "district": "النرجس"}
+    data.update(overrides)
+    return PropertyCriteria(**data)
+
+
+def test_canonical_keys():
+    """Test that equivalent criteria share a key"""
+    print("\n" + "=" * 60)
+    print("TEST 1: Canonical criteria keys")
+    print("=" * 60)
+
+    from models import SearchMode, SchoolRequirements
+    from search_cache import criteria_fingerprint
+
+    a = _criteria(district=" النرجس ", rooms={"min": 3}, original_query="شقة للايجار في النرجس",
+                  school_requirements=SchoolRequirements(required=True, levels=["ابتدائي", "متوسط"]))
+    b = _criteria(rooms={"min": 3.0}, original_query="ابي شقة بالنرجس",
+                  school_requirements=SchoolRequirements(required=True, levels=["متوسط", "ابتدائي"]))
+
+    assert criteria_fingerprint(a, SearchMode.EXACT) == criteria_fingerprint(b, SearchMode.EXACT)
+    assert criteria_fingerprint(a, SearchMode.SIMILAR) != criteria_fingerprint(b, SearchMode.SIMILAR)
+    assert criteria_fingerprint(a, SearchMode.EXACT) != criteria_fingerprint(a, SearchMode.SIMILAR)
+    assert criteria_fingerprint(a, SearchMode.EXACT) != criteria_fingerprint(_criteria(rooms={"min": 4}), SearchMode.EXACT)
+    print("  ✅ equivalent criteria share a key; mode and filters change it")
+
+
+def test_lru_ttl_and_metrics():
+    """Test eviction, expiry and counters"""
+    print("\n" + "=" * 60)
+    print("TEST 2: LRU + TTL")
+    print("=" * 60)
+
+    from search_cache import SearchCache
+
+    cache = SearchCache(max_entries=2, ttl_seconds=0.2)
+    criteria = _criteria()
+    cache.put("a", [1], criteria)
+    cache.put("b", [2], criteria)
+    assert cache.get("a") == [1]          # a becomes most recent
+    cache.put("c", [3], criteria)         # evicts b
+    assert cache.get("b") is None
+    assert cache.get("c") == [3]
+    time.sleep(0.25)
+    assert cache.get("a") is None         # expired
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"], stats["expirations"]) == (2, 2, 1, 1)
+    assert stats["hit_rate"] == 0.5
+    print(f"  ✅ {stats}")
+
+
+def test_invalidation_on_listing_changes():
+    """Test that only affected entries are dropped"""
+    print("\n" + "=" * 60)
+    print("TEST 3: Invalidation from listing changes")
+    print("=" * 60)
+
+    from models import SearchMode
+    from property_store import PropertyStore
+    from search_cache import SearchCache
+
+    row = {"id": "1", "purpose": "للايجار", "property_type": "شقق", "city": "الرياض",
+           "district": "النرجس", "final_lat": 24.8, "final_lon": 46.6, "price_num": 50000.0}
+    store = PropertyStore(updated_at_column=None)
+    store.build([row])
+
+    cache = SearchCache()
+    store.subscribe(cache.on_property_changes)
+
+    rent = _criteria()
+    sale = _criteria(purpose="للبيع")
+    jeddah = _criteria(city="جدة")
+    for criteria in (rent, sale, jeddah):
+        cache.put(cache.key(criteria, SearchMode.EXACT), ["cached"], criteria)
+
+    store.apply_changes([dict(row, price_num=45000.0)])
+
+    assert cache.get(cache.key(rent, SearchMode.EXACT)) is None
+    assert cache.get(cache.key(sale, SearchMode.EXACT)) == ["cached"]
+    assert cache.get(cache.key(jeddah, SearchMode.EXACT)) == ["cached"]
+    assert cache.stats()["invalidations"] == 1
+    print("  ✅ only the entry covering the changed listing was dropped")
+
+
+def test_similar_reuses_exact_tier():
+    """Test exact-tier reuse and full result hits"""
+    print("\n" + "=" * 60)
+    print("TEST 4: SIMILAR reuses the cached exact tier")
+    print("=" * 60)
+
+    from models import SearchMode
+    from search_cache import search_cache
+    from search_engine import SearchEngine
+
+    calls = []
+
+    def query_exact(ctx, position, limit):
+        calls.append(ctx.criteria.district)
+        return [{"id": "1", "purpose": "للايجار", "property_type": "شقق", "district": "النرجس",
+                 "final_lat": 24.8, "final_lon": 46.6, "price_num": 50000.0}], None
+
+    engine = SearchEngine()
+    engine._query_exact_tier = query_exact
+    criteria = _criteria(district="حي اختبار الذاكرة")
+
+    search_cache.clear()
+    try:
+        exact = engine.search(criteria, SearchMode.EXACT)
+        similar = engine.search(criteria, SearchMode.SIMILAR)
+        again = engine.search(criteria, SearchMode.EXACT)
+    finally:
+        search_cache.clear()
+
+    assert len(calls) == 1, f"exact tier computed {len(calls)} times"
+    assert [p.id for p in exact] == [p.id for p in similar] == [p.id for p in again] == ["1"]
+    assert similar[0].match_score == 100
+    print("  ✅ exact tier computed once for EXACT + SIMILAR + repeated EXACT")
+
+
+def test_invalidation_without_property_store():
+    """Test the watcher wired to the global cache with PROPERTY_STORE_ENABLED off"""
+    print("\n" + "=" * 60)
+    print("TEST 5: Invalidation in the default config")
+    print("=" * 60)
+
+    import database
+    from config import settings
+    from models import SearchMode
+    from property_store import property_store
+    from search_cache import search_cache, listing_watcher
+    from test_property_store import FakeDB
+
+    class Database(FakeDB):
+        def fetch_all(self, table, columns="*", order_by=None):
+            return [dict(r) for r in self.rows]
+
+    assert not settings.PROPERTY_STORE_ENABLED and not property_store.is_loaded()
+    table = [{"id": "1", "purpose": "للايجار", "property_type": "شقق", "city": "الرياض",
+              "updated_at": "2024-01-01T00:00:00"},
+             {"id": "2", "purpose": "للبيع", "property_type": "فلل", "city": "الرياض",
+              "updated_at": "2024-01-01T00:00:00"}]
+    rent, sale, villas = _criteria(), _criteria(purpose="للبيع"), _criteria(purpose="للبيع", property_type="فلل")
+
+    def cache_all():
+        for criteria in (rent, sale, villas):
+            search_cache.put(search_cache.key(criteria, SearchMode.EXACT), ["cached"], criteria)
+
+    def cached():
+        return [search_cache.get(search_cache.key(c, SearchMode.EXACT)) is not None for c in (rent, sale, villas)]
+
+    original = database.db
+    search_cache.clear()
+    try:
+        database.db = Database(table)
+        database.db.rows = table
+        listing_watcher.refresh()
+        cache_all()
+        listing_watcher.refresh()
+        assert cached() == [True, True, True], "unchanged listings must not invalidate"
+
+        # تعديل سعر: يُلتقط بالسحب حسب updated_at
+        table[0] = dict(table[0], updated_at="2024-01-02T00:00:00")
+        listing_watcher.refresh()
+        assert cached() == [False, True, True]
+
+        # عقار ينتقل من الإيجار للبيع: يُحذف القطاع القديم والجديد
+        cache_all()
+        table[0] = dict(table[0], purpose="للبيع", updated_at="2024-01-03T00:00:00")
+        listing_watcher.refresh()
+        assert cached() == [False, False, True]
+
+        # الحذف يظهر عند إعادة التحميل الكاملة
+        cache_all()
+        del table[1]
+        listing_watcher._last_full_load = 0.0
+        listing_watcher.refresh()
+        assert cached() == [True, True, False]
+    finally:
+        database.db = original
+        listing_watcher._rows, listing_watcher._watermark = None, None
+        search_cache.clear()
+    print("  ✅ edits, segment moves and deletions invalidate the cache without property_store")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Search Cache - Unit Tests")
+    print("=" * 60)
+
+    test_canonical_keys()
+    test_lru_ttl_and_metrics()
+    test_invalidation_on_listing_changes()
+    test_similar_reuses_exact_tier()
+    test_invalidation_without_property_store()
+
+    print("\n✅ All tests passed!")
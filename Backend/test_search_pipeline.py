@@ -0,0 +1,193 @@
+"""
+Test script for the hybrid search stage scheduler
+Tests:
+1. Independent stages run concurrently and dependents wait for their inputs
+2. A failing stage falls back to its default without stopping the graph
+3. SIMILAR mode resolves the anchor once and its latency tracks the slowest branch
+
+Slow backends are simulated with time.sleep, so no database or model is needed.
+"""
+import sys
+import os
+import time
+import threading
+
+# Add Backend to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+
+def _sleep_then(seconds, value):
+    def stage(ctx):
+        time.sleep(seconds)
+        return value
+    return stage
+
+
+def test_independent_stages_overlap():
+    """Test concurrency and dependency order"""
+    print("\n" + "=" * 60)
+    print("TEST 1: Independent stages overlap")
+    print("=" * 60)
+
+    from search_pipeline import SearchContext, Stage, StageGraph
+
+    ctx = SearchContext(criteria=None)
+    started = time.perf_counter()
+    results = StageGraph([
+        Stage("a", _sleep_then(0.3, 1)),
+        Stage("b", _sleep_then(0.3, 2)),
+        Stage("c", _sleep_then(0.3, 3)),
+        Stage("sum", lambda ctx: ctx.results["a"] + ctx.results["b"] + ctx.results["c"], deps=("a", "b", "c")),
+    ]).run(ctx)
+    elapsed = time.perf_counter() - started
+
+    assert results["sum"] == 6
+    assert elapsed < 0.6, f"three 0.3s stages took {elapsed:.2f}s"
+    assert set(ctx.timings) >= {"a", "b", "c", "sum", "total"}
+    print(f"  ✅ 3 x 0.3s stages + dependent finished in {elapsed:.2f}s, timings={ctx.timings}")
+
+
+def test_failed_stage_uses_default():
+    """Test stage failure isolation"""
+    print("\n" + "=" * 60)
+    print("TEST 2: Failed stage default")
+    print("=" * 60)
+
+    from search_pipeline import SearchContext, Stage, StageGraph
+
+    def broken(ctx):
+        raise RuntimeError("rpc down")
+
+    ctx = SearchContext(criteria=None)
+    results = StageGraph([
+        Stage("vector", broken, default=[]),
+        Stage("merge", lambda ctx: len(ctx.results["vector"]), deps=("vector",)),
+    ]).run(ctx)
+
+    assert results == {"vector": [], "merge": 0}
+    assert "vector" in ctx.errors
+    print("  ✅ failing stage returned its default and the dependent still ran")
+
+
+class _SlowResult:
+    def __init__(self, data):
+        self.data = data
+
+
+class _SlowRPC:
+    def __init__(self, name, calls):
+        self.name = name
+        self.calls = calls
+
+    def select(self, columns):
+        return self
+
+    def range(self, start, end):
+        return self
+
+    def execute(self):
+        self.calls.append(self.name)
+        if self.name == "search_properties_nearby":
+            time.sleep(0.2)
+            return _SlowResult([_row("e1"), _row("e2")])
+        time.sleep(0.1)
+        return _SlowResult([{"id": "e1", "similarity": 0.9}, {"id": "s1", "similarity": 0.8}])
+
+
+class _DetailsQuery:
+    def select(self, columns):
+        return self
+
+    def in_(self, column, ids):
+        self.ids = ids
+        return self
+
+    def execute(self):
+        time.sleep(0.05)
+        return _SlowResult([_row(i) for i in self.ids])
+
+
+def _row(property_id):
+    # similar-only rows sit outside the mosque radius so they are not exact-tier members
+    lat = 24.8 if property_id.startswith("e") else 24.9
+    return {"id": property_id, "purpose": "للبيع", "property_type": "شقق", "city": "الرياض",
+            "district": "النرجس", "final_lat": lat, "final_lon": 46.6, "price_num": 100000.0}
+
+
+def test_similar_mode_runs_branches_concurrently():
+    """Test the SIMILAR pipeline end to end with slow fakes"""
+    print("\n" + "=" * 60)
+    print("TEST 3: SIMILAR mode pipeline")
+    print("=" * 60)
+
+    import search_engine as se
+    from models import PropertyCriteria, MosqueRequirements, SearchMode
+    from search_pipeline import SearchContext
+
+    calls = []
+    lookups = []
+    lock = threading.Lock()
+
+    class Client:
+        def rpc(self, name, params):
+            return _SlowRPC(name, calls)
+
+        def table(self, name):
+            return _DetailsQuery()
+
+    class DB:
+        client = Client()
+
+    def slow_location(name, table):
+        with lock:
+            lookups.append(name)
+        time.sleep(0.2)
+        return (24.8, 46.6)
+
+    def slow_embedding(text):
+        time.sleep(0.4)
+        return [0.1] * 8
+
+    engine = se.SearchEngine()
+    engine.db = DB()
+    engine._get_entity_location = slow_location
+    original_generate = se.embedding_generator.generate
+    se.embedding_generator.generate = slow_embedding
+
+    criteria = PropertyCriteria(
+        purpose="للبيع", property_type="شقق", city="الرياض",
+        mosque_requirements=MosqueRequirements(mosque_name="جامع الراجحي"),
+        original_query="شقة قريبة من جامع الراجحي",
+    )
+    ctx = SearchContext(criteria)
+    try:
+        started = time.perf_counter()
+        properties = engine.search(criteria, SearchMode.SIMILAR, ctx)
+        elapsed = time.perf_counter() - started
+    finally:
+        se.embedding_generator.generate = original_generate
+        se.search_cache.clear()
+
+    # anchor 0.2 -> exact 0.2  ||  embedding 0.4 -> vector 0.1 -> details 0.05
+    # sequential (with the old duplicate anchor lookup) would be ~1.15s
+    assert [p.id for p in properties] == ["e1", "e2", "s1"]
+    assert lookups == ["جامع الراجحي"], f"anchor resolved {len(lookups)} times"
+    assert elapsed < 0.85, f"SIMILAR search took {elapsed:.2f}s"
+    assert {"anchor", "exact", "embedding", "similar", "details", "total"} <= set(ctx.timings)
+    print(f"  ✅ {len(properties)} results in {elapsed:.2f}s, anchor looked up once, timings={ctx.timings}")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Search Pipeline - Scheduler Tests")
+    print("=" * 60)
+
+    test_independent_stages_overlap()
+    test_failed_stage_uses_default()
+    test_similar_mode_runs_branches_concurrently()
+
+    print("\n✅ All tests passed!")
@@ -0,0 +1,174 @@
+"""
+Test script for streaming search responses
+Tests:
+1. The exact tier is emitted before the slow similar stages finish, similar rows follow in batches
+2. /api/search/stream speaks NDJSON by default and SSE when asked, ending with a summary message
+3. The similar stages only run on the page where the exact tier ends
+"""
+import sys
+import os
+import json
+import time
+import asyncio
+from contextlib import contextmanager
+
+# Add Backend to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import httpx
+
+SLOW_EMBEDDING_SECONDS = 0.6
+
+EXACT_ROWS = [{"id": f"e{i}", "purpose": "للبيع", "property_type": "شقق", "city": "الرياض",
+               "final_lat": 24.8, "final_lon": 46.6, "price_num": 1000.0 * i} for i in range(3)]
+SIMILAR_ROWS = [dict(r, id=f"s{i}", property_type="فلل") for i, r in enumerate(EXACT_ROWS * 4)]
+
+SEARCH_BODY = {
+    "mode": "similar",
+    "page_size": 20,
+    "criteria": {"purpose": "للبيع", "property_type": "شقق", "original_query": "شقة للبيع"},
+}
+
+
+@contextmanager
+def _fake_backends(engine):
+    """Fast exact tier, slow embedding, canned vector hits"""
+    from search_cache import search_cache
+
+    def slow_embed(ctx):
+        time.sleep(SLOW_EMBEDDING_SECONDS)
+        return [0.1]
+
+    engine._query_exact_tier = lambda ctx, position, limit: (EXACT_ROWS[:limit], None)
+    engine._embed_query = slow_embed
+    engine._similar_candidates = lambda ctx: [{"id": r["id"], "similarity": 0.75} for r in SIMILAR_ROWS]
+    engine._fetch_details = lambda ctx: {r["id"]: dict(r) for r in SIMILAR_ROWS}
+    search_cache.clear()
+    try:
+        yield engine
+    finally:
+        for name in ("_query_exact_tier", "_embed_query", "_similar_candidates", "_fetch_details"):
+            delattr(engine, name)
+        search_cache.clear()
+
+
+def test_exact_tier_arrives_first():
+    """Test event order and time to first event"""
+    print("\n" + "=" * 60)
+    print("TEST 1: Exact tier first, similar in batches")
+    print("=" * 60)
+
+    from models import PropertyCriteria, SearchMode
+    from search_engine import SearchEngine
+
+    criteria = PropertyCriteria(**SEARCH_BODY["criteria"])
+
+    async def collect(engine):
+        started = time.perf_counter()
+        events = []
+        async for event in engine.search_stream(criteria, SearchMode.SIMILAR, page_size=20, batch_size=5):
+            events.append((time.perf_counter() - started, event))
+        return events
+
+    with _fake_backends(SearchEngine()) as engine:
+        events = asyncio.run(collect(engine))
+
+    kinds = [e["event"] for _, e in events]
+    assert kinds == ["exact", "similar", "similar", "similar", "summary"], kinds
+    first_at = events[0][0]
+    assert first_at < SLOW_EMBEDDING_SECONDS / 2, f"exact tier took {first_at:.2f}s"
+    assert events[1][0] >= SLOW_EMBEDDING_SECONDS * 0.9
+
+    ids = [p.id for _, e in events if e["event"] != "summary" for p in e["properties"]]
+    assert ids == [r["id"] for r in EXACT_ROWS + SIMILAR_ROWS]
+    assert all(p.match_score == 75 for _, e in events if e["event"] == "similar" for p in e["properties"])
+    summary = events[-1][1]
+    assert summary["total_count"] == 15 and not summary["has_more"]
+    print(f"  ✅ exact tier after {first_at * 1000:.0f}ms, similar batches after "
+          f"{events[1][0] * 1000:.0f}ms, summary={summary['total_count']} properties")
+
+
+def test_stream_endpoint_formats():
+    """Test NDJSON and SSE framing"""
+    print("\n" + "=" * 60)
+    print("TEST 2: NDJSON and SSE endpoint")
+    print("=" * 60)
+
+    from main import app
+    from search_engine import search_engine
+
+    async def fetch(headers):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.post("/api/search/stream", json=SEARCH_BODY, headers=headers)
+
+    with _fake_backends(search_engine):
+        ndjson = asyncio.run(fetch({}))
+        sse = asyncio.run(fetch({"accept": "text/event-stream"}))
+
+    assert ndjson.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in ndjson.text.splitlines() if line]
+    assert [l["event"] for l in lines][0] == "exact" and lines[-1]["event"] == "summary"
+    assert lines[-1]["message"] and lines[-1]["total_count"] == 15
+
+    assert sse.headers["content-type"].startswith("text/event-stream")
+    blocks = [b for b in sse.text.split("\n\n") if b]
+    assert blocks[0].startswith("event: exact\ndata: ")
+    assert blocks[-1].startswith("event: summary\ndata: ")
+    print(f"  ✅ NDJSON {len(lines)} lines, SSE {len(blocks)} events")
+
+
+def test_similar_tier_only_when_consumed():
+    """Test that exact pages with a next page never start the similar stages"""
+    print("\n" + "=" * 60)
+    print("TEST 3: Similar tier started only when needed")
+    print("=" * 60)
+
+    from models import PropertyCriteria, SearchMode
+    from pagination import Cursor, TIER_EXACT
+    from search_engine import SearchEngine
+
+    criteria = PropertyCriteria(**SEARCH_BODY["criteria"])
+    embeddings = []
+
+    def query_exact(ctx, position, limit):
+        start = 0 if position.after is None else [r["id"] for r in EXACT_ROWS].index(position.after[1]) + 1
+        page = EXACT_ROWS[start:start + limit]
+        more = start + limit < len(EXACT_ROWS)
+        return page, Cursor(TIER_EXACT, after=(page[-1]["price_num"], page[-1]["id"])) if more else None
+
+    async def walk(engine):
+        pages, cursor = [], None
+        while True:
+            events = [e async for e in engine.search_stream(criteria, SearchMode.SIMILAR, cursor=cursor, page_size=2)]
+            pages.append(([p.id for e in events[:-1] for p in e["properties"]], len(embeddings)))
+            if not events[-1]["has_more"]:
+                return pages
+            cursor = events[-1]["next_cursor"]
+
+    with _fake_backends(SearchEngine()) as engine:
+        engine._query_exact_tier = query_exact
+        engine._embed_query = lambda ctx: embeddings.append(ctx) or [0.1]
+        engine._rows_by_id = lambda ids: {r["id"]: dict(r) for r in SIMILAR_ROWS if r["id"] in ids}
+        pages = asyncio.run(walk(engine))
+
+    ids = [pid for page, _ in pages for pid in page]
+    assert ids == [r["id"] for r in EXACT_ROWS + SIMILAR_ROWS], ids
+    # الصفحة الأولى كلها من المطابق: بدون embedding؛ الثانية تنهي المطابق وتبني المشابه مرة واحدة
+    assert [n for _, n in pages] == [0] + [1] * (len(pages) - 1), pages
+    print(f"  ✅ {len(pages)} pages, embedding ran once on the page where the exact tier ended")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Streaming Search - Tests")
+    print("=" * 60)
+
+    test_exact_tier_arrives_first()
+    test_stream_endpoint_formats()
+    test_similar_tier_only_when_consumed()
+
+    print("\n✅ All tests passed!")
@@ -0,0 +1,250 @@
+"""
+Test script for the road-network travel-time engine
+Tests:
+1. Multi-source grid times match a per-point Dijkstra reference (drive with one-way streets, walk)
+2. OSM XML parsing (one-way, maxspeed, non-walkable roads) and .npz round trip
+3. Search filters, anchor post-filter and display minutes use network times
+"""
+import sys
+import os
+import heapq
+import random
+import tempfile
+
+# Add Backend to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+import numpy as np
+
+
+def _lattice(size, seed):
+    """Square street lattice (~165 m blocks) with mixed speeds and some one-way streets"""
+    from poi_index import haversine_meters
+    from travel_time import RoadNetwork, DRIVE, WALK
+
+    rng = random.Random(seed)
+    idx = lambda i, j: i * size + j
+    lats = np.array([24.70 + i * 0.0015 for i in range(size) for j in range(size)])
+    lons = np.array([46.70 + j * 0.0015 for i in range(size) for j in range(size)])
+
+    drive, walk = ([], [], []), ([], [], [])
+    for i in range(size):
+        for j in range(size):
+            for ni, nj in ((i, j + 1), (i + 1, j)):
+                if ni >= size or nj >= size:
+                    continue
+                a, b = idx(i, j), idx(ni, nj)
+                meters = float(haversine_meters(lats[a], lons[a], lats[b], lons[b]))
+                speed = rng.choice([25.0, 40.0, 60.0])
+                pairs = [(a, b)] if rng.random() < 0.3 else [(a, b), (b, a)]
+                for s, d in pairs:
+                    drive[0].append(s); drive[1].append(d); drive[2].append(meters / (speed / 3.6))
+                for s, d in ((a, b), (b, a)):
+                    walk[0].append(s); walk[1].append(d); walk[2].append(meters / (5.0 / 3.6))
+
+    edges = {mode: tuple(np.array(x) for x in arrays) for mode, arrays in ((DRIVE, drive), (WALK, walk))}
+    return RoadNetwork(lats, lons, edges)
+
+
+def _reference_dijkstra(network, mode, origin):
+    src, dst, seconds = network.edges[mode]
+    adjacency = {}
+    for s, d, w in zip(src, dst, seconds):
+        adjacency.setdefault(int(s), []).append((int(d), float(w)))
+    dist = {origin: 0.0}
+    heap = [(0.0, origin)]
+    while heap:
+        d, node = heapq.heappop(heap)
+        if d > dist.get(node, np.inf):
+            continue
+        for nxt, w in adjacency.get(node, []):
+            if d + w < dist.get(nxt, np.inf):
+                dist[nxt] = d + w
+                heapq.heappush(heap, (d + w, nxt))
+    return dist
+
+
+def _reference_snap(engine, network, mode, lat, lon):
+    """Nearest network node by brute force, plus access seconds"""
+    from travel_time import ACCESS_SPEED_KMH
+
+    xy = engine._project(network.node_lat, network.node_lon)
+    meters = np.hypot(*(xy - engine._project([lat], [lon])).T)
+    node = int(np.argmin(meters))
+    return node, meters[node] / (ACCESS_SPEED_KMH[mode] / 3.6)
+
+
+def _engine(network, mosques=(), universities=(), grid_meters=100.0, max_snap_meters=300.0):
+    from poi_index import POIIndex
+    from travel_time import TravelTimeEngine
+
+    pois = POIIndex()
+    pois.build(schools=[], mosques=list(mosques), universities=list(universities))
+    engine = TravelTimeEngine(pois, network_path="unused.npz", grid_meters=grid_meters,
+                              max_snap_meters=max_snap_meters)
+    engine.build(network)
+    return engine
+
+
+def test_grid_times_match_reference():
+    """Test multi-source Dijkstra grid lookups against per-point Dijkstra"""
+    print("\n" + "=" * 60)
+    print("TEST 1: Grid times vs per-point Dijkstra")
+    print("=" * 60)
+
+    from travel_time import DRIVE, WALK
+
+    network = _lattice(20, seed=41)
+    rng = random.Random(42)
+    mosques = [{"id": str(i), "name": f"m{i}", "lat": 24.70 + rng.uniform(0, 0.0285),
+                "lon": 46.70 + rng.uniform(0, 0.0285)} for i in range(12)]
+    engine = _engine(network, mosques=mosques)
+    g = engine._grid
+
+    points = [(24.70 + rng.uniform(0, 0.0285), 46.70 + rng.uniform(0, 0.0285)) for _ in range(40)]
+    lats, lons = np.array([p[0] for p in points]), np.array([p[1] for p in points])
+
+    for mode in (DRIVE, WALK):
+        got = engine.minutes_to_nearest("mosques", lats, lons, mode)
+        poi_nodes = [_reference_snap(engine, network, mode, m["lat"], m["lon"]) for m in mosques]
+        for (lat, lon), minutes in zip(points, got):
+            cell_lat = g["lat0"] + (np.floor((lat - g["lat0"]) / g["dlat"]) + 0.5) * g["dlat"]
+            cell_lon = g["lon0"] + (np.floor((lon - g["lon0"]) / g["dlon"]) + 0.5) * g["dlon"]
+            origin, access = _reference_snap(engine, network, mode, cell_lat, cell_lon)
+            dist = _reference_dijkstra(network, mode, origin)
+            want = (access + min(dist.get(n, np.inf) + a for n, a in poi_nodes)) / 60.0
+            assert abs(minutes - want) < 0.01, (mode, minutes, want)
+
+        # موقع واحد بحد زمني: نفس القيم داخل الحد وinf بعده
+        anchor, limit = mosques[0], 4.0 if mode == DRIVE else 12.0
+        to_anchor = engine.minutes_to_point(anchor["lat"], anchor["lon"], lats, lons, mode, limit_minutes=limit)
+        single = _engine(network, mosques=[anchor]).minutes_to_nearest("mosques", lats, lons, mode)
+        inside = single <= limit - 0.1
+        assert inside.any() and np.allclose(to_anchor[inside], single[inside], atol=0.01)
+        assert np.all(to_anchor[single > limit + 0.1] == np.inf)
+        print(f"  ✅ {mode}: {len(points)} points match, {int(inside.sum())} within {limit:.0f} min of one mosque")
+
+
+OSM_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+  <node id="1" lat="24.7000" lon="46.7000"/>
+  <node id="2" lat="24.7000" lon="46.7100"/>
+  <node id="3" lat="24.7100" lon="46.7100"/>
+  <node id="4" lat="24.7100" lon="46.7000"/>
+  <node id="5" lat="24.7200" lon="46.7000"/>
+  <way id="10"><nd ref="1"/><nd ref="2"/><tag k="highway" v="primary"/><tag k="oneway" v="yes"/><tag k="maxspeed" v="80"/></way>
+  <way id="11"><nd ref="2"/><nd ref="3"/><nd ref="4"/><tag k="highway" v="residential"/></way>
+  <way id="12"><nd ref="4"/><nd ref="1"/><tag k="highway" v="footway"/></way>
+  <way id="13"><nd ref="4"/><nd ref="5"/><tag k="highway" v="motorway"/></way>
+  <way id="14"><nd ref="1"/><nd ref="5"/><tag k="building" v="yes"/></way>
+</osm>
+"""
+
+
+def test_osm_parsing_and_npz_round_trip():
+    """Test road classes, one-way handling and the compact file format"""
+    print("\n" + "=" * 60)
+    print("TEST 2: OSM parsing + .npz round trip")
+    print("=" * 60)
+
+    from travel_time import RoadNetwork, DRIVE, WALK
+
+    with tempfile.TemporaryDirectory() as tmp:
+        osm_path = os.path.join(tmp, "roads.osm")
+        with open(osm_path, "w", encoding="utf-8") as f:
+            f.write(OSM_XML)
+        network = RoadNetwork.load(osm_path)
+        npz_path = os.path.join(tmp, "roads.npz")
+        network.save(npz_path)
+        loaded = RoadNetwork.load(npz_path)
+
+    assert len(network) == 5
+    drive = {(int(s), int(d)): w for s, d, w in zip(*network.edges[DRIVE])}
+    walk = {(int(s), int(d)) for s, d in zip(*network.edges[WALK][:2])}
+    # 1→2 اتجاه واحد بسرعة 80، 2↔3↔4 سكني، 4→5 طريق سريع (اتجاه واحد، لا مشي)، الممشى للمشي فقط
+    assert (0, 1) in drive and (1, 0) not in drive
+    assert abs(drive[(0, 1)] - 1011.4 / (80 / 3.6)) < 1.0, drive[(0, 1)]
+    assert {(1, 2), (2, 1), (2, 3), (3, 2), (3, 4)} <= set(drive) and (4, 3) not in drive
+    assert (3, 0) not in drive and {(3, 0), (0, 3)} <= walk
+    assert (3, 4) not in walk and (4, 3) not in walk
+    for mode in (DRIVE, WALK):
+        assert np.allclose(network.forward[mode].toarray(), loaded.forward[mode].toarray(), atol=1e-2)
+    print(f"  ✅ {len(drive)} drive edges, {len(walk)} walk edges, round trip ok")
+
+
+def test_search_uses_network_times():
+    """Test service filters, anchor filtering and display minutes with the engine enabled"""
+    print("\n" + "=" * 60)
+    print("TEST 3: Search integration")
+    print("=" * 60)
+
+    import search_engine as search_module
+    from config import settings
+    from poi_index import haversine_meters
+    from travel_time import RoadNetwork, DRIVE, WALK
+
+    # طريق سريع شرق-غرب (100 كم/س) وشارع معزول شمال الجامعة بلا اتصال
+    highway_lons = np.arange(46.60, 46.7801, 0.002)
+    street_lons = np.arange(46.77, 46.7901, 0.002)
+    lats = np.concatenate([np.full(highway_lons.size, 24.70), np.full(street_lons.size, 24.73)])
+    lons = np.concatenate([highway_lons, street_lons])
+    src, dst, seconds = [], [], []
+    for start, count, speed in ((0, highway_lons.size, 100.0), (highway_lons.size, street_lons.size, 25.0)):
+        for a in range(start, start + count - 1):
+            meters = float(haversine_meters(lats[a], lons[a], lats[a + 1], lons[a + 1]))
+            src += [a, a + 1]; dst += [a + 1, a]; seconds += [meters / (speed / 3.6)] * 2
+    edges = {mode: (np.array(src), np.array(dst), np.array(seconds)) for mode in (DRIVE, WALK)}
+    university = {"name_ar": "جامعة الاختبار", "name_en": "Test University", "lat": 24.70, "lon": 46.78}
+    engine = _engine(RoadNetwork(lats, lons, edges), universities=[university], grid_meters=200.0,
+                     max_snap_meters=500.0)
+
+    properties = [
+        {"id": "highway", "final_lat": 24.70, "final_lon": 46.60},    # 18 كم بالطريق السريع (~11 دقيقة)
+        {"id": "isolated", "final_lat": 24.73, "final_lon": 46.78},   # 3.3 كم مباشرة لكن بلا طريق
+        {"id": "off_grid", "final_lat": 24.70, "final_lon": 46.83},   # بلا طريق قريب: دائرة السرعة الثابتة
+    ]
+    lats_p = np.array([p["final_lat"] for p in properties])
+    lons_p = np.array([p["final_lon"] for p in properties])
+
+    original = (search_module.travel_time_engine, search_module.poi_index, settings.TRAVEL_TIME_ENABLED)
+    search = search_module.search_engine
+    try:
+        # فهرس الخدمات العام غير محمّل في الاختبار: نستخدم فهرس المحرك للدائرة أيضاً
+        search_module.travel_time_engine, search_module.poi_index = engine, engine.pois
+        settings.TRAVEL_TIME_ENABLED = False
+        circle = [bool(k) for k in search._services_within("universities", lats_p, lons_p, 15)]
+        settings.TRAVEL_TIME_ENABLED = True
+        network = [bool(k) for k in search._services_within("universities", lats_p, lons_p, 15)]
+
+        anchor = search._anchor((24.70, 46.78), "university", "جامعة الاختبار", 15, walking=False)
+        within = [bool(k) for k in search._within_anchor(anchor, properties)]
+
+        display = search._with_travel_minutes(
+            [{"name_ar": "جامعة الاختبار", "lat": 24.70, "lon": 46.78, "distance_meters": 18000.0}],
+            24.70, 46.60, 20, walking=False)
+    finally:
+        search_module.travel_time_engine, search_module.poi_index, settings.TRAVEL_TIME_ENABLED = original
+
+    assert circle == [False, True, True], circle
+    assert network == [True, False, True], network
+    assert anchor["travel_time"] and anchor["radius_meters"] > 18000
+    assert within == [True, False, True], within
+    assert len(display) == 1 and 10 < display[0]["drive_minutes"] < 13, display
+    print(f"  ✅ circle={circle} → network={network}, anchor radius {anchor['radius_meters']:.0f}m, "
+          f"display {display[0]['drive_minutes']} min")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Travel-Time Engine - Tests")
+    print("=" * 60)
+
+    test_grid_times_match_reference()
+    test_osm_parsing_and_npz_round_trip()
+    test_search_uses_network_times()
+
+    print("\n✅ All tests passed!")
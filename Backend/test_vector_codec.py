@@ -0,0 +1,162 @@
+"""
+Test script for compressed vector storage
+Tests:
+1. float16 / int8 / truncated codecs: memory per vector and similarity error
+2. VectorIndex built with compressed vectors keeps the float32 ranking
+3. Reduced-precision query vectors shrink the RPC payload
+"""
+import sys
+import os
+import json
+
+import numpy as np
+
+# Add Backend to path
+sys.path.insert(0, os.path.dirname(__file__))
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+
+def _vectors(n=4000, dims=256, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(30, dims)).astype(np.float32)
+    vectors = centers[rng.integers(0, 30, size=n)] + 0.5 * rng.normal(size=(n, dims)).astype(np.float32)
+    queries = centers[rng.integers(0, 30, size=20)] + 0.5 * rng.normal(size=(20, dims)).astype(np.float32)
+    return vectors, queries
+
+
+def test_codec_memory_and_error():
+    """Test encoded sizes and dot-product accuracy per precision"""
+    print("\n" + "=" * 60)
+    print("TEST 1: Codec memory and accuracy")
+    print("=" * 60)
+
+    import vector_codec
+    from vector_codec import VectorCodec, truncate
+
+    vectors, queries = _vectors()
+    exact = truncate(vectors) @ truncate(queries[0])
+    errors = {}
+    for precision, size, tolerance in (("float32", 1024, 1e-6), ("float16", 512, 2e-3), ("int8", 260, 2e-2)):
+        codec = VectorCodec(precision)
+        encoded = codec.encode(vectors)
+        assert encoded.nbytes == len(vectors) * size == len(vectors) * codec.bytes_per_vector(256)
+        scores = encoded.dot(codec.prepare(queries[0]))
+        errors[precision] = float(np.max(np.abs(scores - exact)))
+        assert errors[precision] < tolerance, (precision, errors[precision])
+
+        # مواضع محددة وأجزاء أصغر من عدد الصفوف تعطي نفس النتيجة
+        positions = np.array([3, 3999, 17, 2048])
+        assert np.allclose(encoded.dot(codec.prepare(queries[0]), positions), scores[positions], atol=1e-6)
+        assert np.allclose(encoded.decode(positions) @ codec.prepare(queries[0]), scores[positions], atol=1e-5)
+
+    original = vector_codec.CHUNK_BYTES
+    try:
+        vector_codec.CHUNK_BYTES = 4 * 256 * 7
+        assert np.allclose(VectorCodec("int8").encode(vectors).dot(truncate(queries[0])),
+                           VectorCodec("int8").encode(vectors).decode() @ truncate(queries[0]), atol=1e-5)
+    finally:
+        vector_codec.CHUNK_BYTES = original
+
+    truncated = VectorCodec("int8", dimensions=64)
+    assert truncated.name == "int8-64d" and truncated.encode(vectors).shape == (4000, 64)
+    assert np.allclose(np.linalg.norm(truncated.prepare(vectors), axis=1), 1.0, atol=1e-5)
+    assert truncated.bytes_per_vector(256) == 68
+
+    try:
+        VectorCodec("int4")
+        raise AssertionError("expected ValueError")
+    except ValueError:
+        pass
+    print(f"  ✅ max |score error|: {errors}")
+
+
+def test_index_with_compressed_vectors():
+    """Test that compressed indexes keep the exact float32 top-k"""
+    print("\n" + "=" * 60)
+    print("TEST 2: Vector index recall with compressed vectors")
+    print("=" * 60)
+
+    from vector_index import VectorIndex
+
+    vectors, queries = _vectors()
+    ids = [str(i) for i in range(len(vectors))]
+    metadata = [{"purpose": "للبيع", "property_type": "شقق", "city": "الرياض", "price_num": 1000.0}
+                for _ in ids]
+
+    reference = VectorIndex(geo_weight=0.0)
+    reference.build(ids, vectors, metadata)
+    recalls = {}
+    for precision, dimensions, minimum in (("float16", None, 0.99), ("int8", None, 0.9), ("int8", 128, 0.35)):
+        index = VectorIndex(geo_weight=0.0, precision=precision, dimensions=dimensions)
+        index.build(ids, vectors, metadata)
+        assert index.vectors.nbytes < reference.vectors.nbytes / 1.9
+        hits = []
+        for query in queries:
+            truth = {r["id"] for r in reference.search(query, k=20, threshold=-1.0, exact=True)}
+            found = index.search(query, k=20, threshold=-1.0, exact=True)
+            assert all(-1.01 <= r["similarity"] <= 1.01 for r in found)
+            hits.append(len(truth & {r["id"] for r in found}) / 20)
+        recalls[index.codec.name] = float(np.mean(hits))
+        assert recalls[index.codec.name] >= minimum, recalls
+
+    empty = VectorIndex(precision="int8")
+    assert len(empty.vectors) == 0 and empty.search(queries[0]) == []
+    print(f"  ✅ recall@20 vs float32: {recalls}")
+
+
+def test_query_precision_payload():
+    """Test the reduced-precision query vector sent to the RPC"""
+    print("\n" + "=" * 60)
+    print("TEST 3: Query vector precision and RPC payload")
+    print("=" * 60)
+
+    from config import settings
+    from vector_codec import reduce_precision
+    import embedding_generator as generator_module
+    from embedding_cache import EmbeddingCache
+
+    vector = np.random.default_rng(1).standard_normal(1024).astype(np.float32)
+    vector /= np.linalg.norm(vector)
+    sizes = {p: len(json.dumps(reduce_precision(vector, p))) for p in ("float32", "float16", "int8")}
+    assert len(json.dumps(vector.tolist())) > 2 * sizes["float16"]
+    assert sizes["int8"] < sizes["float16"] < sizes["float32"]
+    assert np.allclose(reduce_precision(vector, "float16"), vector, atol=1e-3)
+    assert reduce_precision(vector, "float32") == [float(f"{v:.9g}") for v in vector.tolist()]
+
+    class _Model:
+        def encode(self, text, normalize_embeddings=True):
+            return vector
+
+    generator = generator_module.embedding_generator
+    original = (generator._model, generator._batcher, generator_module.embedding_cache,
+                settings.EMBEDDING_QUERY_PRECISION, settings.EMBEDDING_BATCHING_ENABLED)
+    try:
+        generator._model, generator._batcher = _Model(), None
+        generator_module.embedding_cache = EmbeddingCache(max_entries=8)
+        settings.EMBEDDING_BATCHING_ENABLED = False
+        settings.EMBEDDING_QUERY_PRECISION = "float16"
+        first = generator.generate("شقة في حي النرجس")
+        # الذاكرة المؤقتة تحفظ المتجه الكامل، والتقليل يطبق على الطلب المرجع فقط
+        cached = generator.generate("شقة في حي النرجس")
+        assert first == cached == reduce_precision(vector, "float16")
+        settings.EMBEDDING_QUERY_PRECISION = "float32"
+        assert np.allclose(generator.generate("شقة في حي النرجس"), vector, atol=1e-7)
+    finally:
+        (generator._model, generator._batcher, generator_module.embedding_cache,
+         settings.EMBEDDING_QUERY_PRECISION, settings.EMBEDDING_BATCHING_ENABLED) = original
+    print(f"  ✅ JSON bytes per query vector: {sizes}")
+
+
+if __name__ == "__main__":
+    print("=" * 60)
+    print("Compressed Vectors - Tests")
+    print("=" * 60)
+
+    test_codec_memory_and_error()
+    test_index_with_compressed_vectors()
+    test_query_precision_payload()
+
+    print("\n✅ All tests passed!")
@@ -0,0 +1,515 @@
+"""
+زمن التنقل على شبكة الطرق (Road-Network Travel Times)
+
+بديل تحويل الدقائق إلى دائرة بسرعة ثابتة (30 كم/س قيادة، 5 كم/س مشي): يحمّل
+شبكة طرق محلية (مستخرج OSM للرياض) ويحسب زمن الوصول على الطرق الفعلية.
+
+- شبكة مكانية منتظمة (خلايا ~200م) تغطي الشبكة، كل خلية مربوطة بأقرب عقدة طريق
+- لكل نوع خدمة (جامعات/مساجد/مدارس) ووسيلة تنقل: Dijkstra متعدد المصادر مرة
+  واحدة (عقدة افتراضية متصلة بكل الخدمات) على الشبكة المعكوسة، فيصبح زمن
+  الوصول من كل خلية إلى أقرب خدمة مصفوفة جاهزة وسؤال "هل توجد خدمة خلال N
+  دقيقة؟" قراءة O(1) لكل عقار
+- لموقع محدد (جامعة بالاسم) أو للعرض: Dijkstra محدود بالزمن المطلوب من نقطة
+  واحدة، مع ذاكرة مؤقتة للنتائج
+
+كل شيء من ملفات محلية بدون أي خدمة خارجية: ملف OSM XML (.osm / .osm.gz) أو
+ملف .npz مضغوط يُنتج منه مرة واحدة:
+    python travel_time.py convert riyadh.osm riyadh_roads.npz
+"""
+from config import settings
+from typing import List, Optional, Dict, Any, Tuple
+from collections import OrderedDict
+from poi_index import (POIIndex, poi_index, haversine_meters, normalize_gender, levels_to_bits,
+                       METERS_PER_DEGREE_LAT, SCHOOL_LEVEL_BITS)
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from scipy.spatial import cKDTree
+import numpy as np
+import xml.etree.ElementTree as ET
+import gzip
+import threading
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+DRIVE = 'drive'
+WALK = 'walk'
+MODES = (DRIVE, WALK)
+
+# سرعات القيادة الافتراضية (كم/س) لكل نوع طريق عند غياب maxspeed
+DRIVE_SPEEDS_KMH = {
+    'motorway': 100.0, 'motorway_link': 50.0,
+    'trunk': 80.0, 'trunk_link': 40.0,
+    'primary': 60.0, 'primary_link': 35.0,
+    'secondary': 50.0, 'secondary_link': 30.0,
+    'tertiary': 40.0, 'tertiary_link': 25.0,
+    'unclassified': 30.0, 'residential': 25.0, 'road': 25.0,
+    'living_street': 10.0, 'service': 15.0,
+}
+# طرق لا يُمشى عليها (بقية أنواع highway متاحة للمشي في الاتجاهين)
+NON_WALKABLE = {'motorway', 'motorway_link', 'trunk', 'trunk_link', 'construction', 'proposed', 'raceway'}
+WALK_SPEED_KMH = 5.0
+# سرعة الوصول من العقار/الخدمة إلى أقرب عقدة طريق
+ACCESS_SPEED_KMH = {DRIVE: 15.0, WALK: WALK_SPEED_KMH}
+# csgraph يعامل الوزن 0 كغياب للمقطع
+MIN_EDGE_SECONDS = 1e-3
+
+
+def _parse_maxspeed(value: Optional[str]) -> Optional[float]:
+    """قراءة وسم maxspeed (مثل 60 أو "60 km/h" أو "40 mph") بالكيلومتر/ساعة"""
+    if not value:
+        return None
+    parts = value.strip().lower().split()
+    try:
+        speed = float(parts[0].replace('km/h', '').replace('mph', ''))
+    except (ValueError, IndexError):
+        return None
+    if 'mph' in value.lower():
+        speed *= 1.609
+    return speed if speed > 0 else None
+
+
+def _csr(src: np.ndarray, dst: np.ndarray, seconds: np.ndarray, n: int) -> csr_matrix:
+    """مصفوفة الجوار (n+1 عقدة، الأخيرة للمصدر الافتراضي) مع أقل زمن للمقاطع المكررة"""
+    order = np.lexsort((seconds, dst, src))
+    src, dst, seconds = src[order], dst[order], seconds[order]
+    first = np.ones(src.size, dtype=bool)
+    first[1:] = (src[1:] != src[:-1]) | (dst[1:] != dst[:-1])
+    return csr_matrix((np.maximum(seconds[first], MIN_EDGE_SECONDS), (src[first], dst[first])), shape=(n + 1, n + 1))
+
+
+class RoadNetwork:
+    """عقد شبكة الطرق ومقاطعها (بالثواني) لكل وسيلة تنقل"""
+
+    def __init__(self, node_lat: np.ndarray, node_lon: np.ndarray,
+                 edges: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]]):
+        self.node_lat = np.asarray(node_lat, dtype=np.float64)
+        self.node_lon = np.asarray(node_lon, dtype=np.float64)
+        self.edges = {mode: tuple(np.asarray(a) for a in arrays) for mode, arrays in edges.items()}
+        n = len(self)
+        # الشبكة المعكوسة: Dijkstra من الخدمة عليها = الزمن من كل عقدة إلى الخدمة
+        self.forward = {mode: _csr(src, dst, sec, n) for mode, (src, dst, sec) in self.edges.items()}
+        self.reverse = {mode: _csr(dst, src, sec, n) for mode, (src, dst, sec) in self.edges.items()}
+
+    def __len__(self) -> int:
+        return self.node_lat.size
+
+    def mode_nodes(self, mode: str) -> np.ndarray:
+        """العقد التي لها مقاطع في وسيلة التنقل (لا نربط عقاراً بممر مشاة عند القيادة)"""
+        src, dst, _ = self.edges[mode]
+        return np.unique(np.concatenate([src, dst]))
+
+    # ═══════════════════════════════════════════════════════
+    # الملفات
+    # ═══════════════════════════════════════════════════════
+    @classmethod
+    def load(cls, path: str) -> "RoadNetwork":
+        if path.endswith('.npz'):
+            return cls.from_npz(path)
+        if path.endswith('.pbf'):
+            raise ValueError("ملفات PBF غير مدعومة؛ حوّل المستخرج إلى OSM XML (osmium cat file.pbf -o file.osm)")
+        return cls.from_osm(path)
+
+    @classmethod
+    def from_npz(cls, path: str) -> "RoadNetwork":
+        data = np.load(path)
+        edges = {mode: (data[f'{mode}_src'], data[f'{mode}_dst'], data[f'{mode}_seconds'])
+                 for mode in MODES if f'{mode}_src' in data}
+        return cls(data['node_lat'], data['node_lon'], edges)
+
+    def save(self, path: str):
+        arrays = {'node_lat': self.node_lat, 'node_lon': self.node_lon}
+        for mode, (src, dst, seconds) in self.edges.items():
+            arrays.update({f'{mode}_src': src.astype(np.int32), f'{mode}_dst': dst.astype(np.int32),
+                           f'{mode}_seconds': seconds.astype(np.float32)})
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def from_osm(cls, path: str) -> "RoadNetwork":
+        """قراءة مستخرج OSM XML (الطرق فقط) وحساب زمن كل مقطع للقيادة والمشي"""
+        opener = gzip.open if path.endswith('.gz') else open
+        coords: Dict[int, Tuple[float, float]] = {}
+        ways = []
+        with opener(path, 'rb') as f:
+            for _, elem in ET.iterparse(f, events=('end',)):
+                if elem.tag == 'node':
+                    coords[int(elem.get('id'))] = (float(elem.get('lat')), float(elem.get('lon')))
+                    elem.clear()
+                elif elem.tag == 'way':
+                    tags = {t.get('k'): t.get('v') for t in elem.iter('tag')}
+                    if tags.get('highway'):
+                        refs = [int(nd.get('ref')) for nd in elem.iter('nd')]
+                        ways.append((refs, tags))
+                    elem.clear()
+                elif elem.tag == 'relation':
+                    elem.clear()
+
+        index: Dict[int, int] = {}
+        segments = {DRIVE: ([], [], []), WALK: ([], [], [])}
+        for refs, tags in ways:
+            refs = [index.setdefault(r, len(index)) for r in refs if r in coords]
+            if len(refs) < 2:
+                continue
+            highway = tags['highway']
+            a, b = refs[:-1], refs[1:]
+
+            drive_speed = DRIVE_SPEEDS_KMH.get(highway)
+            if drive_speed is not None and tags.get('access') not in ('no', 'private'):
+                speed = _parse_maxspeed(tags.get('maxspeed')) or drive_speed
+                oneway = tags.get('oneway')
+                forward = oneway != '-1'
+                backward = oneway == '-1' or not (oneway in ('yes', 'true', '1') or
+                                                  tags.get('junction') == 'roundabout' or highway == 'motorway')
+                src, dst, speeds = segments[DRIVE]
+                if forward:
+                    src.extend(a); dst.extend(b); speeds.extend([speed] * len(a))
+                if backward:
+                    src.extend(b); dst.extend(a); speeds.extend([speed] * len(a))
+
+            if highway not in NON_WALKABLE and tags.get('foot') != 'no':
+                src, dst, speeds = segments[WALK]
+                src.extend(a + b); dst.extend(b + a); speeds.extend([WALK_SPEED_KMH] * (2 * len(a)))
+
+        ids = np.empty(len(index), dtype=np.int64)
+        ids[list(index.values())] = list(index.keys())
+        node_lat = np.array([coords[i][0] for i in ids], dtype=np.float64)
+        node_lon = np.array([coords[i][1] for i in ids], dtype=np.float64)
+
+        edges = {}
+        for mode, (src, dst, speeds) in segments.items():
+            src, dst = np.asarray(src, dtype=np.int64), np.asarray(dst, dtype=np.int64)
+            meters = haversine_meters(node_lat[src], node_lon[src], node_lat[dst], node_lon[dst])
+            edges[mode] = (src, dst, meters / (np.asarray(speeds, dtype=np.float64) / 3.6))
+
+        logger.info(f"🛣️ قراءة شبكة الطرق: {len(ids)} عقدة، "
+                    f"{edges[DRIVE][0].size} مقطع قيادة، {edges[WALK][0].size} مقطع مشي")
+        return cls(node_lat, node_lon, edges)
+
+
+class TravelTimeEngine:
+    """
+    أزمنة التنقل على الشبكة لكل worker
+
+    كل الدوال تعيد الدقائق من العقار إلى الخدمة، وNaN للعقارات خارج الشبكة
+    (بدون طريق قريب) حتى يعود المستدعي لدائرة السرعة الثابتة لها فقط
+    """
+
+    def __init__(self, pois: POIIndex, network_path: str, grid_meters: float = 200.0,
+                 max_snap_meters: float = 500.0, cache_size: int = 64):
+        self.pois = pois
+        self.network_path = network_path
+        self.grid_meters = grid_meters
+        self.max_snap_meters = max_snap_meters
+        self.cache_size = cache_size
+        self.network: Optional[RoadNetwork] = None
+        self._trees: Dict[str, Tuple[cKDTree, np.ndarray]] = {}
+        self._cell_node: Dict[str, np.ndarray] = {}
+        self._cell_access: Dict[str, np.ndarray] = {}
+        self._grid: Dict[str, float] = {}
+        # نتائج Dijkstra: مصفوفات الخلايا لأنواع الخدمات + العقد المُتَوصَّل إليها من نقطة واحدة
+        self._cache: "OrderedDict[tuple, Any]" = OrderedDict()
+        self._failed = False
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    # ═══════════════════════════════════════════════════════
+    # التحميل
+    # ═══════════════════════════════════════════════════════
+    def build(self, network: RoadNetwork):
+        """ربط خلايا الشبكة المكانية بأقرب عقدة طريق لكل وسيلة تنقل"""
+        lat0 = float(network.node_lat.min())
+        lon0 = float(network.node_lon.min())
+        self._cos = float(np.cos(np.radians(network.node_lat.mean())))
+        pad = self.max_snap_meters / METERS_PER_DEGREE_LAT
+        dlat = self.grid_meters / METERS_PER_DEGREE_LAT
+        dlon = dlat / self._cos
+        lat0, lon0 = lat0 - pad, lon0 - pad / self._cos
+        height = int(np.ceil((network.node_lat.max() + pad - lat0) / dlat)) + 1
+        width = int(np.ceil((network.node_lon.max() + pad / self._cos - lon0) / dlon)) + 1
+
+        cell_lat = lat0 + (np.arange(height) + 0.5) * dlat
+        cell_lon = lon0 + (np.arange(width) + 0.5) * dlon
+        centers_lat = np.repeat(cell_lat, width)
+        centers_lon = np.tile(cell_lon, height)
+
+        trees, cell_node, cell_access = {}, {}, {}
+        for mode in network.edges:
+            nodes = network.mode_nodes(mode)
+            tree = cKDTree(self._project(network.node_lat[nodes], network.node_lon[nodes]))
+            trees[mode] = (tree, nodes)
+            cell_node[mode], cell_access[mode] = self._snap_with(tree, nodes, mode, centers_lat, centers_lon)
+
+        # تبديل المراجع دفعة واحدة حتى لا يرى أي طلب شبكة نصف محمّلة
+        with self._lock:
+            self._trees, self._cell_node, self._cell_access = trees, cell_node, cell_access
+            self._grid = {'lat0': lat0, 'lon0': lon0, 'dlat': dlat, 'dlon': dlon, 'height': height, 'width': width}
+            self._cache.clear()
+            self.network = network
+
+        logger.info(f"🛣️ شبكة زمن التنقل جاهزة: {len(network)} عقدة، {height}×{width} خلية")
+
+    def load(self):
+        started = time.time()
+        self.build(RoadNetwork.load(self.network_path))
+        self.precompute()
+        logger.info(f"⏱️ تحميل شبكة الطرق وحساب أزمنة الخدمات: {time.time() - started:.1f} ث")
+
+    def precompute(self):
+        """حساب أزمنة الوصول لأقرب جامعة/مسجد/مدرسة مسبقاً (بدون فلاتر)"""
+        if not self.pois.ensure_loaded():
+            return
+        for kind, mode in (('universities', DRIVE), ('mosques', DRIVE), ('mosques', WALK),
+                           ('schools', DRIVE), ('schools', WALK)):
+            self._kind_field(kind, mode, None, 0)
+
+    def is_loaded(self) -> bool:
+        return self.network is not None
+
+    def ensure_loaded(self) -> bool:
+        """
+        التأكد من جاهزية الشبكة (تُحمّل مرة واحدة لكل worker)
+
+        Returns:
+            True إذا كانت أزمنة الشبكة متاحة
+        """
+        if not settings.TRAVEL_TIME_ENABLED:
+            return False
+        if self.is_loaded() or self._failed:
+            return self.is_loaded()
+
+        with self._load_lock:
+            if self.is_loaded() or self._failed:
+                return self.is_loaded()
+            try:
+                self.load()
+            except Exception as e:
+                logger.error(f"❌ فشل تحميل شبكة الطرق ({self.network_path}): {e}")
+                # لا نعيد المحاولة في كل طلب؛ البحث يستمر بالسرعة الثابتة
+                self._failed = True
+        return self.is_loaded()
+
+    # ═══════════════════════════════════════════════════════
+    # الشبكة المكانية
+    # ═══════════════════════════════════════════════════════
+    def _project(self, lats, lons) -> np.ndarray:
+        """إسقاط مسطح بالأمتار (يكفي لنطاق مدينة)"""
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        return np.column_stack([lons * self._cos * METERS_PER_DEGREE_LAT, lats * METERS_PER_DEGREE_LAT])
+
+    def _snap_with(self, tree: cKDTree, nodes: np.ndarray, mode: str, lats, lons) -> Tuple[np.ndarray, np.ndarray]:
+        """أقرب عقدة (أو -1) وزمن الوصول إليها بالثواني"""
+        distance, idx = tree.query(self._project(lats, lons), k=1, distance_upper_bound=self.max_snap_meters)
+        found = np.isfinite(distance)
+        node = np.full(idx.shape, -1, dtype=np.int64)
+        node[found] = nodes[idx[found]]
+        access = np.where(found, distance, 0.0) / (ACCESS_SPEED_KMH[mode] / 3.6)
+        return node, access
+
+    def _cells(self, lats, lons) -> np.ndarray:
+        """فهرس الخلية لكل نقطة (-1 خارج الشبكة)"""
+        g = self._grid
+        lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+        lons = np.atleast_1d(np.asarray(lons, dtype=np.float64))
+        rows = np.floor((lats - g['lat0']) / g['dlat']).astype(np.int64)
+        cols = np.floor((lons - g['lon0']) / g['dlon']).astype(np.int64)
+        inside = (rows >= 0) & (rows < g['height']) & (cols >= 0) & (cols < g['width'])
+        return np.where(inside, rows * g['width'] + cols, -1)
+
+    def _cell_links(self, mode: str, lats, lons) -> Tuple[np.ndarray, np.ndarray]:
+        """عقدة الطريق وزمن الوصول إليها لخلايا النقاط (-1 للنقاط خارج الشبكة)"""
+        cells = self._cells(lats, lons)
+        inside = cells >= 0
+        node = np.full(cells.shape, -1, dtype=np.int64)
+        access = np.zeros(cells.shape)
+        node[inside] = self._cell_node[mode][cells[inside]]
+        access[inside] = self._cell_access[mode][cells[inside]]
+        return node, access
+
+    # ═══════════════════════════════════════════════════════
+    # Dijkstra
+    # ═══════════════════════════════════════════════════════
+    def _shortest(self, mode: str, nodes: np.ndarray, offsets: np.ndarray, outbound: bool,
+                  limit_seconds: float = np.inf) -> np.ndarray:
+        """
+        Dijkstra متعدد المصادر: عقدة افتراضية (الأخيرة) متصلة بكل مصدر بزمن الوصول إليه
+
+        Returns:
+            الزمن بالثواني لكل عقدة (inf لغير المُتَوصَّل إليها)
+        """
+        base = (self.network.forward if outbound else self.network.reverse)[mode]
+        # مصدران على نفس العقدة: نكتفي بالأقرب
+        order = np.lexsort((offsets, nodes))
+        nodes, offsets = nodes[order], offsets[order]
+        first = np.ones(nodes.size, dtype=bool)
+        first[1:] = nodes[1:] != nodes[:-1]
+        nodes, offsets = nodes[first], offsets[first]
+
+        indptr = base.indptr.copy()
+        indptr[-1] += nodes.size
+        graph = csr_matrix((np.concatenate([base.data, np.maximum(offsets, MIN_EDGE_SECONDS)]),
+                            np.concatenate([base.indices, nodes]), indptr), shape=base.shape)
+        return dijkstra(graph, directed=True, indices=base.shape[0] - 1, limit=limit_seconds)[:-1]
+
+    def _cached(self, key: tuple, compute):
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        value = compute()
+        with self._lock:
+            self._cache[key] = value
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return value
+
+    def _kind_field(self, kind: str, mode: str, gender: Optional[str], level_bits: int) -> Optional[np.ndarray]:
+        """دقائق الوصول من كل خلية إلى أقرب خدمة مطابقة (NaN للخلايا بلا طريق)"""
+        network = self.network
+
+        def compute():
+            levels = [name for name, bit in SCHOOL_LEVEL_BITS.items() if level_bits & bit]
+            lats, lons = self.pois.points(kind, gender=gender, levels=levels)
+            tree, nodes = self._trees[mode]
+            source, offsets = self._snap_with(tree, nodes, mode, lats, lons)
+            linked = source >= 0
+            cell_node = self._cell_node[mode]
+            field = np.full(cell_node.size, np.nan, dtype=np.float32)
+            if linked.any():
+                seconds = self._shortest(mode, source[linked], offsets[linked], outbound=False)
+                has_node = cell_node >= 0
+                field[has_node] = (seconds[cell_node[has_node]] + self._cell_access[mode][has_node]) / 60.0
+            else:
+                field[cell_node >= 0] = np.inf
+            return field
+
+        # الفهرس يُعاد تحميله دورياً، فنسخته جزء من المفتاح
+        return self._cached(('kind', id(network), self.pois.version, kind, mode, gender, level_bits), compute)
+
+    def _point_reach(self, lat: float, lon: float, mode: str, limit_minutes: float,
+                     outbound: bool) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """العقد المُتَوصَّل إليها خلال الحد من/إلى نقطة واحدة (مرتبة) وأزمنتها بالثواني"""
+        # المصدر يُربط بعقدته مباشرة مثل مصادر أنواع الخدمات، والطرف الآخر عبر الخلايا
+        tree, nodes = self._trees[mode]
+        node, access = self._snap_with(tree, nodes, mode, [lat], [lon])
+        if node[0] < 0:
+            return None
+        limit = limit_minutes * 60.0
+
+        def compute():
+            seconds = self._shortest(mode, node, access, outbound, limit_seconds=limit)
+            reached = np.flatnonzero(seconds <= limit)
+            return reached, seconds[reached]
+
+        return self._cached(('point', id(self.network), mode, outbound, int(node[0]), round(float(access[0]), 1),
+                             round(limit, 1)), compute)
+
+    # ═══════════════════════════════════════════════════════
+    # الاستعلامات
+    # ═══════════════════════════════════════════════════════
+    def minutes_to_nearest(self, kind: str, lats, lons, mode: str = DRIVE,
+                           gender: Optional[str] = None, levels: Optional[List[str]] = None) -> Optional[np.ndarray]:
+        """
+        دقائق الوصول من كل عقار إلى أقرب خدمة (قراءة من المصفوفة المحسوبة مسبقاً)
+
+        Args:
+            kind: schools / mosques / universities
+            lats, lons: إحداثيات العقارات
+            mode: drive / walk
+            gender, levels: فلاتر المدارس (اختياري)
+
+        Returns:
+            مصفوفة دقائق (NaN خارج الشبكة، inf بلا طريق إلى خدمة)، أو None إذا لم يكن فهرس الخدمات جاهزاً
+        """
+        if not self.pois.ensure_loaded():
+            return None
+        field = self._kind_field(kind, mode, normalize_gender(gender), levels_to_bits(levels))
+        cells = self._cells(lats, lons)
+        minutes = np.full(cells.shape, np.nan)
+        inside = cells >= 0
+        minutes[inside] = field[cells[inside]]
+        return minutes
+
+    def _point_minutes(self, lat: float, lon: float, mode: str, lats, lons, limit_minutes: float,
+                       outbound: bool) -> Optional[np.ndarray]:
+        reach = self._point_reach(lat, lon, mode, limit_minutes, outbound)
+        if reach is None:
+            return None
+        reached, seconds = reach
+        node, access = self._cell_links(mode, lats, lons)
+        minutes = np.where(node >= 0, np.inf, np.nan)
+        if reached.size:
+            linked = np.flatnonzero(node >= 0)
+            pos = np.searchsorted(reached, node[linked]).clip(max=reached.size - 1)
+            found = reached[pos] == node[linked]
+            minutes[linked[found]] = (seconds[pos[found]] + access[linked[found]]) / 60.0
+        return minutes
+
+    def minutes_to_point(self, lat: float, lon: float, lats, lons, mode: str = DRIVE,
+                         limit_minutes: float = 30.0) -> Optional[np.ndarray]:
+        """
+        دقائق الوصول من كل عقار إلى موقع واحد (جامعة أو مسجد محدد بالاسم)
+
+        Returns:
+            مصفوفة دقائق (inf بعد الحد، NaN خارج الشبكة)، أو None إذا كان الموقع خارج الشبكة
+        """
+        return self._point_minutes(lat, lon, mode, lats, lons, limit_minutes, outbound=False)
+
+    def minutes_from_point(self, lat: float, lon: float, lats, lons, mode: str = DRIVE,
+                           limit_minutes: float = 30.0) -> Optional[np.ndarray]:
+        """دقائق الوصول من عقار واحد إلى عدة خدمات (لعرض الخدمات القريبة)"""
+        return self._point_minutes(lat, lon, mode, lats, lons, limit_minutes, outbound=True)
+
+    def reach_radius_meters(self, lat: float, lon: float, mode: str, minutes: float,
+                            outbound: bool = False) -> Optional[float]:
+        """
+        نصف قطر يحيط بكل ما يمكن الوصول إليه خلال N دقيقة (لتضييق الاستعلام المكاني)
+
+        Returns:
+            نصف القطر بالمتر، أو None إذا كان الموقع خارج الشبكة
+        """
+        reach = self._point_reach(lat, lon, mode, minutes, outbound)
+        if reach is None or reach[0].size == 0:
+            return None
+        reached, seconds = reach
+        # العقار قد يبعد عن عقدته حتى مسافة الربط + نصف قطر الخلية
+        slack = self.max_snap_meters + self.grid_meters * 0.75
+        far = haversine_meters(lat, lon, self.network.node_lat[reached], self.network.node_lon[reached]).max()
+        return float(far + slack)
+
+    def stats(self) -> Dict[str, Any]:
+        if self.network is None:
+            return {'loaded': False, 'failed': self._failed}
+        return {
+            'loaded': True,
+            'nodes': len(self.network),
+            'edges': {mode: int(graph.nnz) for mode, graph in self.network.forward.items()},
+            'grid_cells': int(self._grid['height'] * self._grid['width']),
+            'cached_results': len(self._cache),
+        }
+
+
+# إنشاء instance واحد لكل worker
+travel_time_engine = TravelTimeEngine(
+    poi_index,
+    network_path=settings.TRAVEL_TIME_NETWORK_PATH,
+    grid_meters=settings.TRAVEL_TIME_GRID_METERS,
+    max_snap_meters=settings.TRAVEL_TIME_MAX_SNAP_METERS,
+    cache_size=settings.TRAVEL_TIME_CACHE_SIZE
+)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="تحويل مستخرج OSM إلى ملف شبكة طرق مضغوط")
+    sub = parser.add_subparsers(dest="command", required=True)
+    convert = sub.add_parser("convert")
+    convert.add_argument("source", help="ملف .osm أو .osm.gz")
+    convert.add_argument("target", help="ملف .npz الناتج")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    RoadNetwork.from_osm(args.source).save(args.target)
+    print(f"✅ {args.target}")
@@ -0,0 +1,145 @@
+"""
+ضغط متجهات الـ embedding (Reduced-Precision Vectors)
+
+1024 قيمة float32 لكل عقار ولكل طلب مكلفة في الذاكرة وفي حمولة الـ RPC:
+
+- float16: نصف الحجم، وخطأ نسبي ~5e-4 لكل قيمة
+- int8: ربع الحجم، تكميم متماثل بمقياس لكل متجه (max|x| / 127)
+- قص الأبعاد: أول d قيمة ثم إعادة التطبيع (يُستخدم مع الفهرس المحلي فقط،
+  لأن عمود قاعدة البيانات بطول 1024)
+
+التشابه يُحسب على أجزاء صغيرة: كل جزء يُحوَّل إلى float32 في buffer يبقى في
+الـ cache ثم ضرب BLAS، فالذاكرة تبقى مضغوطة. int8 بنفس سرعة float32 تقريباً،
+وfloat16 أبطأ (تحويل half في numpy بدون SIMD) فهو للتوفير في الذاكرة فقط.
+"""
+from typing import List, Optional, Sequence, Union
+import numpy as np
+
+FLOAT32 = 'float32'
+FLOAT16 = 'float16'
+INT8 = 'int8'
+PRECISIONS = (FLOAT32, FLOAT16, INT8)
+
+# أرقام معنوية تكفي لكل دقة عند إرسال المتجه كنص (JSON / pgvector)
+SIGNIFICANT_DIGITS = {FLOAT32: 9, FLOAT16: 4, INT8: 3}
+
+# حجم buffer التحويل إلى float32 في كل خطوة حساب (يبقى داخل cache المعالج)
+CHUNK_BYTES = 1 << 20
+
+
+def _check_precision(precision: str) -> str:
+    if precision not in PRECISIONS:
+        raise ValueError(f"دقة غير مدعومة: {precision} (المتاح: {', '.join(PRECISIONS)})")
+    return precision
+
+
+def truncate(vectors: np.ndarray, dimensions: Optional[int] = None) -> np.ndarray:
+    """أول dimensions قيمة من كل متجه ثم إعادة التطبيع (متجه واحد أو مصفوفة)"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dimensions:
+        vectors = vectors[..., :dimensions]
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def quantize_int8(vectors: np.ndarray):
+    """تكميم متماثل لكل صف: (الأكواد int8، المقياس float32 لكل صف)"""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    scales = np.max(np.abs(vectors), axis=1) / 127.0
+    scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales
+
+
+def reduce_precision(vector: Union[Sequence[float], np.ndarray], precision: str = FLOAT32) -> List[float]:
+    """
+    متجه واحد بالدقة المطلوبة كقائمة أرقام قصيرة التمثيل
+
+    تُستخدم لحمولة الـ RPC ونصوص pgvector: float16 بأربعة أرقام معنوية بدلاً
+    من 17 رقماً لكل قيمة (حجم JSON أصغر بحوالي 3 مرات)
+    """
+    precision = _check_precision(precision)
+    values = np.asarray(vector, dtype=np.float32)
+    if precision == FLOAT16:
+        values = values.astype(np.float16).astype(np.float32)
+    elif precision == INT8:
+        codes, scales = quantize_int8(values)
+        values = codes[0].astype(np.float32) * scales[0]
+    digits = SIGNIFICANT_DIGITS[precision]
+    return [float(f'{v:.{digits}g}') for v in values.tolist()]
+
+
+class EncodedVectors:
+    """مصفوفة متجهات مضغوطة (الأكواد + المقياس لكل صف في int8)"""
+
+    def __init__(self, codes: np.ndarray, scales: Optional[np.ndarray], precision: str):
+        self.codes = codes
+        self.scales = scales
+        self.precision = precision
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def decode(self, positions: Optional[np.ndarray] = None) -> np.ndarray:
+        """المتجهات كـ float32 (كلها أو مواضع محددة)"""
+        codes = self.codes if positions is None else self.codes[positions]
+        values = codes.astype(np.float32)
+        if self.scales is not None:
+            scales = self.scales if positions is None else self.scales[positions]
+            values *= scales[:, None]
+        return values
+
+    def dot(self, query: np.ndarray, positions: Optional[np.ndarray] = None) -> np.ndarray:
+        """التشابه (ضرب نقطي) بين الاستعلام والصفوف على أجزاء"""
+        query = np.asarray(query, dtype=np.float32)
+        if self.precision == FLOAT32:
+            codes = self.codes if positions is None else self.codes[positions]
+            return codes @ query
+        count = len(self) if positions is None else len(positions)
+        result = np.empty(count, dtype=np.float32)
+        step = max(1, CHUNK_BYTES // (4 * max(self.codes.shape[1], 1)))
+        buffer = np.empty((step, self.codes.shape[1]), dtype=np.float32)
+        for start in range(0, count, step):
+            rows = slice(start, start + step) if positions is None else positions[start:start + step]
+            block = self.codes[rows]
+            np.copyto(buffer[:len(block)], block)
+            np.matmul(buffer[:len(block)], query, out=result[start:start + len(block)])
+        if self.scales is not None:
+            result *= self.scales if positions is None else self.scales[positions]
+        return result
+
+
+class VectorCodec:
+    """الدقة + عدد الأبعاد المحفوظة"""
+
+    def __init__(self, precision: str = FLOAT32, dimensions: Optional[int] = None):
+        self.precision = _check_precision(precision)
+        self.dimensions = dimensions or None
+
+    @property
+    def name(self) -> str:
+        return self.precision + (f"-{self.dimensions}d" if self.dimensions else "")
+
+    def prepare(self, vectors: np.ndarray) -> np.ndarray:
+        """قص الأبعاد وإعادة التطبيع (للمتجهات المخزنة وللاستعلام)"""
+        return truncate(vectors, self.dimensions)
+
+    def encode(self, vectors: np.ndarray) -> EncodedVectors:
+        vectors = self.prepare(vectors)
+        if self.precision == INT8:
+            codes, scales = quantize_int8(vectors)
+            return EncodedVectors(codes, scales, INT8)
+        dtype = np.float16 if self.precision == FLOAT16 else np.float32
+        return EncodedVectors(np.ascontiguousarray(vectors, dtype=dtype), None, self.precision)
+
+    def bytes_per_vector(self, dimensions: int) -> int:
+        dims = min(dimensions, self.dimensions or dimensions)
+        return dims * {FLOAT32: 4, FLOAT16: 2, INT8: 1}[self.precision] + (4 if self.precision == INT8 else 0)
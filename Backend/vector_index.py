@@ -0,0 +1,361 @@
+"""
+فهرس متجهات تقريبي (ANN) داخل الذاكرة للبحث الهجين
+
+بديل محلي لـ RPC search_properties_hybrid: فهرس IVF (Inverted File) على
+embeddings العقارات المخزنة، مع فلترة مسبقة على الغرض/النوع/المدينة/السعر
+وانحياز جغرافي نحو نقطة الهدف (جامعة/مسجد/مركز الحي)
+"""
+from config import settings
+from typing import List, Optional, Dict, Any, Sequence
+from poi_index import haversine_meters
+from vector_codec import VectorCodec, EncodedVectors, FLOAT32
+import numpy as np
+import threading
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+VECTOR_COLUMNS = 'id, embedding, purpose, property_type, city, final_lat, final_lon, price_num'
+
+# عند قلة الصفوف المطابقة للفلاتر يكون المسح الكامل لها أسرع وأدق من IVF
+BRUTE_FORCE_MAX_CANDIDATES = 2048
+
+
+def parse_pgvector(value) -> Optional[np.ndarray]:
+    """تحويل قيمة pgvector (نص '[0.1,0.2,...]' أو قائمة) إلى مصفوفة float32"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        if len(value) < 3:
+            return None
+        return np.array(value[1:-1].split(','), dtype=np.float32)
+    return np.asarray(value, dtype=np.float32)
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def _spherical_kmeans(vectors: np.ndarray, n_clusters: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """تدريب مراكز k-means على متجهات مُطبَّعة (تشابه جيب التمام)"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=n_clusters, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        counts = np.bincount(assignment, minlength=n_clusters)
+
+        # إعادة تعيين المراكز الفارغة لنقاط عشوائية
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = vectors[rng.choice(len(vectors), size=int(empty.sum()), replace=False)]
+        centroids = _normalize_rows(sums)
+
+    return centroids
+
+
+class _Lists:
+    """
+    بيانات الفهرس المبنية (تُبدَّل دفعة واحدة بمرجع واحد): البحث يأخذها مرة
+    واحدة حتى لا يخلط متجهات قديمة بمواضع جديدة أثناء إعادة البناء في الخلفية
+    """
+
+    def __init__(self, ids: np.ndarray, vectors: EncodedVectors, centroids: np.ndarray, offsets: np.ndarray,
+                 metadata: Dict[str, np.ndarray], vocab: Dict[str, Dict[Any, int]]):
+        self.ids = ids
+        self.vectors = vectors
+        self.centroids = centroids
+        self.offsets = offsets
+        self.metadata = metadata
+        self.vocab = vocab
+
+
+class VectorIndex:
+    """
+    فهرس IVF لمتجهات BGE-M3 المُطبَّعة
+
+    المتجهات مرتبة حسب القائمة (list) التي تنتمي لها، فكل قائمة نطاق متصل
+    [offsets[i], offsets[i+1]) وتصبح الفلترة المسبقة قناعاً على هذه المواضع
+    """
+
+    def __init__(self, n_probe: int = 8, refresh_seconds: int = 3600,
+                 geo_weight: float = 0.2, geo_scale_km: float = 10.0,
+                 precision: str = FLOAT32, dimensions: Optional[int] = None):
+        self.n_probe = n_probe
+        self.refresh_seconds = refresh_seconds
+        self.geo_weight = geo_weight
+        self.geo_scale_km = geo_scale_km
+        # دقة المتجهات المخزنة وعدد أبعادها (float16/int8 وقص الأبعاد لتوفير الذاكرة)
+        self.codec = VectorCodec(precision, dimensions)
+
+        self._data = _Lists(np.empty(0, dtype=object), self.codec.encode(np.empty((0, 1), dtype=np.float32)),
+                            np.empty((0, 0), dtype=np.float32), np.zeros(1, dtype=np.int64), {}, {})
+        self._loaded_at = 0.0
+        self._last_attempt = 0.0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data.ids)
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._data.ids
+
+    @property
+    def vectors(self) -> EncodedVectors:
+        return self._data.vectors
+
+    @property
+    def offsets(self) -> np.ndarray:
+        return self._data.offsets
+
+    # ═══════════════════════════════════════════════════════
+    # البناء
+    # ═══════════════════════════════════════════════════════
+    def build(self, ids: Sequence[str], vectors: np.ndarray, metadata: List[Dict[str, Any]],
+              n_lists: Optional[int] = None, seed: int = 0):
+        """
+        بناء الفهرس
+
+        Args:
+            ids: معرفات العقارات
+            vectors: مصفوفة (N, D) من embeddings
+            metadata: لكل عقار: purpose, property_type, city, final_lat, final_lon, price_num
+            n_lists: عدد القوائم (الافتراضي √N)
+        """
+        vectors = self.codec.prepare(vectors)
+        n = len(vectors)
+        if n == 0:
+            logger.warning("⚠️ لا توجد embeddings لبناء فهرس المتجهات")
+            return
+
+        n_lists = max(1, min(n_lists or int(np.sqrt(n)), n))
+        started = time.time()
+
+        # التدريب على عينة ثم إسناد كل المتجهات لأقرب مركز
+        rng = np.random.default_rng(seed)
+        sample_size = min(n, 64 * n_lists)
+        sample = vectors[rng.choice(n, size=sample_size, replace=False)]
+        centroids = _spherical_kmeans(sample, n_lists, seed=seed).astype(np.float32)
+
+        assignment = np.empty(n, dtype=np.int64)
+        for start in range(0, n, 8192):
+            assignment[start:start + 8192] = np.argmax(vectors[start:start + 8192] @ centroids.T, axis=1)
+
+        order = np.argsort(assignment, kind='stable')
+        counts = np.bincount(assignment, minlength=n_lists)
+
+        vocab: Dict[str, Dict[Any, int]] = {}
+
+        def coded_column(name):
+            # ترميز قاموسي حتى تكون مقارنة الفلاتر على أعداد صحيحة
+            codes = vocab.setdefault(name, {})
+            return np.array([codes.setdefault(metadata[i].get(name), len(codes)) for i in order], dtype=np.int32)
+
+        def float_column(name):
+            return np.array([np.nan if metadata[i].get(name) is None else float(metadata[i][name]) for i in order],
+                            dtype=np.float64)
+
+        columns = {
+            'purpose': coded_column('purpose'),
+            'property_type': coded_column('property_type'),
+            'city': coded_column('city'),
+            'final_lat': float_column('final_lat'),
+            'final_lon': float_column('final_lon'),
+            'price_num': float_column('price_num'),
+        }
+        # تبديل مرجع واحد بعد اكتمال البناء
+        self._data = _Lists(
+            ids=np.array([str(ids[i]) for i in order], dtype=object),
+            vectors=self.codec.encode(vectors[order]),
+            centroids=centroids,
+            offsets=np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+            metadata=columns,
+            vocab=vocab,
+        )
+        self._loaded_at = time.time()
+
+        logger.info(f"🧭 تم بناء فهرس المتجهات: {n} عقار، {n_lists} قائمة، "
+                    f"{self.vectors.nbytes / 2 ** 20:.1f}MB {self.codec.name} ({time.time() - started:.1f} ث)")
+
+    def load(self):
+        """تحميل embeddings العقارات من Supabase وبناء الفهرس"""
+        from database import db
+
+        rows = db.fetch_all('properties', VECTOR_COLUMNS, order_by='id')
+        ids, vectors, metadata = [], [], []
+        for row in rows:
+            vector = parse_pgvector(row.pop('embedding', None))
+            if vector is None or vector.size == 0:
+                continue
+            ids.append(row['id'])
+            vectors.append(vector)
+            metadata.append(row)
+
+        if vectors:
+            self.build(ids, np.vstack(vectors), metadata)
+
+    def is_loaded(self) -> bool:
+        return len(self) > 0
+
+    def ensure_loaded(self) -> bool:
+        """
+        التأكد من جاهزية الفهرس: أول تحميل فقط يحجز الطلب، وإعادة البناء بعد
+        انتهاء المدة تتم في الخلفية
+        """
+        now = time.time()
+        if self.is_loaded() and now - self._loaded_at < self.refresh_seconds:
+            return True
+        # لا نعيد محاولة التحميل الفاشل مع كل طلب
+        if not self.is_loaded() and now - self._last_attempt < 60:
+            return False
+
+        # طلب واحد فقط يبدأ التحديث؛ الباقون يستخدمون الفهرس الحالي
+        if not self._lock.acquire(blocking=not self.is_loaded()):
+            return True
+        if self.is_loaded() and now - self._loaded_at < self.refresh_seconds:
+            # انتظرنا أول تحميل أكمله طلب آخر
+            self._lock.release()
+            return True
+        if self.is_loaded():
+            # إعادة البناء في خيط خلفي والطلبات تستمر على الفهرس السابق حتى يُبدَّل
+            threading.Thread(target=self._reload, args=(now,), name="vector-index-refresh", daemon=True).start()
+            return True
+        self._reload(now)
+        return self.is_loaded()
+
+    def _reload(self, now: float):
+        """التحميل ثم تحرير القفل (أول تحميل داخل الطلب، والتحديثات في خيط خلفي)"""
+        try:
+            self._last_attempt = now
+            self.load()
+        except Exception as e:
+            logger.error(f"❌ فشل تحميل فهرس المتجهات: {e}")
+            if self.is_loaded():
+                self._loaded_at = now
+        finally:
+            self._lock.release()
+
+    # ═══════════════════════════════════════════════════════
+    # البحث
+    # ═══════════════════════════════════════════════════════
+    def _filter_mask(self, data: _Lists, positions: np.ndarray, purpose: Optional[str],
+                     property_type: Optional[str], city: Optional[str], min_price: Optional[float],
+                     max_price: Optional[float]) -> np.ndarray:
+        meta = data.metadata
+        mask = np.ones(len(positions), dtype=bool)
+        for name, value in (('purpose', purpose), ('property_type', property_type), ('city', city)):
+            if value:
+                mask &= meta[name][positions] == data.vocab[name].get(value, -1)
+        if min_price is not None:
+            mask &= meta['price_num'][positions] >= min_price
+        if max_price is not None:
+            mask &= meta['price_num'][positions] <= max_price
+        return mask
+
+    def _candidates(self, data: _Lists, query: np.ndarray, n_probe: int, filters: Dict[str, Any],
+                    k: int) -> np.ndarray:
+        """مواضع المرشحين المطابقين للفلاتر من أقرب القوائم"""
+        all_positions = np.arange(len(data.ids), dtype=np.int64)
+        allowed = self._filter_mask(data, all_positions, **filters)
+
+        # فلاتر انتقائية جداً: مسح كامل للصفوف المطابقة (نتيجة دقيقة وبتكلفة أقل)
+        if allowed.sum() <= max(BRUTE_FORCE_MAX_CANDIDATES, k):
+            return all_positions[allowed]
+
+        list_order = np.argsort(-(data.centroids @ query))
+        probe = min(n_probe, len(list_order))
+        while True:
+            lists = list_order[:probe]
+            positions = np.concatenate([np.arange(data.offsets[l], data.offsets[l + 1]) for l in lists])
+            positions = positions[allowed[positions]]
+            # زيادة عدد القوائم المفحوصة إذا أفرغت الفلاتر القوائم القريبة
+            if len(positions) >= k or probe >= len(list_order):
+                return positions
+            probe = min(probe * 2, len(list_order))
+
+    def search(self, query_vector, k: int = 100, threshold: float = 0.3,
+               purpose: Optional[str] = None, property_type: Optional[str] = None,
+               city: Optional[str] = None, min_price: Optional[float] = None,
+               max_price: Optional[float] = None, lat: Optional[float] = None,
+               lon: Optional[float] = None, n_probe: Optional[int] = None,
+               exact: bool = False) -> List[Dict[str, Any]]:
+        """
+        أقرب k عقار للاستعلام بنفس شكل مخرجات search_properties_hybrid
+
+        Args:
+            query_vector: embedding الاستعلام
+            k: عدد النتائج
+            threshold: الحد الأدنى للتشابه
+            purpose, property_type, city, min_price, max_price: فلاتر مسبقة
+            lat, lon: نقطة الهدف للانحياز الجغرافي (اختياري)
+            n_probe: عدد القوائم المفحوصة (الافتراضي من الإعدادات)
+            exact: True = مسح كامل (مرجع لقياس الـ recall)
+
+        Returns:
+            قائمة {id, similarity, dist_meters, final_lat, final_lon, price_num} مرتبة
+        """
+        data = self._data
+        if len(data.ids) == 0:
+            return []
+
+        query = self.codec.prepare(query_vector)
+        filters = dict(purpose=purpose, property_type=property_type, city=city,
+                       min_price=min_price, max_price=max_price)
+
+        if exact:
+            positions = np.arange(len(data.ids), dtype=np.int64)
+            positions = positions[self._filter_mask(data, positions, **filters)]
+        else:
+            positions = self._candidates(data, query, n_probe or self.n_probe, filters, k)
+
+        if len(positions) == 0:
+            return []
+
+        similarity = data.vectors.dot(query, positions)
+        keep = similarity >= threshold
+        positions, similarity = positions[keep], similarity[keep]
+
+        meta = data.metadata
+        lats, lons = meta['final_lat'][positions], meta['final_lon'][positions]
+        score = similarity.astype(np.float64)
+        distances = np.full(len(positions), np.nan)
+        if lat is not None and lon is not None and len(positions):
+            distances = haversine_meters(lat, lon, lats, lons)
+            # الانحياز الجغرافي: خصم يصل إلى geo_weight للعقارات البعيدة
+            penalty = np.minimum(np.nan_to_num(distances, nan=np.inf) / (self.geo_scale_km * 1000.0), 1.0)
+            score = score - self.geo_weight * penalty
+
+        if len(score) > k:
+            top = np.argpartition(-score, k - 1)[:k]
+        else:
+            top = np.arange(len(score))
+        top = top[np.argsort(-score[top], kind='stable')]
+
+        return [
+            {
+                'id': data.ids[positions[i]],
+                'similarity': float(similarity[i]),
+                'dist_meters': None if np.isnan(distances[i]) else float(distances[i]),
+                'final_lat': None if np.isnan(lats[i]) else float(lats[i]),
+                'final_lon': None if np.isnan(lons[i]) else float(lons[i]),
+                'price_num': None if np.isnan(meta['price_num'][positions[i]]) else float(meta['price_num'][positions[i]]),
+            }
+            for i in top
+        ]
+
+
+# إنشاء instance واحد لكل worker (يُبنى عند أول بحث مشابه إذا كان مفعّلاً)
+vector_index = VectorIndex(
+    n_probe=settings.VECTOR_INDEX_NPROBE,
+    refresh_seconds=settings.VECTOR_INDEX_REFRESH_SECONDS,
+    geo_weight=settings.VECTOR_INDEX_GEO_WEIGHT,
+    geo_scale_km=settings.VECTOR_INDEX_GEO_SCALE_KM,
+    precision=settings.VECTOR_INDEX_PRECISION,
+    dimensions=settings.VECTOR_INDEX_DIMENSIONS
+)
@@ -0,0 +1,17 @@
+-- Track listing changes so the backend in-memory property store can refresh incrementally
+-- (polls rows with updated_at greater than the last value it has seen)
+
+ALTER TABLE public.properties
+  ADD COLUMN IF NOT EXISTS updated_at timestamp with time zone DEFAULT now();
+
+UPDATE public.properties SET updated_at = now() WHERE updated_at IS NULL;
+
+CREATE INDEX IF NOT EXISTS properties_updated_at_idx
+  ON public.properties (updated_at);
+
+-- Reuse the shared trigger function from the initial migration
+DROP TRIGGER IF EXISTS update_properties_updated_at ON public.properties;
+CREATE TRIGGER update_properties_updated_at
+  BEFORE UPDATE ON public.properties
+  FOR EACH ROW
+  EXECUTE FUNCTION public.update_updated_at_column();
@@ -0,0 +1,5 @@
+-- Fingerprint of the text each property embedding was computed from
+-- (bulk_embedding.py skips rows whose title/type/district/description have not changed)
+
+ALTER TABLE public.properties
+  ADD COLUMN IF NOT EXISTS embedding_text_hash text;
@@ -0,0 +1,19 @@
+-- Bulk write-back for bulk_embedding.py
+-- UPDATE only: a listing deleted between the page read and the asynchronous write is
+-- skipped instead of being re-created (an upsert would INSERT a row with only id,
+-- embedding and hash, and fail on NOT NULL columns). Returns the number of rows updated.
+
+CREATE OR REPLACE FUNCTION public.update_property_embeddings(p_rows jsonb)
+RETURNS integer
+LANGUAGE sql
+AS $$
+  WITH updated AS (
+    UPDATE public.properties AS p
+    SET embedding = r.embedding,
+        embedding_text_hash = r.embedding_text_hash
+    FROM jsonb_populate_recordset(NULL::public.properties, p_rows) AS r
+    WHERE p.id = r.id
+    RETURNING 1
+  )
+  SELECT count(*)::integer FROM updated;
+$$;